@@ -0,0 +1,476 @@
+"""
+Session artefact store.
+
+Large per-session artefacts (repository analyses, image analyses, threat models,
+DREAD assessments, model thinking output) are kept out of st.session_state, which
+pins them in server memory for as long as a session lives. They are stored once, by
+the SHA-256 of their serialised content, on disk with a shared in-memory LRU in
+front; session state only holds an ArtefactRef. Identical artefacts of different
+sessions share one copy, and blobs that no session has read for the idle timeout
+are removed from disk.
+
+Use store_artefact/load_artefact/clear_artefact instead of reading, writing and
+popping session state directly for these keys.
+
+The store also memoizes work across sessions: memoize() keys a result by the
+SHA-256 of its normalised inputs, so when several users analyse the same commit,
+diagram or prompt, the work runs once and the others get the stored result.
+memoize_each() does the same per item of a list, such as the threats of a threat
+model, and computes all missing items in one call.
+Sessions count references to the blobs they hold, keyed by the tracing session ID.
+When the store grows past ARTEFACT_MAX_BYTES, the least recently used blobs that no
+session references are evicted first. Streamlit does not report closed sessions, so
+the references of a session that has not used the store for the idle timeout are
+dropped.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import streamlit as st
+
+from tracing import get_session
+
+# Directory for artefact blobs; override with the ARTEFACT_STORE_DIR environment variable
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stride-gpt", "artefacts")
+
+# Bytes of artefact blobs kept in memory across all sessions (ARTEFACT_MEMORY_BYTES)
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+
+# Blobs not read for this many seconds are deleted from disk (ARTEFACT_IDLE_SECONDS)
+DEFAULT_IDLE_SECONDS = 12 * 3600
+
+# Values smaller than this stay inline in session state
+INLINE_LIMIT_BYTES = 4096
+
+# Bytes of blobs kept on disk before unreferenced ones are evicted (ARTEFACT_MAX_BYTES)
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+# Minimum seconds between sweeps for idle blobs
+SWEEP_INTERVAL_SECONDS = 300
+
+# Subdirectory mapping memoization keys to blob digests
+INDEX_DIRECTORY = "index"
+
+
+_MISSING = object()
+
+
+class ArtefactRef:
+    """Reference to an artefact in the store, kept in session state in place of the value."""
+
+    __slots__ = ("digest", "size")
+
+    def __init__(self, digest, size):
+        self.digest = digest
+        self.size = size
+
+    def __repr__(self):
+        return f"ArtefactRef({self.digest[:12]}, {self.size} bytes)"
+
+
+def _serialise(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True).encode()
+
+
+def _normalise(value):
+    # Equivalent inputs must hash alike: unify line endings and surrounding
+    # whitespace, and reduce binary inputs (uploaded images) to their digest
+    if isinstance(value, bytes):
+        return {"sha256": hashlib.sha256(value).hexdigest()}
+    if isinstance(value, str):
+        return value.replace("\r\n", "\n").strip()
+    if isinstance(value, dict):
+        return {str(k): _normalise(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalise(v) for v in value]
+    return value
+
+
+def artefact_key(kind, inputs):
+    """
+    Return the memoization key of a piece of work.
+
+    Args:
+        kind (str): Kind of work, e.g. "repo_analysis" or "threat_model"
+        inputs: JSON-serialisable inputs the result depends on; bytes are allowed
+
+    Returns:
+        str: kind-prefixed SHA-256 of the normalised inputs
+    """
+    return f"{kind}-{hashlib.sha256(_serialise(_normalise(inputs))).hexdigest()}"
+
+
+class ArtefactStore:
+    """
+    Content-addressed blobs on disk with a byte-bounded LRU of recently used blobs in
+    memory. Every get returns a freshly decoded copy, so sessions never share mutable
+    values. Safe to share between sessions and threads.
+    """
+
+    def __init__(self, directory=None, memory_bytes=None, idle_seconds=None, max_bytes=None):
+        self.directory = directory or os.environ.get("ARTEFACT_STORE_DIR") or DEFAULT_STORE_DIR
+        self.memory_bytes = memory_bytes if memory_bytes is not None else int(os.environ.get("ARTEFACT_MEMORY_BYTES", DEFAULT_MEMORY_BYTES))
+        self.idle_seconds = idle_seconds if idle_seconds is not None else int(os.environ.get("ARTEFACT_IDLE_SECONDS", DEFAULT_IDLE_SECONDS))
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.environ.get("ARTEFACT_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self._memory = OrderedDict()  # digest -> serialised value
+        self._memory_used = 0
+        self._sessions = {}  # session ID -> [last seen time, {digest: number of references}]
+        self._key_locks = {}  # memoization key -> [lock, waiters]
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, INDEX_DIRECTORY), exist_ok=True)
+        self._disk_used = sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def _index_path(self, key):
+        return os.path.join(self.directory, INDEX_DIRECTORY, key)
+
+    def _forget(self, digest, size):
+        # Caller holds the lock; the blob has been removed from disk
+        self._disk_used -= size
+        cached = self._memory.pop(digest, None)
+        if cached is not None:
+            self._memory_used -= len(cached)
+
+    def _remember(self, digest, data):
+        # Caller holds the lock
+        if digest in self._memory:
+            self._memory.move_to_end(digest)
+            return
+        if len(data) > self.memory_bytes:
+            return
+        self._memory[digest] = data
+        self._memory_used += len(data)
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_used -= len(evicted)
+
+    def put(self, value, data=None):
+        """
+        Store a JSON-serialisable value.
+
+        Args:
+            value: The value
+            data (bytes): The value already serialised with _serialise, if available
+
+        Returns:
+            ArtefactRef: Reference to the stored value
+        """
+        data = data if data is not None else _serialise(value)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            os.utime(path)
+            added = 0
+        except FileNotFoundError:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            added = len(data)
+        with self._lock:
+            self._remember(digest, data)
+            self._disk_used += added
+            over_limit = self._disk_used > self.max_bytes
+        self.sweep()
+        if over_limit:
+            self.evict()
+        return ArtefactRef(digest, len(data))
+
+    def _session(self, session):
+        # Caller holds the lock
+        entry = self._sessions.setdefault(session, [0.0, {}])
+        entry[0] = time.time()
+        return entry[1]
+
+    def touch(self, session):
+        """Mark a session as active, so sweep keeps its references."""
+        with self._lock:
+            if session in self._sessions:
+                self._session(session)
+
+    def retain(self, ref, session=None):
+        """Count a session reference to a blob; referenced blobs are evicted for size last."""
+        with self._lock:
+            refs = self._session(session)
+            refs[ref.digest] = refs.get(ref.digest, 0) + 1
+
+    def release(self, ref, session=None):
+        """Drop a session reference taken with retain."""
+        with self._lock:
+            refs = self._session(session)
+            count = refs.get(ref.digest, 0) - 1
+            if count > 0:
+                refs[ref.digest] = count
+            else:
+                refs.pop(ref.digest, None)
+
+    def _referenced(self):
+        # Caller holds the lock
+        return {digest for _, refs in self._sessions.values() for digest in refs}
+
+    def evict(self):
+        """
+        Bring the store under max_bytes by deleting the least recently used blobs,
+        unreferenced ones first.
+
+        Returns:
+            int: Number of blobs deleted
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((entry.name, stat.st_mtime, stat.st_size))
+            except OSError:
+                continue
+        with self._lock:
+            referenced = self._referenced()
+        # Unreferenced blobs sort before referenced ones, oldest first within each group
+        entries.sort(key=lambda item: (item[0] in referenced, item[1]))
+        removed = 0
+        target = self.max_bytes * 0.9
+        for digest, _, size in entries:
+            with self._lock:
+                if self._disk_used <= target:
+                    break
+            try:
+                os.remove(self._path(digest))
+            except OSError:
+                continue
+            removed += 1
+            with self._lock:
+                self._forget(digest, size)
+        return removed
+
+    def lookup(self, key):
+        """Return the reference stored for a memoization key, or None."""
+        try:
+            with open(self._index_path(key), encoding="utf-8") as f:
+                digest, size = f.read().split()
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self._path(digest)):
+            return None
+        return ArtefactRef(digest, int(size))
+
+    def memoize(self, key, compute, keep=bool, refresh=False):
+        """
+        Return the stored result of a piece of work, or compute and store it. Concurrent
+        callers with the same key wait for the first one instead of repeating the work.
+
+        Args:
+            key (str): Key from artefact_key
+            compute (callable): Produces the JSON-serialisable result
+            keep (callable): Whether a result is worth storing; failed runs should not be
+            refresh (bool): Compute even if a result is stored, replacing it if kept
+
+        Returns:
+            The result
+        """
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                ref = None if refresh else self.lookup(key)
+                if ref is not None:
+                    value = self.get(ref, _MISSING)
+                    if value is not _MISSING:
+                        return value
+                value = compute()
+                if keep(value):
+                    self._index(key, self.put(value))
+                return value
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    self._key_locks.pop(key, None)
+
+    def _index(self, key, ref):
+        tmp_path = f"{self._index_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(f"{ref.digest} {ref.size}")
+        os.replace(tmp_path, self._index_path(key))
+
+    def memoize_many(self, keys, compute, keep=bool, refresh=False):
+        """
+        Return the stored results of many pieces of work, computing only the missing
+        ones in a single call. Unlike memoize, concurrent callers are not serialised:
+        two sessions missing the same key may both compute it.
+
+        Args:
+            keys (list): Keys from artefact_key
+            compute (callable): Takes the positions of the missing keys and returns
+                their results in the same order
+            keep (callable): Whether a result is worth storing
+            refresh (bool): Compute every key even if a result is stored, replacing
+                the stored results that are kept
+
+        Returns:
+            list: The result of every key
+        """
+        values = []
+        for key in keys:
+            ref = None if refresh else self.lookup(key)
+            values.append(_MISSING if ref is None else self.get(ref, _MISSING))
+        missing = [position for position, value in enumerate(values) if value is _MISSING]
+        if missing:
+            for position, value in zip(missing, compute(missing)):
+                values[position] = value
+                if keep(value):
+                    self._index(keys[position], self.put(value))
+        return [None if value is _MISSING else value for value in values]
+
+    def get(self, ref, default=None):
+        """Return the value of a reference, or default if it has been evicted."""
+        with self._lock:
+            data = self._memory.get(ref.digest)
+            if data is not None:
+                self._memory.move_to_end(ref.digest)
+        path = self._path(ref.digest)
+        try:
+            # Reading marks the blob as recently used for idle eviction
+            os.utime(path)
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+                with self._lock:
+                    self._remember(ref.digest, data)
+        except OSError:
+            return default
+        return json.loads(data)
+
+    def sweep(self, force=False):
+        """
+        Delete blobs that have not been read for idle_seconds, and drop the references
+        of sessions that have not used the store for as long.
+        """
+        now = time.time()
+        with self._lock:
+            if not force and now - self._last_sweep < SWEEP_INTERVAL_SECONDS:
+                return 0
+            self._last_sweep = now
+            for session, (last_seen, _) in list(self._sessions.items()):
+                if now - last_seen > self.idle_seconds:
+                    del self._sessions[session]
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    if now - stat.st_mtime > self.idle_seconds:
+                        os.remove(entry.path)
+                        removed += 1
+                        with self._lock:
+                            self._forget(entry.name, stat.st_size)
+            except OSError:
+                continue
+        # Index entries whose blob is gone are dead weight
+        for entry in os.scandir(os.path.join(self.directory, INDEX_DIRECTORY)):
+            try:
+                if now - entry.stat().st_mtime > self.idle_seconds and self.lookup(entry.name) is None:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_bytes": self._disk_used,
+                "sessions": len(self._sessions),
+                "referenced_blobs": len(self._referenced()),
+            }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_store():
+    """Return the process-wide ArtefactStore shared by all sessions."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ArtefactStore()
+        return _default_store
+
+
+def store_artefact(key, value):
+    """Store a session artefact, keeping only a reference in session state if it is large."""
+    store = get_store()
+    previous = st.session_state.get(key)
+    data = _serialise(value)
+    if len(data) < INLINE_LIMIT_BYTES:
+        st.session_state[key] = value
+    else:
+        ref = store.put(value, data)
+        store.retain(ref, get_session())
+        st.session_state[key] = ref
+    if isinstance(previous, ArtefactRef):
+        store.release(previous, get_session())
+
+
+def clear_artefact(key):
+    """Remove a session artefact, releasing the session's reference to its blob."""
+    previous = st.session_state.pop(key, None)
+    if isinstance(previous, ArtefactRef):
+        get_store().release(previous, get_session())
+
+
+def load_artefact(key, default=None):
+    """Return a session artefact stored with store_artefact (or set directly in session state)."""
+    value = st.session_state.get(key, default)
+    if isinstance(value, ArtefactRef):
+        return get_store().get(value, default)
+    return value
+
+
+def memoize(kind, inputs, compute, keep=bool, refresh=False):
+    """
+    Run a piece of work once across all sessions.
+
+    Args:
+        kind (str): Kind of work, e.g. "repo_analysis" or "threat_model"
+        inputs: Everything the result depends on (see artefact_key)
+        compute (callable): Produces the JSON-serialisable result
+        keep (callable): Whether a result is worth storing; failed runs should not be
+        refresh (bool): Run the work even if a result is stored, e.g. to regenerate a
+            poor model answer, and replace the stored result
+
+    Returns:
+        The stored or freshly computed result
+    """
+    return get_store().memoize(artefact_key(kind, inputs), compute, keep, refresh)
+
+
+def memoize_each(kind, inputs, items, compute, keep=bool, refresh=False):
+    """
+    Run a piece of work per item, across all sessions, computing only the items that
+    have no stored result yet.
+
+    Args:
+        kind (str): Kind of work, e.g. "mitigations"
+        inputs: What every item's result depends on besides the item (see artefact_key)
+        items (list): Item keys, e.g. threat IDs
+        compute (callable): Takes the list of items without a stored result and returns
+            their results in the same order
+        keep (callable): Whether a result is worth storing
+        refresh (bool): Compute every item even if a result is stored
+
+    Returns:
+        list: The result of every item
+    """
+    keys = [artefact_key(kind, [inputs, item]) for item in items]
+    return get_store().memoize_many(keys, lambda missing: compute([items[position] for position in missing]), keep, refresh)
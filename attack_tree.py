@@ -1,36 +1,24 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import re
 import requests
 import streamlit as st
-from anthropic import Anthropic
-from mistralai import Mistral
-from openai import OpenAI, AzureOpenAI
-from groq import Groq
-from utils import process_groq_response, create_reasoning_system_prompt, extract_mermaid_code
+from utils import process_groq_response, create_reasoning_system_prompt, extract_mermaid_code, create_application_context, CacheablePrompt, stage_prompt, stage_messages
+from providers import complete, openai_client, azure_openai_client, anthropic_client, mistral_client, groq_client, google_client, google_genai_types, anthropic_content
+from artefacts import store_artefact
+from attack_tree_graph import AttackTree, node_attributes
+from tracing import traced
 import json
-from google import genai as google_genai
-from zhipuai import ZhipuAI
 from i18n import get_prompt_language_suffix
 
 # Function to create a prompt to generate an attack tree
+@traced()
 def create_attack_tree_prompt(app_type, authentication, internet_facing, sensitive_data, app_input, language="en"):
-    if language == "zh":
-        prompt = f"""
-应用程序类型：{app_type}
-身份验证方法：{authentication}
-面向互联网：{internet_facing}
-敏感数据：{sensitive_data}
-应用程序描述：{app_input}
-"""
-    else:
-        prompt = f"""
-APPLICATION TYPE: {app_type}
-AUTHENTICATION METHODS: {authentication}
-INTERNET FACING: {internet_facing}
-SENSITIVE DATA: {sensitive_data}
-APPLICATION DESCRIPTION: {app_input}
-"""
-    return prompt
+    # The attack tree instructions are sent as the system prompt, so the whole prompt is the
+    # application details block shared with the threat model prompt
+    return CacheablePrompt(create_application_context(app_type, authentication, internet_facing, sensitive_data, app_input, language))
 
+@traced()
 def convert_tree_to_mermaid(tree_data):
     """
     Convert structured tree data to Mermaid syntax.
@@ -41,34 +29,7 @@ def convert_tree_to_mermaid(tree_data):
     Returns:
         str: Mermaid diagram code
     """
-    mermaid_lines = ["graph TD"]
-    
-    def process_node(node, parent_id=None):
-        node_id = node["id"]
-        node_label = node["label"]
-        
-        # Add quotes if label contains spaces or parentheses
-        if " " in node_label or "(" in node_label or ")" in node_label:
-            node_label = f'"{node_label}"'
-        
-        # Add the node definition
-        mermaid_lines.append(f'    {node_id}[{node_label}]')
-        
-        # Add connection to parent if exists
-        if parent_id:
-            mermaid_lines.append(f'    {parent_id} --> {node_id}')
-        
-        # Process children
-        if "children" in node:
-            for child in node["children"]:
-                process_node(child, node_id)
-    
-    # Process the root node(s)
-    for root_node in tree_data["nodes"]:
-        process_node(root_node)
-    
-    # Join lines with newlines
-    return "\n".join(mermaid_lines)
+    return AttackTree.from_dict(tree_data).to_mermaid()
 
 def create_json_structure_prompt(language="en"):
     """
@@ -83,14 +44,36 @@ JSON结构应遵循以下格式：
         {
             "id": "root",
             "label": "破坏应用程序",
+            "type": "OR",
+            "cost": null,
+            "skill": null,
+            "probability": null,
             "children": [
                 {
                     "id": "auth",
                     "label": "获得未授权访问",
+                    "type": "AND",
+                    "cost": null,
+                    "skill": null,
+                    "probability": null,
                     "children": [
                         {
                             "id": "auth1",
-                            "label": "利用OAuth2漏洞"
+                            "label": "获取有效用户名",
+                            "type": "OR",
+                            "cost": 100,
+                            "skill": 1,
+                            "probability": 0.9,
+                            "children": []
+                        },
+                        {
+                            "id": "auth2",
+                            "label": "利用OAuth2漏洞",
+                            "type": "OR",
+                            "cost": 5000,
+                            "skill": 4,
+                            "probability": 0.3,
+                            "children": []
                         }
                     ]
                 }
@@ -102,6 +85,8 @@ JSON结构应遵循以下格式：
 规则：
 - 使用简单的ID（root, auth, auth1, data等）
 - 使标签清晰且具有描述性
+- 如果任一子节点即可实现目标，type为"OR"；如果需要所有子节点，type为"AND"
+- 为每个叶子节点估计cost（攻击者成本，美元）、skill（所需技能，1为新手到5为专家）和probability（尝试后成功的概率，0到1）；有子节点的目标将这些字段设为null
 - 包含所有攻击路径和子路径
 - 保持适当的父子关系
 - 确保JSON格式正确
@@ -116,14 +101,36 @@ The JSON structure should follow this format:
         {
             "id": "root",
             "label": "Compromise Application",
+            "type": "OR",
+            "cost": null,
+            "skill": null,
+            "probability": null,
             "children": [
                 {
                     "id": "auth",
                     "label": "Gain Unauthorized Access",
+                    "type": "AND",
+                    "cost": null,
+                    "skill": null,
+                    "probability": null,
                     "children": [
                         {
                             "id": "auth1",
-                            "label": "Exploit OAuth2 Vulnerabilities"
+                            "label": "Obtain a Valid Username",
+                            "type": "OR",
+                            "cost": 100,
+                            "skill": 1,
+                            "probability": 0.9,
+                            "children": []
+                        },
+                        {
+                            "id": "auth2",
+                            "label": "Exploit OAuth2 Vulnerabilities",
+                            "type": "OR",
+                            "cost": 5000,
+                            "skill": 4,
+                            "probability": 0.3,
+                            "children": []
                         }
                     ]
                 }
@@ -135,6 +142,8 @@ The JSON structure should follow this format:
 Rules:
 - Use simple IDs (root, auth, auth1, data, etc.)
 - Make labels clear and descriptive
+- Set "type" to "OR" if any one child achieves the goal, or "AND" if all children are needed
+- For every leaf, estimate "cost" (attacker cost in US dollars), "skill" (1 = novice to 5 = expert) and "probability" (0 to 1 that the attack succeeds once attempted); set them to null for goals with children
 - Include all attack paths and sub-paths
 - Maintain proper parent-child relationships
 - Ensure the JSON is properly formatted
@@ -167,8 +176,9 @@ def clean_json_response(response_text):
     return response_text.strip()
 
 # Function to get attack tree from the GPT response.
+@traced()
 def get_attack_tree(api_key, model_name, prompt, language="en"):
-    client = OpenAI(api_key=api_key)
+    client = openai_client(api_key=api_key)
 
     # For models that support JSON output format
     if model_name in ["o1", "o3", "o3-mini", "o4-mini"]:
@@ -181,6 +191,8 @@ Rules:
 - Make labels clear and descriptive
 - Include all attack paths and sub-paths
 - Maintain proper parent-child relationships
+- Set "type" to "OR" if any one child achieves the goal, or "AND" if all children are needed
+- For every leaf, estimate "cost" (attacker cost in US dollars), "skill" (1 = novice to 5 = expert) and "probability" (0 to 1 that the attack succeeds once attempted); set them to null for goals with children
 - Ensure proper JSON structure
 
 Example format:
@@ -189,14 +201,26 @@ Example format:
         {
             "id": "A1",
             "label": "Compromise Application",
+            "type": "OR",
+            "cost": null,
+            "skill": null,
+            "probability": null,
             "children": [
                 {
                     "id": "B1",
                     "label": "Exploit Authentication Vulnerabilities",
+                    "type": "OR",
+                    "cost": null,
+                    "skill": null,
+                    "probability": null,
                     "children": [
                         {
                             "id": "C1",
                             "label": "Brute Force Credentials",
+                            "type": "OR",
+                            "cost": 200,
+                            "skill": 2,
+                            "probability": 0.2,
                             "children": []
                         }
                     ]
@@ -212,10 +236,7 @@ ONLY RESPOND WITH THE JSON STRUCTURE, NO ADDITIONAL TEXT."""
         response = client.chat.completions.create(
             model=model_name,
             response_format=create_attack_tree_schema(),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages(system_prompt, prompt),
             max_completion_tokens=4000
         )
     else:
@@ -223,10 +244,7 @@ ONLY RESPOND WITH THE JSON STRUCTURE, NO ADDITIONAL TEXT."""
         system_prompt = create_json_structure_prompt(language)
         response = client.chat.completions.create(
             model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages(system_prompt, prompt),
             max_tokens=4000
         )
 
@@ -241,8 +259,9 @@ ONLY RESPOND WITH THE JSON STRUCTURE, NO ADDITIONAL TEXT."""
         return extract_mermaid_code(response.choices[0].message.content)
 
 # Function to get attack tree from the Azure OpenAI response.
+@traced()
 def get_attack_tree_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, language="en"):
-    client = AzureOpenAI(
+    client = azure_openai_client(
         azure_endpoint = azure_api_endpoint,
         api_key = azure_api_key,
         api_version = azure_api_version,
@@ -252,10 +271,7 @@ def get_attack_tree_azure(azure_api_endpoint, azure_api_key, azure_api_version,
     system_prompt = create_json_structure_prompt()
     response = client.chat.completions.create(
         model = azure_deployment_name,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages(system_prompt, prompt)
     )
 
     # Try to parse JSON response
@@ -268,17 +284,15 @@ def get_attack_tree_azure(azure_api_endpoint, azure_api_key, azure_api_version,
         return extract_mermaid_code(response.choices[0].message.content)
 
 # Function to get attack tree from the Mistral model's response.
+@traced()
 def get_attack_tree_mistral(mistral_api_key, mistral_model, prompt, language="en"):
-    client = Mistral(api_key=mistral_api_key)
+    client = mistral_client(api_key=mistral_api_key)
 
     # Try to get JSON output
     system_prompt = create_json_structure_prompt()
     response = client.chat.complete(
         model=mistral_model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages(system_prompt, prompt)
     )
 
     # Try to parse JSON response
@@ -291,6 +305,7 @@ def get_attack_tree_mistral(mistral_api_key, mistral_model, prompt, language="en
         return extract_mermaid_code(response.choices[0].message.content)
 
 # Function to get attack tree from Ollama hosted LLM.
+@traced()
 def get_attack_tree_ollama(ollama_endpoint, ollama_model, prompt, language="en"):
     """
     Get attack tree from Ollama hosted LLM.
@@ -312,7 +327,7 @@ def get_attack_tree_ollama(ollama_endpoint, ollama_model, prompt, language="en")
     
     url = ollama_endpoint + "api/generate"
 
-    system_prompt = "You are a helpful assistant designed to output JSON."
+    system_prompt, prompt = stage_prompt("You are a helpful assistant designed to output JSON.", prompt)
     full_prompt = f"{system_prompt}\n\n{prompt}"
 
     data = {
@@ -340,8 +355,9 @@ def get_attack_tree_ollama(ollama_endpoint, ollama_model, prompt, language="en")
         raise
 
 # Function to get attack tree from Anthropic's Claude model.
+@traced()
 def get_attack_tree_anthropic(anthropic_api_key, anthropic_model, prompt, language="en"):
-    client = Anthropic(api_key=anthropic_api_key)
+    client = anthropic_client(api_key=anthropic_api_key)
     
     # Check if we're using extended thinking mode
     is_thinking_mode = "thinking" in anthropic_model.lower()
@@ -350,7 +366,7 @@ def get_attack_tree_anthropic(anthropic_api_key, anthropic_model, prompt, langua
     actual_model = "claude-3-7-sonnet-latest" if is_thinking_mode else anthropic_model
 
     # Try to get JSON output
-    system_prompt = create_json_structure_prompt()
+    system_prompt, prompt = stage_prompt(create_json_structure_prompt(), prompt)
     
     try:
         # Configure the request based on whether thinking mode is enabled
@@ -364,7 +380,7 @@ def get_attack_tree_anthropic(anthropic_api_key, anthropic_model, prompt, langua
                 },
                 system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=600  # 10-minute timeout
             )
@@ -374,7 +390,7 @@ def get_attack_tree_anthropic(anthropic_api_key, anthropic_model, prompt, langua
                 max_tokens=4096,
                 system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=300  # 5-minute timeout
             )
@@ -388,7 +404,7 @@ def get_attack_tree_anthropic(anthropic_api_key, anthropic_model, prompt, langua
                 # Store thinking content in session state for debugging/transparency (optional)
                 thinking_content = ''.join(block.thinking for block in response.content if block.type == "thinking")
                 if thinking_content:
-                    st.session_state['last_thinking_content'] = thinking_content
+                    store_artefact('last_thinking_content', thinking_content)
                     
                 cleaned_response = clean_json_response(text_content)
             else:
@@ -422,8 +438,9 @@ graph TD
         return fallback_mermaid
 
 # Function to get attack tree from LM Studio Server response.
+@traced()
 def get_attack_tree_lm_studio(lm_studio_endpoint, model_name, prompt, language="en"):
-    client = OpenAI(
+    client = openai_client(
         base_url=f"{lm_studio_endpoint}/v1",
         api_key="not-needed"  # LM Studio Server doesn't require an API key
     )
@@ -433,10 +450,7 @@ def get_attack_tree_lm_studio(lm_studio_endpoint, model_name, prompt, language="
     response = client.chat.completions.create(
         model=model_name,
         response_format=create_attack_tree_schema_lm_studio(),  # Use LM Studio specific schema
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages(system_prompt, prompt)
     )
 
     # Try to parse JSON response
@@ -449,17 +463,15 @@ def get_attack_tree_lm_studio(lm_studio_endpoint, model_name, prompt, language="
         return extract_mermaid_code(response.choices[0].message.content)
 
 # Function to get attack tree from the Groq model's response.
+@traced()
 def get_attack_tree_groq(groq_api_key, groq_model, prompt, language="en"):
-    client = Groq(api_key=groq_api_key)
+    client = groq_client(api_key=groq_api_key)
 
     # Try to get JSON output
     system_prompt = create_json_structure_prompt()
     response = client.chat.completions.create(
         model=groq_model,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages(system_prompt, prompt)
     )
 
     # Process the response using our utility function
@@ -486,6 +498,29 @@ def get_attack_tree_groq(groq_api_key, groq_model, prompt, language="en"):
         # Fallback: try to extract Mermaid code if JSON parsing fails
         return extract_mermaid_code(content)
 
+# Node type and leaf attributes, evaluated by attack_tree_analysis
+ATTACK_NODE_PROPERTIES = {
+    "type": {
+        "type": "string",
+        "enum": ["OR", "AND"],
+        "description": "OR if any one child achieves this goal, AND if all children are needed"
+    },
+    "cost": {
+        "type": ["number", "null"],
+        "description": "Leaves only: estimated attacker cost in US dollars; null for goals with children"
+    },
+    "skill": {
+        "type": ["integer", "null"],
+        "description": "Leaves only: attacker skill required, from 1 (novice) to 5 (expert); null for goals with children"
+    },
+    "probability": {
+        "type": ["number", "null"],
+        "description": "Leaves only: probability between 0 and 1 that the attack succeeds once attempted; null for goals with children"
+    }
+}
+
+ATTACK_NODE_REQUIRED = ["id", "label", "type", "cost", "skill", "probability", "children"]
+
 def create_attack_tree_schema():
     """
     Creates a JSON schema for attack tree structure.
@@ -517,6 +552,7 @@ def create_attack_tree_schema():
                                 "type": "string",
                                 "description": "Description of the attack vector or goal"
                             },
+                            **ATTACK_NODE_PROPERTIES,
                             "children": {
                                 "type": "array",
                                 "items": {
@@ -524,7 +560,7 @@ def create_attack_tree_schema():
                                 }
                             }
                         },
-                        "required": ["id", "label", "children"],
+                        "required": ATTACK_NODE_REQUIRED,
                         "additionalProperties": False
                     }
                 },
@@ -561,6 +597,7 @@ def create_attack_tree_schema_lm_studio():
                                     "type": "string",
                                     "description": "Description of the attack vector or goal"
                                 },
+                                **ATTACK_NODE_PROPERTIES,
                                 "children": {
                                     "type": "array",
                                     "items": {
@@ -574,6 +611,7 @@ def create_attack_tree_schema_lm_studio():
                                                 "type": "string",
                                                 "description": "Description of the attack vector or goal"
                                             },
+                                            **ATTACK_NODE_PROPERTIES,
                                             "children": {
                                                 "type": "array",
                                                 "items": {
@@ -587,23 +625,24 @@ def create_attack_tree_schema_lm_studio():
                                                             "type": "string",
                                                             "description": "Description of the attack vector or goal"
                                                         },
+                                                        **ATTACK_NODE_PROPERTIES,
                                                         "children": {
                                                             "type": "array",
                                                             "items": {},
                                                             "default": []
                                                         }
                                                     },
-                                                    "required": ["id", "label", "children"],
+                                                    "required": ATTACK_NODE_REQUIRED,
                                                     "additionalProperties": False
                                                 }
                                             }
                                         },
-                                        "required": ["id", "label", "children"],
+                                        "required": ATTACK_NODE_REQUIRED,
                                         "additionalProperties": False
                                     }
                                 }
                             },
-                            "required": ["id", "label", "children"],
+                            "required": ATTACK_NODE_REQUIRED,
                             "additionalProperties": False
                         }
                     }
@@ -616,21 +655,21 @@ def create_attack_tree_schema_lm_studio():
     }
 
 # Function to get attack tree from the Google model's response.
+@traced()
 def get_attack_tree_google(google_api_key, google_model, prompt, language="en"):
     """
     Generate an attack tree using the Gemini API (Google AI) as per official documentation:
     https://ai.google.dev/gemini-api/docs/text-generation
     """
-    from google import genai as google_genai
     import json
     import streamlit as st
 
-    client = google_genai.Client(api_key=google_api_key)
-    system_instruction = create_json_structure_prompt()
+    client = google_client(api_key=google_api_key)
+    google_types = google_genai_types()
+    system_instruction, prompt = stage_prompt(create_json_structure_prompt(), prompt)
 
     try:
         try:
-            from google.genai import types as google_types
             response = client.models.generate_content(
                 model=google_model,
                 contents=[prompt],
@@ -656,7 +695,7 @@ def get_attack_tree_google(google_api_key, google_model, prompt, language="en"):
                     thinking_content.append(str(part.thought))
     if thinking_content:
         joined_thinking = "\n\n".join(thinking_content)
-        st.session_state['last_thinking_content'] = joined_thinking
+        store_artefact('last_thinking_content', joined_thinking)
 
     try:
         cleaned_response = clean_json_response(response.text)
@@ -666,6 +705,7 @@ def get_attack_tree_google(google_api_key, google_model, prompt, language="en"):
         return extract_mermaid_code(getattr(response, 'text', str(response)))
 
 # Function to get attack tree from GLM response
+@traced()
 def get_attack_tree_glm(glm_api_key, glm_model, prompt, language="en"):
     """
     Get attack tree from GLM (Zhipu AI) response.
@@ -678,7 +718,7 @@ def get_attack_tree_glm(glm_api_key, glm_model, prompt, language="en"):
     Returns:
         str: Mermaid diagram code
     """
-    client = OpenAI(
+    client = openai_client(
     api_key= glm_api_key,
     base_url="https://open.bigmodel.cn/api/paas/v4/"
     )
@@ -689,10 +729,7 @@ def get_attack_tree_glm(glm_api_key, glm_model, prompt, language="en"):
 
         response = client.chat.completions.create(
             model=glm_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages(system_prompt, prompt),
             temperature=0.7,
             max_tokens=4000,
             response_format={"type": "json_object"}
@@ -712,6 +749,7 @@ def get_attack_tree_glm(glm_api_key, glm_model, prompt, language="en"):
         return "graph TD\n    A[\"Error Generating Attack Tree\"] --> B[\"Please try again or check your API key\"]"
 
 # Function to get attack tree from eCloud response
+@traced()
 def get_attack_tree_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
     """
     Get attack tree from eCloud response.
@@ -738,10 +776,7 @@ def get_attack_tree_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
 
     data = {
         "model": ecloud_model,
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
+        "messages": stage_messages(system_prompt, prompt),
         "temperature": 0.7,
         "max_tokens": 4000,
         "stream": False,
@@ -771,4 +806,140 @@ def get_attack_tree_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
         return "graph TD\n    A[\"Error Generating Attack Tree\"] --> B[\"Please try again or check your API key\"]"
     except Exception as e:
         st.error(f"Unexpected error with eCloud: {str(e)}")
-        return "graph TD\n    A[\"Error Generating Attack Tree\"] --> B[\"An unexpected error occurred\"]"
\ No newline at end of file
+        return "graph TD\n    A[\"Error Generating Attack Tree\"] --> B[\"An unexpected error occurred\"]"
+
+
+# ------------------ Breadth-first expansion ------------------ #
+
+# Default limits of breadth-first attack tree expansion
+DEFAULT_EXPANSION_DEPTH = 4
+DEFAULT_EXPANSION_FAN_OUT = 5
+DEFAULT_EXPANSION_WORKERS = 8
+
+EXPANSION_SYSTEM_PROMPT = "You are a cyber security expert who builds attack trees. Respond only with JSON, without any additional text."
+
+def create_attack_goals_prompt(fan_out, language="en"):
+    """
+    Create the instructions for the first expansion step: the root goal and the
+    top-level attack goals, without subtrees.
+    """
+    if language == "zh":
+        return f"""
+根据上述应用程序，确定攻击者的最终目标（攻击树的根）以及最多{fan_out}个不同的顶层攻击目标。不要展开子目标。
+
+仅以如下JSON格式响应：
+{{"root": {{"id": "root", "label": "破坏应用程序"}}, "goals": [{{"id": "auth", "label": "获得未授权访问", "type": "OR"}}]}}
+
+如果需要目标的所有子目标才能实现该目标，type为"AND"，否则为"OR"。"""
+    return f"""
+For the application above, identify the attacker's ultimate goal (the root of the attack tree) and at most {fan_out} distinct top-level attack goals. Do not break the goals down any further.
+
+Respond only with JSON in this format:
+{{"root": {{"id": "root", "label": "Compromise Application"}}, "goals": [{{"id": "auth", "label": "Gain Unauthorized Access", "type": "OR"}}]}}
+
+Set a goal's "type" to "AND" if all of its sub-goals will be needed to achieve it, otherwise "OR"."""
+
+def create_subtree_prompt(goal_path, levels, fan_out, language="en"):
+    """
+    Create the instructions for expanding one attack goal into its subtree.
+
+    Args:
+        goal_path (list): Labels from the root goal down to the goal to expand
+        levels (int): Number of levels to generate below the goal
+        fan_out (int): Maximum number of children per node
+        language (str): Language code
+    """
+    path = " > ".join(goal_path)
+    if language == "zh":
+        return f"""
+攻击树中已有以下路径：{path}
+
+仅展开最后一个目标"{goal_path[-1]}"：生成其下最多{levels}层的攻击路径，每个节点最多{fan_out}个子节点。不要重复路径中已有的目标。
+
+仅以如下JSON格式响应，"nodes"为该目标的直接子节点：
+{{"nodes": [{{"id": "a1", "label": "子目标", "type": "OR", "cost": null, "skill": null, "probability": null, "children": [{{"id": "a1a", "label": "具体攻击", "type": "OR", "cost": 500, "skill": 2, "probability": 0.4, "children": []}}]}}]}}
+
+如果任一子节点即可实现目标，type为"OR"；如果需要所有子节点，type为"AND"。为每个叶子节点估计cost（美元）、skill（1到5）和probability（0到1）。"""
+    return f"""
+The attack tree already contains this path: {path}
+
+Expand only the last goal, "{goal_path[-1]}": generate up to {levels} levels of attack paths below it, with at most {fan_out} children per node. Do not repeat goals from the path.
+
+Respond only with JSON in this format, where "nodes" are the direct children of the goal:
+{{"nodes": [{{"id": "a1", "label": "Sub-goal", "type": "OR", "cost": null, "skill": null, "probability": null, "children": [{{"id": "a1a", "label": "Concrete attack", "type": "OR", "cost": 500, "skill": 2, "probability": 0.4, "children": []}}]}}]}}
+
+Set "type" to "OR" if any one child achieves the goal, or "AND" if all children are needed. For every leaf, estimate "cost" (US dollars), "skill" (1 to 5) and "probability" (0 to 1)."""
+
+def _graft(tree, parent, nodes, namespace, levels, fan_out):
+    # Add a generated subtree below parent, prefixing IDs with the goal's ID so that
+    # subtrees generated independently cannot collide, and enforcing the limits
+    stack = [(node, parent, 1) for node in reversed(nodes[:fan_out])]
+    while stack:
+        node, parent_position, level = stack.pop()
+        if not isinstance(node, dict) or not node.get("label"):
+            continue
+        position = tree.add_node(f"{namespace}_{node.get('id') or 'node'}", node["label"], parent_position, **node_attributes(node))
+        if level < levels:
+            children = node.get("children") or []
+            stack.extend((child, position, level + 1) for child in reversed(children[:fan_out]))
+
+
+@traced()
+def expand_attack_tree(model_provider, model_name, prompt, credentials=None, depth=DEFAULT_EXPANSION_DEPTH,
+                       fan_out=DEFAULT_EXPANSION_FAN_OUT, max_workers=DEFAULT_EXPANSION_WORKERS, language="en"):
+    """
+    Generate an attack tree breadth-first: one call proposes the top-level goals, then
+    every goal's subtree is generated by its own call, all running concurrently. The
+    tree can be several times larger than one completion allows while the wall time
+    stays close to that of a single call.
+
+    Args:
+        model_provider (str): Provider name as shown in the sidebar
+        model_name (str): Model name, or the deployment name for Azure OpenAI Service
+        prompt (str): The attack tree prompt from create_attack_tree_prompt
+        credentials (dict): Provider credentials, see providers.complete
+        depth (int): Maximum number of levels including the root
+        fan_out (int): Maximum number of children per node
+        max_workers (int): Maximum number of concurrent subtree calls
+        language (str): Language code
+
+    Returns:
+        tuple: (the merged AttackTree, labels of the goals whose expansion failed).
+        Failed goals stay leaves and are also reported by validate()
+    """
+    goals_prompt = CacheablePrompt(prompt, create_attack_goals_prompt(fan_out, language))
+    reply = complete(model_provider, model_name, goals_prompt, system_prompt=EXPANSION_SYSTEM_PROMPT,
+                     credentials=credentials, json_mode=True)
+    outline = json.loads(clean_json_response(reply))
+
+    tree = AttackTree()
+    root_data = outline.get("root") or {}
+    root = tree.add_node(root_data.get("id") or "root", root_data.get("label") or "Compromise Application")
+    goals = []
+    for goal in (outline.get("goals") or [])[:fan_out]:
+        if isinstance(goal, dict) and goal.get("label"):
+            goals.append(tree.add_node(goal.get("id") or "goal", goal["label"], root, **node_attributes(goal)))
+
+    levels = depth - 2
+    if levels < 1 or not goals:
+        return tree, []
+
+    def expand(goal):
+        goal_node = tree.nodes[goal]
+        subtree_prompt = CacheablePrompt(prompt, create_subtree_prompt([tree.nodes[root].label, goal_node.label], levels, fan_out, language))
+        reply = complete(model_provider, model_name, subtree_prompt, system_prompt=EXPANSION_SYSTEM_PROMPT,
+                         credentials=credentials, json_mode=True)
+        return json.loads(clean_json_response(reply)).get("nodes") or []
+
+    # Each worker runs in a copy of the current context so its LLM spans nest under this one
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(goals)))) as pool:
+        futures = [pool.submit(contextvars.copy_context().run, expand, goal) for goal in goals]
+        # Grafting happens here, in goal order, so the tree is only modified by one thread
+        failed = []
+        for goal, future in zip(goals, futures):
+            try:
+                _graft(tree, goal, future.result(), tree.nodes[goal].id, levels, fan_out)
+            except Exception as e:
+                failed.append(tree.nodes[goal].label)
+                tree.issues.append(f"Expanding goal '{tree.nodes[goal].label}' failed: {e}")
+    return tree, failed
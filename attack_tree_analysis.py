@@ -0,0 +1,248 @@
+"""
+Quantitative attack tree analysis.
+
+Evaluates an AttackTree whose nodes are OR gates (any child achieves the goal) or AND
+gates (all children are needed) and whose leaves carry an attacker cost, a required
+skill from 1 to 5 and a success probability. Leaves without a value use the defaults
+below, and leaf attacks are assumed to be independent.
+
+The nodes are numbered breadth first, so the children of every node and the nodes of
+every level are contiguous, and one bottom-up pass evaluates a whole level at a time
+with NumPy segment reductions:
+
+    cost          OR: cheapest child         AND: sum of the children
+    probability   OR: 1 - prod(1 - p)        AND: prod(p)
+    skill         OR: lowest child skill     AND: highest child skill
+
+The same pass keeps the cheapest child of every OR gate, which gives the cheapest
+attack, and combines the minimal cut sets (the minimal sets of leaf attacks that
+achieve the root goal) of the children. A top-down pass then works out, for every
+leaf, what the cheapest attack would cost if that leaf were mitigated, and ranks the
+leaves by how much mitigating them raises the attacker's cost.
+"""
+import math
+from itertools import chain
+
+import numpy as np
+
+from attack_tree_graph import AttackTreeError
+
+DEFAULT_COST = 1.0
+DEFAULT_SKILL = 3
+DEFAULT_PROBABILITY = 0.5
+
+# Number of cheapest cut sets and mitigations reported
+CUT_SET_LIMIT = 50
+MITIGATION_LIMIT = 20
+
+
+def _breadth_first(tree):
+    """
+    Number the nodes breadth first below a virtual OR root (position 0) that joins
+    the roots of the forest.
+
+    Returns:
+        tuple: (order, parent, first_child, child_count, level_starts) where order
+        maps positions to tree indices (-1 for the virtual root) and level L holds
+        positions level_starts[L] to level_starts[L + 1]
+    """
+    order, parent = [-1], [-1]
+    first_child, child_count = [], []
+    level_starts, level_end = [0], 1
+    head = 0
+    while head < len(order):
+        if head == level_end:
+            level_starts.append(head)
+            level_end = len(order)
+        position = order[head]
+        children = tree.roots if position < 0 else tree.nodes[position].children
+        first_child.append(len(order))
+        child_count.append(len(children))
+        order.extend(children)
+        parent.extend([head] * len(children))
+        head += 1
+    level_starts.append(len(order))
+    return (np.array(order), np.array(parent), np.array(first_child), np.array(child_count), level_starts)
+
+
+def _cheapest_sums(left, right, limit):
+    """
+    Combine the cut sets of two AND children: the `limit` cheapest unions of one set
+    from each side.
+    """
+    if len(left) * len(right) <= limit:
+        return sorted([(cost + other_cost, probability * other_probability, (members, other_members))
+                       for cost, probability, members in left
+                       for other_cost, other_probability, other_members in right], key=_set_cost)
+    totals = np.add.outer([item[0] for item in left], [item[0] for item in right]).ravel()
+    if totals.size > limit:
+        chosen = np.argpartition(totals, limit - 1)[:limit]
+        chosen = chosen[np.argsort(totals[chosen], kind="stable")]
+    else:
+        chosen = np.argsort(totals, kind="stable")
+    combined = []
+    for index in chosen.tolist():
+        i, j = divmod(index, len(right))
+        combined.append((left[i][0] + right[j][0], left[i][1] * right[j][1], (left[i][2], right[j][2])))
+    return combined
+
+
+def _set_cost(cut_set):
+    return cut_set[0]
+
+
+def _members(members):
+    # Cut sets are built as nested pairs so combining them does not copy leaf lists
+    leaves, stack = [], [members]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, tuple):
+            stack.extend(reversed(item))
+        else:
+            leaves.append(item)
+    return leaves
+
+
+def evaluate_attack_tree(tree, default_cost=DEFAULT_COST, default_skill=DEFAULT_SKILL,
+                         default_probability=DEFAULT_PROBABILITY, cut_set_limit=CUT_SET_LIMIT,
+                         mitigation_limit=MITIGATION_LIMIT):
+    """
+    Evaluate an attack tree bottom-up.
+
+    Args:
+        tree (AttackTree): Tree whose leaves may carry cost, skill and probability
+        default_cost (float): Cost of leaves without one
+        default_skill (int): Skill of leaves without one
+        default_probability (float): Probability of leaves without one
+        cut_set_limit (int): Number of cheapest minimal cut sets to return
+        mitigation_limit (int): Number of leaves to return in the mitigation ranking
+
+    Returns:
+        dict: cost, skill and probability of the root goal; cheapest_attack (node IDs
+        of the cheapest attack, parents before children); cut_sets (the cheapest
+        minimal cut sets with their leaves, cost and probability); mitigations
+        (leaves ranked by cost_increase, the rise in the cheapest attack cost when
+        the leaf is mitigated, which is infinite if nothing else reaches the root);
+        leaves and estimated_leaves (leaves using a default value)
+
+    Raises:
+        AttackTreeError: If the tree has no nodes
+    """
+    if not len(tree):
+        raise AttackTreeError("Attack tree has no nodes")
+
+    order, parent, first_child, child_count, level_starts = _breadth_first(tree)
+    size = len(order)
+    nodes = [None] + [tree.nodes[position] for position in order[1:]]
+    is_leaf = child_count == 0
+    is_and = np.array([False] + [node.gate == "AND" for node in nodes[1:]])
+
+    leaf_positions = np.flatnonzero(is_leaf)
+    leaves = [nodes[position] for position in leaf_positions.tolist()]
+    leaf_cost = [default_cost if node.cost is None else node.cost for node in leaves]
+    leaf_probability = [default_probability if node.probability is None else node.probability for node in leaves]
+    estimated = sum(1 for node in leaves if node.cost is None or node.probability is None or node.skill is None)
+    cost = np.zeros(size)
+    probability = np.zeros(size)
+    skill = np.zeros(size)
+    cost[leaf_positions] = leaf_cost
+    probability[leaf_positions] = leaf_probability
+    skill[leaf_positions] = [default_skill if node.skill is None else node.skill for node in leaves]
+
+    cut_sets = [None] * size
+    for position, cut_set in zip(leaf_positions.tolist(), zip(leaf_cost, leaf_probability, leaf_positions.tolist())):
+        cut_sets[position] = [cut_set]
+    first_children, child_counts, and_gates = first_child.tolist(), child_count.tolist(), is_and.tolist()
+
+    # Bottom-up: the children of level L are exactly level L + 1
+    cheapest_child = np.full(size, -1)
+    second_cheapest = np.full(size, math.inf)
+    for level in range(len(level_starts) - 3, -1, -1):
+        parents = level_starts[level] + np.flatnonzero(child_count[level_starts[level]:level_starts[level + 1]])
+        if not parents.size:
+            continue
+        base, end = level_starts[level + 1], level_starts[level + 2]
+        offsets = first_child[parents] - base
+        and_gate = is_and[parents]
+        child_cost = cost[base:end]
+        child_probability = probability[base:end]
+        child_skill = skill[base:end]
+
+        lowest = np.minimum.reduceat(child_cost, offsets)
+        cost[parents] = np.where(and_gate, np.add.reduceat(child_cost, offsets), lowest)
+        probability[parents] = np.where(and_gate, np.multiply.reduceat(child_probability, offsets),
+                                        1 - np.multiply.reduceat(1 - child_probability, offsets))
+        skill[parents] = np.where(and_gate, np.maximum.reduceat(child_skill, offsets),
+                                  np.minimum.reduceat(child_skill, offsets))
+
+        group = np.repeat(np.arange(parents.size), child_count[parents])
+        ties = np.flatnonzero(child_cost == lowest[group])
+        cheapest = ties[np.unique(group[ties], return_index=True)[1]]
+        cheapest_child[parents] = base + cheapest
+        others = child_cost.copy()
+        others[cheapest] = math.inf
+        second_cheapest[parents] = np.minimum.reduceat(others, offsets)
+
+        # In a tree no leaf is shared, so every combination is minimal and the
+        # cheapest cut sets of a gate only need the cheapest of its children
+        for position in parents.tolist():
+            children = range(first_children[position], first_children[position] + child_counts[position])
+            if and_gates[position]:
+                combined = cut_sets[children[0]]
+                for child in children[1:]:
+                    combined = _cheapest_sums(combined, cut_sets[child], cut_set_limit)
+            else:
+                combined = sorted(chain.from_iterable(cut_sets[child] for child in children), key=_set_cost)[:cut_set_limit]
+            cut_sets[position] = combined
+            for child in children:
+                cut_sets[child] = None
+
+    # Top-down: the root cost as a function of a node's cost x is min(blocked, base + x)
+    blocked = np.full(size, math.inf)
+    offset = np.zeros(size)
+    for level in range(len(level_starts) - 2):
+        base, end = level_starts[level + 1], level_starts[level + 2]
+        if base == end:
+            break
+        children = np.arange(base, end)
+        parents = parent[base:end]
+        and_gate = is_and[parents]
+        cheapest_others = np.where(cheapest_child[parents] == children, second_cheapest[parents], cost[parents])
+        blocked[base:end] = np.where(and_gate, blocked[parents],
+                                     np.minimum(blocked[parents], offset[parents] + cheapest_others))
+        offset[base:end] = np.where(and_gate, offset[parents] + cost[parents] - cost[base:end], offset[parents])
+
+    root_cost = float(cost[0])
+    increase = blocked[leaf_positions] - root_cost
+    ranked = leaf_positions[increase > 1e-9 * max(1.0, root_cost)]
+    ranked = ranked[np.argsort(-(blocked[ranked] - root_cost), kind="stable")][:mitigation_limit]
+
+    cheapest_attack, stack = [], [0]
+    while stack:
+        position = stack.pop()
+        if position:
+            cheapest_attack.append(nodes[position].id)
+        if is_leaf[position]:
+            continue
+        if is_and[position]:
+            stack.extend(range(first_child[position] + child_count[position] - 1, first_child[position] - 1, -1))
+        else:
+            stack.append(int(cheapest_child[position]))
+
+    return {
+        "cost": root_cost,
+        "skill": int(skill[0]),
+        "probability": float(probability[0]),
+        "cheapest_attack": cheapest_attack,
+        "cut_sets": [
+            {"leaves": [nodes[leaf].id for leaf in _members(members)], "cost": float(set_cost), "probability": float(set_probability)}
+            for set_cost, set_probability, members in cut_sets[0]
+        ],
+        "mitigations": [
+            {"id": nodes[position].id, "label": nodes[position].label,
+             "cost_increase": float(blocked[position] - root_cost), "blocked_cost": float(blocked[position])}
+            for position in ranked.tolist()
+        ],
+        "leaves": int(leaf_positions.size),
+        "estimated_leaves": estimated,
+    }
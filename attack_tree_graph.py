@@ -0,0 +1,411 @@
+"""
+Attack tree data structure.
+
+Models generate attack trees as nested JSON ({"nodes": [{"id", "label", "children"}]})
+that can be thousands of nodes large and arbitrarily deep, and they do not always
+keep IDs unique. AttackTree stores the nodes in a flat list with an id to index map
+and walks them with explicit stacks, so depth is not limited by the recursion limit.
+Problems found while building a tree (duplicate IDs, orphans, cycles, nodes with
+several parents) are repaired and reported by validate() instead of failing the
+whole tree.
+
+Nodes are OR gates (any child achieves the goal) unless marked AND (all children are
+needed), and leaves may carry an attacker cost, required skill and success
+probability for attack_tree_analysis.
+
+Trees convert to and from the nested JSON format and Mermaid flowcharts, and export
+to Graphviz DOT. json.dumps recurses, so trees deeper than MAX_NESTED_DEPTH are
+exported as a flat node list in which every node names its parent instead.
+"""
+import json
+import math
+import re
+
+from mermaid_svg import parse_flowchart
+
+# Characters Mermaid and DOT accept in node IDs without quoting
+SAFE_ID_RE = re.compile(r"[^\w]")
+
+GATES = ("OR", "AND")
+
+# Deepest tree exported in the nested JSON format; json encodes two containers per
+# level and stops at the recursion limit
+MAX_NESTED_DEPTH = 200
+
+# Node attributes that to_mermaid keeps in comment lines, which Mermaid ignores
+ATTRIBUTES_COMMENT_RE = re.compile(r"^\s*%% attrs (\S+) (\{.*\})\s*$", re.MULTILINE)
+
+
+def _number(value, low=None, high=None):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number) or (low is not None and number < low) or (high is not None and number > high):
+        return None
+    return number
+
+
+def node_attributes(node):
+    """
+    Read the gate and leaf attributes of a node in the nested JSON format, dropping
+    values that are missing or out of range.
+
+    Args:
+        node (dict): Node with optional "type", "cost", "skill" and "probability"
+
+    Returns:
+        dict: gate, cost, skill and probability keyword arguments for add_node
+    """
+    gate = str(node.get("type") or "OR").upper()
+    skill = _number(node.get("skill"), 1, 5)
+    return {
+        "gate": gate if gate in GATES else "OR",
+        "cost": _number(node.get("cost"), 0),
+        "skill": int(skill) if skill is not None else None,
+        "probability": _number(node.get("probability"), 0, 1),
+    }
+
+
+class AttackTreeError(ValueError):
+    """Raised for input that cannot be turned into an attack tree at all."""
+
+
+class AttackNode:
+    """One attack tree node; parent and children are indices into AttackTree.nodes."""
+
+    __slots__ = ("id", "label", "parent", "children", "gate", "cost", "skill", "probability")
+
+    def __init__(self, node_id, label, parent=None, gate="OR", cost=None, skill=None, probability=None):
+        self.id = node_id
+        self.label = label
+        self.parent = parent
+        self.children = []
+        self.gate = gate
+        self.cost = cost
+        self.skill = skill
+        self.probability = probability
+
+    def attributes(self):
+        """Return the gate and leaf attributes in the nested JSON format."""
+        return {"type": self.gate, "cost": self.cost, "skill": self.skill, "probability": self.probability}
+
+    def __repr__(self):
+        return f"AttackNode({self.id!r}, {self.label!r})"
+
+
+class AttackTree:
+    """A forest of attack nodes stored in a flat list, with an id to index map."""
+
+    __slots__ = ("nodes", "index", "issues")
+
+    def __init__(self):
+        self.nodes = []
+        self.index = {}
+        self.issues = []
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __contains__(self, node_id):
+        return node_id in self.index
+
+    def __getitem__(self, node_id):
+        return self.nodes[self.index[node_id]]
+
+    def _unique_id(self, node_id):
+        candidate, counter = node_id, 2
+        while candidate in self.index:
+            candidate = f"{node_id}_{counter}"
+            counter += 1
+        return candidate
+
+    def add_node(self, node_id, label, parent=None, gate="OR", cost=None, skill=None, probability=None):
+        """
+        Add a node, renaming it if its ID is already taken.
+
+        Args:
+            node_id (str): Requested node ID
+            label (str): Node label
+            parent (int): Index of the parent node, or None for a root
+            gate (str): "OR" if any child achieves the goal, "AND" if all are needed
+            cost (float): Attacker cost of a leaf, or None if unknown
+            skill (int): Skill a leaf requires from 1 (novice) to 5 (expert), or None
+            probability (float): Chance a leaf succeeds once attempted, or None
+
+        Returns:
+            int: Index of the new node
+        """
+        node_id = str(node_id).strip() or "node"
+        if node_id in self.index:
+            unique_id = self._unique_id(node_id)
+            self.issues.append(f"Duplicate node ID '{node_id}' renamed to '{unique_id}'")
+            node_id = unique_id
+        position = len(self.nodes)
+        self.nodes.append(AttackNode(node_id, str(label), parent, gate, cost, skill, probability))
+        self.index[node_id] = position
+        if parent is not None:
+            self.nodes[parent].children.append(position)
+        return position
+
+    @property
+    def roots(self):
+        return [position for position, node in enumerate(self.nodes) if node.parent is None]
+
+    # ------------------ Construction ------------------ #
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Build a tree from the nested JSON format of create_attack_tree_schema, or
+        from the flat format to_dict uses for deep trees.
+
+        Args:
+            data (dict): {"nodes": [...]} or a single root node
+
+        Returns:
+            AttackTree: The tree; see validate() for repaired problems
+
+        Raises:
+            AttackTreeError: If data is not an attack tree
+        """
+        if isinstance(data, dict) and "nodes" in data:
+            roots = data["nodes"]
+        elif isinstance(data, dict) and "id" in data:
+            roots = [data]
+        else:
+            raise AttackTreeError("Attack tree JSON must have a 'nodes' list")
+        if not isinstance(roots, list):
+            raise AttackTreeError("'nodes' must be a list")
+        if any(isinstance(node, dict) and "parent" in node for node in roots):
+            return cls._from_flat(roots)
+
+        tree = cls()
+        stack = [(node, None) for node in reversed(roots)]
+        while stack:
+            node, parent = stack.pop()
+            if not isinstance(node, dict):
+                tree.issues.append(f"Skipped malformed node {node!r:.60}")
+                continue
+            node_id = node.get("id") or node.get("label") or "node"
+            position = tree.add_node(node_id, node.get("label", node_id), parent, **node_attributes(node))
+            children = node.get("children") or []
+            stack.extend((child, position) for child in reversed(children))
+        return tree
+
+    @classmethod
+    def _from_flat(cls, nodes):
+        labels, edges, attributes, skipped = {}, [], {}, []
+        for node in nodes:
+            if not isinstance(node, dict) or not (node.get("id") or node.get("label")):
+                skipped.append(f"Skipped malformed node {node!r:.60}")
+                continue
+            node_id = str(node.get("id") or node.get("label"))
+            labels[node_id] = node.get("label", node_id)
+            attributes[node_id] = node_attributes(node)
+            if node.get("parent") is not None:
+                edges.append((str(node["parent"]), node_id))
+        tree = cls.from_edges(labels, edges, attributes)
+        tree.issues[:0] = skipped
+        return tree
+
+    @classmethod
+    def from_edges(cls, labels, edges, attributes=None):
+        """
+        Build a tree from node labels and parent -> child edges.
+
+        A child with several parents keeps the first; the other edges are dropped.
+        Edges to unknown nodes make the child an orphan, which becomes a root. Nodes
+        that are only reachable through a cycle are attached as roots, breaking the
+        cycle.
+
+        Args:
+            labels (dict): Node ID -> label, in display order
+            edges (list): (parent ID, child ID) pairs
+            attributes (dict): Optional node ID -> add_node keyword arguments
+
+        Returns:
+            AttackTree: The tree; see validate() for repaired problems
+        """
+        issues = []
+        parent_of = {}
+        children_of = {node_id: [] for node_id in labels}
+        for parent, child in edges:
+            if parent not in labels or child not in labels:
+                issues.append(f"Orphan edge {parent} -> {child} refers to an unknown node")
+                continue
+            if child in parent_of:
+                if parent_of[child] != parent:
+                    issues.append(f"Node '{child}' has several parents; kept '{parent_of[child]}', dropped '{parent}'")
+                continue
+            parent_of[child] = parent
+            children_of[parent].append(child)
+
+        attributes = attributes or {}
+        tree = cls()
+        tree.issues = issues
+        starts = [node_id for node_id in labels if node_id not in parent_of]
+        # Whatever remains unvisited afterwards hangs off a cycle
+        starts += [node_id for node_id in labels]
+        for start in starts:
+            if start in tree.index:
+                continue
+            if start in parent_of:
+                tree.issues.append(f"Cycle through node '{start}' broken by making it a root")
+            stack = [(start, None)]
+            while stack:
+                node_id, parent = stack.pop()
+                if node_id in tree.index:
+                    continue
+                position = tree.add_node(node_id, labels[node_id], parent, **attributes.get(node_id, {}))
+                stack.extend((child, position) for child in reversed(children_of[node_id]) if child not in tree.index)
+        return tree
+
+    @classmethod
+    def from_mermaid(cls, code):
+        """
+        Build a tree from a Mermaid flowchart, such as one produced by to_mermaid or by
+        a model asked for Mermaid directly. Gates and leaf attributes are read back
+        from the comment lines to_mermaid writes.
+
+        Raises:
+            MermaidSyntaxError: If the code is not a supported flowchart
+        """
+        diagram = parse_flowchart(code)
+        attributes = {}
+        for match in ATTRIBUTES_COMMENT_RE.finditer(code):
+            try:
+                attributes[match.group(1)] = node_attributes(json.loads(match.group(2)))
+            except (ValueError, AttributeError):
+                continue
+        return cls.from_edges(diagram.labels, [(source, target) for source, target, *_ in diagram.edges], attributes)
+
+    # ------------------ Traversal ------------------ #
+
+    def iter_preorder(self):
+        """Yield (index, depth) for every node, parents before children."""
+        stack = [(root, 0) for root in reversed(self.roots)]
+        while stack:
+            position, depth = stack.pop()
+            yield position, depth
+            stack.extend((child, depth + 1) for child in reversed(self.nodes[position].children))
+
+    def iter_postorder(self):
+        """Yield the index of every node, children before parents."""
+        # A preorder that visits children last to first, reversed, is a postorder in
+        # which children keep their original order
+        order = []
+        stack = list(self.roots)
+        while stack:
+            position = stack.pop()
+            order.append(position)
+            stack.extend(self.nodes[position].children)
+        return reversed(order)
+
+    def depth(self):
+        """Number of levels in the tree."""
+        return max((depth + 1 for _, depth in self.iter_preorder()), default=0)
+
+    def leaves(self):
+        return [position for position, node in enumerate(self.nodes) if not node.children]
+
+    def path_to_root(self, node_id):
+        """Return the node IDs from a node up to its root."""
+        path = []
+        position = self.index[node_id]
+        while position is not None:
+            path.append(self.nodes[position].id)
+            position = self.nodes[position].parent
+        return path
+
+    # ------------------ Validation ------------------ #
+
+    def validate(self):
+        """
+        Return the problems found while building the tree (duplicate IDs, orphans,
+        cycles, nodes with several parents) and nodes no root leads to.
+
+        Returns:
+            list: Human readable problem descriptions; empty if the tree is sound
+        """
+        problems = list(self.issues)
+        unreachable = len(self.nodes) - sum(1 for _ in self.iter_preorder())
+        if unreachable > 0:
+            problems.append(f"{unreachable} nodes are not reachable from a root")
+        return problems
+
+    # ------------------ Export ------------------ #
+
+    def to_dict(self):
+        """
+        Return the tree in the nested JSON format of create_attack_tree_schema, or,
+        if it is deeper than MAX_NESTED_DEPTH, as a flat node list in preorder whose
+        nodes carry their parent's ID instead of children. from_dict reads both.
+        """
+        if self.depth() > MAX_NESTED_DEPTH:
+            return {"nodes": [
+                {
+                    "id": self.nodes[position].id,
+                    "label": self.nodes[position].label,
+                    **self.nodes[position].attributes(),
+                    "parent": None if self.nodes[position].parent is None else self.nodes[self.nodes[position].parent].id,
+                }
+                for position, _ in self.iter_preorder()
+            ]}
+        converted = [None] * len(self.nodes)
+        for position in self.iter_postorder():
+            node = self.nodes[position]
+            converted[position] = {
+                "id": node.id,
+                "label": node.label,
+                **node.attributes(),
+                "children": [converted[child] for child in node.children],
+            }
+        return {"nodes": [converted[root] for root in self.roots]}
+
+    def to_json(self, indent=2):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def _safe_ids(self):
+        # IDs from models may contain spaces or punctuation; map them to unique safe IDs
+        safe, taken = [], set()
+        for node in self.nodes:
+            candidate = base = SAFE_ID_RE.sub("_", node.id) or "node"
+            counter = 2
+            while candidate in taken:
+                candidate = f"{base}_{counter}"
+                counter += 1
+            taken.add(candidate)
+            safe.append(candidate)
+        return safe
+
+    def to_mermaid(self):
+        """Return the tree as a Mermaid flowchart, with AND gates drawn as hexagons."""
+        ids = self._safe_ids()
+        lines = ["graph TD"]
+        for position, _ in self.iter_preorder():
+            node = self.nodes[position]
+            label = node.label.replace('"', "#quot;").replace("\n", "<br>")
+            if node.gate == "AND":
+                lines.append(f'    {ids[position]}{{{{"{label}"}}}}')
+            else:
+                lines.append(f'    {ids[position]}["{label}"]')
+            if node.gate != "OR" or node.cost is not None or node.skill is not None or node.probability is not None:
+                lines.append(f"    %% attrs {ids[position]} {json.dumps(node.attributes())}")
+            if node.parent is not None:
+                lines.append(f"    {ids[node.parent]} --> {ids[position]}")
+        return "\n".join(lines)
+
+    def to_dot(self, name="attack_tree"):
+        """Return the tree as a Graphviz DOT digraph."""
+        ids = self._safe_ids()
+        lines = [f"digraph {SAFE_ID_RE.sub('_', name)} {{", "    rankdir=TB;", '    node [shape=box, style="rounded,filled", fillcolor="#ECECFF"];']
+        for position, _ in self.iter_preorder():
+            node = self.nodes[position]
+            label = node.label.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+            shape = ", shape=hexagon" if node.gate == "AND" else ""
+            lines.append(f'    {ids[position]} [label="{label}"{shape}];')
+            if node.parent is not None:
+                lines.append(f"    {ids[node.parent]} -> {ids[position]};")
+        lines.append("}")
+        return "\n".join(lines)
@@ -0,0 +1,338 @@
+"""
+Offline batch runner for threat modelling many applications at once.
+
+Prompts for every application are packaged into provider batch-API jobs (OpenAI
+Batch API or Anthropic Message Batches), which trade interactive latency for
+higher throughput and lower cost. The run has two rounds: threat models and attack
+trees first, then mitigations, DREAD assessments and test cases built from each
+application's threat model. Results are written to one directory per application.
+
+Usage:
+    python batch_runner.py apps.json --provider openai --model gpt-4o --output batch-output
+
+apps.json is a list of objects with the keys "name", "app_type", "authentication",
+"internet_facing", "sensitive_data" and "app_input". API keys are read from
+OPENAI_API_KEY / ANTHROPIC_API_KEY (or a .env file). Set --base-url to run against
+llm_stub_server.py offline.
+"""
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+
+from dotenv import load_dotenv
+
+from threat_model import create_threat_model_prompt, json_to_markdown
+from threat_record import normalize_threat_model
+from attack_tree import create_attack_tree_prompt, create_json_structure_prompt, clean_json_response, convert_tree_to_mermaid
+from mitigations import MITIGATIONS_SYSTEM_PROMPT, create_mitigations_prompt, mitigations_json_to_markdown, parse_mitigations
+from dread import create_dread_assessment_prompt, dread_json_to_markdown
+from test_cases import create_test_cases_prompt
+from providers import openai_client, anthropic_client, anthropic_content
+from utils import extract_mermaid_code, stage_prompt
+from portfolio_index import PortfolioIndex, import_batch_output
+
+JSON_SYSTEM_PROMPT = "You are a helpful assistant designed to output JSON."
+TEST_CASES_SYSTEM_PROMPT = "You are a helpful assistant that provides Gherkin test cases in Markdown format."
+
+# Batch states after which polling stops
+OPENAI_FINAL_STATES = ("completed", "failed", "expired", "cancelled")
+
+DEFAULT_MAX_TOKENS = 4000
+
+
+class BatchRequest:
+    """One prompt in a batch job; custom_id identifies the application and stage."""
+
+    def __init__(self, custom_id, prompt, system_prompt, json_mode=False, max_tokens=DEFAULT_MAX_TOKENS):
+        self.custom_id = custom_id
+        self.system_prompt, self.prompt = stage_prompt(system_prompt, prompt)
+        self.json_mode = json_mode
+        self.max_tokens = max_tokens
+
+
+class OpenAIBatchBackend:
+    """Runs batch requests through the OpenAI Batch API (/v1/chat/completions)."""
+
+    def __init__(self, model, api_key=None, base_url=None):
+        self.model = model
+        kwargs = {"api_key": api_key or os.getenv("OPENAI_API_KEY", "")}
+        if base_url:
+            kwargs["base_url"] = base_url
+        self.client = openai_client(**kwargs)
+
+    def submit(self, requests):
+        lines = []
+        for request in requests:
+            body = {
+                "model": self.model,
+                "messages": [
+                    {"role": "system", "content": request.system_prompt},
+                    {"role": "user", "content": request.prompt},
+                ],
+                "max_tokens": request.max_tokens,
+            }
+            if request.json_mode:
+                body["response_format"] = {"type": "json_object"}
+            lines.append(json.dumps({"custom_id": request.custom_id, "method": "POST", "url": "/v1/chat/completions", "body": body}))
+
+        batch_file = self.client.files.create(
+            file=("batch.jsonl", io.BytesIO("\n".join(lines).encode())),
+            purpose="batch",
+        )
+        batch = self.client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return batch.id
+
+    def is_done(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        return batch.status in OPENAI_FINAL_STATES, batch.status
+
+    def results(self, batch_id):
+        batch = self.client.batches.retrieve(batch_id)
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                response = entry.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[entry["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+                else:
+                    results[entry["custom_id"]] = RuntimeError(str(entry.get("error") or response.get("body")))
+        return results
+
+
+class AnthropicBatchBackend:
+    """Runs batch requests through the Anthropic Message Batches API."""
+
+    def __init__(self, model, api_key=None, base_url=None):
+        self.model = model
+        kwargs = {"api_key": api_key or os.getenv("ANTHROPIC_API_KEY", "")}
+        if base_url:
+            kwargs["base_url"] = base_url
+        self.client = anthropic_client(**kwargs)
+
+    def submit(self, requests):
+        batch = self.client.messages.batches.create(requests=[
+            {
+                "custom_id": request.custom_id,
+                "params": {
+                    "model": self.model,
+                    "max_tokens": request.max_tokens,
+                    "system": request.system_prompt,
+                    # Prompts sharing an application or threat list reuse the cached prefix
+                    "messages": [{"role": "user", "content": anthropic_content(request.prompt)}],
+                },
+            }
+            for request in requests
+        ])
+        return batch.id
+
+    def is_done(self, batch_id):
+        batch = self.client.messages.batches.retrieve(batch_id)
+        return batch.processing_status == "ended", batch.processing_status
+
+    def results(self, batch_id):
+        results = {}
+        for entry in self.client.messages.batches.results(batch_id):
+            if entry.result.type == "succeeded":
+                results[entry.custom_id] = ''.join(
+                    block.text for block in entry.result.message.content if block.type == "text"
+                )
+            else:
+                results[entry.custom_id] = RuntimeError(f"request {entry.result.type}")
+        return results
+
+
+BACKENDS = {
+    "openai": OpenAIBatchBackend,
+    "anthropic": AnthropicBatchBackend,
+}
+
+
+def wait_for_batch(backend, batch_id, initial_interval=5, max_interval=300, timeout=24 * 3600, sleep=time.sleep, log=print):
+    """
+    Poll a batch until it finishes, backing off exponentially between polls.
+
+    Raises:
+        TimeoutError: If the batch has not finished within the timeout
+    """
+    interval = initial_interval
+    waited = 0
+    while True:
+        done, status = backend.is_done(batch_id)
+        if done:
+            log(f"Batch {batch_id} finished with status {status}")
+            return status
+        if waited >= timeout:
+            raise TimeoutError(f"Batch {batch_id} did not finish within {timeout} seconds (status {status})")
+        log(f"Batch {batch_id} is {status}; checking again in {interval:.0f}s")
+        sleep(interval)
+        waited += interval
+        interval = min(interval * 2, max_interval)
+
+
+def run_batch(backend, requests, poll_options=None):
+    """Submit requests as one batch job, wait for it and return the results by custom_id."""
+    if not requests:
+        return {}
+    batch_id = backend.submit(requests)
+    wait_for_batch(backend, batch_id, **(poll_options or {}))
+    return backend.results(batch_id)
+
+
+def app_directory_name(app, index):
+    name = app.get("name") or f"app-{index + 1}"
+    return re.sub(r'[^A-Za-z0-9._-]+', '-', name).strip('-') or f"app-{index + 1}"
+
+
+def parse_json_result(result):
+    if isinstance(result, Exception):
+        raise result
+    return json.loads(clean_json_response(result))
+
+
+def run(apps, backend, output_dir, language="en", poll_options=None, log=print):
+    """
+    Run the full threat modelling pipeline for a list of applications using batch jobs.
+
+    Returns:
+        dict: Mapping of application directory name to the list of stages that failed
+    """
+    names = [app_directory_name(app, index) for index, app in enumerate(apps)]
+    failures = {name: [] for name in names}
+
+    def write(name, file_name, content):
+        app_dir = os.path.join(output_dir, name)
+        os.makedirs(app_dir, exist_ok=True)
+        with open(os.path.join(app_dir, file_name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    # Round 1: threat models and attack trees only need the application details
+    first_round = []
+    for name, app in zip(names, apps):
+        details = (app.get("app_type", ""), app.get("authentication", []), app.get("internet_facing", ""),
+                   app.get("sensitive_data", ""), app.get("app_input", ""))
+        first_round.append(BatchRequest(f"{name}:threat_model", create_threat_model_prompt(*details, language), JSON_SYSTEM_PROMPT, json_mode=True))
+        first_round.append(BatchRequest(f"{name}:attack_tree", create_attack_tree_prompt(*details, language), create_json_structure_prompt(language)))
+
+    log(f"Submitting {len(first_round)} threat model and attack tree requests")
+    results = run_batch(backend, first_round, poll_options)
+
+    threat_models = {}
+    for name in names:
+        try:
+            output = parse_json_result(results.get(f"{name}:threat_model", RuntimeError("missing result")))
+            output["threat_model"] = [threat.to_dict() for threat in normalize_threat_model(output.get("threat_model", []))]
+            threat_models[name] = output["threat_model"]
+            write(name, "threat_model.json", json.dumps(output, ensure_ascii=False, indent=2))
+            write(name, "threat_model.md", json_to_markdown(threat_models[name], output.get("improvement_suggestions", []), language))
+        except Exception as e:
+            failures[name].append(f"threat_model: {e}")
+
+        result = results.get(f"{name}:attack_tree", RuntimeError("missing result"))
+        try:
+            mermaid_code = convert_tree_to_mermaid(parse_json_result(result))
+        except (json.JSONDecodeError, KeyError, TypeError):
+            mermaid_code = extract_mermaid_code(result)
+        except Exception as e:
+            failures[name].append(f"attack_tree: {e}")
+            mermaid_code = None
+        if mermaid_code:
+            write(name, "attack_tree.mmd", mermaid_code)
+
+    # Round 2: downstream stages are built from each application's threat model
+    second_round = []
+    for name in names:
+        if not threat_models.get(name):
+            continue
+        threats_markdown = json_to_markdown(threat_models[name], [], language)
+        second_round.append(BatchRequest(f"{name}:mitigations", create_mitigations_prompt(threats_markdown, language), MITIGATIONS_SYSTEM_PROMPT, json_mode=True))
+        second_round.append(BatchRequest(f"{name}:dread", create_dread_assessment_prompt(threats_markdown, language), JSON_SYSTEM_PROMPT, json_mode=True))
+        second_round.append(BatchRequest(f"{name}:test_cases", create_test_cases_prompt(threats_markdown, language), TEST_CASES_SYSTEM_PROMPT))
+
+    log(f"Submitting {len(second_round)} mitigation, DREAD and test case requests")
+    results = run_batch(backend, second_round, poll_options)
+
+    for name in names:
+        if not threat_models.get(name):
+            continue
+        result = results.get(f"{name}:test_cases", RuntimeError("missing result"))
+        if isinstance(result, Exception):
+            failures[name].append(f"test_cases: {result}")
+        else:
+            write(name, "test_cases.md", result)
+        result = results.get(f"{name}:mitigations", RuntimeError("missing result"))
+        if isinstance(result, Exception):
+            failures[name].append(f"mitigations: {result}")
+        else:
+            # Markdown is rendered locally from the structured mitigations
+            try:
+                mitigations = parse_mitigations(result)
+            except ValueError as e:
+                failures[name].append(f"mitigations: {e}")
+            else:
+                write(name, "mitigations.json", json.dumps(mitigations, ensure_ascii=False, indent=2))
+                write(name, "mitigations.md", mitigations_json_to_markdown(mitigations, language))
+        try:
+            dread_assessment = parse_json_result(results.get(f"{name}:dread", RuntimeError("missing result")))
+            write(name, "dread.json", json.dumps(dread_assessment, ensure_ascii=False, indent=2))
+            write(name, "dread.md", dread_json_to_markdown(dread_assessment, language))
+        except Exception as e:
+            failures[name].append(f"dread: {e}")
+
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Threat model many applications with provider batch APIs.")
+    parser.add_argument("apps", help="JSON file with a list of applications")
+    parser.add_argument("--provider", choices=sorted(BACKENDS), default="openai")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--output", default="batch-output", help="Directory for per-application artefacts")
+    parser.add_argument("--language", choices=["en", "zh"], default="en")
+    parser.add_argument("--base-url", help="Override the provider API base URL, e.g. to use llm_stub_server.py")
+    parser.add_argument("--poll-interval", type=float, default=5, help="Initial seconds between status checks")
+    parser.add_argument("--max-poll-interval", type=float, default=300, help="Maximum seconds between status checks")
+    parser.add_argument("--timeout", type=float, default=24 * 3600, help="Seconds to wait for each batch")
+    parser.add_argument("--index", help="Also record the results in this portfolio index database (see portfolio_index.py)")
+    parser.add_argument("--commit", help="Commit the applications were modelled at, recorded in the portfolio index")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    with open(args.apps, encoding="utf-8") as f:
+        apps = json.load(f)
+
+    backend = BACKENDS[args.provider](args.model, base_url=args.base_url)
+    failures = run(apps, backend, args.output, args.language, poll_options={
+        "initial_interval": args.poll_interval,
+        "max_interval": args.max_poll_interval,
+        "timeout": args.timeout,
+    })
+
+    if args.index:
+        index = PortfolioIndex(args.index)
+        count = import_batch_output(index, args.output, commit=args.commit,
+                                    apps={app_directory_name(app, position): app for position, app in enumerate(apps)},
+                                    provider=args.provider, model=args.model, language=args.language)
+        print(f"Recorded {count} applications in {index.path}")
+
+    failed = {name: stages for name, stages in failures.items() if stages}
+    for name, stages in failed.items():
+        print(f"{name}: " + "; ".join(stages))
+    print(f"Wrote artefacts for {len(apps)} applications to {args.output} ({len(failed)} with failures)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
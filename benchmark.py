@@ -0,0 +1,358 @@
+"""
+Offline benchmark of the analysis pipeline.
+
+Boots llm_stub_server.py in-process, then repeatedly drives the full pipeline against
+it: repository analysis of fixture repositories (tarballs or directories), then the
+threat model, attack tree, mitigations, DREAD and test case stages, each split into
+prompt building, the provider call, and parsing/rendering. The stub's latency, token
+rate and failure injection simulate a real provider deterministically, so runs are
+comparable without API keys or network access.
+
+Reports throughput and p50/p95/p99 latency per stage, and stores the results as JSON
+so that runs can be compared:
+
+    python benchmark.py --fixture repo.tar.gz --iterations 50 --concurrency 4 --latency 0.2 --token-rate 200
+    python benchmark.py --provider ollama --failure-rate 0.1 --compare benchmark-results/20260101-120000.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from threat_model import create_threat_model_prompt, get_threat_model, get_threat_model_ollama, json_to_markdown
+from attack_tree import create_attack_tree_prompt, get_attack_tree, get_attack_tree_ollama, convert_tree_to_mermaid
+from mitigations import create_mitigations_prompt, get_mitigations, get_mitigations_ollama, mitigations_json_to_markdown
+from dread import create_dread_assessment_prompt, get_dread_assessment, get_dread_assessment_ollama, dread_json_to_markdown
+from test_cases import create_test_cases_prompt, get_test_cases, get_test_cases_ollama
+from repo_analysis import DescriptionBuilder, estimate_tokens, is_candidate_file, iter_ranked_summaries, rank_files, summarize_file
+from llm_stub_server import create_server
+
+DEFAULT_OUTPUT_DIR = "benchmark-results"
+
+PERCENTILES = (50, 95, 99)
+
+# Used as the application description when no fixture repository is given
+SAMPLE_APP_INPUT = (
+    "A web application that allows users to create, store, and share personal notes. The application is "
+    "built using the React frontend framework and a Node.js backend with a MongoDB database. Users can sign "
+    "up for an account and log in using OAuth2 with Google or Facebook."
+)
+
+SAMPLE_APP_DETAILS = ("Web application", ["OAuth2"], "Yes", "High")
+
+
+def load_fixture(path):
+    """
+    Read a fixture repository from a tarball or a directory.
+
+    Returns:
+        dict: Mapping of repository-relative file path to text content
+    """
+    files = {}
+    if os.path.isdir(path):
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in names:
+                full_path = os.path.join(root, name)
+                with open(full_path, "rb") as f:
+                    files[os.path.relpath(full_path, path).replace(os.sep, "/")] = f.read().decode("utf-8", errors="replace")
+        return files
+
+    with tarfile.open(path) as archive:
+        for member in archive.getmembers():
+            if member.isfile():
+                files[member.name] = archive.extractfile(member).read().decode("utf-8", errors="replace")
+
+    # Archives such as GitHub's tarballs put every file below a single top-level directory
+    prefixes = {name.split("/", 1)[0] for name in files}
+    if len(prefixes) == 1 and all("/" in name for name in files):
+        files = {name.split("/", 1)[1]: content for name, content in files.items()}
+    return files
+
+
+def analyze_fixture(files, token_limit):
+    """The offline part of repository analysis: select, rank, summarize and budget files."""
+    analysis_token_limit = int(token_limit * 0.7)
+    code_files = rank_files([path for path in files if is_candidate_file(path)])
+
+    description = DescriptionBuilder("gpt-4o")
+    readme = next((path for path in files if path.lower() == "readme.md"), None)
+    if readme:
+        description.append(files[readme] + "\n", section="README.md Content")
+
+    token_budget = analysis_token_limit - description.token_count
+    for path, summary in iter_ranked_summaries(code_files, lambda path: summarize_file(path, files[path]), token_budget):
+        summary_tokens = estimate_tokens(summary)
+        if description.token_count + summary_tokens > analysis_token_limit:
+            break
+        description.append(summary + "\n", section=f"{path.split('.')[-1].upper()} Files", tokens=summary_tokens)
+    return description.build()
+
+
+def provider_calls(provider, base_url, model):
+    """Return the per-stage provider functions, bound to the stub server."""
+    if provider == "ollama":
+        return {
+            "threat_model": lambda prompt: get_threat_model_ollama(base_url, model, prompt),
+            "attack_tree": lambda prompt: get_attack_tree_ollama(base_url, model, prompt),
+            "mitigations": lambda prompt: get_mitigations_ollama(base_url, model, prompt),
+            "dread": lambda prompt: get_dread_assessment_ollama(base_url, model, prompt),
+            "test_cases": lambda prompt: get_test_cases_ollama(base_url, model, prompt),
+        }
+
+    # The OpenAI SDK picks the stub up from OPENAI_BASE_URL
+    os.environ["OPENAI_BASE_URL"] = f"{base_url}/v1"
+    return {
+        "threat_model": lambda prompt: get_threat_model("stub-key", model, prompt),
+        "attack_tree": lambda prompt: get_attack_tree("stub-key", model, prompt),
+        "mitigations": lambda prompt: get_mitigations("stub-key", model, prompt),
+        "dread": lambda prompt: get_dread_assessment("stub-key", model, prompt),
+        "test_cases": lambda prompt: get_test_cases("stub-key", model, prompt),
+    }
+
+
+class Recorder:
+    """Collects latency samples and error counts per stage, thread-safely."""
+
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def time(self, name, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception:
+            with self.lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        finally:
+            with self.lock:
+                self.samples.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+
+
+def run_stage(recorder, stage, build_prompt, call, render, max_retries=3):
+    """Run one stage like the app does: build the prompt, call the model with retries, render."""
+    start = time.perf_counter()
+    try:
+        prompt = recorder.time(f"{stage}.prompt", build_prompt)
+        for attempt in range(max_retries):
+            try:
+                output = recorder.time(f"{stage}.llm", call, prompt)
+                break
+            except Exception:
+                if attempt == max_retries - 1:
+                    raise
+        return output, recorder.time(f"{stage}.render", render, output)
+    finally:
+        with recorder.lock:
+            recorder.samples.setdefault(stage, []).append((time.perf_counter() - start) * 1000)
+
+
+def run_pipeline(recorder, calls, app_input, language="en"):
+    """Run every stage once for an application description."""
+    details = SAMPLE_APP_DETAILS + (app_input,)
+
+    threat_model, threats_markdown = run_stage(
+        recorder, "threat_model",
+        lambda: create_threat_model_prompt(*details, language),
+        calls["threat_model"],
+        lambda output: json_to_markdown(output.get("threat_model", []), output.get("improvement_suggestions", []), language),
+    )
+    run_stage(
+        recorder, "attack_tree",
+        lambda: create_attack_tree_prompt(*details, language),
+        calls["attack_tree"],
+        lambda output: convert_tree_to_mermaid(output) if isinstance(output, dict) else output,
+    )
+
+    # Downstream stages use the threat list without the improvement suggestions
+    threats = json_to_markdown(threat_model.get("threat_model", []), [], language)
+    run_stage(recorder, "mitigations", lambda: create_mitigations_prompt(threats, language), calls["mitigations"], lambda output: mitigations_json_to_markdown(output, language))
+    run_stage(
+        recorder, "dread",
+        lambda: create_dread_assessment_prompt(threats, language),
+        calls["dread"],
+        lambda output: dread_json_to_markdown(output, language),
+    )
+    run_stage(recorder, "test_cases", lambda: create_test_cases_prompt(threats, language), calls["test_cases"], lambda output: output)
+    return threats_markdown
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-q * len(ordered) // 100))
+    return ordered[int(rank) - 1]
+
+
+def summarize(recorder, wall_seconds):
+    stats = {}
+    for name, samples in sorted(recorder.samples.items()):
+        stats[name] = {
+            "count": len(samples),
+            "errors": recorder.errors.get(name, 0),
+            "mean_ms": round(sum(samples) / len(samples), 3),
+            **{f"p{q}_ms": round(percentile(samples, q), 3) for q in PERCENTILES},
+            "throughput_per_s": round(len(samples) / wall_seconds, 3) if wall_seconds else 0.0,
+        }
+    return stats
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(iterations=10, concurrency=1, provider="openai", model="gpt-4o", fixtures=(), token_limit=64000,
+                  simulation=None, log=print):
+    """
+    Run the benchmark and return the results document.
+
+    Args:
+        iterations (int): Number of full pipeline runs
+        concurrency (int): Number of pipeline runs in flight at once
+        provider (str): "openai" or "ollama", the stub API to drive
+        model (str): Model name sent to the stub
+        fixtures (list): Fixture repository paths; with none, a fixed description is used
+        token_limit (int): Token limit for repository analysis
+        simulation (dict): latency, jitter, token_rate, failure_rate, failure_status and seed for the stub
+    """
+    simulation = simulation or {}
+    server = create_server("127.0.0.1", 0, batch_delay=0, **simulation)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    fixture_files = [load_fixture(path) for path in fixtures]
+    calls = provider_calls(provider, base_url, model)
+    recorder = Recorder()
+    failed_runs = 0
+
+    def one_run(index):
+        if fixture_files:
+            app_input = recorder.time("repo_analysis", analyze_fixture, fixture_files[index % len(fixture_files)], token_limit)
+        else:
+            app_input = SAMPLE_APP_INPUT
+        run_pipeline(recorder, calls, app_input)
+
+    log(f"Running {iterations} pipelines ({concurrency} at a time) against the {provider} stub at {base_url}")
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(one_run, index) for index in range(iterations)]:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed_runs += 1
+                    log(f"Pipeline failed: {e}")
+    finally:
+        wall_seconds = time.perf_counter() - start
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {
+            "iterations": iterations, "concurrency": concurrency, "provider": provider, "model": model,
+            "fixtures": list(fixtures), "token_limit": token_limit, "simulation": simulation,
+        },
+        "pipeline": {
+            "completed": iterations - failed_runs,
+            "failed": failed_runs,
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_per_min": round((iterations - failed_runs) / wall_seconds * 60, 3) if wall_seconds else 0.0,
+        },
+        "stub": {"requests": server.state.requests, "injected_failures": server.state.failures},
+        "stages": summarize(recorder, wall_seconds),
+    }
+
+
+def format_report(results, baseline=None):
+    """Format the per-stage table, with p50/p95 changes against a baseline run if given."""
+    lines = [f"{'stage':<24}{'count':>7}{'errors':>7}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'per s':>9}"]
+    for name, stats in results["stages"].items():
+        line = (f"{name:<24}{stats['count']:>7}{stats['errors']:>7}{stats['p50_ms']:>11.1f}"
+                f"{stats['p95_ms']:>11.1f}{stats['p99_ms']:>11.1f}{stats['throughput_per_s']:>9.2f}")
+        previous = (baseline or {}).get("stages", {}).get(name)
+        if previous:
+            changes = []
+            for key in ("p50_ms", "p95_ms"):
+                if previous[key]:
+                    changes.append(f"{key[:3]} {(stats[key] - previous[key]) / previous[key] * 100:+.1f}%")
+            line += "  " + ", ".join(changes)
+        lines.append(line)
+
+    pipeline = results["pipeline"]
+    lines.append("")
+    lines.append(f"Pipelines: {pipeline['completed']} completed, {pipeline['failed']} failed in {pipeline['wall_seconds']:.1f}s "
+                 f"({pipeline['throughput_per_min']:.1f} per minute)")
+    lines.append(f"Stub: {results['stub']['requests']} requests, {results['stub']['injected_failures']} injected failures")
+    if baseline:
+        lines.append(f"Compared with {baseline.get('timestamp')} (commit {baseline.get('commit')})")
+    return "\n".join(lines)
+
+
+def save_results(results, output_dir=DEFAULT_OUTPUT_DIR):
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline against a local LLM stub server.")
+    parser.add_argument("--iterations", type=int, default=10, help="Number of full pipeline runs")
+    parser.add_argument("--concurrency", type=int, default=1, help="Pipeline runs in flight at once")
+    parser.add_argument("--provider", choices=["openai", "ollama"], default="openai", help="Stub API to drive")
+    parser.add_argument("--model", default="gpt-4o")
+    parser.add_argument("--fixture", action="append", default=[], help="Fixture repository (tarball or directory); repeatable")
+    parser.add_argument("--token-limit", type=int, default=64000, help="Token limit for repository analysis")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the stub adds to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per request")
+    parser.add_argument("--token-rate", type=float, help="Stub output tokens per second")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of stub requests that fail")
+    parser.add_argument("--failure-status", type=int, default=500, help="HTTP status of injected failures")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for jitter and failure injection")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory for result files")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(
+        iterations=args.iterations,
+        concurrency=args.concurrency,
+        provider=args.provider,
+        model=args.model,
+        fixtures=args.fixture,
+        token_limit=args.token_limit,
+        simulation={
+            "latency": args.latency, "jitter": args.jitter, "token_rate": args.token_rate,
+            "failure_rate": args.failure_rate, "failure_status": args.failure_status, "seed": args.seed,
+        },
+    )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(format_report(results, baseline))
+    print(f"Results written to {save_results(results, args.output_dir)}")
+    return 1 if results["pipeline"]["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
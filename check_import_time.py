@@ -0,0 +1,105 @@
+"""
+Import-time budget check for the app's modules.
+
+Runs `python -X importtime` on the modules imported by main.py and fails if any
+provider SDK is loaded at import time, or if the total import time exceeds the
+budget. Run it from the repository root:
+
+    python check_import_time.py --budget-ms 2500
+"""
+import argparse
+import subprocess
+import sys
+
+# Modules imported by main.py at startup (main.py itself builds the UI on import)
+APP_MODULES = [
+    "threat_model",
+    "attack_tree",
+    "mitigations",
+    "dread",
+    "test_cases",
+    "providers",
+    "repo_analysis",
+    "github_graphql",
+    "http_cache",
+    "tracing",
+    "metrics",
+    "artefacts",
+    "mermaid_svg",
+    "attack_tree_graph",
+    "attack_tree_analysis",
+    "dread_analytics",
+    "portfolio_index",
+    "threat_record",
+    "i18n",
+    "utils",
+]
+
+# Heavy dependencies that must only be imported on first use
+LAZY_MODULES = ["openai", "anthropic", "mistralai", "groq", "google.genai", "zhipuai", "tiktoken", "github"]
+
+DEFAULT_BUDGET_MS = 2500
+
+
+def measure_imports(modules, python=sys.executable):
+    """
+    Import modules in a fresh interpreter with -X importtime.
+
+    Returns:
+        tuple: (mapping of every imported module to its cumulative import time in
+            microseconds, total time of the top-level imports in microseconds)
+    """
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    timings = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        # Format: "import time:   self [us] | cumulative | imported package", nested
+        # imports are indented below the module that imported them
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = int(cumulative)
+        if not name.startswith("  "):
+            total += int(cumulative)
+    return timings, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail if app startup imports exceed a time budget.")
+    parser.add_argument("--budget-ms", type=int, default=DEFAULT_BUDGET_MS, help="Total import time budget in milliseconds")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest modules to report")
+    args = parser.parse_args(argv)
+
+    try:
+        timings, total_us = measure_imports(APP_MODULES)
+    except RuntimeError as e:
+        print(f"Could not import the app modules: {e}")
+        return 2
+
+    failures = []
+    eager = [module for module in LAZY_MODULES if module in timings]
+    if eager:
+        failures.append(f"provider SDKs imported at startup: {', '.join(eager)}")
+
+    total_ms = total_us / 1000
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.0f} ms exceeds the budget of {args.budget_ms} ms")
+
+    print(f"Total import time: {total_ms:.0f} ms (budget {args.budget_ms} ms)")
+    for name, cumulative in sorted(timings.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,18 +2,28 @@ import json
 import requests
 import time
 import re
-from anthropic import Anthropic
-from mistralai import Mistral, UserMessage
-from openai import OpenAI, AzureOpenAI
 import streamlit as st
 
-from google import genai as google_genai
-from groq import Groq
-from zhipuai import ZhipuAI
-from utils import process_groq_response, create_reasoning_system_prompt
+from utils import process_groq_response, create_reasoning_system_prompt, create_threats_context, threat_id, CacheablePrompt, stage_prompt, stage_messages
+from providers import openai_client, azure_openai_client, anthropic_client, mistral_client, groq_client, google_client, google_genai_types, anthropic_content
+from artefacts import store_artefact
+from dread_analytics import DREAD_FACTORS, DreadTable
+from tracing import traced
 from i18n import get_prompt_language_suffix, get_text
 
-def dread_json_to_markdown(dread_assessment, language="en"):
+@traced()
+def dread_json_to_markdown(dread_assessment, language="en", weights="equal"):
+    """
+    Render a DREAD assessment as a Markdown table, highest risk first.
+
+    Args:
+        dread_assessment (dict): Assessment with a "Risk Assessment" list
+        language (str): Language code
+        weights: Weighting scheme name or five factor weights, see dread_analytics
+
+    Returns:
+        str: The Markdown table
+    """
     # Create a clean Markdown table with proper spacing using i18n
     markdown_output = f"| Threat Type | Scenario | {get_text('dread_damage_potential', language)} | {get_text('dread_reproducibility', language)} | {get_text('dread_exploitability', language)} | {get_text('dread_affected_users', language)} | {get_text('dread_discoverability', language)} | Risk Score |\n"
     markdown_output += "|------------|----------|------------------|-----------------|----------------|----------------|-----------------|------------|\n"
@@ -26,35 +36,31 @@ def dread_json_to_markdown(dread_assessment, language="en"):
         if not threats:
             markdown_output += "| No threats found | Please generate a threat model first | - | - | - | - | - | - |\n"
             return markdown_output
+
+        # Score all threats at once and list them by risk
+        table = DreadTable.from_assessment(dread_assessment)
+        risk_scores = table.scores(weights)
+        for index in table.ranking(weights).tolist():
+            threat = table.threats[index]
+            # Get values with defaults
+            threat_type = threat.get('Threat Type', 'N/A')
+            scenario = threat.get('Scenario', 'N/A')
+            
+            # Escape any pipe characters in text fields to prevent table formatting issues
+            threat_type = str(threat_type).replace('|', '\\|')
+            scenario = str(scenario).replace('|', '\\|')
+            
+            # Ensure scenario text doesn't break table formatting by limiting length and removing newlines
+            if len(scenario) > 100:
+                scenario = scenario[:97] + "..."
+            scenario = scenario.replace('\n', ' ').replace('\r', '')
             
+            factors = " | ".join(str(threat.get(factor, 0)) for factor in DREAD_FACTORS)
+            markdown_output += f"| {threat_type} | {scenario} | {factors} | {risk_scores[index]:.2f} |\n"
+
+        # Non-dictionary entries cannot be scored and are flagged at the end
         for threat in threats:
-            # Check if threat is a dictionary
-            if isinstance(threat, dict):
-                # Get values with defaults
-                threat_type = threat.get('Threat Type', 'N/A')
-                scenario = threat.get('Scenario', 'N/A')
-                damage_potential = threat.get('Damage Potential', 0)
-                reproducibility = threat.get('Reproducibility', 0)
-                exploitability = threat.get('Exploitability', 0)
-                affected_users = threat.get('Affected Users', 0)
-                discoverability = threat.get('Discoverability', 0)
-                
-                # Calculate the Risk Score
-                risk_score = (damage_potential + reproducibility + exploitability + affected_users + discoverability) / 5
-                
-                # Escape any pipe characters in text fields to prevent table formatting issues
-                threat_type = str(threat_type).replace('|', '\\|')
-                scenario = str(scenario).replace('|', '\\|')
-                
-                # Ensure scenario text doesn't break table formatting by limiting length and removing newlines
-                if len(scenario) > 100:
-                    scenario = scenario[:97] + "..."
-                scenario = scenario.replace('\n', ' ').replace('\r', '')
-                
-                # Add the row to the table with proper formatting
-                markdown_output += f"| {threat_type} | {scenario} | {damage_potential} | {reproducibility} | {exploitability} | {affected_users} | {discoverability} | {risk_score:.2f} |\n"
-            else:
-                # Skip non-dictionary entries and log a warning
+            if not isinstance(threat, dict):
                 markdown_output += "| Invalid threat | Threat data is not in the correct format | - | - | - | - | - | - |\n"
     except Exception as e:
         # Add a note about the error and a placeholder row
@@ -65,17 +71,43 @@ def dread_json_to_markdown(dread_assessment, language="en"):
     return markdown_output
 
 
+def split_dread_assessment(dread_assessment, threat_ids):
+    """
+    Split a DREAD assessment into one row per threat, so rows can be reused when the
+    threat model changes.
+
+    Args:
+        dread_assessment (dict): Assessment with a "Risk Assessment" list
+        threat_ids (list): IDs of the threats the assessment was requested for
+
+    Returns:
+        list: The row of every threat in threat_ids, or None where the assessment
+        has no row for it
+    """
+    rows = [row for row in (dread_assessment or {}).get("Risk Assessment", [])
+            if isinstance(row, dict) and row.get("Threat Type") != "Error"]
+    by_id = {}
+    for row in rows:
+        by_id.setdefault(row.get("Threat ID") or threat_id(row.get("Threat Type", ""), row.get("Scenario", "")), row)
+    if not any(key in by_id for key in threat_ids) and len(rows) == len(threat_ids):
+        # The model changed the IDs and scenarios but kept the order
+        by_id = dict(zip(threat_ids, rows))
+    return [dict(by_id[key], **{"Threat ID": key}) if key in by_id else None for key in threat_ids]
+
+
 # Function to create a prompt to generate mitigating controls
+@traced()
 def create_dread_assessment_prompt(threats, language="en"):
     language_suffix = get_prompt_language_suffix(language)
 
-    if language == "zh":
-        prompt = f"""
-作为一名拥有超过20年STRIDE和DREAD威胁建模方法经验的网络安全专家，您的任务是为威胁模型中识别的威胁生成DREAD风险评估。
+    # The threat list comes first so it forms a prefix shared with the mitigations and test case prompts
+    context = create_threats_context(threats, language)
 
-以下是识别出的威胁列表：
-{threats}
+    if language == "zh":
+        instructions = f"""
+作为一名拥有超过20年STRIDE和DREAD威胁建模方法经验的网络安全专家，您的任务是为上面列出的威胁生成DREAD风险评估。
 提供风险评估时，使用JSON格式的响应，顶层键为"Risk Assessment"，威胁列表中的每个威胁都有以下子键：
+- "Threat ID": 上表中威胁的ID（例如，"T-3f9a0c12"），原样复制。
 - "Threat Type": 表示威胁类型的字符串（例如，"欺骗"）。
 - "Scenario": 描述威胁场景的字符串。
 - "Damage Potential": 1到10之间的整数。
@@ -91,6 +123,7 @@ def create_dread_assessment_prompt(threats, language="en"):
 {{
   "Risk Assessment": [
     {{
+      "Threat ID": "T-3f9a0c12",
       "Threat Type": "欺骗",
       "Scenario": "攻击者可以创建虚假的OAuth2提供者并诱骗用户通过它登录。",
       "Damage Potential": 8,
@@ -100,6 +133,7 @@ def create_dread_assessment_prompt(threats, language="en"):
       "Discoverability": 7
     }},
     {{
+      "Threat ID": "T-8b21d4e7",
       "Threat Type": "欺骗",
       "Scenario": "攻击者可以通过中间人（MitM）攻击拦截OAuth2令牌交换过程。",
       "Damage Potential": 8,
@@ -113,12 +147,11 @@ def create_dread_assessment_prompt(threats, language="en"):
 {language_suffix}
 """
     else:
-        prompt = f"""
+        instructions = f"""
 Act as a cyber security expert with more than 20 years of experience in threat modeling using STRIDE and DREAD methodologies.
-Your task is to produce a DREAD risk assessment for the threats identified in a threat model.
-Below is the list of identified threats:
-{threats}
+Your task is to produce a DREAD risk assessment for the threats listed above.
 When providing the risk assessment, use a JSON formatted response with a top-level key "Risk Assessment" and a list of threats, each with the following sub-keys:
+- "Threat ID": The ID of the threat from the table above (e.g., "T-3f9a0c12"), copied exactly.
 - "Threat Type": A string representing the type of threat (e.g., "Spoofing").
 - "Scenario": A string describing the threat scenario.
 - "Damage Potential": An integer between 1 and 10.
@@ -134,6 +167,7 @@ Ensure the JSON response is correctly formatted and does not contain any additio
 {{
   "Risk Assessment": [
     {{
+      "Threat ID": "T-3f9a0c12",
       "Threat Type": "Spoofing",
       "Scenario": "An attacker could create a fake OAuth2 provider and trick users into logging in through it.",
       "Damage Potential": 8,
@@ -143,6 +177,7 @@ Ensure the JSON response is correctly formatted and does not contain any additio
       "Discoverability": 7
     }},
     {{
+      "Threat ID": "T-8b21d4e7",
       "Threat Type": "Spoofing",
       "Scenario": "An attacker could intercept the OAuth2 token exchange process through a Man-in-the-Middle (MitM) attack.",
       "Damage Potential": 8,
@@ -155,7 +190,7 @@ Ensure the JSON response is correctly formatted and does not contain any additio
 }}
 {language_suffix}
 """
-    return prompt
+    return CacheablePrompt(context, instructions)
 
 def clean_json_response(response_text):
     import re
@@ -172,8 +207,9 @@ def clean_json_response(response_text):
     # If no code blocks, return the original text
     return response_text.strip()
 
+@traced()
 def get_dread_assessment(api_key, model_name, prompt, language="en"):
-    client = OpenAI(api_key=api_key)
+    client = openai_client(api_key=api_key)
 
     # For reasoning models (o1, o3, o3-mini, o4-mini), use a structured system prompt
     if model_name in ["o1", "o3", "o3-mini", "o4-mini"]:
@@ -197,6 +233,7 @@ def get_dread_assessment(api_key, model_name, prompt, language="en"):
      * Assess how easily the vulnerability can be found
      * Consider visibility and detection methods
 2. Format output as JSON with 'Risk Assessment' array containing:
+   - Threat ID
    - Threat Type
    - Scenario
    - Numerical scores (1-10) for each DREAD category"""
@@ -207,10 +244,7 @@ def get_dread_assessment(api_key, model_name, prompt, language="en"):
     response = client.chat.completions.create(
         model=model_name,
         response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages(system_prompt, prompt)
     )
     
     # Convert the JSON string in the 'content' field to a Python dictionary
@@ -222,8 +256,9 @@ def get_dread_assessment(api_key, model_name, prompt, language="en"):
     
     return dread_assessment
 
+@traced()
 def get_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, language="en"):
-    client = AzureOpenAI(
+    client = azure_openai_client(
         azure_endpoint = azure_api_endpoint,
         api_key = azure_api_key,
         api_version = azure_api_version,
@@ -232,10 +267,7 @@ def get_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_vers
     response = client.chat.completions.create(
         model = azure_deployment_name,
         response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant designed to output JSON.", prompt)
     )
 
     # Convert the JSON string in the 'content' field to a Python dictionary
@@ -248,22 +280,24 @@ def get_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_vers
     return dread_assessment
 
 # Function to get DREAD risk assessment from the Google model's response.
+@traced()
 def get_dread_assessment_google(google_api_key, google_model, prompt, language="en"):
     """
     Generate a DREAD risk assessment using the Gemini API (Google AI) as per official documentation:
     https://ai.google.dev/gemini-api/docs/text-generation
     """
-    client = google_genai.Client(api_key=google_api_key)
+    client = google_client(api_key=google_api_key)
+    google_types = google_genai_types()
     system_instruction = (
         "You are a helpful assistant designed to output JSON. "
         "Only provide the DREAD risk assessment in JSON format with no additional text. "
         "Do not wrap the output in a code block."
     )
+    system_instruction, prompt = stage_prompt(system_instruction, prompt)
 
     is_gemini_2_5 = "gemini-2.5" in google_model.lower()
 
     try:
-        from google.genai import types as google_types
         if is_gemini_2_5:
             config = google_types.GenerateContentConfig(
                 system_instruction=system_instruction,
@@ -288,7 +322,7 @@ def get_dread_assessment_google(google_api_key, google_model, prompt, language="
                         thinking_content.append(str(part.thought))
         if thinking_content:
             joined_thinking = "\n\n".join(thinking_content)
-            st.session_state['last_thinking_content'] = joined_thinking
+            store_artefact('last_thinking_content', joined_thinking)
     except Exception as e:
         st.error(f"Error generating DREAD assessment with Google AI: {str(e)}")
         return {"Risk Assessment": []}
@@ -302,14 +336,15 @@ def get_dread_assessment_google(google_api_key, google_model, prompt, language="
         return {}
 
 # Function to get DREAD risk assessment from the Mistral model's response.
+@traced()
 def get_dread_assessment_mistral(mistral_api_key, mistral_model, prompt, language="en"):
-    client = Mistral(api_key=mistral_api_key)
+    client = mistral_client(api_key=mistral_api_key)
 
     response = client.chat.complete(
         model=mistral_model,
         response_format={"type": "json_object"},
         messages=[
-            UserMessage(content=prompt)
+            {"role": "user", "content": prompt}
         ]
     )
 
@@ -322,6 +357,7 @@ def get_dread_assessment_mistral(mistral_api_key, mistral_model, prompt, languag
     return dread_assessment
 
 # Function to get DREAD risk assessment from Ollama hosted LLM.
+@traced()
 def get_dread_assessment_ollama(ollama_endpoint, ollama_model, prompt, language="en"):
     """
     Get DREAD risk assessment from Ollama hosted LLM.
@@ -351,10 +387,7 @@ def get_dread_assessment_ollama(ollama_endpoint, ollama_model, prompt, language=
         "model": ollama_model,
         "stream": False,
         "format": "json",
-        "messages": [
-            {
-                "role": "system", 
-                "content": """You are a cyber security expert with more than 20 years experience of using the DREAD risk assessment methodology to evaluate security threats. Your task is to analyze the provided application description and perform a DREAD assessment.
+        "messages": stage_messages("""You are a cyber security expert with more than 20 years experience of using the DREAD risk assessment methodology to evaluate security threats. Your task is to analyze the provided application description and perform a DREAD assessment.
 
 Please provide your response in JSON format with the following structure:
 {
@@ -369,13 +402,7 @@ Please provide your response in JSON format with the following structure:
             "risk_score": "Calculated total score"
         }
     ]
-}"""
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
+}""", prompt)
     }
 
     for attempt in range(max_retries):
@@ -402,8 +429,9 @@ Please provide your response in JSON format with the following structure:
             continue
 
 # Function to get DREAD risk assessment from the Anthropic model's response.
+@traced()
 def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, language="en"):
-    client = Anthropic(api_key=anthropic_api_key)
+    client = anthropic_client(api_key=anthropic_api_key)
     
     # Check if we're using extended thinking mode
     is_thinking_mode = "thinking" in anthropic_model.lower()
@@ -413,6 +441,11 @@ def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, l
     
     # If using thinking mode, use the actual model name without the "thinking" suffix
     actual_model = "claude-3-7-sonnet-latest" if is_thinking_mode else anthropic_model
+
+    system_prompt, prompt = stage_prompt(
+        "You are a JSON-generating assistant. You must ONLY output valid, parseable JSON with no additional text or formatting.",
+        prompt
+    )
     
     try:
         # Configure the request based on whether thinking mode is enabled
@@ -424,9 +457,9 @@ def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, l
                     "type": "enabled",
                     "budget_tokens": 16000
                 },
-                system="You are a JSON-generating assistant. You must ONLY output valid, parseable JSON with no additional text or formatting.",
+                system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt + "\n\nIMPORTANT: Your response MUST be a valid JSON object with the exact structure shown in the example above. Do not include any explanatory text, markdown formatting, or code blocks. Return only the raw JSON object."}
+                    {"role": "user", "content": anthropic_content(prompt, "\n\nIMPORTANT: Your response MUST be a valid JSON object with the exact structure shown in the example above. Do not include any explanatory text, markdown formatting, or code blocks. Return only the raw JSON object.")}
                 ],
                 timeout=600  # 10-minute timeout
             )
@@ -434,9 +467,9 @@ def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, l
             response = client.messages.create(
                 model=actual_model,
                 max_tokens=4096,
-                system="You are a JSON-generating assistant. You must ONLY output valid, parseable JSON with no additional text or formatting.",
+                system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=300  # 5-minute timeout
             )
@@ -450,7 +483,7 @@ def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, l
                 # Store thinking content in session state for debugging/transparency (optional)
                 thinking_content = ''.join(block.thinking for block in response.content if block.type == "thinking")
                 if thinking_content:
-                    st.session_state['last_thinking_content'] = thinking_content
+                    store_artefact('last_thinking_content', thinking_content)
             else:
                 # Standard handling for regular responses
                 response_text = response.content[0].text
@@ -508,8 +541,9 @@ def get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, prompt, l
         return fallback_assessment
 
 # Function to get DREAD risk assessment from LM Studio Server response.
+@traced()
 def get_dread_assessment_lm_studio(lm_studio_endpoint, model_name, prompt, language="en"):
-    client = OpenAI(
+    client = openai_client(
         base_url=f"{lm_studio_endpoint}/v1",
         api_key="not-needed"  # LM Studio Server doesn't require an API key
     )
@@ -527,6 +561,7 @@ def get_dread_assessment_lm_studio(lm_studio_endpoint, model_name, prompt, langu
                         "items": {
                             "type": "object",
                             "properties": {
+                                "Threat ID": {"type": "string"},
                                 "Threat Type": {"type": "string"},
                                 "Scenario": {"type": "string"},
                                 "Damage Potential": {"type": "integer", "minimum": 1, "maximum": 10},
@@ -547,10 +582,7 @@ def get_dread_assessment_lm_studio(lm_studio_endpoint, model_name, prompt, langu
     response = client.chat.completions.create(
         model=model_name,
         response_format=dread_schema,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant designed to output JSON.", prompt)
     )
 
     # Convert the JSON string in the 'content' field to a Python dictionary
@@ -563,15 +595,13 @@ def get_dread_assessment_lm_studio(lm_studio_endpoint, model_name, prompt, langu
     return dread_assessment
 
 # Function to get DREAD risk assessment from the Groq model's response.
+@traced()
 def get_dread_assessment_groq(groq_api_key, groq_model, prompt, language="en"):
-    client = Groq(api_key=groq_api_key)
+    client = groq_client(api_key=groq_api_key)
     response = client.chat.completions.create(
         model=groq_model,
         response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant designed to output JSON.", prompt)
     )
 
     # Process the response using our utility function
@@ -589,6 +619,7 @@ def get_dread_assessment_groq(groq_api_key, groq_model, prompt, language="en"):
     return dread_assessment
 
 # Function to get DREAD assessment from GLM response
+@traced()
 def get_dread_assessment_glm(glm_api_key, glm_model, prompt, language="en"):
     """
     Get DREAD assessment from GLM (Zhipu AI) response.
@@ -601,7 +632,7 @@ def get_dread_assessment_glm(glm_api_key, glm_model, prompt, language="en"):
     Returns:
         dict: DREAD assessment data
     """
-    client = OpenAI(
+    client = openai_client(
     api_key= glm_api_key,
     base_url="https://open.bigmodel.cn/api/paas/v4/"
     )
@@ -609,10 +640,7 @@ def get_dread_assessment_glm(glm_api_key, glm_model, prompt, language="en"):
     try:
         response = client.chat.completions.create(
             model=glm_model,
-            messages=[
-                {"role": "system", "content": "You are a cybersecurity expert specializing in risk assessment. Generate a DREAD risk assessment in valid JSON format."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages("You are a cybersecurity expert specializing in risk assessment. Generate a DREAD risk assessment in valid JSON format.", prompt),
             temperature=0.7,
             max_tokens=4000,
             response_format={"type": "json_object"}
@@ -632,6 +660,7 @@ def get_dread_assessment_glm(glm_api_key, glm_model, prompt, language="en"):
         return {"Risk Assessment": []}
 
 # Function to get DREAD assessment from eCloud response
+@traced()
 def get_dread_assessment_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
     """
     Get DREAD assessment from eCloud response.
@@ -655,10 +684,7 @@ def get_dread_assessment_ecloud(ecloud_api_key, ecloud_model, prompt, language="
 
     data = {
         "model": ecloud_model,
-        "messages": [
-            {"role": "system", "content": "You are a cybersecurity expert specializing in risk assessment. Generate a DREAD risk assessment in valid JSON format."},
-            {"role": "user", "content": prompt}
-        ],
+        "messages": stage_messages("You are a cybersecurity expert specializing in risk assessment. Generate a DREAD risk assessment in valid JSON format.", prompt),
         "temperature": 0.7,
         "max_tokens": 4000,
         "stream": False,
@@ -0,0 +1,200 @@
+"""
+DREAD risk analytics.
+
+Loads the "Risk Assessment" list of one or more DREAD assessments into NumPy arrays
+(one row per threat, one column per DREAD factor) so that risk scores, rankings,
+per-STRIDE-category aggregates, percentile bands and heatmaps are computed in bulk.
+A portfolio of thousands of threats across services takes milliseconds.
+
+Risk scores are the weighted mean of the five factors. The "equal" scheme is the
+plain average shown in the DREAD tab; other schemes, or any five weights, can be
+passed wherever weights are accepted.
+"""
+import numpy as np
+
+DREAD_FACTORS = ["Damage Potential", "Reproducibility", "Exploitability", "Affected Users", "Discoverability"]
+
+# Weights for DREAD_FACTORS
+WEIGHTING_SCHEMES = {
+    "equal": (1, 1, 1, 1, 1),
+    # Damage and affected users count double, for business impact driven reviews
+    "impact": (2, 1, 1, 2, 1),
+    # Ignores discoverability, assuming every threat will eventually be found
+    "no_discoverability": (1, 1, 1, 1, 0),
+}
+
+STRIDE_CATEGORIES = ["Spoofing", "Tampering", "Repudiation", "Information Disclosure", "Denial of Service", "Elevation of Privilege"]
+
+# Spellings models use for the STRIDE categories, lower case
+STRIDE_ALIASES = {
+    "spoofing": "Spoofing", "欺骗": "Spoofing",
+    "tampering": "Tampering", "篡改": "Tampering",
+    "repudiation": "Repudiation", "否认": "Repudiation", "抵赖": "Repudiation",
+    "information disclosure": "Information Disclosure", "信息泄露": "Information Disclosure", "信息泄漏": "Information Disclosure",
+    "denial of service": "Denial of Service", "拒绝服务": "Denial of Service",
+    "elevation of privilege": "Elevation of Privilege", "权限提升": "Elevation of Privilege", "特权提升": "Elevation of Privilege",
+    "eop": "Elevation of Privilege", "dos": "Denial of Service",
+}
+
+DEFAULT_PERCENTILES = (50, 75, 90)
+
+
+def stride_category(threat_type):
+    """Map a threat type to its STRIDE category name, or return it unchanged."""
+    text = str(threat_type).strip()
+    return STRIDE_ALIASES.get(text.lower(), text or "Unknown")
+
+
+def _factor(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return min(max(number, 0.0), 10.0) if number == number else 0.0
+
+
+def resolve_weights(weights="equal"):
+    """
+    Return the five factor weights as an array.
+
+    Args:
+        weights (str or sequence): A WEIGHTING_SCHEMES name, a factor name to weight
+            mapping, or five weights in DREAD_FACTORS order
+
+    Raises:
+        ValueError: For unknown schemes or weights that are negative or all zero
+    """
+    if isinstance(weights, str):
+        if weights not in WEIGHTING_SCHEMES:
+            raise ValueError(f"Unknown weighting scheme '{weights}'")
+        weights = WEIGHTING_SCHEMES[weights]
+    elif isinstance(weights, dict):
+        weights = [weights.get(factor, 0) for factor in DREAD_FACTORS]
+    weights = np.asarray(weights, dtype=float)
+    if weights.shape != (len(DREAD_FACTORS),) or (weights < 0).any() or not weights.sum():
+        raise ValueError("Weights must be five non-negative numbers that are not all zero")
+    return weights
+
+
+class DreadTable:
+    """
+    DREAD factors of many threats in columnar form.
+
+    Attributes:
+        threats (list): The threat dicts, in input order
+        categories (ndarray): STRIDE category of every threat
+        services (ndarray): Service every threat belongs to
+        factors (ndarray): Threats x DREAD_FACTORS scores, clipped to 0-10
+    """
+
+    __slots__ = ("threats", "categories", "services", "factors")
+
+    def __init__(self, threats, services=None):
+        self.threats = threats
+        self.categories = np.array([stride_category(threat.get("Threat Type", "Unknown")) for threat in threats], dtype=object)
+        self.services = np.array(services if services is not None else [""] * len(threats), dtype=object)
+        self.factors = np.array([[_factor(threat.get(factor, 0)) for factor in DREAD_FACTORS] for threat in threats],
+                                dtype=float).reshape(len(threats), len(DREAD_FACTORS))
+
+    def __len__(self):
+        return len(self.threats)
+
+    @classmethod
+    def from_assessment(cls, dread_assessment, service=""):
+        """Load the "Risk Assessment" list of one DREAD assessment."""
+        threats = [threat for threat in (dread_assessment or {}).get("Risk Assessment", []) if isinstance(threat, dict)]
+        return cls(threats, [service] * len(threats))
+
+    @classmethod
+    def from_portfolio(cls, assessments):
+        """
+        Load the DREAD assessments of several services into one table.
+
+        Args:
+            assessments (dict): Service name -> DREAD assessment
+        """
+        threats, services = [], []
+        for service, dread_assessment in assessments.items():
+            service_threats = [threat for threat in (dread_assessment or {}).get("Risk Assessment", []) if isinstance(threat, dict)]
+            threats.extend(service_threats)
+            services.extend([service] * len(service_threats))
+        return cls(threats, services)
+
+    # ------------------ Scores ------------------ #
+
+    def scores(self, weights="equal"):
+        """Risk score of every threat: the weighted mean of its factors."""
+        weights = resolve_weights(weights)
+        return self.factors @ (weights / weights.sum())
+
+    def ranking(self, weights="equal"):
+        """Threat indices from highest to lowest risk; ties keep their input order."""
+        return np.argsort(-self.scores(weights), kind="stable")
+
+    def percentile_bands(self, weights="equal", percentiles=DEFAULT_PERCENTILES):
+        """
+        Place every threat in a band between score percentiles.
+
+        Returns:
+            tuple: (band index per threat, 0 below the first percentile and
+            len(percentiles) at or above the last; score threshold per percentile)
+        """
+        scores = self.scores(weights)
+        if not scores.size:
+            return np.zeros(0, dtype=int), np.zeros(len(percentiles))
+        thresholds = np.percentile(scores, percentiles)
+        return np.searchsorted(thresholds, scores, side="right"), thresholds
+
+    # ------------------ Aggregates ------------------ #
+
+    def _groups(self, by):
+        keys = self.categories if by == "category" else self.services
+        if by == "category":
+            present = set(keys.tolist())
+            names = [name for name in STRIDE_CATEGORIES if name in present] + sorted(present - set(STRIDE_CATEGORIES))
+        else:
+            names = sorted(set(keys.tolist()))
+        lookup = {name: position for position, name in enumerate(names)}
+        return names, np.array([lookup[key] for key in keys.tolist()], dtype=int)
+
+    def aggregates(self, weights="equal", by="category"):
+        """
+        Count, mean, maximum and high-risk share of the scores per STRIDE category or
+        per service.
+
+        Args:
+            weights: See resolve_weights
+            by (str): "category" or "service"
+
+        Returns:
+            list: One dict per group with name, count, mean, max and high (the share
+            of its threats in the top percentile band)
+        """
+        names, group = self._groups(by)
+        if not names:
+            return []
+        scores = self.scores(weights)
+        bands, _ = self.percentile_bands(weights)
+        count = np.bincount(group, minlength=len(names))
+        total = np.bincount(group, weights=scores, minlength=len(names))
+        high = np.bincount(group, weights=bands == len(DEFAULT_PERCENTILES), minlength=len(names))
+        highest = np.full(len(names), -np.inf)
+        np.maximum.at(highest, group, scores)
+        return [
+            {"name": name, "count": int(count[i]), "mean": float(total[i] / count[i]), "max": float(highest[i]),
+             "high": float(high[i] / count[i])}
+            for i, name in enumerate(names)
+        ]
+
+    def heatmap(self, by="category"):
+        """
+        Mean of every DREAD factor per STRIDE category or per service.
+
+        Returns:
+            tuple: (group names, DREAD_FACTORS, groups x factors array of means)
+        """
+        names, group = self._groups(by)
+        count = np.bincount(group, minlength=len(names))
+        sums = np.column_stack([np.bincount(group, weights=self.factors[:, column], minlength=len(names))
+                                for column in range(len(DREAD_FACTORS))]).reshape(len(names), len(DREAD_FACTORS))
+        return names, list(DREAD_FACTORS), sums / np.maximum(count, 1)[:, None]
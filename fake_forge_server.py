@@ -0,0 +1,308 @@
+"""
+Local fake of the GitHub and Gerrit APIs that serves one repository from disk.
+
+Serves a directory or tarball (for example one written by synthetic_repo.py) under
+any owner/name, so repository analysis can be benchmarked at scale without network
+access or rate limits. Implements the endpoints the app uses:
+
+    GitHub REST:  GET /repos/{owner}/{repo}, /branches/{branch}, /git/trees/{sha}?recursive=1,
+                  /contents/{path}?ref=...
+    GitHub GraphQL: POST /graphql with blob object(expression: "ref:path") lookups
+    Gerrit:       GET /projects/{project}, /projects/{project}/files/?recursive&limit=N,
+                  /projects/{project}/files/{path}/content
+
+Responses carry ETags and honour If-None-Match, and GitHub responses report a
+decreasing X-RateLimit-Remaining, so conditional requests and rate-limit metrics
+behave as they do against GitHub.
+
+Usage:
+    python fake_forge_server.py fixtures/repo-10k.tar.gz --port 8766
+    GITHUB_API_URL=http://localhost:8766 streamlit run main.py
+    (then analyze https://github.com/any/repo, or the Gerrit URL http://localhost:8766/project)
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import tarfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+DEFAULT_BRANCH = "main"
+
+RATE_LIMIT = 5000
+
+# Blobs larger than this are not returned as text, like GitHub's contents and GraphQL APIs
+MAX_TEXT_BYTES = 1_000_000
+
+# Gerrit prefixes JSON responses with this line to prevent XSSI
+GERRIT_MAGIC_PREFIX = ")]}'\n"
+
+
+def load_repository(path):
+    """
+    Read a repository from a directory or tarball.
+
+    Returns:
+        dict: Mapping of repository-relative path to content bytes
+    """
+    files = {}
+    if os.path.isdir(path):
+        for root, dirs, names in os.walk(path):
+            dirs[:] = [d for d in dirs if d != ".git"]
+            for name in names:
+                full_path = os.path.join(root, name)
+                with open(full_path, "rb") as f:
+                    files[os.path.relpath(full_path, path).replace(os.sep, "/")] = f.read()
+        return files
+
+    with tarfile.open(path) as archive:
+        for member in archive.getmembers():
+            if member.isfile():
+                files[member.name] = archive.extractfile(member).read()
+    return files
+
+
+def _git_sha(kind, data):
+    return hashlib.sha1(f"{kind} {len(data)}\0".encode() + data).hexdigest()
+
+
+class Repository:
+    """Files plus the git object IDs GitHub would report for them."""
+
+    def __init__(self, files):
+        self.files = files
+        self.blob_shas = {path: _git_sha("blob", content) for path, content in files.items()}
+
+        # Directory SHAs derive from their children, so a change anywhere changes its ancestors
+        children = {}
+        for path in files:
+            parts = path.split("/")
+            for depth in range(len(parts)):
+                children.setdefault("/".join(parts[:depth]), set()).add("/".join(parts[:depth + 1]))
+        self.tree_shas = {}
+        for directory in sorted(children, key=lambda d: d.count("/") if d else -1, reverse=True):
+            entries = "".join(f"{child}:{self.tree_shas.get(child) or self.blob_shas[child]}\n" for child in sorted(children[directory]))
+            self.tree_shas[directory] = _git_sha("tree", entries.encode())
+        self.commit_sha = _git_sha("commit", self.tree_shas[""].encode())
+
+    def tree_entries(self):
+        entries = [{"path": path, "mode": "040000", "type": "tree", "sha": sha}
+                   for path, sha in self.tree_shas.items() if path]
+        entries += [{"path": path, "mode": "100644", "type": "blob", "sha": self.blob_shas[path], "size": len(content)}
+                    for path, content in self.files.items()]
+        return sorted(entries, key=lambda entry: entry["path"])
+
+    def text(self, path):
+        """Return (text, is_binary, is_truncated) for a file."""
+        content = self.files[path]
+        if len(content) > MAX_TEXT_BYTES:
+            return None, False, True
+        try:
+            return content.decode("utf-8"), False, False
+        except UnicodeDecodeError:
+            return None, True, False
+
+
+class ForgeState:
+    def __init__(self, repository, latency=0.0):
+        self.repository = repository
+        self.latency = latency
+        self.rate_limit_remaining = RATE_LIMIT
+        self.requests = 0
+        self.not_modified = 0
+        self.lock = threading.Lock()
+
+
+class ForgeHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, data, content_type, etag=None, github=True):
+        with self.state.lock:
+            self.state.requests += 1
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        if etag and self.headers.get("If-None-Match") == f'"{etag}"':
+            with self.state.lock:
+                self.state.not_modified += 1
+            self.send_response(304)
+            self.send_header("ETag", f'"{etag}"')
+            self._rate_limit_headers(github, counted=False)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        if etag:
+            self.send_header("ETag", f'"{etag}"')
+        self._rate_limit_headers(github, counted=True)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _rate_limit_headers(self, github, counted):
+        if not github:
+            return
+        # Conditional requests answered with 304 do not count against GitHub's rate limit
+        with self.state.lock:
+            if counted:
+                self.state.rate_limit_remaining = max(0, self.state.rate_limit_remaining - 1)
+            remaining = self.state.rate_limit_remaining
+        self.send_header("X-RateLimit-Limit", str(RATE_LIMIT))
+        self.send_header("X-RateLimit-Remaining", str(remaining))
+
+    def _send_json(self, payload, etag=None):
+        data = json.dumps(payload).encode()
+        self._send(data, "application/json", etag=etag or hashlib.sha1(data).hexdigest())
+
+    def _send_gerrit(self, text, etag=None):
+        data = text.encode()
+        self._send(data, "application/json", etag=etag or hashlib.sha1(data).hexdigest(), github=False)
+
+    def _not_found(self):
+        data = json.dumps({"message": "Not Found"}).encode()
+        self.send_response(404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    # ------------------ GitHub ------------------ #
+
+    def _github(self, rest, query):
+        repository = self.state.repository
+        if not rest:
+            self._send_json({"name": "repo", "default_branch": DEFAULT_BRANCH, "private": False})
+        elif rest[0] == "branches" and len(rest) == 2:
+            self._send_json({"name": rest[1], "commit": {"sha": repository.commit_sha}})
+        elif rest[:2] == ["git", "trees"] and len(rest) == 3:
+            if "recursive" in query:
+                tree = repository.tree_entries()
+            else:
+                tree = [entry for entry in repository.tree_entries() if "/" not in entry["path"]]
+            self._send_json({"sha": repository.tree_shas[""], "tree": tree, "truncated": False}, etag=repository.tree_shas[""])
+        elif rest[0] == "contents" and len(rest) > 1:
+            path = "/".join(rest[1:])
+            if path not in repository.files:
+                self._not_found()
+                return
+            content = repository.files[path]
+            too_large = len(content) > MAX_TEXT_BYTES
+            self._send_json({
+                "type": "file", "name": path.rsplit("/", 1)[-1], "path": path, "sha": repository.blob_shas[path],
+                "size": len(content), "encoding": "none" if too_large else "base64",
+                "content": "" if too_large else base64.b64encode(content).decode(),
+            }, etag=repository.blob_shas[path])
+        else:
+            self._not_found()
+
+    def _graphql(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        variables = body.get("variables", {})
+        repository = self.state.repository
+
+        result = {}
+        for name, expression in variables.items():
+            if not re.fullmatch(r"e\d+", name):
+                continue
+            _, _, path = expression.partition(":")
+            if path not in repository.files:
+                result[f"f{name[1:]}"] = None
+                continue
+            text, is_binary, is_truncated = repository.text(path)
+            result[f"f{name[1:]}"] = {"text": text, "isBinary": is_binary, "isTruncated": is_truncated}
+
+        data = json.dumps({"data": {"repository": result}}).encode()
+        self._send(data, "application/json")
+
+    # ------------------ Gerrit ------------------ #
+
+    def _gerrit(self, path, query):
+        repository = self.state.repository
+        project, _, rest = path.partition("/files/")
+        if not rest and not path.endswith("/files/"):
+            self._send_gerrit(GERRIT_MAGIC_PREFIX + json.dumps({"id": project, "name": project, "state": "ACTIVE"}))
+        elif rest.endswith("/content"):
+            file_path = rest[:-len("/content")]
+            if file_path not in repository.files:
+                self._not_found()
+                return
+            self._send_gerrit(base64.b64encode(repository.files[file_path]).decode(), etag=repository.blob_shas[file_path])
+        elif not rest:
+            limit = int(query.get("limit", [0])[0] or 0)
+            paths = sorted(repository.files)
+            if limit:
+                paths = paths[:limit]
+            listing = {file_path: {"size": len(repository.files[file_path])} for file_path in paths}
+            self._send_gerrit(GERRIT_MAGIC_PREFIX + json.dumps(listing))
+        else:
+            self._not_found()
+
+    # ------------------ Routing ------------------ #
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query, keep_blank_values=True)
+        path = unquote(parsed.path)
+
+        # GitHub Enterprise style prefix
+        if path.startswith("/api/v3/"):
+            path = path[len("/api/v3"):]
+
+        parts = path.strip("/").split("/")
+        if parts[0] == "repos" and len(parts) >= 3:
+            self._github(parts[3:], query)
+        elif parts[0] == "projects" and len(parts) >= 2:
+            self._gerrit(path[len("/projects/"):], query)
+        elif parts[0] == "a" and len(parts) >= 3 and parts[1] == "projects":
+            self._gerrit(path[len("/a/projects/"):], query)
+        else:
+            self._not_found()
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip("/") in ("/graphql", "/api/graphql"):
+            self._graphql()
+        else:
+            self._not_found()
+
+
+def create_server(repository_path, host="127.0.0.1", port=8766, latency=0.0):
+    """
+    Create the fake server for a repository directory or tarball; call serve_forever()
+    on the result to run it. The state is available as server.state.
+    """
+    state = ForgeState(Repository(load_repository(repository_path)), latency)
+    handler = type("BoundForgeHandler", (ForgeHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.state = state
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local fake of the GitHub and Gerrit APIs serving one repository.")
+    parser.add_argument("repository", help="Repository directory or tarball, e.g. from synthetic_repo.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    args = parser.parse_args(argv)
+
+    server = create_server(args.repository, args.host, args.port, args.latency)
+    print(f"Serving {len(server.state.repository.files)} files on http://{args.host}:{args.port} "
+          f"(set GITHUB_API_URL=http://{args.host}:{args.port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
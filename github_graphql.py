@@ -0,0 +1,171 @@
+import os
+from urllib.parse import urlparse
+
+import requests
+
+from tracing import span
+
+# API endpoints; override them to use GitHub Enterprise Server or a local fake such as
+# fake_forge_server.py
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_GRAPHQL_URL = os.getenv("GITHUB_GRAPHQL_URL", f"{GITHUB_API_URL}/graphql")
+
+# Number of blobs requested per GraphQL query. Each blob counts towards the query's node
+# limit and response size, so large batches of big files can time out.
+DEFAULT_BATCH_SIZE = 50
+
+# README names tried in order of preference
+README_CANDIDATES = ["README.md", "readme.md", "README.rst", "README.txt", "README"]
+
+
+class GraphQLError(Exception):
+    """Raised when the GitHub GraphQL API returns errors instead of data."""
+
+
+def _build_blob_query(count):
+    # Pass each expression as a variable so paths never need escaping inside the query
+    variables = ''.join(f", $e{i}: String!" for i in range(count))
+    fields = ''.join(
+        f" f{i}: object(expression: $e{i}) {{ ... on Blob {{ text isBinary isTruncated }} }}"
+        for i in range(count)
+    )
+    return f"query($owner: String!, $name: String!{variables}) {{ repository(owner: $owner, name: $name) {{{fields} }} }}"
+
+
+def graphql_request(query, variables, token, session=None, api_url=GITHUB_GRAPHQL_URL):
+    """
+    Run a GitHub GraphQL query.
+
+    Args:
+        query (str): The GraphQL query
+        variables (dict): The query variables
+        token (str): GitHub access token
+        session: Optional requests session, e.g. one replaying recorded responses
+        api_url (str): The GraphQL endpoint
+
+    Returns:
+        dict: The "data" member of the response
+
+    Raises:
+        GraphQLError: If the response contains errors and no data
+    """
+    http = session or requests
+    with span("http.graphql", host=urlparse(api_url).netloc) as http_span:
+        response = http.post(
+            api_url,
+            json={"query": query, "variables": variables},
+            headers={"Authorization": f"bearer {token}"},
+            timeout=60,
+        )
+        http_span.set(
+            status_code=response.status_code,
+            rate_limit_remaining=response.headers.get("X-RateLimit-Remaining"),
+        )
+    response.raise_for_status()
+    payload = response.json()
+    if payload.get("errors") and not payload.get("data"):
+        raise GraphQLError("; ".join(error.get("message", "") for error in payload["errors"]))
+    return payload["data"]
+
+
+def fetch_blob_texts(owner, repo, ref, paths, token, batch_size=DEFAULT_BATCH_SIZE, session=None, api_url=GITHUB_GRAPHQL_URL):
+    """
+    Fetch the text of many files with one GraphQL query per batch of paths.
+
+    Args:
+        owner (str): Repository owner
+        repo (str): Repository name
+        ref (str): Branch, tag or commit SHA
+        paths (list): File paths relative to the repository root
+        token (str): GitHub access token
+        batch_size (int): Number of files requested per query
+        session: Optional requests session
+        api_url (str): The GraphQL endpoint
+
+    Returns:
+        dict: Mapping of path to file text. Files that do not exist are omitted; binary and
+            truncated files map to None.
+    """
+    texts = {}
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start:start + batch_size]
+        variables = {"owner": owner, "name": repo}
+        variables.update({f"e{i}": f"{ref}:{path}" for i, path in enumerate(batch)})
+        data = graphql_request(_build_blob_query(len(batch)), variables, token, session=session, api_url=api_url)
+
+        repository = data.get("repository") or {}
+        for i, path in enumerate(batch):
+            blob = repository.get(f"f{i}")
+            if blob is None:
+                continue
+            if blob.get("isBinary") or blob.get("isTruncated"):
+                texts[path] = None
+            else:
+                texts[path] = blob.get("text")
+    return texts
+
+
+def find_readme(owner, repo, ref, token, candidates=None, session=None, api_url=GITHUB_GRAPHQL_URL):
+    """
+    Look up all README candidates in a single query and return the first one that exists.
+
+    Returns:
+        tuple: (path, text), or (None, "") if the repository has no README
+    """
+    candidates = candidates or README_CANDIDATES
+    texts = fetch_blob_texts(owner, repo, ref, candidates, token, batch_size=len(candidates), session=session, api_url=api_url)
+    for path in candidates:
+        if texts.get(path):
+            return path, texts[path]
+    return None, ""
+
+
+class BlobBatchLoader:
+    """
+    Lazily load file texts in batches, in the order the files will be read.
+
+    Requesting a file that has not been loaded yet fetches it together with the files that
+    follow it in the list, so a loop over the list makes one query per batch instead of one
+    request per file.
+    """
+
+    def __init__(self, owner, repo, ref, token, paths, batch_size=DEFAULT_BATCH_SIZE, session=None, api_url=GITHUB_GRAPHQL_URL):
+        self.owner = owner
+        self.repo = repo
+        self.ref = ref
+        self.token = token
+        self.paths = list(paths)
+        self.batch_size = batch_size
+        self.session = session
+        self.api_url = api_url
+        self.request_count = 0
+        self._positions = {path: index for index, path in enumerate(self.paths)}
+        self._texts = {}
+        self._loaded = set()
+
+    def get(self, path):
+        """
+        Return the text of a file.
+
+        Raises:
+            KeyError: If the file does not exist at the ref
+            ValueError: If the file is binary or too large to be returned as text
+        """
+        if path not in self._loaded:
+            start = self._positions.get(path)
+            if start is None:
+                batch = [path]
+            else:
+                batch = [p for p in self.paths[start:start + self.batch_size] if p not in self._loaded]
+            self._texts.update(fetch_blob_texts(
+                self.owner, self.repo, self.ref, batch, self.token,
+                batch_size=self.batch_size, session=self.session, api_url=self.api_url,
+            ))
+            self._loaded.update(batch)
+            self.request_count += 1
+
+        if path not in self._texts:
+            raise KeyError(path)
+        if self._texts[path] is None:
+            raise ValueError(f"{path} is binary or too large to fetch as text")
+        return self._texts[path]
@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+import threading
+from urllib.parse import urlparse
+
+import requests
+
+from tracing import span
+
+# Directory for cached responses; override with the HTTP_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "stride-gpt", "http")
+
+# Bytes of response bodies kept before the least recently used are evicted (HTTP_CACHE_MAX_BYTES)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_atomic(path, data):
+    # Sessions are threads of one process, so the thread ID keeps their temporary files apart
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ConditionalFetcher:
+    """
+    Send GET requests with If-None-Match / If-Modified-Since headers and serve
+    304 Not Modified responses from a local blob store.
+
+    Validators (ETag and Last-Modified) are stored per URL and credential, and response
+    bodies are stored by content hash so identical files are kept only once. A 304 does
+    not count against GitHub's rate limit, so re-analysing an unchanged repository is
+    almost free.
+
+    When the bodies grow past max_bytes, the least recently used are evicted; their
+    URLs are then fetched in full again.
+    """
+
+    def __init__(self, cache_dir=None, session=None, max_bytes=None):
+        self.cache_dir = cache_dir or os.environ.get("HTTP_CACHE_DIR") or DEFAULT_CACHE_DIR
+        self.session = session or requests.Session()
+        self.max_bytes = max_bytes or int(os.environ.get("HTTP_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.cache_dir, "meta"), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, "blobs"), exist_ok=True)
+        self._disk_used = sum(size for _, _, size in self._blobs())
+
+    def _meta_path(self, url, identity):
+        # Keep entries of different users apart so one user's cache is never served to another
+        key = _sha256(f"{identity}\0{url}".encode())
+        return os.path.join(self.cache_dir, "meta", f"{key}.json")
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, "blobs", digest)
+
+    def _blobs(self):
+        # (path, last use, size) of every stored body
+        blobs = []
+        for entry in os.scandir(os.path.join(self.cache_dir, "blobs")):
+            try:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    blobs.append((entry.path, stat.st_mtime, stat.st_size))
+            except OSError:
+                continue
+        return blobs
+
+    def evict(self):
+        """
+        Bring the stored bodies under max_bytes by deleting the least recently used,
+        along with the entries that pointed to them.
+
+        Returns:
+            int: Number of bodies deleted
+        """
+        removed = 0
+        for path, _, size in sorted(self._blobs(), key=lambda blob: blob[1]):
+            with self._lock:
+                if self._disk_used <= self.max_bytes * 0.9:
+                    break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            removed += 1
+            with self._lock:
+                self._disk_used -= size
+        if removed:
+            self._prune_meta()
+        return removed
+
+    def _prune_meta(self):
+        # Entries whose body was evicted can never be served; drop them
+        for entry in os.scandir(os.path.join(self.cache_dir, "meta")):
+            if not entry.name.endswith(".json"):
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    digest = json.load(f)["blob"]
+                if not os.path.exists(self._blob_path(digest)):
+                    os.remove(entry.path)
+            except (OSError, ValueError, KeyError):
+                continue
+
+    def _load(self, meta_path):
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            blob_path = self._blob_path(meta["blob"])
+            with open(blob_path, "rb") as f:
+                body = f.read()
+            # The modification time records the last use for eviction
+            os.utime(blob_path)
+            return meta, body
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _store(self, meta_path, url, response):
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        digest = _sha256(response.content)
+        blob_path = self._blob_path(digest)
+        if not os.path.exists(blob_path):
+            _write_atomic(blob_path, response.content)
+            with self._lock:
+                self._disk_used += len(response.content)
+                over_limit = self._disk_used > self.max_bytes
+            if over_limit:
+                self.evict()
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "blob": digest,
+            "content_type": response.headers.get("Content-Type", ""),
+            "encoding": response.encoding,
+        }
+        _write_atomic(meta_path, json.dumps(meta).encode())
+
+    def get(self, url, headers=None, auth=None, timeout=30):
+        """
+        Conditionally GET a URL.
+
+        Args:
+            url (str): The URL to fetch
+            headers (dict): Request headers
+            auth: requests authentication, e.g. a (username, password) tuple
+            timeout (int): Request timeout in seconds
+
+        Returns:
+            requests.Response: The live response, or a 200 response rebuilt from the local
+                store when the server answered 304 Not Modified. Cached responses have
+                from_cache set to True.
+        """
+        headers = dict(headers or {})
+        identity = _sha256(repr((auth, headers.get("Authorization"))).encode())
+        meta_path = self._meta_path(url, identity)
+        meta, body = self._load(meta_path)
+
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with span("http.get", host=urlparse(url).netloc) as http_span:
+            response = self.session.get(url, headers=headers, auth=auth, timeout=timeout)
+            http_span.set(
+                status_code=response.status_code,
+                cache_hit=response.status_code == 304 and meta is not None,
+                rate_limit_remaining=response.headers.get("X-RateLimit-Remaining"),
+            )
+
+        if response.status_code == 304 and meta is not None:
+            self.hits += 1
+            cached = requests.Response()
+            cached.status_code = 200
+            cached.url = url
+            cached._content = body
+            cached.encoding = meta.get("encoding")
+            cached.headers.update(response.headers)
+            cached.headers["Content-Type"] = meta.get("content_type", "")
+            cached.from_cache = True
+            return cached
+
+        self.misses += 1
+        response.from_cache = False
+        if response.status_code == 200:
+            self._store(meta_path, url, response)
+        return response
+
+
+_default_fetcher = None
+_default_fetcher_lock = threading.Lock()
+
+
+def get_fetcher():
+    """Return the process-wide ConditionalFetcher, creating it on first use."""
+    global _default_fetcher
+    with _default_fetcher_lock:
+        if _default_fetcher is None:
+            _default_fetcher = ConditionalFetcher()
+        return _default_fetcher
@@ -52,18 +52,35 @@ class translations:
         "app_type_help": "Select the type of application that you are threat modeling.",
         "auth_label": "Does the application have authentication?",
         "auth_help": "Indicate whether the application has any form of authentication.",
+        "application_name_label": "Application name (optional)",
+        "application_name_help": "Name under which threats, DREAD scores, mitigations and test cases are recorded in the portfolio index. Defaults to the analysed repository URL.",
+        "portfolio_index_error": "Could not record the results in the portfolio index: {}",
         "internet_facing_label": "Is the application internet-facing?",
         "internet_facing_help": "Indicate whether the application is accessible from the internet.",
         "sensitive_data_label": "Does the application handle sensitive data?",
         "sensitive_data_help": "Indicate whether the application handles sensitive data such as PII, financial information, or health records.",
         "app_input_label": "Please provide a description of the application including its architecture, technologies used, and main functionality:",
         "app_input_help": "Provide as much detail as possible about the application including its architecture, technologies used, and main functionality. You can also include code snippets or links to documentation.",
+        "repo_analysis_label": "Repository analysis (added before the description below)",
         "analyze_button": "Analyze Application",
 
         # Threat Model Section
         "threat_model_header": "Threat Model",
         "threat_model_code": "Threat Model Code:",
         "download_threat_model": "Download Threat Model",
+        "incremental_update_header": "Incremental Threat Model Update",
+        "incremental_update_description": "Update the previous threat model with the changes made to the GitHub repository since it was generated. Only the changed files are analysed, so the update is much faster and cheaper than a full regeneration.",
+        "incremental_run_upload_label": "Restore a previous run (threat_model_run.json)",
+        "incremental_run_invalid": "Could not read the run file: {}",
+        "incremental_run_missing": "Generate a threat model from a GitHub repository, or restore a previous run, to enable incremental updates.",
+        "incremental_run_download": "Download Run (for incremental updates)",
+        "incremental_base_label": "Base commit (previous analysis)",
+        "incremental_head_label": "Head commit or branch",
+        "incremental_head_help": "The commit, branch or tag to update the threat model to. Defaults to the repository's default branch.",
+        "incremental_update_button": "Update Threat Model",
+        "incremental_no_changes": "No source files changed since the previous analysis.",
+        "incremental_update_applied": "Threat model updated: {} added, {} modified, {} retired.",
+        "incremental_update_error": "Error updating threat model: {}",
         "attack_tree_header": "Attack Tree",
         "attack_tree_code": "Attack Tree Code:",
         "download_attack_tree": "Download Attack Tree Code",
@@ -71,6 +88,7 @@ class translations:
         "mitigations_header": "Mitigations",
         "mitigations_code": "Mitigations Code:",
         "download_mitigations": "Download Mitigations",
+        "download_mitigations_json": "Download Mitigations (JSON)",
         "dread_header": "DREAD Risk Assessment",
         "dread_code": "DREAD Assessment Code:",
         "download_dread": "Download DREAD Assessment",
@@ -229,6 +247,25 @@ Please check:
         "attack_tree_code": "Attack Tree Code:",
         "attack_tree_preview": "Attack Tree Diagram Preview:",
         "download_diagram_code": "Download Diagram Code",
+        "download_diagram_svg": "Download Diagram (SVG)",
+        "attack_tree_expansion_label": "Expand the attack tree goal by goal",
+        "attack_tree_expansion_help": "First ask the model for the top-level attack goals, then generate each goal's subtree in a separate concurrent request. Produces larger and deeper trees than a single response can hold, in about the same time.",
+        "attack_tree_depth_label": "Maximum depth",
+        "attack_tree_depth_help": "Number of levels in the tree, including the root goal.",
+        "attack_tree_fan_out_label": "Maximum children per node",
+        "attack_tree_fan_out_help": "Number of top-level goals, and of sub-goals below each node.",
+        "download_diagram_dot": "Download Graphviz (DOT)",
+        "download_diagram_json": "Download Tree (JSON)",
+        "attack_tree_issues": "Problems repaired in the generated attack tree",
+        "attack_tree_analysis": "Attack tree analysis",
+        "attack_tree_cheapest_cost": "Cheapest attack cost",
+        "attack_tree_success_probability": "Success probability",
+        "attack_tree_minimum_skill": "Minimum skill (1-5)",
+        "attack_tree_cheapest_attack": "Cheapest attack",
+        "attack_tree_cut_sets": "Cheapest attack combinations (minimal cut sets)",
+        "attack_tree_mitigation_ranking": "Mitigations ranked by attacker cost increase",
+        "attack_tree_blocks_all": "blocks every attack",
+        "attack_tree_estimated_leaves": "{0} of {1} attacks had no cost, skill or probability estimate and use defaults.",
         "dread_assessment_header": "DREAD Risk Assessment",
         "dread_description": "The table below shows the DREAD risk assessment for each identified threat. The Risk Score is calculated as the average of the five DREAD categories.",
         "please_enter_app_details": "Please enter your application details before submitting.",
@@ -250,6 +287,20 @@ Please check:
         "advanced_settings": "Advanced Settings",
         "github_token_limit_label": "Maximum token limit for GitHub analysis:",
         "github_token_limit_help": "Set the maximum number of tokens to use for GitHub repository analysis. This helps prevent exceeding your model's context window.",
+        "hierarchical_summaries_label": "Summarize large repositories by component",
+        "hierarchical_summaries_help": "Group files by directory and roll their summaries up into one digest per component. Gives the threat model an architectural overview of very large repositories instead of only the first files that fit in the token limit.",
+        "hierarchical_llm_summaries_label": "Use the selected model to summarize components",
+        "hierarchical_llm_summaries_help": "Rewrite each component digest with the selected model. Summaries are cached by the component's git tree SHA, so unchanged components are not summarized again.",
+        "github_fetch_backend_label": "GitHub fetch backend",
+        "github_fetch_backend_graphql": "GraphQL (batched)",
+        "github_fetch_backend_rest": "REST (one request per file)",
+        "github_fetch_backend_help": "GraphQL fetches up to 50 files per request, which uses far fewer API calls against GitHub's rate limit. REST fetches each file separately and is used automatically if a GraphQL request fails.",
+        "regenerate_results_label": "Regenerate instead of reusing stored results",
+        "regenerate_results_help": "Results are stored and shared when the same prompt is sent to the same model. Tick this to send it to the model again and replace the stored result, e.g. after a poor answer.",
+        "performance_header": "Performance",
+        "performance_caption": "Timings for the last {} traced operations of this session, slowest first.",
+        "performance_download_traces": "Download traces (OTLP JSON)",
+        "performance_no_spans": "No traced operations yet. Run an analysis to see per-stage timings, token counts and retries.",
 
         # Gerrit Repository Analysis
         "gerrit_url_label": "Enter Gerrit repository URL (optional):",
@@ -293,6 +344,14 @@ Please check:
         "debug_no_threats": "Debug: No threats were found in the response. Please try generating the threat model again.",
         "retrying_dread": "Error generating DREAD risk assessment. Retrying attempt {}/{}...",
         "debug_empty_dread": "Debug: The DREAD assessment response is empty. Please ensure you have generated a threat model first.",
+        "dread_weighting_label": "Risk score weighting",
+        "dread_weighting_help": "How the five DREAD factors are weighted in the risk score. Threats are listed from highest to lowest risk.",
+        "dread_weighting_equal": "Equal (average of the five factors)",
+        "dread_weighting_impact": "Impact (damage and affected users count double)",
+        "dread_weighting_no_discoverability": "Without discoverability",
+        "dread_analytics": "Risk by STRIDE category",
+        "dread_percentile_bands": "Risk score percentiles: 50th {0:.2f}, 75th {1:.2f}, 90th {2:.2f}. High risk means at or above the 90th percentile.",
+        "dread_heatmap": "Average DREAD factors by STRIDE category",
         "requesting_dread": "requesting a DREAD risk assessment",
         "error_generating_test_cases": "Error generating test cases after {} attempts: {}",
         "retrying_test_cases": "Error generating test cases. Retrying attempt {}/{}...",
@@ -345,18 +404,35 @@ Please check:
         "app_type_help": "选择您正在进行威胁建模的应用程序类型。",
         "auth_label": "应用程序是否具有身份验证？",
         "auth_help": "指示应用程序是否具有任何形式的身份验证。",
+        "application_name_label": "应用名称（可选）",
+        "application_name_help": "威胁、DREAD 评分、缓解措施和测试用例记录到组合索引时使用的名称。默认为所分析仓库的 URL。",
+        "portfolio_index_error": "无法将结果记录到组合索引：{}",
         "internet_facing_label": "应用程序是否面向互联网？",
         "internet_facing_help": "指示应用程序是否可以从互联网访问。",
         "sensitive_data_label": "应用程序是否处理敏感数据？",
         "sensitive_data_help": "指示应用程序是否处理敏感数据，如个人身份信息、财务信息或健康记录。",
         "app_input_label": "请提供应用程序的描述，包括其架构、使用的技术和主要功能：",
         "app_input_help": "尽可能详细地提供应用程序的信息，包括其架构、使用的技术和主要功能。您也可以包括代码片段或文档链接。",
+        "repo_analysis_label": "代码仓库分析（添加在下方描述之前）",
         "analyze_button": "分析应用程序",
 
         # Threat Model Section
         "threat_model_header": "威胁模型",
         "threat_model_code": "威胁模型代码：",
         "download_threat_model": "下载威胁模型",
+        "incremental_update_header": "增量更新威胁模型",
+        "incremental_update_description": "根据生成上一个威胁模型以来 GitHub 仓库中的变更来更新该威胁模型。只分析发生变更的文件，因此比完整重新生成更快、成本更低。",
+        "incremental_run_upload_label": "恢复之前的运行记录 (threat_model_run.json)",
+        "incremental_run_invalid": "无法读取运行记录文件：{}",
+        "incremental_run_missing": "请先基于 GitHub 仓库生成威胁模型，或恢复之前的运行记录，以启用增量更新。",
+        "incremental_run_download": "下载运行记录（用于增量更新）",
+        "incremental_base_label": "基准提交（上一次分析）",
+        "incremental_head_label": "目标提交或分支",
+        "incremental_head_help": "要将威胁模型更新到的提交、分支或标签。默认为仓库的默认分支。",
+        "incremental_update_button": "更新威胁模型",
+        "incremental_no_changes": "自上一次分析以来没有源文件发生变化。",
+        "incremental_update_applied": "威胁模型已更新：新增 {} 个，修改 {} 个，移除 {} 个。",
+        "incremental_update_error": "更新威胁模型时出错：{}",
         "attack_tree_header": "攻击树",
         "attack_tree_code": "攻击树代码：",
         "download_attack_tree": "下载攻击树代码",
@@ -364,6 +440,7 @@ Please check:
         "mitigations_header": "缓解措施",
         "mitigations_code": "缓解措施代码：",
         "download_mitigations": "下载缓解措施",
+        "download_mitigations_json": "下载缓解措施（JSON）",
         "dread_header": "DREAD 风险评估",
         "dread_code": "DREAD 评估代码：",
         "download_dread": "下载 DREAD 评估",
@@ -522,6 +599,25 @@ Please check:
         "attack_tree_code": "攻击树代码：",
         "attack_tree_preview": "攻击树图预览：",
         "download_diagram_code": "下载图表代码",
+        "download_diagram_svg": "下载图表 (SVG)",
+        "attack_tree_expansion_label": "逐个目标展开攻击树",
+        "attack_tree_expansion_help": "先让模型给出顶层攻击目标，再为每个目标并发地单独生成其子树。能在大致相同的时间内生成比单次响应更大、更深的攻击树。",
+        "attack_tree_depth_label": "最大深度",
+        "attack_tree_depth_help": "攻击树的层数，包括根目标。",
+        "attack_tree_fan_out_label": "每个节点的最大子节点数",
+        "attack_tree_fan_out_help": "顶层目标的数量，以及每个节点下子目标的数量。",
+        "download_diagram_dot": "下载 Graphviz (DOT)",
+        "download_diagram_json": "下载攻击树 (JSON)",
+        "attack_tree_issues": "生成的攻击树中已修复的问题",
+        "attack_tree_analysis": "攻击树分析",
+        "attack_tree_cheapest_cost": "最低攻击成本",
+        "attack_tree_success_probability": "成功概率",
+        "attack_tree_minimum_skill": "最低技能要求（1-5）",
+        "attack_tree_cheapest_attack": "最低成本攻击",
+        "attack_tree_cut_sets": "成本最低的攻击组合（最小割集）",
+        "attack_tree_mitigation_ranking": "按攻击者成本增加排序的缓解措施",
+        "attack_tree_blocks_all": "阻断所有攻击",
+        "attack_tree_estimated_leaves": "{1} 个攻击中有 {0} 个没有成本、技能或概率估计，使用默认值。",
         "dread_assessment_header": "DREAD风险评估",
         "dread_description": "下表显示了每个已识别威胁的DREAD风险评估。风险分数计算为五个DREAD类别的平均值。",
         "please_enter_app_details": "请在提交前输入您的应用程序详细信息。",
@@ -543,6 +639,20 @@ Please check:
         "advanced_settings": "高级设置",
         "github_token_limit_label": "GitHub分析的最大令牌限制：",
         "github_token_limit_help": "设置用于GitHub仓库分析的最大令牌数。这有助于防止超出模型的上下文窗口。",
+        "hierarchical_summaries_label": "按组件汇总大型仓库",
+        "hierarchical_summaries_help": "按目录对文件分组，并将其摘要汇总为每个组件的一份概要。这样威胁模型可以获得超大型仓库的架构概览，而不仅仅是令牌限制内的前几个文件。",
+        "hierarchical_llm_summaries_label": "使用所选模型汇总组件",
+        "hierarchical_llm_summaries_help": "使用所选模型重写每个组件的概要。摘要按组件的git树SHA缓存，未更改的组件不会被再次汇总。",
+        "github_fetch_backend_label": "GitHub 获取方式",
+        "github_fetch_backend_graphql": "GraphQL（批量）",
+        "github_fetch_backend_rest": "REST（每个文件一次请求）",
+        "github_fetch_backend_help": "GraphQL 每次请求最多获取 50 个文件，可大幅减少 GitHub 速率限制下的 API 调用次数。REST 逐个获取文件，在 GraphQL 请求失败时会自动使用。",
+        "regenerate_results_label": "重新生成，不复用已存储的结果",
+        "regenerate_results_help": "向同一模型发送相同提示词时，结果会被存储并共享。勾选此项可重新发送给模型并替换已存储的结果，例如在回答质量不佳时。",
+        "performance_header": "性能",
+        "performance_caption": "本会话中最近 {} 个被追踪操作的耗时，按耗时从高到低排列。",
+        "performance_download_traces": "下载追踪数据（OTLP JSON）",
+        "performance_no_spans": "暂无追踪数据。运行一次分析即可查看各阶段的耗时、令牌数和重试次数。",
 
         # Gerrit 仓库分析
         "gerrit_url_label": "输入Gerrit仓库URL（可选）：",
@@ -586,6 +696,14 @@ Please check:
         "debug_no_threats": "调试：响应中未找到威胁。请尝试再次生成威胁模型。",
         "retrying_dread": "生成DREAD风险评估时出错。重试尝试 {}/{}...",
         "debug_empty_dread": "调试：DREAD评估响应为空。请确保您已先生成威胁模型。",
+        "dread_weighting_label": "风险分数权重",
+        "dread_weighting_help": "五个DREAD因素在风险分数中的权重。威胁按风险从高到低排列。",
+        "dread_weighting_equal": "相等（五个因素的平均值）",
+        "dread_weighting_impact": "影响（损害潜力和受影响用户按双倍计算）",
+        "dread_weighting_no_discoverability": "不计可发现性",
+        "dread_analytics": "按STRIDE类别的风险",
+        "dread_percentile_bands": "风险分数百分位：第50百分位 {0:.2f}，第75百分位 {1:.2f}，第90百分位 {2:.2f}。高风险指达到或超过第90百分位。",
+        "dread_heatmap": "按STRIDE类别的DREAD因素平均值",
         "requesting_dread": "请求DREAD风险评估",
         "error_generating_test_cases": "在{}次尝试后生成测试用例时出错：{}",
         "retrying_test_cases": "生成测试用例时出错。重试尝试 {}/{}...",
@@ -0,0 +1,267 @@
+"""
+Repository ingestion benchmark.
+
+Serves a repository (a directory, a tarball or a freshly generated synthetic
+repository) from fake_forge_server.py and ingests it the way analyze_github_repo and
+analyze_gerrit_repo do: list the tree, select and rank candidate files, fetch them
+through the REST contents API, batched GraphQL or Gerrit, summarize each file with
+summarize_file and build the token-budgeted description.
+
+Each backend runs twice with an empty HTTP cache: a cold pass, then a warm pass
+served by conditional requests. Reports files and bytes per second, API requests,
+304 responses and peak Python memory, and stores the results like benchmark.py:
+
+    python ingest_benchmark.py --generate 10000 --token-limit 1000000
+    python ingest_benchmark.py fixtures/repo-100k.tar.gz --backend graphql --compare benchmark-results/ingest-<run>.json
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from urllib.parse import quote
+
+from benchmark import DEFAULT_OUTPUT_DIR, git_commit
+from fake_forge_server import GERRIT_MAGIC_PREFIX, create_server
+from github_graphql import BlobBatchLoader, find_readme
+from http_cache import ConditionalFetcher
+from repo_analysis import DescriptionBuilder, estimate_tokens, is_candidate_file, iter_ranked_summaries, rank_files, summarize_file
+from synthetic_repo import write_repository
+
+BACKENDS = ["rest", "graphql", "gerrit"]
+
+# analyze_gerrit_repo lists at most this many files
+GERRIT_FILE_LIMIT = 100
+
+
+class Ingestion:
+    """Counts what one ingestion pass read."""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+
+    def summarize(self, path, content):
+        """Count a fetched file and return its summary."""
+        self.files += 1
+        self.bytes += len(content.encode())
+        return summarize_file(path, content)
+
+    def describe(self, description, code_files, fetch_summary, token_limit):
+        """Add file summaries to the description in ranked order until the token budget is spent."""
+        for path, summary in iter_ranked_summaries(code_files, fetch_summary, token_limit - description.token_count):
+            summary_tokens = estimate_tokens(summary)
+            if description.token_count + summary_tokens > token_limit:
+                break
+            description.append(summary + "\n", section=f"{path.split('.')[-1].upper()} Files", tokens=summary_tokens)
+
+
+def ingest_github(base_url, fetcher, backend, token_limit, owner="bench", repo_name="repo"):
+    """Replay analyze_github_repo against the fake server."""
+    api_url = base_url
+
+    def get(api_path):
+        response = fetcher.get(f"{api_url}{api_path}", headers={"Authorization": "token bench"})
+        response.raise_for_status()
+        return response.json()
+
+    def read_contents(path, ref):
+        content = get(f"/repos/{owner}/{repo_name}/contents/{quote(path)}?ref={quote(ref, safe='')}")
+        return base64.b64decode(content["content"]).decode()
+
+    default_branch = get(f"/repos/{owner}/{repo_name}")["default_branch"]
+    commit_sha = get(f"/repos/{owner}/{repo_name}/branches/{default_branch}")["commit"]["sha"]
+    tree_entries = get(f"/repos/{owner}/{repo_name}/git/trees/{commit_sha}?recursive=1")["tree"]
+
+    ingestion = Ingestion()
+    analysis_token_limit = int(token_limit * 0.7)
+    description = DescriptionBuilder("gpt-4o")
+
+    if backend == "graphql":
+        _, readme = find_readme(owner, repo_name, default_branch, "bench", api_url=f"{api_url}/graphql")
+    else:
+        try:
+            readme = read_contents("README.md", default_branch)
+        except Exception:
+            readme = ""
+    if readme:
+        description.append(readme + "\n", section="README.md Content")
+
+    code_files = rank_files([entry["path"] for entry in tree_entries if entry["type"] == "blob" and is_candidate_file(entry["path"])])
+    loader = BlobBatchLoader(owner, repo_name, commit_sha, "bench", code_files, api_url=f"{api_url}/graphql") if backend == "graphql" else None
+
+    def fetch_summary(path):
+        try:
+            content = loader.get(path) if loader else read_contents(path, commit_sha)
+        except (KeyError, ValueError):
+            ingestion.skipped += 1
+            return None
+        return ingestion.summarize(path, content)
+
+    ingestion.describe(description, code_files, fetch_summary, analysis_token_limit)
+
+    description.build()
+    return ingestion, len(code_files)
+
+
+def ingest_gerrit(base_url, fetcher, token_limit, project="bench/repo"):
+    """Replay analyze_gerrit_repo against the fake server."""
+    headers = {"Accept": "application/json"}
+
+    def get_text(url):
+        response = fetcher.get(url, headers=headers, auth=("bench", "bench"))
+        response.raise_for_status()
+        text = response.text
+        return text[len(GERRIT_MAGIC_PREFIX):] if text.startswith(GERRIT_MAGIC_PREFIX) else text
+
+    json.loads(get_text(f"{base_url}/projects/{project}"))
+    files_data = json.loads(get_text(f"{base_url}/projects/{project}/files/?recursive&limit={GERRIT_FILE_LIMIT}"))
+
+    ingestion = Ingestion()
+    analysis_token_limit = int(token_limit * 0.7)
+    description = DescriptionBuilder("gpt-4o")
+    readme = next((path for path in files_data if "README" in path.upper()), None)
+    if readme:
+        description.append(base64.b64decode(get_text(f"{base_url}/projects/{project}/files/{readme}/content")).decode() + "\n",
+                           section="README Content")
+
+    code_files = rank_files([path for path in files_data if is_candidate_file(path)])
+    def fetch_summary(path):
+        try:
+            content = base64.b64decode(get_text(f"{base_url}/projects/{project}/files/{path}/content")).decode()
+        except UnicodeDecodeError:
+            ingestion.skipped += 1
+            return None
+        return ingestion.summarize(path, content)
+
+    ingestion.describe(description, code_files, fetch_summary, analysis_token_limit)
+
+    description.build()
+    return ingestion, len(code_files)
+
+
+def run_pass(server, base_url, backend, cache_dir, token_limit, trace_memory):
+    requests_before = server.state.requests
+    not_modified_before = server.state.not_modified
+    fetcher = ConditionalFetcher(cache_dir=cache_dir)
+
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        if backend == "gerrit":
+            ingestion, candidates = ingest_gerrit(base_url, fetcher, token_limit)
+        else:
+            ingestion, candidates = ingest_github(base_url, fetcher, backend, token_limit)
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+        if trace_memory:
+            tracemalloc.stop()
+
+    return {
+        "seconds": round(seconds, 3),
+        "candidate_files": candidates,
+        "files_read": ingestion.files,
+        "files_skipped": ingestion.skipped,
+        "megabytes_read": round(ingestion.bytes / 1e6, 3),
+        "files_per_s": round(ingestion.files / seconds, 1) if seconds else 0.0,
+        "megabytes_per_s": round(ingestion.bytes / 1e6 / seconds, 3) if seconds else 0.0,
+        "api_requests": server.state.requests - requests_before,
+        "not_modified": server.state.not_modified - not_modified_before,
+        "peak_memory_mb": round(peak / 1e6, 1) if peak is not None else None,
+    }
+
+
+def run_ingest_benchmark(repository, backends=BACKENDS, token_limit=64000, latency=0.0, trace_memory=True, log=print):
+    """
+    Ingest a repository with each backend, cold and then warm.
+
+    Returns:
+        dict: The results document
+    """
+    server = create_server(repository, "127.0.0.1", 0, latency)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log(f"Serving {len(server.state.repository.files)} files from {repository} at {base_url}")
+
+    results = {}
+    try:
+        for backend in backends:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                results[backend] = {
+                    "cold": run_pass(server, base_url, backend, cache_dir, token_limit, trace_memory),
+                    "warm": run_pass(server, base_url, backend, cache_dir, token_limit, trace_memory),
+                }
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {"repository": repository, "files": len(server.state.repository.files), "token_limit": token_limit, "latency": latency},
+        "backends": results,
+    }
+
+
+def format_report(results, baseline=None):
+    lines = [f"{'backend':<10}{'pass':<6}{'files':>8}{'MB':>9}{'seconds':>10}{'files/s':>10}{'MB/s':>8}{'requests':>10}{'304s':>7}{'peak MB':>9}"]
+    for backend, passes in results["backends"].items():
+        for name, stats in passes.items():
+            peak = f"{stats['peak_memory_mb']:>9.1f}" if stats["peak_memory_mb"] is not None else f"{'-':>9}"
+            line = (f"{backend:<10}{name:<6}{stats['files_read']:>8}{stats['megabytes_read']:>9.1f}{stats['seconds']:>10.2f}"
+                    f"{stats['files_per_s']:>10.1f}{stats['megabytes_per_s']:>8.2f}{stats['api_requests']:>10}{stats['not_modified']:>7}{peak}")
+            previous = (baseline or {}).get("backends", {}).get(backend, {}).get(name)
+            if previous and previous.get("files_per_s"):
+                line += f"  files/s {(stats['files_per_s'] - previous['files_per_s']) / previous['files_per_s'] * 100:+.1f}%"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark repository ingestion against a fake GitHub/Gerrit server.")
+    parser.add_argument("repository", nargs="?", help="Repository directory or tarball")
+    parser.add_argument("--generate", type=int, metavar="FILES", help="Generate a synthetic repository with this many files instead")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --generate")
+    parser.add_argument("--backend", action="append", choices=BACKENDS, help="Backend to benchmark; repeatable (default: all)")
+    parser.add_argument("--token-limit", type=int, default=64000, help="Token limit; raise it to ingest more files")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake server adds to every request")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc, which slows ingestion down")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory for result files")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    if not args.repository and not args.generate:
+        parser.error("give a repository or --generate FILES")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        repository = args.repository
+        if args.generate:
+            repository = os.path.join(work_dir, f"synthetic-{args.generate}.tar")
+            count, total = write_repository(repository, files=args.generate, seed=args.seed)
+            print(f"Generated {count} files ({total / 1e6:.1f} MB)")
+        results = run_ingest_benchmark(repository, args.backend or BACKENDS, args.token_limit, args.latency, not args.no_memory)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(results, baseline))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, "ingest-" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,443 @@
+"""
+Local stub of the OpenAI and Anthropic APIs for running the app and the batch runner offline.
+
+Implements the endpoints used by batch_runner.py:
+    POST /v1/files, GET /v1/files/{id}/content
+    POST /v1/batches, GET /v1/batches/{id}
+    POST /v1/messages/batches, GET /v1/messages/batches/{id}, GET /v1/messages/batches/{id}/results
+plus the synchronous POST /v1/chat/completions and POST /v1/messages, and the Ollama
+POST /api/generate, POST /api/chat and GET /api/tags.
+
+Replies are canned responses chosen from the prompt (threat model, DREAD, attack tree,
+mitigations or test cases), so every stage receives output it can parse. Synchronous
+requests can be slowed down and made to fail to simulate a real provider: --latency
+adds a fixed delay, --token-rate paces the reply at that many output tokens per second,
+and --failure-rate fails that fraction of requests. Random choices are seeded, so a
+run with the same options sees the same delays and failures.
+
+Usage:
+    python llm_stub_server.py --port 8765 --batch-delay 2
+    python llm_stub_server.py --port 8765 --latency 0.5 --token-rate 50 --failure-rate 0.05
+    python batch_runner.py apps.json --provider openai --base-url http://localhost:8765/v1
+    python batch_runner.py apps.json --provider anthropic --model claude-3-5-haiku-latest --base-url http://localhost:8765
+"""
+import argparse
+import email.parser
+import email.policy
+import itertools
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Shared counter for generated object IDs
+_ids = itertools.count(1)
+
+CANNED_THREAT_MODEL = {
+    "threat_model": [
+        {"Threat Type": "Spoofing", "Scenario": "An attacker reuses a stolen session token to impersonate a user.", "Potential Impact": "Unauthorized access to user data."},
+        {"Threat Type": "Tampering", "Scenario": "An attacker modifies requests between the client and the API.", "Potential Impact": "Integrity of stored records is compromised."},
+        {"Threat Type": "Information Disclosure", "Scenario": "Verbose error messages reveal internal hostnames.", "Potential Impact": "Attackers learn the internal network layout."},
+    ],
+    "improvement_suggestions": ["Describe how sessions are issued and revoked."],
+}
+
+CANNED_DREAD = {
+    "Risk Assessment": [
+        {"Threat Type": "Spoofing", "Scenario": "An attacker reuses a stolen session token to impersonate a user.",
+         "Damage Potential": 7, "Reproducibility": 6, "Exploitability": 5, "Affected Users": 8, "Discoverability": 5},
+        {"Threat Type": "Tampering", "Scenario": "An attacker modifies requests between the client and the API.",
+         "Damage Potential": 6, "Reproducibility": 4, "Exploitability": 4, "Affected Users": 6, "Discoverability": 4},
+    ]
+}
+
+CANNED_ATTACK_TREE = {
+    "nodes": [
+        {"id": "root", "label": "Compromise Application", "children": [
+            {"id": "auth", "label": "Gain Unauthorized Access", "children": [
+                {"id": "auth1", "label": "Steal Session Token"},
+            ]},
+        ]},
+    ]
+}
+
+CANNED_MITIGATIONS = {
+    "Mitigations": [
+        {"Threat ID": "T-d337669d", "Threat Type": "Spoofing", "Scenario": "An attacker reuses a stolen session token to impersonate a user.",
+         "Controls": [
+             {"Mitigation": "Bind sessions to the client and rotate tokens on privilege change.", "Control Type": "Preventive", "Effort": "Medium"},
+             {"Mitigation": "Alert on concurrent use of one session from different clients.", "Control Type": "Detective", "Effort": "Medium"},
+         ]},
+    ]
+}
+
+CANNED_TEST_CASES = """### Session token reuse
+```gherkin
+Given a session token issued to another user
+When the attacker sends a request with the token
+Then the request is rejected
+```
+"""
+
+
+def canned_response(system_prompt, prompt, json_mode=False):
+    """Pick a canned reply for a prompt."""
+    if '"nodes"' in system_prompt:
+        return json.dumps(CANNED_ATTACK_TREE)
+    if "Risk Assessment" in prompt:
+        return json.dumps(CANNED_DREAD)
+    if "threat_model" in prompt:
+        return json.dumps(CANNED_THREAT_MODEL)
+    if "Gherkin" in prompt:
+        return CANNED_TEST_CASES
+    if "mitigation" in prompt.lower() or "缓解" in prompt:
+        return json.dumps(CANNED_MITIGATIONS)
+    if json_mode:
+        # Attack tree prompts only carry the application details; the JSON
+        # instructions are in the system prompt, which Ollama requests inline
+        return json.dumps(CANNED_ATTACK_TREE)
+    return "OK"
+
+
+def _text_of(content):
+    # Message content is a string or a list of content blocks
+    if isinstance(content, str):
+        return content
+    return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+
+
+def _count_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def openai_chat_completion(body):
+    messages = body.get("messages", [])
+    system_prompt = "".join(_text_of(m["content"]) for m in messages if m.get("role") == "system")
+    prompt = "".join(_text_of(m["content"]) for m in messages if m.get("role") != "system")
+    content = canned_response(system_prompt, prompt)
+    return {
+        "id": f"chatcmpl-stub-{next(_ids)}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {
+            "prompt_tokens": _count_tokens(system_prompt + prompt),
+            "completion_tokens": _count_tokens(content),
+            "total_tokens": _count_tokens(system_prompt + prompt) + _count_tokens(content),
+        },
+    }
+
+
+def anthropic_message(params):
+    system_prompt = _text_of(params.get("system", ""))
+    prompt = "".join(_text_of(m["content"]) for m in params.get("messages", []))
+    content = canned_response(system_prompt, prompt)
+    return {
+        "id": f"msg_stub_{next(_ids)}",
+        "type": "message",
+        "role": "assistant",
+        "model": params.get("model", "stub"),
+        "content": [{"type": "text", "text": content}],
+        "stop_reason": "end_turn",
+        "stop_sequence": None,
+        "usage": {"input_tokens": _count_tokens(system_prompt + prompt), "output_tokens": _count_tokens(content)},
+    }
+
+
+def ollama_generate(body):
+    prompt = body.get("system", "") + body.get("prompt", "")
+    content = canned_response("", prompt, json_mode=body.get("format") == "json")
+    return {
+        "model": body.get("model", "stub"),
+        "created_at": _now(),
+        "response": content,
+        "done": True,
+        "done_reason": "stop",
+        "prompt_eval_count": _count_tokens(prompt),
+        "eval_count": _count_tokens(content),
+    }
+
+
+def ollama_chat(body):
+    messages = body.get("messages", [])
+    system_prompt = "".join(m["content"] for m in messages if m.get("role") == "system")
+    prompt = "".join(m["content"] for m in messages if m.get("role") != "system")
+    content = canned_response(system_prompt, prompt, json_mode=body.get("format") == "json")
+    return {
+        "model": body.get("model", "stub"),
+        "created_at": _now(),
+        "message": {"role": "assistant", "content": content},
+        "done": True,
+        "done_reason": "stop",
+        "prompt_eval_count": _count_tokens(system_prompt + prompt),
+        "eval_count": _count_tokens(content),
+    }
+
+
+def _output_tokens(reply):
+    # Output token count of a reply from any of the synchronous endpoints
+    usage = reply.get("usage") or {}
+    return usage.get("completion_tokens") or usage.get("output_tokens") or reply.get("eval_count") or 0
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class StubState:
+    """
+    In-memory files and batches, plus the simulated provider behaviour.
+
+    Batches complete batch_delay seconds after creation. Synchronous requests wait
+    latency seconds (plus up to jitter seconds), then output_tokens / token_rate
+    seconds, and fail with failure_status for a failure_rate fraction of requests.
+    """
+
+    def __init__(self, batch_delay=2.0, latency=0.0, jitter=0.0, token_rate=None, failure_rate=0.0,
+                 failure_status=500, seed=0):
+        self.batch_delay = batch_delay
+        self.latency = latency
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.random = random.Random(seed)
+        self.files = {}
+        self.batches = {}
+        self.requests = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def simulate(self, output_tokens):
+        """
+        Delay a synchronous reply as configured.
+
+        Returns:
+            bool: True if the request should fail
+        """
+        with self.lock:
+            self.requests += 1
+            delay = self.latency + self.jitter * self.random.random()
+            failed = self.random.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        if not failed and self.token_rate:
+            delay += output_tokens / self.token_rate
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+    def add_file(self, content, purpose):
+        file_id = f"file-stub-{next(_ids)}"
+        with self.lock:
+            self.files[file_id] = {"content": content, "purpose": purpose, "created_at": int(time.time())}
+        return file_id
+
+    def batch_ready(self, batch):
+        return time.time() - batch["submitted"] >= self.batch_delay
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state = None
+    base_url = ""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, text, content_type="application/octet-stream"):
+        data = text.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, payload):
+        if self.state.simulate(_output_tokens(payload)):
+            self._send_json({"error": {"type": "api_error", "message": "Injected failure"}}, status=self.state.failure_status)
+        else:
+            self._send_json(payload)
+
+    def _not_found(self):
+        self._send_json({"error": {"type": "not_found_error", "message": f"Unknown path {self.path}"}}, status=404)
+
+    # ------------------ OpenAI ------------------ #
+
+    def _upload_file(self):
+        # Parse the multipart upload with the email parser (the cgi module is deprecated)
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode()
+        message = email.parser.BytesParser(policy=email.policy.default).parsebytes(header + self._body())
+        content, purpose = b"", ""
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            if name == "file":
+                content = part.get_payload(decode=True)
+            elif name == "purpose":
+                purpose = part.get_payload(decode=True).decode()
+        file_id = self.state.add_file(content.decode(), purpose)
+        self._send_json({"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                         "filename": "batch.jsonl", "purpose": purpose, "status": "processed"})
+
+    def _openai_batch(self, batch):
+        if batch["status"] == "in_progress" and self.state.batch_ready(batch):
+            self._complete_openai_batch(batch)
+        return {key: value for key, value in batch.items() if key != "submitted"}
+
+    def _complete_openai_batch(self, batch):
+        lines = []
+        for line in self.state.files[batch["input_file_id"]]["content"].splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            lines.append(json.dumps({
+                "id": f"batch_req_{next(_ids)}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": f"req_{next(_ids)}", "body": openai_chat_completion(request["body"])},
+                "error": None,
+            }))
+        batch["output_file_id"] = self.state.add_file("\n".join(lines) + "\n", "batch_output")
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+        batch["request_counts"] = {"total": len(lines), "completed": len(lines), "failed": 0}
+
+    def _create_openai_batch(self):
+        body = json.loads(self._body())
+        batch_id = f"batch_stub_{next(_ids)}"
+        total = len([line for line in self.state.files[body["input_file_id"]]["content"].splitlines() if line.strip()])
+        batch = {
+            "id": batch_id, "object": "batch", "endpoint": body["endpoint"], "errors": None,
+            "input_file_id": body["input_file_id"], "completion_window": body.get("completion_window", "24h"),
+            "status": "in_progress", "output_file_id": None, "error_file_id": None,
+            "created_at": int(time.time()), "completed_at": None,
+            "request_counts": {"total": total, "completed": 0, "failed": 0},
+            "submitted": time.time(),
+        }
+        with self.state.lock:
+            self.state.batches[batch_id] = batch
+        self._send_json(self._openai_batch(batch))
+
+    # ------------------ Anthropic ------------------ #
+
+    def _anthropic_batch(self, batch):
+        if batch["processing_status"] == "in_progress" and self.state.batch_ready(batch):
+            batch["results"] = [
+                {"custom_id": request["custom_id"], "result": {"type": "succeeded", "message": anthropic_message(request["params"])}}
+                for request in batch["requests"]
+            ]
+            batch["processing_status"] = "ended"
+            batch["ended_at"] = _now()
+            batch["results_url"] = f"{self.base_url}/v1/messages/batches/{batch['id']}/results"
+            batch["request_counts"] = {"processing": 0, "succeeded": len(batch["requests"]), "errored": 0, "canceled": 0, "expired": 0}
+        return {key: value for key, value in batch.items() if key not in ("submitted", "requests", "results")}
+
+    def _create_anthropic_batch(self):
+        body = json.loads(self._body())
+        batch_id = f"msgbatch_stub_{next(_ids)}"
+        batch = {
+            "id": batch_id, "type": "message_batch", "processing_status": "in_progress",
+            "request_counts": {"processing": len(body["requests"]), "succeeded": 0, "errored": 0, "canceled": 0, "expired": 0},
+            "created_at": _now(), "expires_at": _now(), "ended_at": None, "archived_at": None,
+            "cancel_initiated_at": None, "results_url": None,
+            "requests": body["requests"], "submitted": time.time(),
+        }
+        with self.state.lock:
+            self.state.batches[batch_id] = batch
+        self._send_json(self._anthropic_batch(batch))
+
+    # ------------------ Routing ------------------ #
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        if path == "/v1/chat/completions":
+            self._reply(openai_chat_completion(json.loads(self._body())))
+        elif path == "/v1/messages":
+            self._reply(anthropic_message(json.loads(self._body())))
+        elif path == "/api/generate":
+            self._reply(ollama_generate(json.loads(self._body())))
+        elif path == "/api/chat":
+            self._reply(ollama_chat(json.loads(self._body())))
+        elif path == "/v1/files":
+            self._upload_file()
+        elif path == "/v1/batches":
+            self._create_openai_batch()
+        elif path == "/v1/messages/batches":
+            self._create_anthropic_batch()
+        else:
+            self._not_found()
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        batch = self.state.batches.get(parts[-1]) or (self.state.batches.get(parts[-2]) if len(parts) > 1 else None)
+
+        if parts == ["api", "tags"]:
+            self._send_json({"models": [{"name": "stub", "model": "stub", "modified_at": _now(), "size": 0}]})
+        elif parts[:2] == ["v1", "files"] and len(parts) == 4 and parts[3] == "content" and parts[2] in self.state.files:
+            self._send_text(self.state.files[parts[2]]["content"])
+        elif parts[:2] == ["v1", "batches"] and len(parts) == 3 and batch:
+            self._send_json(self._openai_batch(batch))
+        elif parts[:3] == ["v1", "messages", "batches"] and len(parts) == 4 and batch:
+            self._send_json(self._anthropic_batch(batch))
+        elif parts[:3] == ["v1", "messages", "batches"] and len(parts) == 5 and parts[4] == "results" and batch and "results" in batch:
+            self._send_text("\n".join(json.dumps(result) for result in batch["results"]) + "\n", "application/x-jsonl")
+        else:
+            self._not_found()
+
+
+def create_server(host="127.0.0.1", port=8765, batch_delay=2.0, **simulation):
+    """
+    Create the stub server; call serve_forever() on the result to run it.
+
+    Args:
+        simulation: latency, jitter, token_rate, failure_rate, failure_status and
+            seed, passed to StubState. The state is available as server.state.
+    """
+    state = StubState(batch_delay, **simulation)
+    handler = type("BoundStubHandler", (StubHandler,), {
+        "state": state,
+        "base_url": f"http://{host}:{port}",
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.state = state
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI and Anthropic APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--batch-delay", type=float, default=2.0, help="Seconds before a submitted batch completes")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every synchronous request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds, chosen at random")
+    parser.add_argument("--token-rate", type=float, help="Output tokens per second; unset replies immediately")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of synchronous requests that fail")
+    parser.add_argument("--failure-status", type=int, default=500, help="HTTP status of injected failures, e.g. 429")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for jitter and failure injection")
+    args = parser.parse_args(argv)
+
+    server = create_server(args.host, args.port, args.batch_delay, latency=args.latency, jitter=args.jitter,
+                           token_rate=args.token_rate, failure_rate=args.failure_rate,
+                           failure_status=args.failure_status, seed=args.seed)
+    print(f"LLM stub server listening on http://{args.host}:{args.port}/v1 (Ollama: http://{args.host}:{args.port})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -3,19 +3,21 @@
 import base64
 import streamlit as st
 import streamlit.components.v1 as components
-from github import Github
-from collections import defaultdict
-import re
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
 import requests
 import json
-import tiktoken
+import sqlite3
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
 
 from i18n import get_text, get_prompt_language_suffix
 from threat_model import (
     create_threat_model_prompt,
+    create_incremental_threat_model_prompt,
+    apply_threat_model_update,
+    get_threat_model_update,
     get_threat_model,
     get_threat_model_azure,
     get_threat_model_google,
@@ -34,17 +36,31 @@ from threat_model import (
     get_image_analysis_glm,
     create_image_analysis_prompt,
 )
-from attack_tree import create_attack_tree_prompt, get_attack_tree, get_attack_tree_azure, get_attack_tree_mistral, get_attack_tree_ollama, get_attack_tree_anthropic, get_attack_tree_lm_studio, get_attack_tree_groq, get_attack_tree_google, get_attack_tree_glm, get_attack_tree_ecloud
-from mitigations import create_mitigations_prompt, get_mitigations, get_mitigations_azure, get_mitigations_google, get_mitigations_mistral, get_mitigations_ollama, get_mitigations_anthropic, get_mitigations_lm_studio, get_mitigations_groq, get_mitigations_glm, get_mitigations_ecloud
-from test_cases import create_test_cases_prompt, get_test_cases, get_test_cases_azure, get_test_cases_google, get_test_cases_mistral, get_test_cases_ollama, get_test_cases_anthropic, get_test_cases_lm_studio, get_test_cases_groq, get_test_cases_glm, get_test_cases_ecloud
-from dread import create_dread_assessment_prompt, get_dread_assessment, get_dread_assessment_azure, get_dread_assessment_google, get_dread_assessment_mistral, get_dread_assessment_ollama, get_dread_assessment_anthropic, get_dread_assessment_lm_studio, get_dread_assessment_groq, get_dread_assessment_glm, get_dread_assessment_ecloud, dread_json_to_markdown
+from attack_tree import create_attack_tree_prompt, get_attack_tree, get_attack_tree_azure, get_attack_tree_mistral, get_attack_tree_ollama, get_attack_tree_anthropic, get_attack_tree_lm_studio, get_attack_tree_groq, get_attack_tree_google, get_attack_tree_glm, get_attack_tree_ecloud, expand_attack_tree, DEFAULT_EXPANSION_DEPTH, DEFAULT_EXPANSION_FAN_OUT
+from mitigations import create_mitigations_prompt, mitigations_json_to_markdown, split_mitigations, get_mitigations, get_mitigations_azure, get_mitigations_google, get_mitigations_mistral, get_mitigations_ollama, get_mitigations_anthropic, get_mitigations_lm_studio, get_mitigations_groq, get_mitigations_glm, get_mitigations_ecloud
+from test_cases import create_test_cases_prompt, split_test_cases, get_test_cases, get_test_cases_azure, get_test_cases_google, get_test_cases_mistral, get_test_cases_ollama, get_test_cases_anthropic, get_test_cases_lm_studio, get_test_cases_groq, get_test_cases_glm, get_test_cases_ecloud
+from dread import create_dread_assessment_prompt, get_dread_assessment, get_dread_assessment_azure, get_dread_assessment_google, get_dread_assessment_mistral, get_dread_assessment_ollama, get_dread_assessment_anthropic, get_dread_assessment_lm_studio, get_dread_assessment_groq, get_dread_assessment_glm, get_dread_assessment_ecloud, dread_json_to_markdown, split_dread_assessment
+from artefacts import artefact_key, clear_artefact, get_store, load_artefact, memoize, memoize_each, store_artefact
+from repo_analysis import DescriptionBuilder, build_hierarchical_overview, estimate_tokens, is_candidate_file, iter_ranked_summaries, rank_files, summarize_file
+from providers import complete, openai_client
+from github_graphql import GITHUB_API_URL, BlobBatchLoader, GraphQLError, find_readme
+from http_cache import get_fetcher
+from mermaid_svg import MermaidSyntaxError, render_svg
+from attack_tree_graph import AttackTree
+from attack_tree_analysis import evaluate_attack_tree
+from dread_analytics import WEIGHTING_SCHEMES, DreadTable
+from threat_record import normalize_threat_model
+from portfolio_index import get_index
+from utils import clean_mermaid_syntax
+from metrics import start_metrics_server
+from tracing import event, get_spans, set_session, summarize_spans, to_otlp_json, traced
 
 # ------------------ Helper Functions ------------------ #
 
 # Function to get available models from LM Studio Server
 def get_lm_studio_models(endpoint):
     try:
-        client = OpenAI(
+        client = openai_client(
             base_url=f"{endpoint}/v1",
             api_key="not-needed"
         )
@@ -100,6 +116,147 @@ def get_ollama_models(ollama_endpoint):
         st.error(get_text("ollama_unexpected_error", st.session_state.language).format(str(e)))
         return ["local-model"]
 
+# Session state keys holding the API key of each model provider
+PROVIDER_API_KEY_STATE = {
+    "OpenAI API": "openai_api_key",
+    "Anthropic API": "anthropic_api_key",
+    "Azure OpenAI Service": "azure_api_key",
+    "Google AI API": "google_api_key",
+    "Mistral API": "mistral_api_key",
+    "Groq API": "groq_api_key",
+    "GLM API": "glm_api_key",
+    "eCloud": "ecloud_api_key",
+}
+
+def get_provider_credentials(model_provider):
+    """
+    Collect the credentials of a model provider from the session state, in the form
+    expected by providers.complete.
+    """
+    return {
+        "api_key": st.session_state.get(PROVIDER_API_KEY_STATE.get(model_provider, ''), ''),
+        "azure_api_endpoint": st.session_state.get('azure_api_endpoint', ''),
+        "azure_api_version": '2023-12-01-preview',
+        "ollama_endpoint": st.session_state.get('ollama_endpoint', 'http://localhost:11434'),
+        "lm_studio_endpoint": st.session_state.get('lm_studio_endpoint', 'http://localhost:1234'),
+    }
+
+def get_provider_model(model_provider):
+    """Return the model (or Azure deployment) currently selected for a model provider."""
+    if model_provider == "Azure OpenAI Service":
+        return st.session_state.get('azure_deployment_name', '')
+    return st.session_state.get('selected_model', '')
+
+def is_reusable_output(output):
+    """
+    Whether a stage result can be shared with other users. The stage functions return
+    error placeholders instead of raising on most failures, and those must not be reused.
+    """
+    if not output:
+        return False
+    if isinstance(output, str):
+        return "error generating" not in output[:200].lower()
+    rows = output.get("threat_model", output.get("Risk Assessment", output.get("Mitigations")))
+    if rows is not None:
+        return bool(rows) and rows[0].get("Threat Type") != "Error"
+    return True
+
+def get_component_summarizer():
+    """
+    Return a function that summarises repository components with the selected model,
+    or None if LLM component summaries are disabled.
+    """
+    if not st.session_state.get('hierarchical_llm_summaries', False):
+        return None
+    model_provider = st.session_state.get('model_provider', 'OpenAI API')
+    model_name = get_provider_model(model_provider)
+    credentials = get_provider_credentials(model_provider)
+    return lambda prompt: complete(model_provider, model_name, prompt, credentials=credentials, max_tokens=400)
+
+def record_threat_model_run(threat_model, improvement_suggestions, inputs, commit=None):
+    """
+    Store the inputs and outputs of a threat model run so that a later run can update it
+    incrementally instead of regenerating it from scratch.
+    """
+    repo_url = st.session_state.get('last_analyzed_url', '')
+    if commit is None and repo_url == st.session_state.get('github_url', ''):
+        commit = st.session_state.get('last_analyzed_commit')
+    store_artefact('threat_model_run', {
+        "repo_url": repo_url,
+        "commit": commit,
+        "inputs": inputs,
+        "threat_model": threat_model,
+        "improvement_suggestions": improvement_suggestions,
+    })
+
+def memoize_per_threat(stage, threat_model, generate, split):
+    """
+    Run a downstream stage only for the threats that have no stored result for the
+    selected model and language, and reuse the stored results of the others. Threats
+    are keyed by their ID, so editing or adding a few threats only sends those.
+
+    Args:
+        stage (str): Stage name, e.g. "mitigations"
+        threat_model (list): The threats
+        generate (callable): Takes the Markdown table of the threats to send and
+            returns the stage output for them
+        split (callable): Splits a stage output into per-threat results, e.g.
+            split_mitigations
+
+    Returns:
+        tuple: (results of the threats in threat model order, None where the stage
+        returned nothing for a threat; the new stage output, or None if every threat
+        was stored)
+    """
+    model_provider = st.session_state.get('model_provider', 'OpenAI API')
+    threats = {}
+    for threat in normalize_threat_model(threat_model):
+        threats.setdefault(threat.id, threat)
+    output = {}
+
+    def generate_missing(threat_ids):
+        event("stage.per_threat", stage=stage, threats=len(threats), generated=len(threat_ids))
+        output["value"] = generate(json_to_markdown([threats[key] for key in threat_ids], [], st.session_state.language))
+        return split(output["value"], threat_ids)
+
+    results = memoize_each(
+        stage,
+        [model_provider, get_provider_model(model_provider), st.session_state.language],
+        list(threats),
+        generate_missing,
+        refresh=st.session_state.get('regenerate_results', False),
+    )
+    return results, output.get("value")
+
+def record_portfolio(stage, output, inputs=None, commit=None):
+    """
+    Record the output of a stage in the cross-application portfolio index. A threat
+    model starts a new portfolio run (pass its inputs); later stages are added to it.
+    """
+    try:
+        index = get_index()
+        if inputs is not None:
+            repo_url = st.session_state.get('last_analyzed_url', '')
+            application = st.session_state.get('application_name') or repo_url or inputs.get("app_type", "")
+            if commit is None and repo_url:
+                commit = st.session_state.get('last_analyzed_commit')
+            model_provider = st.session_state.get('model_provider', 'OpenAI API')
+            created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+            # Regenerating the same threat model on the same day updates one run
+            run_key = artefact_key("portfolio_run", [application, commit, load_artefact('app_input', ''), inputs, created_at[:10]])
+            st.session_state['portfolio_run_id'] = index.start_run(
+                run_key, application, commit=commit, created_at=created_at,
+                app_type=inputs.get("app_type"), authentication=inputs.get("authentication"),
+                internet_facing=inputs.get("internet_facing") == get_text("auth_yes", st.session_state.language),
+                sensitive_data=inputs.get("sensitive_data"), provider=model_provider,
+                model=get_provider_model(model_provider), language=st.session_state.language,
+            )
+        run_id = st.session_state.get('portfolio_run_id')
+        if run_id is not None:
+            index.record(run_id, stage, output)
+    except (sqlite3.Error, OSError) as e:
+        st.warning(get_text("portfolio_index_error", st.session_state.language).format(e))
+
 # Function to get user input for the application description and key details
 def get_input():
     # Repository type selection
@@ -128,9 +285,8 @@ def get_input():
             else:
                 with st.spinner(get_text("analyzing_github_repo", st.session_state.language)):
                     system_description = analyze_github_repo(github_url)
-                    st.session_state['github_analysis'] = system_description
+                    store_artefact('repo_analysis', system_description)
                     st.session_state['last_analyzed_url'] = github_url
-                    st.session_state['app_input'] = system_description + "\n\n" + st.session_state.get('app_input', '')
 
     # Gerrit URL input
     elif repo_type == "gerrit":
@@ -150,64 +306,142 @@ def get_input():
             else:
                 with st.spinner(get_text("analyzing_gerrit_repo", st.session_state.language)):
                     system_description = analyze_gerrit_repo(gerrit_url)
-                    st.session_state['gerrit_analysis'] = system_description
+                    store_artefact('repo_analysis', system_description)
                     st.session_state['last_analyzed_url'] = gerrit_url
-                    st.session_state['app_input'] = system_description + "\n\n" + st.session_state.get('app_input', '')
+
+    # The repository analysis is kept as its own artefact; only the user's description
+    # goes into the text area, whose value Streamlit holds in session state
+    analysis = load_artefact('repo_analysis', '')
+    if analysis:
+        with st.expander(get_text("repo_analysis_label", st.session_state.language)):
+            st.markdown(analysis)
 
     input_text = st.text_area(
         label=get_text("app_input_label", st.session_state.language),
-        value=st.session_state.get('app_input', ''),
+        value=load_artefact('app_description', ''),
         placeholder=get_text("app_input_placeholder", st.session_state.language),
         height=300,
         key="app_desc",
         help=get_text("app_input_help", st.session_state.language),
     )
 
-    st.session_state['app_input'] = input_text
+    if input_text != load_artefact('app_description', ''):
+        store_artefact('app_description', input_text)
 
-    return input_text
+    return f"{analysis}\n\n{input_text}" if analysis else input_text
 
-def estimate_tokens(text, model="gpt-4o"):
+def github_api_get(api_path):
     """
-    Estimate the number of tokens in a text string.
-    Uses tiktoken for OpenAI models, or falls back to a character-based approximation.
-    
-    Args:
-        text: The text to estimate tokens for
-        model: The model to use for estimation (default: gpt-4o)
-        
-    Returns:
-        Estimated token count
+    GET a GitHub REST API path with a conditional request, so unchanged resources are
+    served from the local cache without counting against the rate limit.
     """
-    try:
-        # Try to use tiktoken for accurate estimation
-        enc = tiktoken.encoding_for_model(model)
-        return len(enc.encode(text))
-    except (ImportError, KeyError, ValueError):
-        # Fall back to character-based approximation
-        # Different languages have different token densities
-        # English: ~4 chars per token, Chinese: ~1-2 chars per token
-        return len(text) // 4  # Conservative estimate for English text
+    response = get_fetcher().get(
+        f"{GITHUB_API_URL}{api_path}",
+        headers={
+            "Authorization": f"token {st.session_state.get('github_api_key', '')}",
+            "Accept": "application/vnd.github+json",
+        },
+    )
+    response.raise_for_status()
+    return response.json()
+
+def read_github_contents(owner, repo_name, path, ref):
+    """Read a file through the REST contents API."""
+    content = github_api_get(f"/repos/{owner}/{repo_name}/contents/{quote(path)}?ref={quote(ref, safe='')}")
+    return base64.b64decode(content["content"]).decode()
+
+def get_github_file_reader(owner, repo_name, ref, paths):
+    """
+    Return a function that reads the text of a repository file at a ref.
 
+    With the GraphQL backend, files are fetched in batches in the order given by paths,
+    falling back to the REST contents API if a GraphQL query fails.
+    """
+    loader = None
+    if st.session_state.get('github_fetch_backend', 'graphql') == 'graphql':
+        loader = BlobBatchLoader(owner, repo_name, ref, st.session_state.get('github_api_key', ''), paths)
+
+    def read_file(path):
+        nonlocal loader
+        if loader is not None:
+            try:
+                return loader.get(path)
+            except (GraphQLError, requests.RequestException):
+                # GraphQL unavailable (e.g. token without GraphQL access); use REST from now on
+                loader = None
+        return read_github_contents(owner, repo_name, path, ref)
+
+    return read_file
+
+def is_missing_file_error(error):
+    """
+    Whether a repository read failed because the file does not exist or is not text,
+    rather than because GitHub refused or failed the request (e.g. rate limiting).
+    """
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code == 404
+    return isinstance(error, (KeyError, ValueError))
+
+@traced()
 def analyze_github_repo(repo_url):
     # Extract owner and repo name from URL
     parts = repo_url.split('/')
     owner = parts[-2]
     repo_name = parts[-1]
 
-    # Initialize PyGithub
-    g = Github(st.session_state.get('github_api_key', ''))
+    # Get the repository and its default branch
+    repo = github_api_get(f"/repos/{owner}/{repo_name}")
+    default_branch = repo["default_branch"]
+    branch = github_api_get(f"/repos/{owner}/{repo_name}/branches/{quote(default_branch, safe='')}")
+    commit_sha = branch["commit"]["sha"]
 
-    # Get the repository
-    repo = g.get_repo(f"{owner}/{repo_name}")
-    # Get the default branch
-    default_branch = repo.default_branch
+    # Record the analysed commit so later runs can update the threat model incrementally
+    st.session_state['last_analyzed_commit'] = commit_sha
+
+    # The description depends only on the commit and the analysis settings, so users
+    # analysing the same commit share one analysis
+    model_provider = st.session_state.get('model_provider', 'OpenAI API')
+    analysis_inputs = {
+        "repo_url": repo_url,
+        "commit": commit_sha,
+        "token_limit": st.session_state.get('token_limit', 64000),
+        "model": [model_provider, get_provider_model(model_provider)],
+        "hierarchical_summaries": st.session_state.get('hierarchical_summaries', False),
+        "hierarchical_llm_summaries": st.session_state.get('hierarchical_llm_summaries', False),
+    }
+    failures = []
+    description = memoize(
+        "repo_analysis",
+        analysis_inputs,
+        lambda: describe_github_commit(repo_url, owner, repo_name, default_branch, commit_sha, failures),
+        # An analysis missing files GitHub failed to serve must not be shared
+        keep=lambda description: bool(description) and not failures,
+        refresh=st.session_state.get('regenerate_results', False),
+    )
+    if failures:
+        st.warning(f"⚠️ {len(failures)} repository files could not be read from GitHub (first error: {failures[0]}). The analysis may be incomplete and was not stored for reuse; try again later.")
+
+    # Shown here rather than while analysing, so analyses reused from the store warn too
+    token_limit = analysis_inputs["token_limit"]
+    token_estimation_model = st.session_state.get('selected_model', 'gpt-4o') if model_provider == "OpenAI API" else "gpt-4o"
+    estimated_total_tokens = estimate_tokens(description, token_estimation_model)
+    if estimated_total_tokens > token_limit * 0.9:
+        st.warning(f"⚠️ The GitHub analysis is using approximately {estimated_total_tokens} tokens, which is close to your configured limit of {token_limit}. Consider increasing the token limit in the sidebar settings if you need more comprehensive analysis.")
+    return description
 
-    # Get the tree of the default branch
-    tree = repo.get_git_tree(default_branch, recursive=True)
+def describe_github_commit(repo_url, owner, repo_name, default_branch, commit_sha, failures=None):
+    """
+    Build the system description of a repository at a commit.
+
+    Reads that fail for reasons other than a missing or binary file (rate limiting,
+    network errors) are appended to failures, so the caller can tell an incomplete
+    analysis from a complete one.
+    """
+    failures = failures if failures is not None else []
+    # Get the tree of the commit
+    tree_entries = github_api_get(f"/repos/{owner}/{repo_name}/git/trees/{commit_sha}?recursive=1")["tree"]
 
     # Analyze files
-    file_summaries = defaultdict(list)
     total_tokens = 0
     
     # Get the configured token limit from session state, or use a default
@@ -234,18 +468,33 @@ def analyze_github_repo(repo_url):
     # First, get the README to prioritize it
     readme_content = ""
     readme_tokens = 0
-    try:
-        readme_file = repo.get_contents("README.md", ref=default_branch)
-        readme_content = base64.b64decode(readme_file.content).decode()
-        readme_tokens = estimate_tokens(readme_content, token_estimation_model)
-    except:
+    readme_checked = False
+    if st.session_state.get('github_fetch_backend', 'graphql') == 'graphql':
+        # Look up all README name variants in a single query
+        try:
+            readme_path, readme_content = find_readme(owner, repo_name, default_branch, st.session_state.get('github_api_key', ''))
+            readme_checked = True
+            if readme_path is None:
+                st.warning("No README.md found in the repository.")
+            else:
+                readme_tokens = estimate_tokens(readme_content, token_estimation_model)
+        except Exception:
+            readme_content = ""
+    if not readme_checked:
         try:
-            # Try lowercase readme.md as fallback
-            readme_file = repo.get_contents("readme.md", ref=default_branch)
-            readme_content = base64.b64decode(readme_file.content).decode()
+            readme_content = read_github_contents(owner, repo_name, "README.md", default_branch)
             readme_tokens = estimate_tokens(readme_content, token_estimation_model)
-        except:
-            st.warning("No README.md found in the repository.")
+        except Exception as e:
+            if not is_missing_file_error(e):
+                failures.append(f"README.md: {e}")
+            try:
+                # Try lowercase readme.md as fallback
+                readme_content = read_github_contents(owner, repo_name, "readme.md", default_branch)
+                readme_tokens = estimate_tokens(readme_content, token_estimation_model)
+            except Exception as e:
+                if not is_missing_file_error(e):
+                    failures.append(f"readme.md: {e}")
+                st.warning("No README.md found in the repository.")
     
     # Calculate how many tokens we can use for code analysis
     # Reserve at least 30% of the token limit for code analysis
@@ -263,87 +512,190 @@ def analyze_github_repo(repo_url):
     progress_bar.progress(0.2)
     status_text.text("Analyzing code files...")
     
-    # Get all code files
-    code_files = [file for file in tree.tree if file.type == "blob" and file.path.endswith(
-        ('.py', '.js', '.ts', '.html', '.css', '.java', '.go', '.rb', '.c', '.cpp', '.h', '.cs', '.php')
-    )]
+    # Get all code, IaC and container definition files
+    code_files = [entry["path"] for entry in tree_entries if entry["type"] == "blob" and is_candidate_file(entry["path"])]
     
-    # Sort files by importance (you can customize this logic)
-    # For example, prioritize main files, configuration files, etc.
-    def file_importance(file):
-        # Lower score means higher importance
-        if file.path.lower() in ['main.py', 'app.py', 'index.js', 'package.json', 'config.json']:
-            return 0
-        if 'test' in file.path.lower() or 'spec' in file.path.lower():
-            return 3
-        if file.path.endswith(('.py', '.js', '.ts', '.java', '.go')):
-            return 1
-        return 2
+    # Sort files by security relevance so the token budget is spent on the files that matter most
+    code_files = rank_files(code_files)
     
-    code_files.sort(key=file_importance)
+    # Compile the analysis into a system description as files are processed
+    description = DescriptionBuilder(token_estimation_model)
+    description.append(f"Repository: {repo_url}\n\n")
+    
+    if readme_content:
+        description.append(readme_content + "\n", section="README.md Content", tokens=readme_tokens)
     
     # Process files until we reach the token limit
     total_tokens = readme_tokens
     file_count = len(code_files)
     processed_files = 0
+    read_file = get_github_file_reader(owner, repo_name, commit_sha, code_files)
     
-    for i, file in enumerate(code_files):
-        # Update progress
-        progress_percent = 0.2 + (0.8 * (i / file_count))
-        progress_bar.progress(min(progress_percent, 1.0))
-        status_text.text(f"Analyzing file {i+1}/{file_count}: {file.path}")
+    if st.session_state.get('hierarchical_summaries', False):
+        # Roll file summaries up into per-component digests for very large repositories
+        def fetch_summary(path):
+            try:
+                return summarize_file(path, read_file(path))
+            except Exception as e:
+                if not is_missing_file_error(e):
+                    failures.append(f"{path}: {e}")
+                return None
         
-        try:
-            content = repo.get_contents(file.path, ref=default_branch)
-            decoded_content = base64.b64decode(content.content).decode()
-            
-            # Summarize the file content
-            summary = summarize_file(file.path, decoded_content)
+        def show_progress(index, total, component):
+            progress_bar.progress(min(0.2 + (0.8 * (index / total)), 1.0))
+            status_text.text(f"Analyzing component {index+1}/{total}: {component}")
+        
+        overview, processed_files = build_hierarchical_overview(
+            code_files,
+            fetch_summary,
+            analysis_token_limit - readme_tokens,
+            count_tokens=lambda text: estimate_tokens(text, token_estimation_model),
+            tree_shas={entry["path"]: entry["sha"] for entry in tree_entries if entry["type"] == "tree"},
+            summarize=get_component_summarizer(),
+            cache_namespace=f"{model_provider}:{get_provider_model(model_provider)}",
+            on_progress=show_progress,
+        )
+        description.append(overview, section="Architecture Overview")
+    else:
+        fetched = []
+
+        def fetch_summary(path):
+            # Update progress
+            progress_bar.progress(min(0.2 + (0.8 * (len(fetched) / file_count)), 1.0))
+            status_text.text(f"Analyzing file {len(fetched)+1}/{file_count}: {path}")
+            fetched.append(path)
+            try:
+                return summarize_file(path, read_file(path))
+            except Exception as e:
+                # Skip files that can't be decoded, but remember reads GitHub failed
+                if not is_missing_file_error(e):
+                    failures.append(f"{path}: {e}")
+                return None
+
+        # Files are re-ranked with the auth, route and fan-in signals of their summaries
+        ranked_summaries = iter_ranked_summaries(
+            code_files,
+            fetch_summary,
+            analysis_token_limit - readme_tokens,
+            count_tokens=lambda text: estimate_tokens(text, token_estimation_model),
+        )
+        for i, (file_path, summary) in enumerate(ranked_summaries):
             summary_tokens = estimate_tokens(summary, token_estimation_model)
-            
+        
             # Check if adding this summary would exceed our token limit
             if total_tokens + summary_tokens > analysis_token_limit:
                 # If we're about to exceed the limit, add a note and stop processing
-                file_summaries["info"].append(f"Analysis truncated: {file_count - i} more files not analyzed due to token limit.")
+                description.append(f"Analysis truncated: {file_count - i} more files not analyzed due to token limit.\n", section="INFO Files")
                 break
-            
-            file_summaries[file.path.split('.')[-1]].append(summary)
+        
+            description.append(summary + "\n", section=f"{file_path.split('.')[-1].upper()} Files", tokens=summary_tokens)
             total_tokens += summary_tokens
             processed_files += 1
-        except Exception as e:
-            # Skip files that can't be decoded
-            continue
     
     # Clear progress indicators
     progress_bar.empty()
     status_text.empty()
     
-    # Compile the analysis into a system description
-    system_description = f"Repository: {repo_url}\n\n"
-    
-    if readme_content:
-        system_description += "README.md Content:\n"
-        system_description += readme_content + "\n\n"
-
-    for file_type, summaries in file_summaries.items():
-        system_description += f"{file_type.upper()} Files:\n"
-        for summary in summaries:
-            system_description += summary + "\n"
-        system_description += "\n"
-    
-    # Add token usage information
-    estimated_total_tokens = estimate_tokens(system_description, token_estimation_model)
-    system_description += f"\nRepository Analysis Summary:\n"
-    system_description += f"- Files analyzed: {processed_files} of {file_count} total files\n"
-    system_description += f"- Token usage estimate: ~{estimated_total_tokens} tokens\n"
-    system_description += f"- Token limit configured: {token_limit} tokens\n"
-    
-    # Show a warning if we're close to the token limit
-    if estimated_total_tokens > token_limit * 0.9:
-        st.warning(f"⚠️ The GitHub analysis is using approximately {estimated_total_tokens} tokens, which is close to your configured limit of {token_limit}. Consider increasing the token limit in the sidebar settings if you need more comprehensive analysis.")
+    # Add token usage information; the builder already tracks the running token count
+    estimated_total_tokens = description.token_count
+    description.append(
+        f"- Files analyzed: {processed_files} of {file_count} total files\n"
+        f"- Token usage estimate: ~{estimated_total_tokens} tokens\n"
+        f"- Token limit configured: {token_limit} tokens\n",
+        section="Repository Analysis Summary",
+    )
     
-    return system_description
+    return description.build()
+
+@traced()
+def analyze_github_diff(repo_url, base, head=None):
+    """
+    Describe the changes between two commits of a GitHub repository for an incremental
+    threat model update. Only the changed files are fetched and summarised, so the token
+    usage grows with the size of the change rather than the size of the repository.
+
+    Args:
+        repo_url (str): The URL of the GitHub repository
+        base (str): The commit SHA (or ref) of the previous analysis
+        head (str): The commit SHA (or ref) to compare against; defaults to the default branch
+
+    Returns:
+        tuple: (change description, head commit SHA, number of changed files analysed or
+            removed, 0 when nothing relevant changed)
+    """
+    parts = repo_url.rstrip('/').split('/')
+    owner = parts[-2]
+    repo_name = parts[-1]
+
+    from github import Github  # Only needed for incremental updates, so imported on first use
+
+    g = Github(st.session_state.get('github_api_key', ''), base_url=GITHUB_API_URL)
+    repo = g.get_repo(f"{owner}/{repo_name}")
+    head_sha = repo.get_commit(head or repo.default_branch).sha
+    comparison = repo.compare(base, head_sha)
 
+    token_limit = st.session_state.get('token_limit', 64000)
+    model_provider = st.session_state.get('model_provider', 'OpenAI API')
+    token_estimation_model = "gpt-4o"
+    if model_provider == "OpenAI API":
+        token_estimation_model = st.session_state.get('selected_model', 'gpt-4o')
+    analysis_token_limit = int(token_limit * 0.7)
+
+    changed_files = [file for file in comparison.files if is_candidate_file(file.filename)]
+    changed_files = rank_files(changed_files, key=lambda file: file.filename)
+
+    description = DescriptionBuilder(token_estimation_model)
+    description.append(f"Repository: {repo_url}\nCommit range: {base[:12]}..{head_sha[:12]}\n\n")
+
+    removed = [file.filename for file in changed_files if file.status == "removed"]
+    if removed:
+        description.append(''.join(f"- {path}\n" for path in removed), section="Removed Files")
+
+    processed_files = 0
+    read_file = get_github_file_reader(
+        owner, repo_name, head_sha,
+        [file.filename for file in changed_files if file.status != "removed"],
+    )
+
+    def fetch_summary(path):
+        try:
+            return summarize_file(path, read_file(path))
+        except Exception:
+            return f"File: {path}\n"
+
+    files_by_name = {file.filename: file for file in changed_files}
+    ranked_summaries = iter_ranked_summaries(
+        [file.filename for file in changed_files if file.status != "removed"],
+        fetch_summary,
+        analysis_token_limit,
+        count_tokens=lambda text: estimate_tokens(text, token_estimation_model),
+    )
+    for i, (path, summary) in enumerate(ranked_summaries):
+        file = files_by_name[path]
+        # The patch shows what actually changed; keep it short so large rewrites stay within budget
+        patch = (file.patch or '')[:2000]
+        entry = f"{summary}Status: {file.status} (+{file.additions}/-{file.deletions})\n"
+        if patch:
+            entry += f"```diff\n{patch}\n```\n"
+        entry_tokens = estimate_tokens(entry, token_estimation_model)
+
+        if description.token_count + entry_tokens > analysis_token_limit:
+            description.append(f"Analysis truncated: {len(changed_files) - len(removed) - i} more changed files not analyzed due to token limit.\n", section="INFO Files")
+            break
+
+        description.append(entry + "\n", section="Changed Files", tokens=entry_tokens)
+        processed_files += 1
+
+    description.append(
+        f"- Changed files analyzed: {processed_files} of {len(changed_files) - len(removed)}\n"
+        f"- Removed files: {len(removed)}\n"
+        f"- Token usage estimate: ~{description.token_count} tokens\n",
+        section="Change Analysis Summary",
+    )
+
+    return description.build(), head_sha, len(changed_files)
+
+@traced()
 def analyze_gerrit_repo(repo_url):
     """
     Analyze a Gerrit repository to extract system description information.
@@ -371,8 +723,9 @@ def analyze_gerrit_repo(repo_url):
         if repo_path.startswith('a/'):
             repo_path = repo_path[2:]
 
-        # Build Gerrit API URL
-        gerrit_api_url = f"https://{gerrit_host}/projects/{repo_path}"
+        # Build Gerrit API URL, keeping the scheme of the given URL (e.g. a local http test server)
+        gerrit_base_url = f"{parsed_url.scheme or 'https'}://{gerrit_host}"
+        gerrit_api_url = f"{gerrit_base_url}/projects/{repo_path}"
 
         # Get authentication credentials
         username = st.session_state.get('gerrit_username', '')
@@ -383,9 +736,10 @@ def analyze_gerrit_repo(repo_url):
         if username and password:
             auth = (username, password)
 
-        # Get project information
+        # Get project information; conditional requests serve unchanged resources from the local cache
         headers = {'Accept': 'application/json'}
-        response = requests.get(gerrit_api_url, auth=auth, headers=headers, timeout=30)
+        fetcher = get_fetcher()
+        response = fetcher.get(gerrit_api_url, auth=auth, headers=headers, timeout=30)
 
         # Gerrit returns JSON with a magic prefix, remove it
         if response.status_code == 200:
@@ -417,16 +771,16 @@ def analyze_gerrit_repo(repo_url):
         status_text.text("Analyzing Gerrit repository structure...")
 
         # Initialize variables
-        file_summaries = defaultdict(list)
         total_tokens = 0
+        processed_files = 0
 
         # Try to get README content first
         readme_content = ""
         readme_tokens = 0
         try:
             # Try to get files from the repository
-            files_api_url = f"https://{gerrit_host}/projects/{repo_path}/files/?recursive&limit=100"
-            files_response = requests.get(files_api_url, auth=auth, headers=headers, timeout=30)
+            files_api_url = f"{gerrit_base_url}/projects/{repo_path}/files/?recursive&limit=100"
+            files_response = fetcher.get(files_api_url, auth=auth, headers=headers, timeout=30)
 
             if files_response.status_code == 200:
                 files_content = files_response.text
@@ -438,8 +792,8 @@ def analyze_gerrit_repo(repo_url):
                 for file_path in files_data:
                     if 'README' in file_path.upper():
                         print(f"Found README file: {file_path}")
-                        file_api_url = f"https://{gerrit_host}/projects/{repo_path}/files/{file_path}/content"
-                        file_response = requests.get(file_api_url, auth=auth, headers=headers, timeout=30)
+                        file_api_url = f"{gerrit_base_url}/projects/{repo_path}/files/{file_path}/content"
+                        file_response = fetcher.get(file_api_url, auth=auth, headers=headers, timeout=30)
 
                         if file_response.status_code == 200:
                             file_content_b64 = file_response.text
@@ -466,40 +820,38 @@ def analyze_gerrit_repo(repo_url):
         progress_bar.progress(0.2)
         status_text.text("Analyzing code files...")
 
+        # Compile the analysis into a system description as files are processed
+        description = DescriptionBuilder(token_estimation_model)
+        description.append(f"Gerrit Repository: {repo_url}\n\n")
+
+        if readme_content:
+            description.append(readme_content + "\n", section="README Content", tokens=readme_tokens)
+
         # Try to get code files for analysis
         try:
             if files_response.status_code == 200:
-                # Filter code files
-                code_files = [file_path for file_path in files_data if file_path.endswith(
-                    ('.py', '.js', '.ts', '.html', '.css', '.java', '.go', '.rb', '.c', '.cpp', '.h', '.cs', '.php')
-                )]
-
-                # Sort files by importance (similar to GitHub analysis)
-                def file_importance(file_path):
-                    if file_path.lower() in ['main.py', 'app.py', 'index.js', 'package.json', 'config.json']:
-                        return 0
-                    if 'test' in file_path.lower() or 'spec' in file_path.lower():
-                        return 3
-                    if file_path.endswith(('.py', '.js', '.ts', '.java', '.go')):
-                        return 1
-                    return 2
-
-                code_files.sort(key=file_importance)
+                # Filter code, IaC and container definition files
+                code_files = [file_path for file_path in files_data if is_candidate_file(file_path)]
+
+                # Sort files by security relevance (same ranking as GitHub analysis)
+                code_files = rank_files(code_files)
 
                 # Process files until we reach the token limit
                 total_tokens = readme_tokens
                 file_count = len(code_files)
                 processed_files = 0
 
-                for i, file_path in enumerate(code_files):
+                fetched = []
+
+                def fetch_summary(file_path):
                     # Update progress
-                    progress_percent = 0.2 + (0.8 * (i / file_count))
-                    progress_bar.progress(min(progress_percent, 1.0))
-                    status_text.text(f"Analyzing file {i+1}/{file_count}: {file_path}")
+                    progress_bar.progress(min(0.2 + (0.8 * (len(fetched) / file_count)), 1.0))
+                    status_text.text(f"Analyzing file {len(fetched)+1}/{file_count}: {file_path}")
+                    fetched.append(file_path)
 
                     try:
-                        file_api_url = f"https://{gerrit_host}/projects/{repo_path}/files/{file_path}/content"
-                        file_response = requests.get(file_api_url, auth=auth, headers=headers, timeout=30)
+                        file_api_url = f"{gerrit_base_url}/projects/{repo_path}/files/{file_path}/content"
+                        file_response = fetcher.get(file_api_url, auth=auth, headers=headers, timeout=30)
 
                         if file_response.status_code == 200:
                             file_content_b64 = file_response.text
@@ -508,20 +860,30 @@ def analyze_gerrit_repo(repo_url):
                             decoded_content = base64.b64decode(file_content_b64).decode()
 
                             # Summarize the file content
-                            summary = summarize_file(file_path, decoded_content)
-                            summary_tokens = estimate_tokens(summary, token_estimation_model)
-
-                            # Check if adding this summary would exceed our token limit
-                            if total_tokens + summary_tokens > analysis_token_limit:
-                                file_summaries["info"].append(f"Analysis truncated: {file_count - i} more files not analyzed due to token limit.")
-                                break
-
-                            file_summaries[file_path.split('.')[-1]].append(summary)
-                            total_tokens += summary_tokens
-                            processed_files += 1
-                    except Exception as e:
+                            return summarize_file(file_path, decoded_content)
+                    except Exception:
                         # Skip files that can't be accessed
-                        continue
+                        return None
+                    return None
+
+                # Files are re-ranked with the auth, route and fan-in signals of their summaries
+                ranked_summaries = iter_ranked_summaries(
+                    code_files,
+                    fetch_summary,
+                    analysis_token_limit - readme_tokens,
+                    count_tokens=lambda text: estimate_tokens(text, token_estimation_model),
+                )
+                for i, (file_path, summary) in enumerate(ranked_summaries):
+                    summary_tokens = estimate_tokens(summary, token_estimation_model)
+
+                    # Check if adding this summary would exceed our token limit
+                    if total_tokens + summary_tokens > analysis_token_limit:
+                        description.append(f"Analysis truncated: {file_count - i} more files not analyzed due to token limit.\n", section="INFO Files")
+                        break
+
+                    description.append(summary + "\n", section=f"{file_path.split('.')[-1].upper()} Files", tokens=summary_tokens)
+                    total_tokens += summary_tokens
+                    processed_files += 1
         except Exception as e:
             st.warning(f"Could not analyze code files from Gerrit repository: {str(e)}")
 
@@ -529,31 +891,20 @@ def analyze_gerrit_repo(repo_url):
         progress_bar.empty()
         status_text.empty()
 
-        # Compile the analysis into a system description
-        system_description = f"Gerrit Repository: {repo_url}\n\n"
-
-        if readme_content:
-            system_description += "README Content:\n"
-            system_description += readme_content + "\n\n"
-
-        for file_type, summaries in file_summaries.items():
-            system_description += f"{file_type.upper()} Files:\n"
-            for summary in summaries:
-                system_description += summary + "\n"
-            system_description += "\n"
-
-        # Add token usage information
-        estimated_total_tokens = estimate_tokens(system_description, token_estimation_model)
-        system_description += f"\nRepository Analysis Summary:\n"
-        system_description += f"- Files analyzed: {processed_files} of {file_count if 'file_count' in locals() else 0} total files\n"
-        system_description += f"- Token usage estimate: ~{estimated_total_tokens} tokens\n"
-        system_description += f"- Token limit configured: {token_limit} tokens\n"
+        # Add token usage information; the builder already tracks the running token count
+        estimated_total_tokens = description.token_count
+        description.append(
+            f"- Files analyzed: {processed_files} of {file_count if 'file_count' in locals() else 0} total files\n"
+            f"- Token usage estimate: ~{estimated_total_tokens} tokens\n"
+            f"- Token limit configured: {token_limit} tokens\n",
+            section="Repository Analysis Summary",
+        )
 
         # Show a warning if we're close to the token limit
         if estimated_total_tokens > token_limit * 0.9:
             st.warning(f"⚠️ The Gerrit analysis is using approximately {estimated_total_tokens} tokens, which is close to your configured limit of {token_limit}. Consider increasing the token limit in the sidebar settings if you need more comprehensive analysis.")
 
-        return system_description
+        return description.build()
 
     except requests.exceptions.Timeout:
         error_msg = "连接Gerrit服务器超时。请检查网络连接或服务器状态。"
@@ -579,107 +930,38 @@ def analyze_gerrit_repo(repo_url):
         st.error(error_msg)
         return f"错误: {error_msg}"
 
-def summarize_file(file_path, content):
-    """
-    Summarize a file's content by extracting key components.
-    Adapts the level of detail based on file size and importance.
-    
-    Args:
-        file_path: Path to the file
-        content: Content of the file
-        
-    Returns:
-        A string summary of the file
-    """
-    # Determine file type
-    file_ext = file_path.split('.')[-1].lower() if '.' in file_path else ''
-    
-    # Initialize summary
-    summary = f"File: {file_path}\n"
-    
-    # For very large files, be more selective
-    is_large_file = len(content) > 10000
-    
-    # Extract imports based on file type
-    imports = []
-    if file_ext in ['py']:
-        imports = re.findall(r'^import .*|^from .* import .*', content, re.MULTILINE)
-    elif file_ext in ['js', 'ts']:
-        imports = re.findall(r'^import .*|^const .* = require\(.*\)|^import .* from .*', content, re.MULTILINE)
-    elif file_ext in ['java']:
-        imports = re.findall(r'^import .*;', content, re.MULTILINE)
-    elif file_ext in ['go']:
-        imports = re.findall(r'^import \(.*?\)|^import ".*"', content, re.MULTILINE | re.DOTALL)
-    
-    # Extract functions based on file type
-    functions = []
-    if file_ext in ['py']:
-        functions = re.findall(r'def .*\(.*\):', content, re.MULTILINE)
-    elif file_ext in ['js', 'ts']:
-        functions = re.findall(r'function .*\(.*\) {|const .* = \(.*\) =>|.*: function\(.*\)', content, re.MULTILINE)
-    elif file_ext in ['java', 'c', 'cpp', 'cs']:
-        functions = re.findall(r'(public|private|protected|static|\s) +[\w\<\>\[\]]+\s+(\w+) *\([^\)]*\) *(\{?|[^;])', content, re.MULTILINE)
-        functions = [' '.join(f).strip() for f in functions]
-    elif file_ext in ['go']:
-        functions = re.findall(r'func .*\(.*\).*{', content, re.MULTILINE)
-    
-    # Extract classes based on file type
-    classes = []
-    if file_ext in ['py']:
-        classes = re.findall(r'class .*:', content, re.MULTILINE)
-    elif file_ext in ['js', 'ts']:
-        classes = re.findall(r'class .* {', content, re.MULTILINE)
-    elif file_ext in ['java', 'c', 'cpp', 'cs']:
-        classes = re.findall(r'(public|private|protected|static|\s) +(class|interface) +(\w+)', content, re.MULTILINE)
-        classes = [' '.join(c).strip() for c in classes]
-    
-    # Add imports to summary (limit based on file size)
-    import_limit = 5 if not is_large_file else 3
-    if imports:
-        summary += "Imports:\n" + "\n".join(imports[:import_limit])
-        if len(imports) > import_limit:
-            summary += f"\n... ({len(imports) - import_limit} more imports)"
-        summary += "\n"
-    
-    # Add classes to summary (limit based on file size)
-    class_limit = 5 if not is_large_file else 3
-    if classes:
-        summary += "Classes:\n" + "\n".join(classes[:class_limit])
-        if len(classes) > class_limit:
-            summary += f"\n... ({len(classes) - class_limit} more classes)"
-        summary += "\n"
-    
-    # Add functions to summary (limit based on file size)
-    function_limit = 10 if not is_large_file else 5
-    if functions:
-        summary += "Functions:\n" + "\n".join(functions[:function_limit])
-        if len(functions) > function_limit:
-            summary += f"\n... ({len(functions) - function_limit} more functions)"
-        summary += "\n"
-    
-    # For configuration files (JSON, YAML, etc.), try to extract key information
-    if file_ext in ['json', 'yaml', 'yml', 'toml', 'ini']:
-        # Just include a snippet of the beginning for config files
-        config_preview = content[:500] + ("..." if len(content) > 500 else "")
-        summary += "Configuration Content Preview:\n" + config_preview + "\n"
-    
-    # For README or documentation files, include a brief excerpt
-    if 'readme' in file_path.lower() or file_ext in ['md', 'rst', 'txt']:
-        doc_preview = content[:300] + ("..." if len(content) > 300 else "")
-        summary += "Content Preview:\n" + doc_preview + "\n"
-    
-    return summary
-
 # Function to render Mermaid diagram
 def mermaid(code: str, height: int = 500) -> None:
     """
     Render a Mermaid diagram with error handling.
-    If rendering fails, displays the raw code with an error message.
+
+    Flowcharts are rendered to SVG on the server, so they show up immediately and
+    without network access; diagrams larger than height scroll. Other diagram types
+    fall back to mermaid.js in the browser. If rendering fails, displays the raw code
+    with an error message.
     """
     # Clean the code first
-    from utils import clean_mermaid_syntax
     cleaned_code = clean_mermaid_syntax(code)
 
+    try:
+        svg, _, svg_height = render_svg(cleaned_code)
+    except MermaidSyntaxError:
+        svg = None
+    if svg is not None:
+        components.html(
+            f"""
+            <div style="margin: 20px 0;">
+                <h4 style="margin-bottom: 10px;">Attack Tree Diagram:</h4>
+                <div style="border: 1px solid #ddd; border-radius: 5px; padding: 20px; background-color: white; overflow: auto;">
+                    {svg}
+                </div>
+            </div>
+            """,
+            height=min(int(svg_height) + 120, max(height, 800)),
+            scrolling=True,
+        )
+        return
+
     # Create a unique ID for this diagram
     import hashlib
     diagram_id = f"mermaid-{hashlib.md5(cleaned_code.encode()).hexdigest()[:8]}"
@@ -889,6 +1171,9 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# Serve Prometheus metrics on a separate port (METRICS_PORT, default 9464); started once per process
+start_metrics_server()
+
 # Load custom CSS for black and purple theme
 def load_css():
     with open("style.css", "r", encoding="utf-8") as f:
@@ -901,6 +1186,13 @@ load_css()
 if "language" not in st.session_state:
     st.session_state.language = "en"
 
+# Tag this run's spans so the performance panel only shows this session's operations
+if "trace_session" not in st.session_state:
+    st.session_state.trace_session = uuid.uuid4().hex
+set_session(st.session_state.trace_session)
+# Keep the session's artefact references alive while it is in use
+get_store().touch(st.session_state.trace_session)
+
 # Define callback for language change
 def on_language_change():
     """Update language when user changes selection"""
@@ -1359,6 +1651,28 @@ with st.sidebar:
         # Store the GitHub token limit in session state
         st.session_state['token_limit'] = token_limit
 
+        # Hierarchical (per-component) summarization for very large repositories
+        st.checkbox(
+            get_text("hierarchical_summaries_label", st.session_state.language),
+            key="hierarchical_summaries",
+            help=get_text("hierarchical_summaries_help", st.session_state.language)
+        )
+        st.checkbox(
+            get_text("hierarchical_llm_summaries_label", st.session_state.language),
+            key="hierarchical_llm_summaries",
+            disabled=not st.session_state.get('hierarchical_summaries', False),
+            help=get_text("hierarchical_llm_summaries_help", st.session_state.language)
+        )
+
+        # Backend used to fetch file contents from GitHub
+        st.radio(
+            get_text("github_fetch_backend_label", st.session_state.language),
+            options=["graphql", "rest"],
+            format_func=lambda x: get_text(f"github_fetch_backend_{x}", st.session_state.language),
+            key="github_fetch_backend",
+            help=get_text("github_fetch_backend_help", st.session_state.language)
+        )
+
         # Add Gerrit token limit configuration
         # Get the max token limit for Gerrit (can use same limits as GitHub)
         gerrit_max_token_limit = max_token_limit
@@ -1381,6 +1695,14 @@ with st.sidebar:
         # Store the Gerrit token limit in session state
         st.session_state['gerrit_token_limit'] = gerrit_token_limit
 
+    # Results are shared across users by prompt and model; this skips them so a poor
+    # answer can be generated again, replacing the stored one
+    st.checkbox(
+        get_text("regenerate_results_label", st.session_state.language),
+        key="regenerate_results",
+        help=get_text("regenerate_results_help", st.session_state.language),
+    )
+
     st.markdown("---")
 
     # Add "About" section to the sidebar
@@ -1506,39 +1828,49 @@ with tab1:
                     media_type = "image/jpeg"  # Default fallback
 
                 try:
-                    if model_provider == "OpenAI API":
-                        if not openai_api_key:
-                            st.error(get_text("please_enter_api_key", st.session_state.language).format("OpenAI"))
-                            raise ValueError
-                        image_analysis_output = get_image_analysis(openai_api_key, selected_model, image_analysis_prompt, base64_image)
-                    elif model_provider == "Azure OpenAI Service":
-                        if not azure_api_key or not azure_api_endpoint or not azure_deployment_name:
-                            st.error(get_text("please_enter_api_key", st.session_state.language).format("Azure OpenAI"))
-                            raise ValueError
-                        azure_api_version = '2023-12-01-preview'
-                        image_analysis_output = get_image_analysis_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, image_analysis_prompt, base64_image)
-                    elif model_provider == "Google AI API":
-                        if not google_api_key:
-                            st.error(get_text("please_enter_api_key", st.session_state.language).format("Google AI"))
-                            raise ValueError
-                        image_analysis_output = get_image_analysis_google(google_api_key, selected_model, image_analysis_prompt, base64_image)
-                    elif model_provider == "Anthropic API":
-                        if not anthropic_api_key:
-                            st.error(get_text("please_enter_api_key", st.session_state.language).format("Anthropic"))
-                            raise ValueError
-                        image_analysis_output = get_image_analysis_anthropic(anthropic_api_key, selected_model, image_analysis_prompt, base64_image, media_type)
-                    elif model_provider == "GLM API":
-                        if not glm_api_key:
-                            st.error(get_text("please_enter_api_key", st.session_state.language).format("GLM"))
-                            raise ValueError
-                        image_analysis_output = get_image_analysis_glm(glm_api_key, selected_model, image_analysis_prompt, base64_image, media_type)
-                    else:
-                        image_analysis_output = None
+                    def run_image_analysis():
+                        if model_provider == "OpenAI API":
+                            if not openai_api_key:
+                                st.error(get_text("please_enter_api_key", st.session_state.language).format("OpenAI"))
+                                raise ValueError
+                            return get_image_analysis(openai_api_key, selected_model, image_analysis_prompt, base64_image)
+                        elif model_provider == "Azure OpenAI Service":
+                            if not azure_api_key or not azure_api_endpoint or not azure_deployment_name:
+                                st.error(get_text("please_enter_api_key", st.session_state.language).format("Azure OpenAI"))
+                                raise ValueError
+                            azure_api_version = '2023-12-01-preview'
+                            return get_image_analysis_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, image_analysis_prompt, base64_image)
+                        elif model_provider == "Google AI API":
+                            if not google_api_key:
+                                st.error(get_text("please_enter_api_key", st.session_state.language).format("Google AI"))
+                                raise ValueError
+                            return get_image_analysis_google(google_api_key, selected_model, image_analysis_prompt, base64_image)
+                        elif model_provider == "Anthropic API":
+                            if not anthropic_api_key:
+                                st.error(get_text("please_enter_api_key", st.session_state.language).format("Anthropic"))
+                                raise ValueError
+                            return get_image_analysis_anthropic(anthropic_api_key, selected_model, image_analysis_prompt, base64_image, media_type)
+                        elif model_provider == "GLM API":
+                            if not glm_api_key:
+                                st.error(get_text("please_enter_api_key", st.session_state.language).format("GLM"))
+                                raise ValueError
+                            return get_image_analysis_glm(glm_api_key, selected_model, image_analysis_prompt, base64_image, media_type)
+                        else:
+                            return None
+
+                    # The same diagram analysed with the same model is only sent to the model once
+                    image_analysis_output = memoize(
+                        "image_analysis",
+                        [model_provider, get_provider_model(model_provider), image_analysis_prompt, base64_image],
+                        run_image_analysis,
+                        keep=lambda output: bool(output and 'choices' in output and output['choices'][0]['message']['content']),
+                        refresh=st.session_state.get('regenerate_results', False),
+                    )
 
                     if image_analysis_output and 'choices' in image_analysis_output and image_analysis_output['choices'][0]['message']['content']:
                         image_analysis_content = image_analysis_output['choices'][0]['message']['content']
-                        st.session_state.image_analysis_content = image_analysis_content
-                        st.session_state['app_input'] = image_analysis_content
+                        store_artefact('image_analysis_content', image_analysis_content)
+                        store_artefact('app_description', image_analysis_content)
                     else:
                         st.error(get_text("failed_to_analyze", st.session_state.language))
                 except Exception as e:
@@ -1547,11 +1879,11 @@ with tab1:
         # Use the get_input() function to get the application description and GitHub URL
         app_input = get_input()
         # Update session state only if the text area content has changed
-        if app_input != st.session_state['app_input']:
-            st.session_state['app_input'] = app_input
+        if app_input != load_artefact('app_input'):
+            store_artefact('app_input', app_input)
 
     # Ensure app_input is always up to date in the session state
-    app_input = st.session_state['app_input']
+    app_input = load_artefact('app_input', '')
 
 
 
@@ -1600,6 +1932,11 @@ with tab1:
                 help=get_text("auth_help", st.session_state.language),
             )
 
+            st.text_input(
+                get_text("application_name_label", st.session_state.language),
+                key="application_name",
+                help=get_text("application_name_help", st.session_state.language),
+            )
 
 
     # ------------------ Threat Model Generation ------------------ #
@@ -1608,14 +1945,14 @@ with tab1:
     threat_model_submit_button = st.button(label=get_text("analyze_button", st.session_state.language))
 
     # If the Generate Threat Model button is clicked and the user has provided an application description
-    if threat_model_submit_button and st.session_state.get('app_input'):
-        app_input = st.session_state['app_input']  # Retrieve from session state
+    if threat_model_submit_button and load_artefact('app_input'):
+        app_input = load_artefact('app_input')  # Retrieve from session state
         # Generate the prompt using the create_prompt function
         threat_model_prompt = create_threat_model_prompt(app_type, authentication, internet_facing, sensitive_data, app_input, st.session_state.language)
 
         # Clear thinking content when switching models or starting a new operation
         if model_provider != "Anthropic API" or "thinking" not in anthropic_model.lower():
-            st.session_state.pop('last_thinking_content', None)
+            clear_artefact('last_thinking_content')
 
         # Show a spinner while generating the threat model
         with st.spinner(get_text("analysing_threats", st.session_state.language)):
@@ -1624,42 +1961,63 @@ with tab1:
             while retry_count < max_retries:
                 try:
                     # Call the relevant get_threat_model function with the generated prompt
-                    if model_provider == "Azure OpenAI Service":
-                        model_output = get_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, threat_model_prompt)
-                    elif model_provider == "OpenAI API":
-                        model_output = get_threat_model(openai_api_key, selected_model, threat_model_prompt)
-                    elif model_provider == "Google AI API":
-                        model_output = get_threat_model_google(google_api_key, google_model, threat_model_prompt)
-                    elif model_provider == "Mistral API":
-                        model_output = get_threat_model_mistral(mistral_api_key, mistral_model, threat_model_prompt)
-                    elif model_provider == "Ollama":
-                        model_output = get_threat_model_ollama(st.session_state['ollama_endpoint'], selected_model, threat_model_prompt)
-                    elif model_provider == "Anthropic API":
-                        model_output = get_threat_model_anthropic(anthropic_api_key, anthropic_model, threat_model_prompt)
-                        # Check if we got a fallback response
-                        if model_output.get("threat_model") and len(model_output["threat_model"]) == 1 and model_output["threat_model"][0].get("Threat Type") == "Error":
-                            st.warning("⚠️ " + get_text("threat_model_generation_issue", st.session_state.language))
-                            st.markdown("1. " + get_text("retry_generation", st.session_state.language))
-                            st.markdown("2. " + get_text("check_logs", st.session_state.language))
-                            st.markdown("3. " + get_text("use_different_model", st.session_state.language))
-                    elif model_provider == "LM Studio Server":
-                        model_output = get_threat_model_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, threat_model_prompt)
-                    elif model_provider == "Groq API":
-                        model_output = get_threat_model_groq(groq_api_key, groq_model, threat_model_prompt)
-                    elif model_provider == "GLM API":
-                        model_output = get_threat_model_glm(glm_api_key, glm_model, threat_model_prompt)
-                    elif model_provider == "eCloud":
-                        model_output = get_threat_model_ecloud(ecloud_api_key, ecloud_model, threat_model_prompt)
-
-                    # Access the threat model and improvement suggestions from the parsed content
-                    threat_model = model_output.get("threat_model", [])
+                    def generate_threat_model():
+                        if model_provider == "Azure OpenAI Service":
+                            model_output = get_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, threat_model_prompt)
+                        elif model_provider == "OpenAI API":
+                            model_output = get_threat_model(openai_api_key, selected_model, threat_model_prompt)
+                        elif model_provider == "Google AI API":
+                            model_output = get_threat_model_google(google_api_key, google_model, threat_model_prompt)
+                        elif model_provider == "Mistral API":
+                            model_output = get_threat_model_mistral(mistral_api_key, mistral_model, threat_model_prompt)
+                        elif model_provider == "Ollama":
+                            model_output = get_threat_model_ollama(st.session_state['ollama_endpoint'], selected_model, threat_model_prompt)
+                        elif model_provider == "Anthropic API":
+                            model_output = get_threat_model_anthropic(anthropic_api_key, anthropic_model, threat_model_prompt)
+                            # Check if we got a fallback response
+                            if model_output.get("threat_model") and len(model_output["threat_model"]) == 1 and model_output["threat_model"][0].get("Threat Type") == "Error":
+                                st.warning("⚠️ " + get_text("threat_model_generation_issue", st.session_state.language))
+                                st.markdown("1. " + get_text("retry_generation", st.session_state.language))
+                                st.markdown("2. " + get_text("check_logs", st.session_state.language))
+                                st.markdown("3. " + get_text("use_different_model", st.session_state.language))
+                        elif model_provider == "LM Studio Server":
+                            model_output = get_threat_model_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, threat_model_prompt)
+                        elif model_provider == "Groq API":
+                            model_output = get_threat_model_groq(groq_api_key, groq_model, threat_model_prompt)
+                        elif model_provider == "GLM API":
+                            model_output = get_threat_model_glm(glm_api_key, glm_model, threat_model_prompt)
+                        elif model_provider == "eCloud":
+                            model_output = get_threat_model_ecloud(ecloud_api_key, ecloud_model, threat_model_prompt)
+                        return model_output
+
+                    # Users sending the same prompt to the same model share one result
+                    model_output = memoize(
+                        "threat_model",
+                        [model_provider, get_provider_model(model_provider), threat_model_prompt, st.session_state.language],
+                        generate_threat_model,
+                        keep=is_reusable_output,
+                        refresh=st.session_state.get('regenerate_results', False),
+                    )
+
+                    # Access the threat model and improvement suggestions from the parsed content,
+                    # normalising the threats once so later stages do not probe provider keys
+                    threat_model = [threat.to_dict() for threat in normalize_threat_model(model_output.get("threat_model", []))]
                     improvement_suggestions = model_output.get("improvement_suggestions", [])
 
                     # Save the threat model to the session state for later use in mitigations
-                    st.session_state['threat_model'] = threat_model
+                    store_artefact('threat_model', threat_model)
+                    threat_model_inputs = {
+                        "app_type": app_type,
+                        "authentication": authentication,
+                        "internet_facing": internet_facing,
+                        "sensitive_data": sensitive_data,
+                    }
+                    record_threat_model_run(threat_model, improvement_suggestions, threat_model_inputs)
+                    record_portfolio("threat_model", threat_model, threat_model_inputs)
                     break  # Exit the loop if successful
                 except Exception as e:
                     retry_count += 1
+                    event("stage.retry", stage="threat_model", provider=model_provider, retries=1, error=str(e))
                     if retry_count == max_retries:
                         st.error(get_text("error_generating_threat_model", st.session_state.language).format(max_retries, e))
                         threat_model = []
@@ -1671,13 +2029,13 @@ with tab1:
         markdown_output = json_to_markdown(threat_model, improvement_suggestions, st.session_state.language)
 
         # Display thinking content in an expander if available
-        if ('last_thinking_content' in st.session_state and 
-            st.session_state['last_thinking_content'] and 
+        thinking_content = load_artefact('last_thinking_content')
+        if (thinking_content and 
             ((model_provider == "Anthropic API" and "thinking" in anthropic_model.lower()) or
              (model_provider == "Google AI API" and "gemini-2.5" in google_model.lower()))):
             thinking_model = "Claude" if model_provider == "Anthropic API" else "Gemini"
             with st.expander(get_text("view_thinking_process", st.session_state.language).format(thinking_model)):
-                st.markdown(st.session_state['last_thinking_content'])
+                st.markdown(thinking_content)
 
         # Display the threat model in Markdown
         st.markdown(markdown_output)
@@ -1690,8 +2048,115 @@ with tab1:
             mime="text/markdown",
         )
         
+    # ------------------ Incremental Threat Model Update ------------------ #
+
+    with st.expander(get_text("incremental_update_header", st.session_state.language)):
+        st.markdown(get_text("incremental_update_description", st.session_state.language))
+
+        # A previous run can be restored from a downloaded run file
+        uploaded_run = st.file_uploader(
+            get_text("incremental_run_upload_label", st.session_state.language),
+            type=["json"],
+            key="threat_model_run_upload",
+        )
+        # The uploader keeps its file across reruns, so a file is applied only once;
+        # otherwise it would overwrite every threat model generated or updated after it
+        if uploaded_run is not None and st.session_state.get('applied_run_upload') != uploaded_run.file_id:
+            st.session_state['applied_run_upload'] = uploaded_run.file_id
+            try:
+                restored_run = json.loads(uploaded_run.getvalue().decode())
+                if not isinstance(restored_run, dict) or not isinstance(restored_run.get("threat_model", []), list):
+                    raise ValueError("expected a JSON object with a threat_model list")
+                store_artefact('threat_model_run', restored_run)
+                store_artefact('threat_model', [threat.to_dict() for threat in normalize_threat_model(restored_run.get("threat_model", []))])
+            except (UnicodeDecodeError, ValueError) as e:
+                st.error(get_text("incremental_run_invalid", st.session_state.language).format(e))
+
+        threat_model_run = load_artefact('threat_model_run')
+        if not threat_model_run or not threat_model_run.get("repo_url") or not threat_model_run.get("commit"):
+            st.info(get_text("incremental_run_missing", st.session_state.language))
+        else:
+            st.download_button(
+                label=get_text("incremental_run_download", st.session_state.language),
+                data=json.dumps(threat_model_run, ensure_ascii=False, indent=2),
+                file_name="threat_model_run.json",
+                mime="application/json",
+            )
+            # Follow the run's commit, so an applied update becomes the next base
+            if st.session_state.get('incremental_base_run_commit') != threat_model_run["commit"]:
+                st.session_state['incremental_base_run_commit'] = threat_model_run["commit"]
+                st.session_state['incremental_base'] = threat_model_run["commit"]
+            base_commit = st.text_input(
+                get_text("incremental_base_label", st.session_state.language),
+                key="incremental_base",
+            )
+            head_ref = st.text_input(
+                get_text("incremental_head_label", st.session_state.language),
+                placeholder="main",
+                key="incremental_head",
+                help=get_text("incremental_head_help", st.session_state.language),
+            )
+
+            if st.button(get_text("incremental_update_button", st.session_state.language)):
+                if not st.session_state.get('github_api_key'):
+                    st.warning(get_text("github_api_key_warning", st.session_state.language))
+                else:
+                    try:
+                        with st.spinner(get_text("analyzing_github_repo", st.session_state.language)):
+                            change_summary, head_sha, changed_count = analyze_github_diff(
+                                threat_model_run["repo_url"], base_commit, head_ref or None
+                            )
+
+                        # Compare the file count rather than the SHAs: base may be a short SHA, tag or branch
+                        if changed_count == 0:
+                            st.info(get_text("incremental_no_changes", st.session_state.language))
+                        else:
+                            inputs = threat_model_run.get("inputs", {})
+                            update_prompt = create_incremental_threat_model_prompt(
+                                inputs.get("app_type", app_type),
+                                inputs.get("authentication", authentication),
+                                inputs.get("internet_facing", internet_facing),
+                                inputs.get("sensitive_data", sensitive_data),
+                                threat_model_run["threat_model"],
+                                change_summary,
+                                st.session_state.language,
+                            )
+                            with st.spinner(get_text("analysing_threats", st.session_state.language)):
+                                update = get_threat_model_update(
+                                    model_provider,
+                                    get_provider_model(model_provider),
+                                    update_prompt,
+                                    get_provider_credentials(model_provider),
+                                )
+                            threat_model, applied = apply_threat_model_update(threat_model_run["threat_model"], update)
+                            improvement_suggestions = update["improvement_suggestions"]
+
+                            store_artefact('threat_model', threat_model)
+                            store_artefact('threat_model_run', dict(
+                                threat_model_run,
+                                commit=head_sha,
+                                threat_model=threat_model,
+                                improvement_suggestions=improvement_suggestions,
+                            ))
+                            record_portfolio("threat_model", threat_model, inputs, commit=head_sha)
+
+                            st.success(get_text("incremental_update_applied", st.session_state.language).format(
+                                applied["added"], applied["modified"], applied["retired"]
+                            ))
+                            markdown_output = json_to_markdown(threat_model, improvement_suggestions, st.session_state.language)
+                            st.markdown(markdown_output)
+                            st.download_button(
+                                label=get_text("download_threat_model", st.session_state.language),
+                                data=markdown_output,
+                                file_name="threat_model.md",
+                                mime="text/markdown",
+                                key="download_incremental_threat_model",
+                            )
+                    except Exception as e:
+                        st.error(get_text("incremental_update_error", st.session_state.language).format(e))
+
 # If the submit button is clicked and the user has not provided an application description
-if threat_model_submit_button and not st.session_state.get('app_input'):
+if threat_model_submit_button and not load_artefact('app_input'):
     st.error(get_text("please_enter_app_details", st.session_state.language))
 
 
@@ -1712,52 +2177,109 @@ with tab2:
         if model_provider in ["Ollama", "LM Studio Server"]:
             st.warning(get_text("local_llm_warning", st.session_state.language))
         
+        # Breadth-first expansion generates every top-level goal's subtree in its own concurrent call
+        attack_tree_expansion = None
+        if st.checkbox(
+            get_text("attack_tree_expansion_label", st.session_state.language),
+            key="attack_tree_expansion",
+            help=get_text("attack_tree_expansion_help", st.session_state.language),
+        ):
+            depth_col, fan_out_col = st.columns(2)
+            with depth_col:
+                expansion_depth = st.number_input(
+                    get_text("attack_tree_depth_label", st.session_state.language),
+                    min_value=2,
+                    max_value=8,
+                    value=DEFAULT_EXPANSION_DEPTH,
+                    key="attack_tree_depth",
+                    help=get_text("attack_tree_depth_help", st.session_state.language),
+                )
+            with fan_out_col:
+                expansion_fan_out = st.number_input(
+                    get_text("attack_tree_fan_out_label", st.session_state.language),
+                    min_value=1,
+                    max_value=12,
+                    value=DEFAULT_EXPANSION_FAN_OUT,
+                    key="attack_tree_fan_out",
+                    help=get_text("attack_tree_fan_out_help", st.session_state.language),
+                )
+            attack_tree_expansion = {"depth": int(expansion_depth), "fan_out": int(expansion_fan_out)}
+
         # Create a submit button for Attack Tree
         attack_tree_submit_button = st.button(label=get_text("generate_attack_tree", st.session_state.language))
         
         # If the Generate Attack Tree button is clicked and the user has provided an application description
-        if attack_tree_submit_button and st.session_state.get('app_input'):
-            app_input = st.session_state.get('app_input')
+        if attack_tree_submit_button and load_artefact('app_input'):
+            app_input = load_artefact('app_input')
             # Generate the prompt using the create_attack_tree_prompt function
             attack_tree_prompt = create_attack_tree_prompt(app_type, authentication, internet_facing, sensitive_data, app_input, st.session_state.language)
 
             # Clear thinking content when switching models or starting a new operation
             if model_provider != "Anthropic API" or "thinking" not in anthropic_model.lower():
-                st.session_state.pop('last_thinking_content', None)
+                clear_artefact('last_thinking_content')
 
             # Show a spinner while generating the attack tree
             with st.spinner(get_text("generating_attack_tree", st.session_state.language)):
                 try:
+                    # Problems found while expanding the tree; the Mermaid code does not carry them
+                    expansion_issues = []
+                    expansion_failed = []
+
                     # Call the relevant get_attack_tree function with the generated prompt
-                    if model_provider == "Azure OpenAI Service":
-                        mermaid_code = get_attack_tree_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "OpenAI API":
-                        mermaid_code = get_attack_tree(openai_api_key, selected_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "Google AI API":
-                        mermaid_code = get_attack_tree_google(google_api_key, google_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "Mistral API":
-                        mermaid_code = get_attack_tree_mistral(mistral_api_key, mistral_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "Ollama":
-                        mermaid_code = get_attack_tree_ollama(st.session_state['ollama_endpoint'], selected_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "Anthropic API":
-                        mermaid_code = get_attack_tree_anthropic(anthropic_api_key, anthropic_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "LM Studio Server":
-                        mermaid_code = get_attack_tree_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "Groq API":
-                        mermaid_code = get_attack_tree_groq(groq_api_key, groq_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "GLM API":
-                        mermaid_code = get_attack_tree_glm(glm_api_key, glm_model, attack_tree_prompt, st.session_state.language)
-                    elif model_provider == "eCloud":
-                        mermaid_code = get_attack_tree_ecloud(ecloud_api_key, ecloud_model, attack_tree_prompt, st.session_state.language)
+                    def generate_attack_tree():
+                        if attack_tree_expansion:
+                            tree, failed_goals = expand_attack_tree(
+                                model_provider,
+                                get_provider_model(model_provider),
+                                attack_tree_prompt,
+                                get_provider_credentials(model_provider),
+                                depth=attack_tree_expansion["depth"],
+                                fan_out=attack_tree_expansion["fan_out"],
+                                language=st.session_state.language,
+                            )
+                            expansion_issues.extend(tree.issues)
+                            expansion_failed.extend(failed_goals)
+                            return tree.to_mermaid()
+                        if model_provider == "Azure OpenAI Service":
+                            mermaid_code = get_attack_tree_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "OpenAI API":
+                            mermaid_code = get_attack_tree(openai_api_key, selected_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "Google AI API":
+                            mermaid_code = get_attack_tree_google(google_api_key, google_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "Mistral API":
+                            mermaid_code = get_attack_tree_mistral(mistral_api_key, mistral_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "Ollama":
+                            mermaid_code = get_attack_tree_ollama(st.session_state['ollama_endpoint'], selected_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "Anthropic API":
+                            mermaid_code = get_attack_tree_anthropic(anthropic_api_key, anthropic_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "LM Studio Server":
+                            mermaid_code = get_attack_tree_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "Groq API":
+                            mermaid_code = get_attack_tree_groq(groq_api_key, groq_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "GLM API":
+                            mermaid_code = get_attack_tree_glm(glm_api_key, glm_model, attack_tree_prompt, st.session_state.language)
+                        elif model_provider == "eCloud":
+                            mermaid_code = get_attack_tree_ecloud(ecloud_api_key, ecloud_model, attack_tree_prompt, st.session_state.language)
+                        return mermaid_code
+
+                    # Users sending the same prompt to the same model share one result; a tree
+                    # with goals that failed to expand is incomplete and is not shared
+                    mermaid_code = memoize(
+                        "attack_tree",
+                        [model_provider, get_provider_model(model_provider), attack_tree_prompt, st.session_state.language, attack_tree_expansion],
+                        generate_attack_tree,
+                        keep=lambda code: not expansion_failed and is_reusable_output(code),
+                        refresh=st.session_state.get('regenerate_results', False),
+                    )
 
                     # Display thinking content in an expander if available
-                    if ('last_thinking_content' in st.session_state and 
-                        st.session_state['last_thinking_content'] and 
+                    thinking_content = load_artefact('last_thinking_content')
+                    if (thinking_content and 
                         ((model_provider == "Anthropic API" and "thinking" in anthropic_model.lower()) or
                          (model_provider == "Google AI API" and "gemini-2.5" in google_model.lower()))):
                         thinking_model = "Claude" if model_provider == "Anthropic API" else "Gemini"
                         with st.expander(get_text("view_thinking_process", st.session_state.language).format(thinking_model)):
-                            st.markdown(st.session_state['last_thinking_content'])
+                            st.markdown(thinking_content)
 
                     # Display the generated attack tree code
                     st.write(get_text("attack_tree_code", st.session_state.language))
@@ -1784,16 +2306,88 @@ with tab2:
                         mermaid_live_button = st.link_button(get_text("open_mermaid_live", st.session_state.language), "https://mermaid.live")
 
                     with col3:
-                        # Blank placeholder
-                        st.write("")
+                        # Add a button to download the diagram as rendered on the server
+                        try:
+                            svg, _, _ = render_svg(clean_mermaid_syntax(mermaid_code))
+                            st.download_button(
+                                label=get_text("download_diagram_svg", st.session_state.language),
+                                data=svg,
+                                file_name="attack_tree.svg",
+                                mime="image/svg+xml",
+                            )
+                        except MermaidSyntaxError:
+                            st.write("")
+
+                    # Keep the tree itself for exports and later analysis
+                    try:
+                        attack_tree = AttackTree.from_mermaid(clean_mermaid_syntax(mermaid_code))
+                    except MermaidSyntaxError:
+                        attack_tree = None
+                    if attack_tree is not None:
+                        store_artefact('attack_tree_data', attack_tree.to_dict())
 
                     with col4:
-                        # Blank placeholder
-                        st.write("")
+                        # Add a button to download the tree as a Graphviz DOT file
+                        if attack_tree is not None:
+                            st.download_button(
+                                label=get_text("download_diagram_dot", st.session_state.language),
+                                data=attack_tree.to_dot(),
+                                file_name="attack_tree.dot",
+                                mime="text/vnd.graphviz",
+                            )
 
                     with col5:
-                        # Blank placeholder
-                        st.write("")
+                        # Add a button to download the tree as JSON
+                        if attack_tree is not None:
+                            st.download_button(
+                                label=get_text("download_diagram_json", st.session_state.language),
+                                data=attack_tree.to_json(),
+                                file_name="attack_tree.json",
+                                mime="application/json",
+                            )
+
+                    tree_issues = expansion_issues + [
+                        issue for issue in (attack_tree.validate() if attack_tree is not None else []) if issue not in expansion_issues
+                    ]
+                    if tree_issues:
+                        with st.expander(get_text("attack_tree_issues", st.session_state.language)):
+                            for issue in tree_issues:
+                                st.markdown(f"- {issue}")
+
+                    # Quantify the tree when the model estimated what its attacks take
+                    if attack_tree is not None and any(
+                        attack_tree.nodes[leaf].cost is not None or attack_tree.nodes[leaf].probability is not None
+                        for leaf in attack_tree.leaves()
+                    ):
+                        analysis = evaluate_attack_tree(attack_tree)
+                        with st.expander(get_text("attack_tree_analysis", st.session_state.language), expanded=True):
+                            metric_col1, metric_col2, metric_col3 = st.columns(3)
+                            metric_col1.metric(get_text("attack_tree_cheapest_cost", st.session_state.language), f"{analysis['cost']:,.0f}")
+                            metric_col2.metric(get_text("attack_tree_success_probability", st.session_state.language), f"{analysis['probability']:.0%}")
+                            metric_col3.metric(get_text("attack_tree_minimum_skill", st.session_state.language), analysis["skill"])
+                            if analysis["estimated_leaves"]:
+                                st.caption(get_text("attack_tree_estimated_leaves", st.session_state.language).format(analysis["estimated_leaves"], analysis["leaves"]))
+
+                            st.markdown(f"**{get_text('attack_tree_cheapest_attack', st.session_state.language)}**")
+                            st.markdown("\n".join(
+                                f"- {attack_tree[node_id].label}" for node_id in analysis["cheapest_attack"] if not attack_tree[node_id].children
+                            ))
+
+                            st.markdown(f"**{get_text('attack_tree_cut_sets', st.session_state.language)}**")
+                            st.dataframe([
+                                {"cost": cut_set["cost"], "probability": round(cut_set["probability"], 3),
+                                 "attacks": " + ".join(attack_tree[node_id].label for node_id in cut_set["leaves"])}
+                                for cut_set in analysis["cut_sets"][:10]
+                            ])
+
+                            if analysis["mitigations"]:
+                                blocks_all = get_text("attack_tree_blocks_all", st.session_state.language)
+                                st.markdown(f"**{get_text('attack_tree_mitigation_ranking', st.session_state.language)}**")
+                                st.dataframe([
+                                    {"attack": mitigation["label"],
+                                     "cost increase": blocks_all if mitigation["cost_increase"] == float("inf") else f"+{mitigation['cost_increase']:,.0f}"}
+                                    for mitigation in analysis["mitigations"]
+                                ])
                     
                 except Exception as e:
                     st.error(get_text("error_generating_attack_tree", st.session_state.language).format(e))
@@ -1816,15 +2410,12 @@ with tab3:
     # If the Suggest Mitigations button is clicked and the user has identified threats
     if mitigations_submit_button:
         # Check if threat_model data exists
-        if 'threat_model' in st.session_state and st.session_state['threat_model']:
-            # Convert the threat_model data into a Markdown list
-            threats_markdown = json_to_markdown(st.session_state['threat_model'], [], st.session_state.language)
-            # Generate the prompt using the create_mitigations_prompt function
-            mitigations_prompt = create_mitigations_prompt(threats_markdown, st.session_state.language)
+        threat_model = load_artefact('threat_model')
+        if threat_model:
 
             # Clear thinking content when switching models or starting a new operation
             if model_provider != "Anthropic API" or "thinking" not in anthropic_model.lower():
-                st.session_state.pop('last_thinking_content', None)
+                clear_artefact('last_thinking_content')
 
             # Show a spinner while suggesting mitigations
             with st.spinner(get_text("suggesting_mitigations", st.session_state.language)):
@@ -1833,55 +2424,74 @@ with tab3:
                 while retry_count < max_retries:
                     try:
                         # Call the relevant get_mitigations function with the generated prompt
-                        if model_provider == "Azure OpenAI Service":
-                            mitigations_markdown = get_mitigations_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "OpenAI API":
-                            mitigations_markdown = get_mitigations(openai_api_key, selected_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "Google AI API":
-                            mitigations_markdown = get_mitigations_google(google_api_key, google_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "Mistral API":
-                            mitigations_markdown = get_mitigations_mistral(mistral_api_key, mistral_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "Ollama":
-                            mitigations_markdown = get_mitigations_ollama(st.session_state['ollama_endpoint'], selected_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "Anthropic API":
-                            mitigations_markdown = get_mitigations_anthropic(anthropic_api_key, anthropic_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "LM Studio Server":
-                            mitigations_markdown = get_mitigations_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "Groq API":
-                            mitigations_markdown = get_mitigations_groq(groq_api_key, groq_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "GLM API":
-                            mitigations_markdown = get_mitigations_glm(glm_api_key, glm_model, mitigations_prompt, st.session_state.language)
-                        elif model_provider == "eCloud":
-                            mitigations_markdown = get_mitigations_ecloud(ecloud_api_key, ecloud_model, mitigations_prompt, st.session_state.language)
+                        def generate_mitigations(threats_markdown):
+                            # Generate the prompt using the create_mitigations_prompt function
+                            mitigations_prompt = create_mitigations_prompt(threats_markdown, st.session_state.language)
+                            if model_provider == "Azure OpenAI Service":
+                                mitigations = get_mitigations_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "OpenAI API":
+                                mitigations = get_mitigations(openai_api_key, selected_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "Google AI API":
+                                mitigations = get_mitigations_google(google_api_key, google_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "Mistral API":
+                                mitigations = get_mitigations_mistral(mistral_api_key, mistral_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "Ollama":
+                                mitigations = get_mitigations_ollama(st.session_state['ollama_endpoint'], selected_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "Anthropic API":
+                                mitigations = get_mitigations_anthropic(anthropic_api_key, anthropic_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "LM Studio Server":
+                                mitigations = get_mitigations_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "Groq API":
+                                mitigations = get_mitigations_groq(groq_api_key, groq_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "GLM API":
+                                mitigations = get_mitigations_glm(glm_api_key, glm_model, mitigations_prompt, st.session_state.language)
+                            elif model_provider == "eCloud":
+                                mitigations = get_mitigations_ecloud(ecloud_api_key, ecloud_model, mitigations_prompt, st.session_state.language)
+                            return mitigations
+
+                        # Only threats without stored mitigations from this model are sent
+                        results, _ = memoize_per_threat("mitigations", threat_model, generate_mitigations, split_mitigations)
+                        mitigations = {"Mitigations": [entry for entry in results if entry]}
 
                         # Display thinking content in an expander if available and using a model with thinking capabilities
-                        if ('last_thinking_content' in st.session_state and 
-                            st.session_state['last_thinking_content'] and 
+                        thinking_content = load_artefact('last_thinking_content')
+                        if (thinking_content and 
                             ((model_provider == "Anthropic API" and "thinking" in anthropic_model.lower()) or
                              (model_provider == "Google AI API" and "gemini-2.5" in google_model.lower()))):
                             thinking_model = "Claude" if model_provider == "Anthropic API" else "Gemini"
                             with st.expander(get_text("view_thinking_process", st.session_state.language).format(thinking_model)):
-                                st.markdown(st.session_state['last_thinking_content'])
+                                st.markdown(thinking_content)
 
-                        # Display the suggested mitigations in Markdown
+                        store_artefact('mitigations', mitigations)
+                        record_portfolio("mitigations", mitigations)
+
+                        # Render the structured mitigations locally and display them in Markdown
+                        mitigations_markdown = mitigations_json_to_markdown(mitigations, st.session_state.language)
                         st.markdown(mitigations_markdown)
                         
                         st.markdown("")
                         
-                        # Add a button to allow the user to download the mitigations as a Markdown file
+                        # Add buttons to allow the user to download the mitigations as a Markdown or JSON file
                         st.download_button(
                             label=get_text("download_mitigations", st.session_state.language),
                             data=mitigations_markdown,
                             file_name="mitigations.md",
                             mime="text/markdown",
                         )
+                        st.download_button(
+                            label=get_text("download_mitigations_json", st.session_state.language),
+                            data=json.dumps(mitigations, ensure_ascii=False, indent=2),
+                            file_name="mitigations.json",
+                            mime="application/json",
+                        )
                         
                         break  # Exit the loop if successful
                     except Exception as e:
                         retry_count += 1
+                        event("stage.retry", stage="mitigations", provider=model_provider, retries=1, error=str(e))
                         if retry_count == max_retries:
                             st.error(get_text("error_generating_mitigations", st.session_state.language).format(max_retries, e))
-                            mitigations_markdown = ""
+                            mitigations = {"Mitigations": []}
                         else:
                             st.warning(get_text("retrying_mitigations", st.session_state.language).format(retry_count+1, max_retries))
             
@@ -1899,19 +2509,25 @@ with tab4:
     """, unsafe_allow_html=True)
     st.markdown("""---""")
     
+    # Let the user choose how the DREAD factors are weighted in the risk score
+    dread_weighting = st.selectbox(
+        get_text("dread_weighting_label", st.session_state.language),
+        options=list(WEIGHTING_SCHEMES),
+        format_func=lambda scheme: get_text(f"dread_weighting_{scheme}", st.session_state.language),
+        key="dread_weighting",
+        help=get_text("dread_weighting_help", st.session_state.language),
+    )
+
     # Create a submit button for DREAD Risk Assessment
     dread_assessment_submit_button = st.button(label=get_text("generate_dread", st.session_state.language))
     # If the Generate DREAD Risk Assessment button is clicked and the user has identified threats
     if dread_assessment_submit_button:
         # Check if threat_model data exists
-        if 'threat_model' in st.session_state and st.session_state['threat_model']:
-            # Convert the threat_model data into a Markdown list
-            threats_markdown = json_to_markdown(st.session_state['threat_model'], [], st.session_state.language)
-            # Generate the prompt using the create_dread_assessment_prompt function
-            dread_assessment_prompt = create_dread_assessment_prompt(threats_markdown, st.session_state.language)
+        threat_model = load_artefact('threat_model')
+        if threat_model:
             # Clear thinking content when switching models or starting a new operation
             if model_provider != "Anthropic API" or "thinking" not in anthropic_model.lower():
-                st.session_state.pop('last_thinking_content', None)
+                clear_artefact('last_thinking_content')
 
             # Show a spinner while generating DREAD Risk Assessment
             with st.spinner(get_text("generating_dread", st.session_state.language)):
@@ -1920,32 +2536,42 @@ with tab4:
                 while retry_count < max_retries:
                     try:
                         # Call the relevant get_dread_assessment function with the generated prompt
-                        if model_provider == "Azure OpenAI Service":
-                            dread_assessment = get_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "OpenAI API":
-                            dread_assessment = get_dread_assessment(openai_api_key, selected_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "Google AI API":
-                            dread_assessment = get_dread_assessment_google(google_api_key, google_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "Mistral API":
-                            dread_assessment = get_dread_assessment_mistral(mistral_api_key, mistral_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "Ollama":
-                            dread_assessment = get_dread_assessment_ollama(st.session_state['ollama_endpoint'], selected_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "Anthropic API":
-                            dread_assessment = get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "LM Studio Server":
-                            dread_assessment = get_dread_assessment_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "Groq API":
-                            dread_assessment = get_dread_assessment_groq(groq_api_key, groq_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "GLM API":
-                            dread_assessment = get_dread_assessment_glm(glm_api_key, glm_model, dread_assessment_prompt, st.session_state.language)
-                        elif model_provider == "eCloud":
-                            dread_assessment = get_dread_assessment_ecloud(ecloud_api_key, ecloud_model, dread_assessment_prompt, st.session_state.language)
+                        def generate_dread_assessment(threats_markdown):
+                            # Generate the prompt using the create_dread_assessment_prompt function
+                            dread_assessment_prompt = create_dread_assessment_prompt(threats_markdown, st.session_state.language)
+                            if model_provider == "Azure OpenAI Service":
+                                dread_assessment = get_dread_assessment_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "OpenAI API":
+                                dread_assessment = get_dread_assessment(openai_api_key, selected_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "Google AI API":
+                                dread_assessment = get_dread_assessment_google(google_api_key, google_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "Mistral API":
+                                dread_assessment = get_dread_assessment_mistral(mistral_api_key, mistral_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "Ollama":
+                                dread_assessment = get_dread_assessment_ollama(st.session_state['ollama_endpoint'], selected_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "Anthropic API":
+                                dread_assessment = get_dread_assessment_anthropic(anthropic_api_key, anthropic_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "LM Studio Server":
+                                dread_assessment = get_dread_assessment_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "Groq API":
+                                dread_assessment = get_dread_assessment_groq(groq_api_key, groq_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "GLM API":
+                                dread_assessment = get_dread_assessment_glm(glm_api_key, glm_model, dread_assessment_prompt, st.session_state.language)
+                            elif model_provider == "eCloud":
+                                dread_assessment = get_dread_assessment_ecloud(ecloud_api_key, ecloud_model, dread_assessment_prompt, st.session_state.language)
+                            return dread_assessment
+
+                        # Only threats without a stored assessment from this model are sent
+                        results, _ = memoize_per_threat("dread", threat_model, generate_dread_assessment, split_dread_assessment)
+                        dread_assessment = {"Risk Assessment": [row for row in results if row]}
                         
                         # Save the DREAD assessment to the session state for later use in test cases
-                        st.session_state['dread_assessment'] = dread_assessment
+                        store_artefact('dread_assessment', dread_assessment)
+                        record_portfolio("dread", dread_assessment)
                         break  # Exit the loop if successful
                     except Exception as e:
                         retry_count += 1
+                        event("stage.retry", stage="dread", provider=model_provider, retries=1, error=str(e))
                         if retry_count == max_retries:
                             st.error(get_text("error_generating_dread", st.session_state.language).format(max_retries, e))
                             dread_assessment = {"Risk Assessment": []}
@@ -1954,20 +2580,20 @@ with tab4:
                         else:
                             st.warning(get_text("retrying_dread", st.session_state.language).format(retry_count+1, max_retries))
             # Convert the DREAD assessment JSON to Markdown
-            dread_assessment_markdown = dread_json_to_markdown(dread_assessment, st.session_state.language)
+            dread_assessment_markdown = dread_json_to_markdown(dread_assessment, st.session_state.language, dread_weighting)
             
             # Add debug information about the assessment
             if not dread_assessment.get("Risk Assessment"):
                 st.warning(get_text("debug_empty_dread", st.session_state.language))
             
             # Display thinking content in an expander if available and using a model with thinking capabilities
-            if ('last_thinking_content' in st.session_state and 
-                st.session_state['last_thinking_content'] and 
+            thinking_content = load_artefact('last_thinking_content')
+            if (thinking_content and 
                 ((model_provider == "Anthropic API" and "thinking" in anthropic_model.lower()) or
                  (model_provider == "Google AI API" and "gemini-2.5" in google_model.lower()))):
                 thinking_model = "Claude" if model_provider == "Anthropic API" else "Gemini"
                 with st.expander(get_text("view_thinking_process", st.session_state.language).format(thinking_model)):
-                    st.markdown(st.session_state['last_thinking_content'])
+                    st.markdown(thinking_content)
                     
             # Display the DREAD assessment with a header
             st.markdown("## " + get_text("dread_assessment_header", st.session_state.language))
@@ -1975,6 +2601,23 @@ with tab4:
             
             # Display the DREAD assessment in Markdown format
             st.markdown(dread_assessment_markdown, unsafe_allow_html=False)
+
+            # Summarise the scores per STRIDE category
+            dread_table = DreadTable.from_assessment(dread_assessment)
+            if len(dread_table):
+                with st.expander(get_text("dread_analytics", st.session_state.language)):
+                    st.dataframe([
+                        {**row, "mean": round(row["mean"], 2), "max": round(row["max"], 2), "high": f"{row['high']:.0%}"}
+                        for row in dread_table.aggregates(dread_weighting)
+                    ])
+                    _, thresholds = dread_table.percentile_bands(dread_weighting)
+                    st.caption(get_text("dread_percentile_bands", st.session_state.language).format(*thresholds))
+                    st.markdown(f"**{get_text('dread_heatmap', st.session_state.language)}**")
+                    categories, factors, means = dread_table.heatmap()
+                    st.dataframe([
+                        {"category": category, **{factor: round(float(mean), 1) for factor, mean in zip(factors, row)}}
+                        for category, row in zip(categories, means)
+                    ])
             
             # Add a button to allow the user to download the DREAD assessment as a Markdown file
             st.download_button(
@@ -2004,15 +2647,12 @@ with tab5:
     # If the Generate Test Cases button is clicked and the user has identified threats
     if test_cases_submit_button:
         # Check if threat_model data exists
-        if 'threat_model' in st.session_state and st.session_state['threat_model']:
-            # Convert the threat_model data into a Markdown list
-            threats_markdown = json_to_markdown(st.session_state['threat_model'], [], st.session_state.language)
-            # Generate the prompt using the create_test_cases_prompt function
-            test_cases_prompt = create_test_cases_prompt(threats_markdown, st.session_state.language)
+        threat_model = load_artefact('threat_model')
+        if threat_model:
 
             # Clear thinking content when switching models or starting a new operation
             if model_provider != "Anthropic API" or "thinking" not in anthropic_model.lower():
-                st.session_state.pop('last_thinking_content', None)
+                clear_artefact('last_thinking_content')
 
             # Show a spinner while generating test cases
             with st.spinner(get_text("generating_test_cases", st.session_state.language)):
@@ -2021,35 +2661,48 @@ with tab5:
                 while retry_count < max_retries:
                     try:
                         # Call to the relevant get_test_cases function with the generated prompt
-                        if model_provider == "Azure OpenAI Service":
-                            test_cases_markdown = get_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "OpenAI API":
-                            test_cases_markdown = get_test_cases(openai_api_key, selected_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "Google AI API":
-                            test_cases_markdown = get_test_cases_google(google_api_key, google_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "Mistral API":
-                            test_cases_markdown = get_test_cases_mistral(mistral_api_key, mistral_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "Ollama":
-                            test_cases_markdown = get_test_cases_ollama(st.session_state['ollama_endpoint'], selected_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "Anthropic API":
-                            test_cases_markdown = get_test_cases_anthropic(anthropic_api_key, anthropic_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "LM Studio Server":
-                            test_cases_markdown = get_test_cases_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "Groq API":
-                            test_cases_markdown = get_test_cases_groq(groq_api_key, groq_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "GLM API":
-                            test_cases_markdown = get_test_cases_glm(glm_api_key, glm_model, test_cases_prompt, st.session_state.language)
-                        elif model_provider == "eCloud":
-                            test_cases_markdown = get_test_cases_ecloud(ecloud_api_key, ecloud_model, test_cases_prompt, st.session_state.language)
+                        def generate_test_cases(threats_markdown):
+                            # Generate the prompt using the create_test_cases_prompt function
+                            test_cases_prompt = create_test_cases_prompt(threats_markdown, st.session_state.language)
+                            if model_provider == "Azure OpenAI Service":
+                                test_cases_markdown = get_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "OpenAI API":
+                                test_cases_markdown = get_test_cases(openai_api_key, selected_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "Google AI API":
+                                test_cases_markdown = get_test_cases_google(google_api_key, google_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "Mistral API":
+                                test_cases_markdown = get_test_cases_mistral(mistral_api_key, mistral_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "Ollama":
+                                test_cases_markdown = get_test_cases_ollama(st.session_state['ollama_endpoint'], selected_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "Anthropic API":
+                                test_cases_markdown = get_test_cases_anthropic(anthropic_api_key, anthropic_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "LM Studio Server":
+                                test_cases_markdown = get_test_cases_lm_studio(st.session_state['lm_studio_endpoint'], selected_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "Groq API":
+                                test_cases_markdown = get_test_cases_groq(groq_api_key, groq_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "GLM API":
+                                test_cases_markdown = get_test_cases_glm(glm_api_key, glm_model, test_cases_prompt, st.session_state.language)
+                            elif model_provider == "eCloud":
+                                test_cases_markdown = get_test_cases_ecloud(ecloud_api_key, ecloud_model, test_cases_prompt, st.session_state.language)
+                            return test_cases_markdown
+
+                        # Only threats without stored test cases from this model are sent
+                        results, output = memoize_per_threat("test_cases", threat_model, generate_test_cases, split_test_cases)
+                        test_cases_markdown = "\n\n".join(section for section in results if section)
+                        if output and not any(split_test_cases(output, [threat.id for threat in normalize_threat_model(threat_model)])):
+                            # Test cases that name no threat cannot be stored per threat; show them anyway
+                            test_cases_markdown = (test_cases_markdown + "\n\n" + output).strip()
 
                         # Display thinking content in an expander if available and using a model with thinking capabilities
-                        if ('last_thinking_content' in st.session_state and 
-                            st.session_state['last_thinking_content'] and 
+                        thinking_content = load_artefact('last_thinking_content')
+                        if (thinking_content and 
                             ((model_provider == "Anthropic API" and "thinking" in anthropic_model.lower()) or
                              (model_provider == "Google AI API" and "gemini-2.5" in google_model.lower()))):
                             thinking_model = "Claude" if model_provider == "Anthropic API" else "Gemini"
                             with st.expander(get_text("view_thinking_process", st.session_state.language).format(thinking_model)):
-                                st.markdown(st.session_state['last_thinking_content'])
+                                st.markdown(thinking_content)
+
+                        record_portfolio("test_cases", test_cases_markdown)
 
                         # Display the suggested mitigations in Markdown
                         st.markdown(test_cases_markdown)
@@ -2067,6 +2720,7 @@ with tab5:
                         break  # Exit the loop if successful
                     except Exception as e:
                         retry_count += 1
+                        event("stage.retry", stage="test_cases", provider=model_provider, retries=1, error=str(e))
                         if retry_count == max_retries:
                             st.error(get_text("error_generating_test_cases", st.session_state.language).format(max_retries, e))
                             test_cases_markdown = ""
@@ -2076,4 +2730,25 @@ with tab5:
             st.markdown("")
 
         else:
-            st.error(get_text("generate_threat_model_first", st.session_state.language).format(get_text("requesting_test_cases", st.session_state.language)))
\ No newline at end of file
+            st.error(get_text("generate_threat_model_first", st.session_state.language).format(get_text("requesting_test_cases", st.session_state.language)))
+
+# ------------------ Performance Panel ------------------ #
+
+# Rendered last so that the spans recorded during this run are included
+with st.sidebar:
+    with st.expander(get_text("performance_header", st.session_state.language)):
+        spans = get_spans(session=st.session_state.trace_session)
+        if spans:
+            st.caption(get_text("performance_caption", st.session_state.language).format(len(spans)))
+            st.dataframe([
+                {**row, "total_ms": round(row["total_ms"], 1), "max_ms": round(row["max_ms"], 1)}
+                for row in summarize_spans(spans)
+            ])
+            st.download_button(
+                label=get_text("performance_download_traces", st.session_state.language),
+                data=json.dumps(to_otlp_json(spans)),
+                file_name="stride-gpt-traces.json",
+                mime="application/json",
+            )
+        else:
+            st.info(get_text("performance_no_spans", st.session_state.language))
@@ -0,0 +1,223 @@
+"""
+Mermaid cleanup benchmark.
+
+Compares clean_mermaid_syntax and extract_mermaid_code from utils.py with the
+multi-pass regex versions they replaced, on generated attack tree diagrams of
+growing size: well-formed flowcharts wrapped in a model reply, and the shapes that
+made the regex passes backtrack, such as long labels with many spaces and a
+missing closing bracket. Reports the best time of each implementation, the speedup
+and whether the output still parses, and stores the results like benchmark.py:
+
+    python mermaid_benchmark.py --nodes 1000 --nodes 10000 --nodes 100000
+    python mermaid_benchmark.py --compare benchmark-results/mermaid-<run>.json
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import time
+from datetime import datetime
+
+from benchmark import DEFAULT_OUTPUT_DIR, git_commit
+from mermaid_svg import MermaidSyntaxError, parse_flowchart
+from utils import extract_mermaid_code
+
+DEFAULT_NODES = [40, 1000, 10000, 50000]
+
+# Diagram shapes generated for every size
+SHAPES = ["flowchart", "long-labels", "unclosed-labels"]
+
+# The regex versions take time cubic in the size of unclosed labels; above this
+# many characters they are skipped on that shape
+LEGACY_UNCLOSED_LIMIT = 12_000
+
+WORDS = ["exploit", "token", "session", "admin", "upload", "injection", "bypass", "credential", "cache", "(OAuth)",
+         "api", "phishing", "privilege", "escalation", "legacy", "secret", "webhook", "replay", "brute-force"]
+
+
+# ------------------ Replaced implementations ------------------ #
+
+def legacy_clean_mermaid_syntax(code):
+    """clean_mermaid_syntax before the single-pass tokenizer."""
+    try:
+        if not code.strip().startswith(('graph ', 'flowchart ', 'sequenceDiagram ')):
+            return code.strip()
+
+        code = re.sub(r'(\w+)-->(\w+)', r'\1 --> \2', code)
+        code = re.sub(r'(\w+)==>(\w+)', r'\1 ==> \2', code)
+
+        def fix_space_labels(match):
+            full_match = match.group(0)
+            label = match.group(1)
+            if ' ' in label and not label.startswith('"') and not label.startswith("'"):
+                return f'["{label}"]'
+            return full_match
+
+        code = re.sub(r'\[([^\]]*?\s[^\]]*?)\]', fix_space_labels, code)
+
+        def fix_parentheses_labels(match):
+            full_match = match.group(0)
+            label = match.group(1)
+            if ('(' in label or ')' in label) and not label.startswith('"') and not label.startswith("'"):
+                return f'["{label}"]'
+            return full_match
+
+        code = re.sub(r'\[([^\]]*?\([^)]*\)[^\]]*?)\]', fix_parentheses_labels, code)
+
+        def clean_label_content(match):
+            full_match = match.group(0)
+            label = match.group(1)
+            if not label.startswith('"') and not label.startswith("'"):
+                label = label.strip()
+                label = label.lstrip('[]{}()').rstrip('[]{}()')
+                return f'[{label}]'
+            return full_match
+
+        code = re.sub(r'\[([^\]]+)\]', clean_label_content, code)
+
+        lines = [line.strip() for line in code.split('\n') if line.strip()]
+        return '\n'.join(lines)
+    except Exception:
+        return code.strip()
+
+
+def legacy_extract_mermaid_code(text):
+    """extract_mermaid_code before the single-pass tokenizer."""
+    match = re.search(r'```mermaid\s*(graph[\s\S]*?)```', text, re.MULTILINE)
+    if not match:
+        match = re.search(r'```\s*(graph[\s\S]*?)```', text, re.MULTILINE)
+    code = match.group(1).strip() if match else text.strip()
+    if not code.startswith('graph '):
+        if 'graph ' in code:
+            code = code[code.find('graph '):]
+        else:
+            return text
+    return legacy_clean_mermaid_syntax(code)
+
+
+# ------------------ Diagrams ------------------ #
+
+def generate_diagram(nodes, shape, seed=0):
+    """
+    Generate an attack tree flowchart wrapped in a model reply.
+
+    Args:
+        nodes (int): Number of nodes
+        shape (str): "flowchart" for short labels, "long-labels" for labels of up
+            to 60 words, "unclosed-labels" for long labels that lose their closing
+            bracket halfway through the diagram, as in a truncated or malformed reply
+        seed (int): Random seed; the same seed always gives the same diagram
+
+    Returns:
+        str: The reply text
+    """
+    rng = random.Random(seed)
+    words = 3 if shape == "flowchart" else 60
+    lines = ["graph TD"]
+    for node in range(nodes):
+        label = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, words)))
+        closing = "" if shape == "unclosed-labels" and node >= nodes // 2 else "]"
+        lines.append(f"    N{node}[{label}{closing}")
+        if node:
+            arrow = rng.choice(["-->", "==>", " --> "])
+            lines.append(f"    N{rng.randrange(max(0, node - 20), node)}{arrow}N{node}")
+    return "Here is the attack tree:\n\n```mermaid\n" + "\n".join(lines) + "\n```\n\nLet me know if you need changes."
+
+
+# ------------------ Measurement ------------------ #
+
+def _parses(code):
+    try:
+        parse_flowchart(code)
+        return True
+    except MermaidSyntaxError:
+        return False
+
+
+def time_function(function, text, repeat):
+    best, output = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = function(text)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, output
+
+
+def run_mermaid_benchmark(sizes=DEFAULT_NODES, shapes=SHAPES, repeat=3, seed=0, log=print):
+    """
+    Time the current and replaced cleanup on every diagram.
+
+    Returns:
+        dict: The results document
+    """
+    results = []
+    for nodes in sizes:
+        for shape in shapes:
+            text = generate_diagram(nodes, shape, seed)
+            row = {"nodes": nodes, "shape": shape, "megabytes": round(len(text.encode()) / 1e6, 3)}
+            current_seconds, current = time_function(extract_mermaid_code, text, repeat)
+            row.update(seconds=round(current_seconds, 4), parses=_parses(current))
+            if shape == "unclosed-labels" and len(text) > LEGACY_UNCLOSED_LIMIT:
+                row.update(legacy_seconds=None, legacy_parses=None, speedup=None)
+            else:
+                legacy_seconds, legacy = time_function(legacy_extract_mermaid_code, text, repeat)
+                row.update(legacy_seconds=round(legacy_seconds, 4), legacy_parses=_parses(legacy),
+                           speedup=round(legacy_seconds / current_seconds, 1) if current_seconds else None)
+            log(f"{nodes} nodes, {shape}: {row['seconds']:.3f}s")
+            results.append(row)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {"nodes": list(sizes), "shapes": list(shapes), "repeat": repeat, "seed": seed},
+        "diagrams": results,
+    }
+
+
+def format_report(results, baseline=None):
+    previous_rows = {(row["nodes"], row["shape"]): row for row in (baseline or {}).get("diagrams", [])}
+    lines = [f"{'nodes':>8}  {'shape':<16}{'MB':>8}{'legacy s':>10}{'current s':>11}{'speedup':>9}{'parses':>15}"]
+    for row in results["diagrams"]:
+        legacy = f"{row['legacy_seconds']:>10.3f}" if row["legacy_seconds"] is not None else f"{'skipped':>10}"
+        speedup = f"{row['speedup']:>8.1f}x" if row["speedup"] is not None else f"{'-':>9}"
+        parses = f"{'yes' if row['parses'] else 'no'}/{'-' if row['legacy_parses'] is None else 'yes' if row['legacy_parses'] else 'no'}"
+        line = f"{row['nodes']:>8}  {row['shape']:<16}{row['megabytes']:>8.2f}{legacy}{row['seconds']:>11.3f}{speedup}{parses:>15}"
+        previous = previous_rows.get((row["nodes"], row["shape"]))
+        if previous and previous.get("seconds"):
+            line += f"  {(row['seconds'] - previous['seconds']) / previous['seconds'] * 100:+.1f}%"
+        lines.append(line)
+    lines.append("parses: current/legacy output accepted by mermaid_svg.parse_flowchart")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Mermaid cleanup against the replaced regex passes.")
+    parser.add_argument("--nodes", type=int, action="append", help="Diagram size in nodes; repeatable")
+    parser.add_argument("--shape", action="append", choices=SHAPES, help="Diagram shape; repeatable (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation; the best time is reported")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the generated diagrams")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR, help="Directory for result files")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_mermaid_benchmark(args.nodes or DEFAULT_NODES, args.shape or SHAPES, args.repeat, args.seed)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(results, baseline))
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, "mermaid-" + datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,402 @@
+"""
+Server-side rendering of Mermaid flowcharts to SVG.
+
+The attack tree view used to load mermaid.js from a CDN and lay the diagram out in
+the browser, which is slow for large trees and impossible in air-gapped
+deployments. This module parses the flowchart subset of Mermaid that the app
+generates (graph/flowchart headers, node shapes, chained edges with labels) and lays
+it out in Python as a tidy tree: every node gets a band as wide as its subtree and
+is centred over its children, so subtrees never overlap. Edges that do not belong
+to the spanning tree (shared sub-goals, cycles) are drawn as extra curves.
+
+Rendered SVG is cached by the SHA-256 of the diagram code.
+"""
+import hashlib
+import html
+import re
+import threading
+from collections import OrderedDict
+
+# Number of rendered diagrams kept in memory
+MAX_CACHED_DIAGRAMS = 256
+
+# Layout metrics in pixels
+FONT_SIZE = 14
+LINE_HEIGHT = 18
+CHAR_WIDTH = 7.5
+WIDE_CHAR_WIDTH = 14
+NODE_PADDING_X = 14
+NODE_PADDING_Y = 10
+MAX_LABEL_CHARS = 28
+SIBLING_GAP = 24
+LEVEL_GAP = 56
+MARGIN = 16
+
+NODE_FILL = "#ECECFF"
+NODE_STROKE = "#9370DB"
+TEXT_COLOR = "#333"
+EDGE_COLOR = "#333"
+
+# Opening delimiter -> (closing delimiter, shape); longer openers must be tried first
+SHAPES = [
+    ("(((", ")))", "circle"),
+    ("((", "))", "circle"),
+    ("([", "])", "stadium"),
+    ("[[", "]]", "rect"),
+    ("[(", ")]", "stadium"),
+    ("[/", "/]", "rect"),
+    ("[\\", "\\]", "rect"),
+    ("{{", "}}", "hexagon"),
+    ("[", "]", "rect"),
+    ("(", ")", "round"),
+    ("{", "}", "diamond"),
+    (">", "]", "rect"),
+]
+
+NODE_ID_RE = re.compile(r"[\w.$]+")
+HEADER_RE = re.compile(r"^(?:graph|flowchart)(?:\s+(TB|TD|BT|LR|RL))?\s*;?$", re.IGNORECASE)
+EDGE_RE = re.compile(r"""\s*(?:
+    (?P<open>--|==|-\.)\s+(?P<text>[^|]+?)\s+(?P<close>-{2,}>|={2,}>|\.->|-{3,}|={3,}|\.-)
+  | (?P<arrow><?(?:-{2,}>|={2,}>|-\.+->|-{3,}|={3,}|-\.+-|--[xo]|==[xo]))\s*(?:\|(?P<label>[^|]*)\|)?
+)\s*""", re.VERBOSE)
+AMPERSAND_RE = re.compile(r"\s*&\s*")
+ENTITY_RE = re.compile(r"#(\w+);")
+BREAK_RE = re.compile(r"<br\s*/?>", re.IGNORECASE)
+IGNORED_STATEMENTS = ("%%", "classDef ", "class ", "style ", "linkStyle ", "click ", "subgraph", "direction ")
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+class MermaidSyntaxError(ValueError):
+    """Raised for diagrams outside the supported flowchart subset."""
+
+
+class Diagram:
+    """A parsed flowchart: nodes in order of first appearance and directed edges."""
+
+    def __init__(self, direction="TD"):
+        self.direction = direction
+        self.labels = {}  # node id -> label
+        self.shapes = {}  # node id -> shape
+        self.edges = []  # (source, target, label, style, arrow)
+
+    def add_node(self, node_id, label=None, shape=None):
+        if node_id not in self.labels or label is not None:
+            self.labels[node_id] = label if label is not None else node_id
+            self.shapes[node_id] = shape or self.shapes.get(node_id, "rect")
+
+
+def _decode_label(label):
+    label = label.strip()
+    if len(label) >= 2 and label[0] == label[-1] == '"':
+        label = label[1:-1]
+    # Mermaid writes entities as #quot; or #35; instead of &quot; and &#35;
+    label = ENTITY_RE.sub(lambda m: html.unescape(f"&{'#' if m.group(1).isdigit() else ''}{m.group(1)};"), label)
+    return BREAK_RE.sub("\n", label)
+
+
+def _parse_node(line, pos, diagram):
+    """Parse a node reference at pos; returns (node id, new position)."""
+    match = NODE_ID_RE.match(line, pos)
+    if not match:
+        raise MermaidSyntaxError(f"Expected a node at column {pos + 1}: {line}")
+    node_id, pos = match.group(0), match.end()
+    for opener, closer, shape in SHAPES:
+        if line.startswith(opener, pos):
+            start = pos + len(opener)
+            if line.startswith('"', start):
+                quote_end = line.find('"', start + 1)
+                end = line.find(closer, quote_end + 1) if quote_end != -1 else -1
+            else:
+                end = line.find(closer, start)
+            if end == -1:
+                raise MermaidSyntaxError(f"Unclosed label for node {node_id}: {line}")
+            diagram.add_node(node_id, _decode_label(line[start:end]), shape)
+            return node_id, end + len(closer)
+    diagram.add_node(node_id)
+    return node_id, pos
+
+
+def _parse_group(line, pos, diagram):
+    """Parse "A & B & C"; returns (node ids, new position)."""
+    nodes = []
+    while True:
+        node_id, pos = _parse_node(line, pos, diagram)
+        nodes.append(node_id)
+        match = AMPERSAND_RE.match(line, pos)
+        if not match:
+            return nodes, pos
+        pos = match.end()
+
+
+def parse_flowchart(code):
+    """
+    Parse Mermaid flowchart code.
+
+    Args:
+        code (str): Diagram code starting with "graph" or "flowchart"
+
+    Returns:
+        Diagram: The parsed diagram
+
+    Raises:
+        MermaidSyntaxError: If the code is not a supported flowchart
+    """
+    lines = [line.strip() for line in code.strip().splitlines()]
+    lines = [line for line in lines if line]
+    if not lines:
+        raise MermaidSyntaxError("Empty diagram")
+    header = HEADER_RE.match(lines[0])
+    if not header:
+        raise MermaidSyntaxError(f"Unsupported diagram type: {lines[0]}")
+    diagram = Diagram((header.group(1) or "TD").upper().replace("TB", "TD"))
+
+    for line in lines[1:]:
+        line = line.rstrip(";").strip()
+        if not line or line == "end" or line.startswith(IGNORED_STATEMENTS):
+            continue
+        sources, pos = _parse_group(line, 0, diagram)
+        while pos < len(line):
+            edge = EDGE_RE.match(line, pos)
+            if not edge:
+                raise MermaidSyntaxError(f"Unexpected text at column {pos + 1}: {line}")
+            arrow = edge.group("arrow") or (edge.group("open") + edge.group("close"))
+            label = edge.group("label") if edge.group("arrow") else edge.group("text")
+            style = "thick" if "=" in arrow else "dotted" if "." in arrow else "normal"
+            targets, pos = _parse_group(line, edge.end(), diagram)
+            for source in sources:
+                for target in targets:
+                    diagram.edges.append((source, target, _decode_label(label) if label else "", style, arrow.endswith(">")))
+            sources = targets
+    return diagram
+
+
+def _char_width(char):
+    return WIDE_CHAR_WIDTH if ord(char) > 0x2E80 else CHAR_WIDTH
+
+
+def _wrap(label):
+    lines = []
+    for paragraph in label.split("\n"):
+        line = ""
+        words = []
+        for word in paragraph.split():
+            # Labels without spaces (long identifiers, Chinese text) are split anywhere
+            words += [word[i:i + MAX_LABEL_CHARS] for i in range(0, len(word), MAX_LABEL_CHARS)]
+        for word in words:
+            if line and len(line) + 1 + len(word) > MAX_LABEL_CHARS:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+
+def _node_size(lines, shape):
+    width = max(sum(_char_width(c) for c in line) for line in lines) + 2 * NODE_PADDING_X
+    height = len(lines) * LINE_HEIGHT + 2 * NODE_PADDING_Y
+    if shape == "diamond":
+        width, height = width * 1.4, height * 1.4
+    elif shape == "circle":
+        width = height = max(width, height)
+    return width, height
+
+
+def layout(diagram):
+    """
+    Compute node positions.
+
+    Returns:
+        tuple: (centres {node id: (x, y)}, sizes {node id: (width, height)}, wrapped
+        labels {node id: [lines]}, tree edges set of (source, target), width, height)
+    """
+    wrapped = {node: _wrap(label) for node, label in diagram.labels.items()}
+    sizes = {node: _node_size(wrapped[node], diagram.shapes[node]) for node in diagram.labels}
+    vertical = diagram.direction in ("TD", "BT")
+
+    def breadth(node):
+        return sizes[node][0] if vertical else sizes[node][1]
+
+    def depth_size(node):
+        return sizes[node][1] if vertical else sizes[node][0]
+
+    successors = {node: [] for node in diagram.labels}
+    has_parent = set()
+    for source, target, *_ in diagram.edges:
+        successors[source].append(target)
+        has_parent.add(target)
+
+    # Spanning forest by iterative depth-first search from the roots, then from any
+    # node left over (nodes that are only reachable through a cycle)
+    children = {node: [] for node in diagram.labels}
+    depth = {}
+    preorder = []
+    starts = [node for node in diagram.labels if node not in has_parent] + list(diagram.labels)
+    for start in starts:
+        if start in depth:
+            continue
+        depth[start] = 0
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            preorder.append(node)
+            fresh = [child for child in successors[node] if child not in depth]
+            for child in fresh:
+                depth[child] = depth[node] + 1
+                children[node].append(child)
+            stack.extend(reversed(fresh))
+    roots = [node for node in preorder if depth[node] == 0]
+
+    # Each subtree gets a band as wide as the larger of its root and its children
+    band = {}
+    for node in reversed(preorder):
+        child_total = sum(band[child] for child in children[node]) + SIBLING_GAP * max(0, len(children[node]) - 1)
+        band[node] = max(breadth(node), child_total)
+
+    levels = max(depth.values(), default=0) + 1
+    level_size = [0] * levels
+    for node, level in depth.items():
+        level_size[level] = max(level_size[level], depth_size(node))
+    level_offset = [MARGIN]
+    for level in range(1, levels):
+        level_offset.append(level_offset[-1] + level_size[level - 1] + LEVEL_GAP)
+
+    left = {}
+    cursor = MARGIN
+    for root in roots:
+        left[root] = cursor
+        cursor += band[root] + SIBLING_GAP
+    centres = {}
+    for node in preorder:
+        centre = left[node] + band[node] / 2
+        child_total = sum(band[child] for child in children[node]) + SIBLING_GAP * max(0, len(children[node]) - 1)
+        child_left = centre - child_total / 2
+        for child in children[node]:
+            left[child] = child_left
+            child_left += band[child] + SIBLING_GAP
+        along = level_offset[depth[node]] + level_size[depth[node]] / 2
+        centres[node] = (centre, along) if vertical else (along, centre)
+
+    total_breadth = max(cursor - SIBLING_GAP + MARGIN, 2 * MARGIN)
+    total_depth = level_offset[-1] + level_size[-1] + MARGIN if preorder else 2 * MARGIN
+    width, height = (total_breadth, total_depth) if vertical else (total_depth, total_breadth)
+
+    if diagram.direction == "BT":
+        centres = {node: (x, height - y) for node, (x, y) in centres.items()}
+    elif diagram.direction == "RL":
+        centres = {node: (width - x, y) for node, (x, y) in centres.items()}
+
+    tree_edges = {(parent, child) for parent in children for child in children[parent]}
+    return centres, sizes, wrapped, tree_edges, width, height
+
+
+def _anchor(centre, size, towards, vertical):
+    # Point where an edge leaves a node's box on the side facing the other node
+    (x, y), (width, height) = centre, size
+    if vertical:
+        return (x, y + height / 2) if towards[1] > y else (x, y - height / 2)
+    return (x + width / 2, y) if towards[0] > x else (x - width / 2, y)
+
+
+def _shape_svg(shape, x, y, width, height):
+    style = f'fill="{NODE_FILL}" stroke="{NODE_STROKE}" stroke-width="1"'
+    left, top = x - width / 2, y - height / 2
+    if shape == "diamond":
+        points = f"{x:.1f},{top:.1f} {left + width:.1f},{y:.1f} {x:.1f},{top + height:.1f} {left:.1f},{y:.1f}"
+        return f'<polygon points="{points}" {style}/>'
+    if shape == "hexagon":
+        inset = height / 4
+        points = " ".join(f"{px:.1f},{py:.1f}" for px, py in [
+            (left + inset, top), (left + width - inset, top), (left + width, y),
+            (left + width - inset, top + height), (left + inset, top + height), (left, y)])
+        return f'<polygon points="{points}" {style}/>'
+    if shape == "circle":
+        return f'<circle cx="{x:.1f}" cy="{y:.1f}" r="{width / 2:.1f}" {style}/>'
+    radius = {"round": 8, "stadium": height / 2}.get(shape, 0)
+    return f'<rect x="{left:.1f}" y="{top:.1f}" width="{width:.1f}" height="{height:.1f}" rx="{radius:.1f}" {style}/>'
+
+
+def _text_svg(lines, x, y):
+    first = y - (len(lines) - 1) * LINE_HEIGHT / 2
+    spans = "".join(
+        f'<tspan x="{x:.1f}" y="{first + i * LINE_HEIGHT:.1f}">{html.escape(line)}</tspan>' for i, line in enumerate(lines)
+    )
+    return f'<text text-anchor="middle" dominant-baseline="central" fill="{TEXT_COLOR}">{spans}</text>'
+
+
+def diagram_to_svg(diagram):
+    """
+    Lay out a parsed diagram and draw it as SVG.
+
+    Returns:
+        tuple: (SVG document, width, height)
+    """
+    centres, sizes, wrapped, tree_edges, width, height = layout(diagram)
+    vertical = diagram.direction in ("TD", "BT")
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" viewBox="0 0 {width:.0f} {height:.0f}" '
+        f'font-family="trebuchet ms, verdana, arial, sans-serif" font-size="{FONT_SIZE}">',
+        f'<defs><marker id="arrowhead" viewBox="0 0 10 10" refX="9" refY="5" markerWidth="8" markerHeight="8" orient="auto-start-reverse">'
+        f'<path d="M 0 0 L 10 5 L 0 10 z" fill="{EDGE_COLOR}"/></marker></defs>',
+    ]
+    labels = []
+    for source, target, label, style, arrow in diagram.edges:
+        start = _anchor(centres[source], sizes[source], centres[target], vertical)
+        end = _anchor(centres[target], sizes[target], centres[source], vertical)
+        if vertical:
+            middle = (start[1] + end[1]) / 2
+            path = f"M {start[0]:.1f} {start[1]:.1f} C {start[0]:.1f} {middle:.1f}, {end[0]:.1f} {middle:.1f}, {end[0]:.1f} {end[1]:.1f}"
+        else:
+            middle = (start[0] + end[0]) / 2
+            path = f"M {start[0]:.1f} {start[1]:.1f} C {middle:.1f} {start[1]:.1f}, {middle:.1f} {end[1]:.1f}, {end[0]:.1f} {end[1]:.1f}"
+        attributes = {"normal": 'stroke-width="1.5"', "thick": 'stroke-width="3"', "dotted": 'stroke-width="1.5" stroke-dasharray="3 3"'}[style]
+        if (source, target) not in tree_edges:
+            attributes += ' opacity="0.6"'
+        marker = ' marker-end="url(#arrowhead)"' if arrow else ""
+        parts.append(f'<path d="{path}" fill="none" stroke="{EDGE_COLOR}" {attributes}{marker}/>')
+        if label:
+            lines = _wrap(label)
+            label_width = max(sum(_char_width(c) for c in line) for line in lines) + 8
+            label_height = len(lines) * LINE_HEIGHT + 4
+            x, y = (start[0] + end[0]) / 2, (start[1] + end[1]) / 2
+            labels.append(
+                f'<rect x="{x - label_width / 2:.1f}" y="{y - label_height / 2:.1f}" width="{label_width:.1f}" '
+                f'height="{label_height:.1f}" fill="#e8e8e8" opacity="0.9"/>' + _text_svg(lines, x, y)
+            )
+    for node, (x, y) in centres.items():
+        node_width, node_height = sizes[node]
+        parts.append(f'<g class="node" id="node-{html.escape(node, quote=True)}">'
+                     f'{_shape_svg(diagram.shapes[node], x, y, node_width, node_height)}{_text_svg(wrapped[node], x, y)}</g>')
+    parts.extend(labels)
+    parts.append("</svg>")
+    return "".join(parts), width, height
+
+
+def render_svg(code):
+    """
+    Render Mermaid flowchart code to SVG, reusing earlier renderings of the same code.
+
+    Args:
+        code (str): Diagram code
+
+    Returns:
+        tuple: (SVG document, width, height)
+
+    Raises:
+        MermaidSyntaxError: If the code is not a supported flowchart
+    """
+    digest = hashlib.sha256(code.encode()).hexdigest()
+    with _cache_lock:
+        cached = _cache.get(digest)
+        if cached is not None:
+            _cache.move_to_end(digest)
+            return cached
+    rendered = diagram_to_svg(parse_flowchart(code))
+    with _cache_lock:
+        _cache[digest] = rendered
+        while len(_cache) > MAX_CACHED_DIAGRAMS:
+            _cache.popitem(last=False)
+    return rendered
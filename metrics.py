@@ -0,0 +1,220 @@
+"""
+Prometheus metrics for the service deployment.
+
+Metrics are derived from finished tracing spans, so anything that is traced (LLM
+calls, analysis stages, retries, HTTP fetches) is counted without extra
+instrumentation. They are served in the Prometheus text exposition format on a
+separate port, by default http://0.0.0.0:9464/metrics. Set METRICS_PORT to change
+the port, or to 0 to disable the endpoint.
+
+Exported metrics:
+    stride_gpt_llm_requests_total{provider,model,status}
+    stride_gpt_llm_request_duration_seconds{provider,model} (histogram)
+    stride_gpt_llm_tokens_total{provider,model,type}
+    stride_gpt_stage_duration_seconds{stage} (histogram)
+    stride_gpt_stage_retries_total{stage,provider}
+    stride_gpt_cache_requests_total{cache,result}
+    stride_gpt_github_api_calls_total{api,status}
+    stride_gpt_github_rate_limit_remaining{api}
+"""
+import bisect
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tracing import add_listener
+
+DEFAULT_PORT = 9464
+
+# Latency buckets in seconds; LLM calls and stages range from sub-second to minutes
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# Modules whose get_* functions run one analysis stage
+STAGE_MODULES = ("threat_model", "attack_tree", "mitigations", "dread", "test_cases")
+
+# Repository analysis functions, reported as the "repository_analysis" stage
+REPOSITORY_FUNCTIONS = ("analyze_github_repo", "analyze_github_diff", "analyze_gerrit_repo")
+
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """A monotonically increasing value per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+
+    def inc(self, *label_values, amount=1):
+        with _lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in sorted(self.values.items()):
+            yield self.name + _format_labels(self.labels, label_values), value
+
+
+class Gauge(Counter):
+    """A value per label set that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, *label_values, value):
+        with _lock:
+            self.values[label_values] = value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets, plus their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self.values = {}
+
+    def observe(self, *label_values, value):
+        with _lock:
+            counts, total = self.values.get(label_values, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[label_values] = (counts, total + value)
+
+    def samples(self):
+        for label_values, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield self.name + "_bucket" + _format_labels(self.labels, label_values, [("le", bound)]), cumulative
+            yield self.name + "_sum" + _format_labels(self.labels, label_values), total
+            yield self.name + "_count" + _format_labels(self.labels, label_values), cumulative
+
+
+LLM_REQUESTS = Counter("stride_gpt_llm_requests_total", "LLM API requests.", ("provider", "model", "status"))
+LLM_LATENCY = Histogram("stride_gpt_llm_request_duration_seconds", "LLM API request latency.", ("provider", "model"))
+LLM_TOKENS = Counter("stride_gpt_llm_tokens_total", "Tokens consumed by LLM requests.", ("provider", "model", "type"))
+STAGE_LATENCY = Histogram("stride_gpt_stage_duration_seconds", "Analysis stage latency per attempt.", ("stage",))
+STAGE_RETRIES = Counter("stride_gpt_stage_retries_total", "Analysis stage retries after a failed attempt.", ("stage", "provider"))
+CACHE_REQUESTS = Counter("stride_gpt_cache_requests_total", "Cache lookups by result; hit ratio is hit / (hit + miss).", ("cache", "result"))
+GITHUB_CALLS = Counter("stride_gpt_github_api_calls_total", "GitHub API calls.", ("api", "status"))
+GITHUB_RATE_LIMIT = Gauge("stride_gpt_github_rate_limit_remaining", "Requests left in the current GitHub rate-limit window.", ("api",))
+
+REGISTRY = [LLM_REQUESTS, LLM_LATENCY, LLM_TOKENS, STAGE_LATENCY, STAGE_RETRIES, CACHE_REQUESTS, GITHUB_CALLS, GITHUB_RATE_LIMIT]
+
+
+def _stage_of(span_name):
+    module, _, function = span_name.rpartition(".")
+    if module in STAGE_MODULES and function.startswith("get_"):
+        return module
+    if function in REPOSITORY_FUNCTIONS:
+        return "repository_analysis"
+    return None
+
+
+def observe_span(finished):
+    """Update the metrics from a finished span. Registered as a tracing listener."""
+    attributes = finished.attributes
+    seconds = finished.duration_ms / 1000
+
+    if finished.name.startswith("llm."):
+        provider = attributes.get("provider", "unknown")
+        model = attributes.get("model", "unknown")
+        LLM_REQUESTS.inc(provider, model, "error" if finished.error else "ok")
+        LLM_LATENCY.observe(provider, model, value=seconds)
+        for token_type in ("input", "output", "cached_input"):
+            if attributes.get(f"{token_type}_tokens"):
+                LLM_TOKENS.inc(provider, model, token_type, amount=attributes[f"{token_type}_tokens"])
+        if "cache_hit" in attributes:
+            CACHE_REQUESTS.inc("prompt", "hit" if attributes["cache_hit"] else "miss")
+
+    elif finished.name == "stage.retry":
+        STAGE_RETRIES.inc(attributes.get("stage", "unknown"), attributes.get("provider", "unknown"), amount=attributes.get("retries", 1))
+
+    elif finished.name in ("http.get", "http.graphql"):
+        api = "graphql" if finished.name == "http.graphql" else "rest"
+        if finished.name == "http.get" and "cache_hit" in attributes:
+            CACHE_REQUESTS.inc("http", "hit" if attributes["cache_hit"] else "miss")
+        if "github" in attributes.get("host", ""):
+            GITHUB_CALLS.inc(api, str(attributes.get("status_code", "error")))
+            if attributes.get("rate_limit_remaining") is not None:
+                GITHUB_RATE_LIMIT.set(api, value=int(attributes["rate_limit_remaining"]))
+
+    else:
+        stage = _stage_of(finished.name)
+        if stage:
+            STAGE_LATENCY.observe(stage, value=seconds)
+
+
+def render():
+    """Render every metric in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for metric in REGISTRY:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+_server = None
+_started = False
+
+
+def start_metrics_server(port=None, host="0.0.0.0"):
+    """
+    Start the metrics endpoint in a background thread, once per process.
+
+    Streamlit re-runs main.py on every interaction, so repeated calls return the
+    running server. Returns None if the endpoint is disabled or the port is taken.
+    """
+    global _server, _started
+    with _lock:
+        if _started:
+            return _server
+        _started = True
+        port = int(os.getenv("METRICS_PORT", DEFAULT_PORT)) if port is None else port
+        if port == 0:
+            return None
+        try:
+            _server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            print(f"Metrics endpoint disabled: could not bind port {port}: {e}")
+            return None
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    add_listener(observe_span)
+    return _server
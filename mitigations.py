@@ -1,55 +1,270 @@
+import json
+import re
 import requests
-from anthropic import Anthropic
-from mistralai import Mistral
-from openai import OpenAI, AzureOpenAI
 import streamlit as st
 
-from google import genai as google_genai
-from groq import Groq
-from zhipuai import ZhipuAI
-from utils import process_groq_response, create_reasoning_system_prompt
+from utils import process_groq_response, create_reasoning_system_prompt, create_threats_context, threat_id, CacheablePrompt, stage_prompt, stage_messages
+from providers import openai_client, azure_openai_client, anthropic_client, mistral_client, groq_client, google_client, google_genai_types, anthropic_content
+from artefacts import store_artefact
+from tracing import traced
 from i18n import get_prompt_language_suffix
 
+CONTROL_TYPES = ["Preventive", "Detective", "Corrective", "Deterrent", "Compensating"]
+EFFORT_LEVELS = ["Low", "Medium", "High"]
+
+# Schema of the mitigations JSON, for providers that accept one
+MITIGATIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Mitigations": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "Threat ID": {"type": "string"},
+                    "Threat Type": {"type": "string"},
+                    "Scenario": {"type": "string"},
+                    "Controls": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "Mitigation": {"type": "string"},
+                                "Control Type": {"type": "string", "enum": CONTROL_TYPES},
+                                "Effort": {"type": "string", "enum": EFFORT_LEVELS}
+                            },
+                            "required": ["Mitigation", "Control Type", "Effort"]
+                        }
+                    }
+                },
+                "required": ["Threat ID", "Threat Type", "Scenario", "Controls"]
+            }
+        }
+    },
+    "required": ["Mitigations"]
+}
+
+MITIGATIONS_SYSTEM_PROMPT = "You are a helpful assistant that provides threat mitigation strategies in JSON format."
+
 # Function to create a prompt to generate mitigating controls
+@traced()
 def create_mitigations_prompt(threats, language="en"):
     language_suffix = get_prompt_language_suffix(language)
 
+    # The threat list comes first so it forms a prefix shared with the DREAD and test case prompts
+    context = create_threats_context(threats, language)
+
     if language == "zh":
-        prompt = f"""
-作为一名拥有超过20年STRIDE威胁建模方法经验的网络安全专家，您的任务是为威胁模型中识别的威胁提供潜在的缓解措施。您的响应必须根据威胁的详细信息进行调整。
+        instructions = f"""
+作为一名拥有超过20年STRIDE威胁建模方法经验的网络安全专家，您的任务是为上面列出的威胁提供潜在的缓解措施。您的响应必须根据威胁的详细信息进行调整。
+
+使用JSON格式的响应，顶层键为"Mitigations"，按上表顺序为每个威胁提供一项，包含以下子键：
+- "Threat ID": 上表中威胁的ID（例如，"T-3f9a0c12"），原样复制。
+- "Threat Type": 威胁类型，从上表复制。
+- "Scenario": 威胁场景，从上表复制。
+- "Controls": 缓解措施列表，每项包含：
+  - "Mitigation": 具体、可执行的缓解措施。
+  - "Control Type": "Preventive"、"Detective"、"Corrective"、"Deterrent" 或 "Compensating" 之一。
+  - "Effort": 实施工作量，"Low"、"Medium" 或 "High" 之一。
+"Control Type" 和 "Effort" 的值使用英文。确保JSON响应格式正确，不包含任何额外文本。以下是预期的JSON响应格式示例：
+{{
+  "Mitigations": [
+    {{
+      "Threat ID": "T-3f9a0c12",
+      "Threat Type": "欺骗",
+      "Scenario": "攻击者可能创建一个虚假的OAuth2提供者，诱骗用户通过它登录。",
+      "Controls": [
+        {{"Mitigation": "只允许预先注册的OAuth2提供者和重定向URI。", "Control Type": "Preventive", "Effort": "Low"}},
+        {{"Mitigation": "对来自未知颁发者的令牌发出告警。", "Control Type": "Detective", "Effort": "Medium"}}
+      ]
+    }}
+  ]
+}}
+{language_suffix}
+"""
+    else:
+        instructions = f"""
+Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology. Your task is to provide potential mitigations for the threats listed above. It is very important that your responses are tailored to reflect the details of the threats.
+
+Your response should be in JSON format with a top-level key "Mitigations" holding one entry per threat, in the order of the table above, with the following sub-keys:
+- "Threat ID": The ID of the threat from the table above (e.g. "T-3f9a0c12"), copied exactly.
+- "Threat Type": The threat type, copied from the table above.
+- "Scenario": The threat scenario, copied from the table above.
+- "Controls": A list of mitigations, each with:
+  - "Mitigation": A specific, actionable security control.
+  - "Control Type": One of "Preventive", "Detective", "Corrective", "Deterrent" or "Compensating".
+  - "Effort": The implementation effort, one of "Low", "Medium" or "High".
+Ensure the JSON response is correctly formatted and does not contain any additional text. Here is an example of the expected JSON response format:
+{{
+  "Mitigations": [
+    {{
+      "Threat ID": "T-3f9a0c12",
+      "Threat Type": "Spoofing",
+      "Scenario": "An attacker could create a fake OAuth2 provider and trick users into logging in through it.",
+      "Controls": [
+        {{"Mitigation": "Only allow pre-registered OAuth2 providers and redirect URIs.", "Control Type": "Preventive", "Effort": "Low"}},
+        {{"Mitigation": "Alert on tokens from unknown issuers.", "Control Type": "Detective", "Effort": "Medium"}}
+      ]
+    }}
+  ]
+}}
+{language_suffix}
+"""
+    return CacheablePrompt(context, instructions)
+
+
+def _choice(value, options):
+    # Match an enum value case-insensitively; anything else is unknown
+    text = str(value or "").strip().lower()
+    return next((option for option in options if option.lower() == text), None)
+
+
+def _markdown_table_mitigations(text):
+    # Models that ignore the JSON instructions reply with the older Markdown table:
+    # Threat Type | Scenario | Suggested Mitigation(s)
+    entries = []
+    for line in text.splitlines():
+        cells = [cell.strip() for cell in re.split(r"(?<!\\)\|", line.strip().strip("|"))]
+        if not line.strip().startswith("|") or len(cells) < 3 or all(re.fullmatch(r":?-{2,}:?", cell) for cell in cells if cell):
+            continue
+        if cells[0].lower() in ("threat type", "id", "threat id", "威胁类型"):
+            continue
+        offset = 1 if re.fullmatch(r"T-[0-9a-f]{8}", cells[0]) else 0
+        if len(cells) < offset + 3:
+            continue
+        entries.append({
+            "Threat ID": cells[0] if offset else None,
+            "Threat Type": cells[offset],
+            "Scenario": cells[offset + 1],
+            "Controls": [{"Mitigation": item} for item in re.split(r"\s*<br\s*/?>\s*", " | ".join(cells[offset + 2:])) if item],
+        })
+    return entries
+
+
+@traced()
+def parse_mitigations(response):
+    """
+    Normalise a mitigations response into {"Mitigations": [...]}, one entry per threat
+    with "Threat ID", "Threat Type", "Scenario" and "Controls" (each with "Mitigation",
+    "Control Type" and "Effort"). Replies in the older Markdown table format are
+    converted as well. Entries without a threat ID get the ID of their threat type and
+    scenario.
 
-您的输出应该采用markdown表格形式，包含以下列：
-    - A列：威胁类型
-    - B列：场景
-    - C列：建议的缓解措施
+    Args:
+        response (str or dict): The model response or parsed JSON
 
-以下是识别出的威胁列表：
-{threats}
+    Returns:
+        dict: The normalised mitigations
 
-您的响应（不要包装在代码块中）：
-{language_suffix}
-"""
+    Raises:
+        ValueError: If the response is neither mitigations JSON nor a mitigations
+            table, e.g. prose or truncated JSON
+    """
+    entries = []
+    if isinstance(response, str):
+        text = re.sub(r'^```(?:json)?\s*|\s*```$', '', response.strip())
+        try:
+            response = json.loads(text)
+        except json.JSONDecodeError as e:
+            entries = _markdown_table_mitigations(text)
+            if not entries:
+                raise ValueError(f"Mitigations response is neither JSON nor a mitigations table: {e}; response starts with {text[:200]!r}") from e
+            response = {}
+    if isinstance(response, dict):
+        entries = entries or response.get("Mitigations") or response.get("mitigations") or []
+    elif isinstance(response, list):
+        entries = response
     else:
-        prompt = f"""
-Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology. Your task is to provide potential mitigations for the threats identified in the threat model. It is very important that your responses are tailored to reflect the details of the threats.
+        raise ValueError(f"Mitigations response must be a JSON object or list, got {type(response).__name__}")
+
+    mitigations = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        threat_type = entry.get("Threat Type") or entry.get("threat_type") or "Unknown"
+        scenario = entry.get("Scenario") or entry.get("scenario") or ""
+        controls = entry.get("Controls") or entry.get("controls") or entry.get("Mitigations") or entry.get("mitigations") or []
+        if isinstance(controls, (str, dict)):
+            controls = [controls]
+        normalised = []
+        for control in controls:
+            if isinstance(control, str):
+                control = {"Mitigation": control}
+            if not isinstance(control, dict) or not (control.get("Mitigation") or control.get("mitigation")):
+                continue
+            normalised.append({
+                "Mitigation": str(control.get("Mitigation") or control.get("mitigation")).strip(),
+                "Control Type": _choice(control.get("Control Type") or control.get("control_type"), CONTROL_TYPES),
+                "Effort": _choice(control.get("Effort") or control.get("effort"), EFFORT_LEVELS),
+            })
+        mitigations.append({
+            "Threat ID": str(entry.get("Threat ID") or entry.get("threat_id") or entry.get("id") or threat_id(threat_type, scenario)).strip(),
+            "Threat Type": threat_type,
+            "Scenario": scenario,
+            "Controls": normalised,
+        })
+    return {"Mitigations": mitigations}
+
+
+def split_mitigations(mitigations, threat_ids):
+    """
+    Split mitigations into one entry per threat, so entries can be reused when the
+    threat model changes.
+
+    Args:
+        mitigations (str or dict): The model response or parsed mitigations
+        threat_ids (list): IDs of the threats the mitigations were requested for
+
+    Returns:
+        list: The entry of every threat in threat_ids, or None where the response has
+        no mitigations for it
+    """
+    entries = [entry for entry in parse_mitigations(mitigations)["Mitigations"] if entry["Controls"]]
+    by_id = {}
+    for entry in entries:
+        by_id.setdefault(entry["Threat ID"], entry)
+    if not any(key in by_id for key in threat_ids) and len(entries) == len(threat_ids):
+        # The model changed the IDs but kept the order
+        by_id = dict(zip(threat_ids, entries))
+    return [dict(by_id[key], **{"Threat ID": key}) if key in by_id else None for key in threat_ids]
+
+
+# Function to convert the mitigations JSON to Markdown for display.
+@traced()
+def mitigations_json_to_markdown(mitigations, language="en"):
+    """
+    Render mitigations as a Markdown table with one row per control.
 
-Your output should be in the form of a markdown table with the following columns:
-    - Column A: Threat Type
-    - Column B: Scenario
-    - Column C: Suggested Mitigation(s)
+    Args:
+        mitigations (dict): Mitigations as returned by parse_mitigations
+        language (str): Language code
 
-Below is the list of identified threats:
-{threats}
+    Returns:
+        str: The Markdown table
+    """
+    markdown_output = "| Threat ID | Threat Type | Scenario | Suggested Mitigation(s) | Control Type | Effort |\n"
+    markdown_output += "|-----------|-------------|----------|-------------------------|--------------|--------|\n"
 
-YOUR RESPONSE (do not wrap in a code block):
-{language_suffix}
-"""
-    return prompt
+    def cell(value):
+        # Keep pipes and line breaks from breaking the table
+        return str(value).replace("|", "\\|").replace("\r", "").replace("\n", " ")
+
+    entries = (mitigations or {}).get("Mitigations", [])
+    if not entries:
+        markdown_output += "| - | No mitigations found | Please generate a threat model first | - | - | - |\n"
+    for entry in entries:
+        prefix = f"| {cell(entry['Threat ID'])} | {cell(entry['Threat Type'])} | {cell(entry['Scenario'])} "
+        for control in entry["Controls"] or [{"Mitigation": "-"}]:
+            markdown_output += prefix + f"| {cell(control['Mitigation'])} | {control.get('Control Type') or '-'} | {control.get('Effort') or '-'} |\n"
+
+    markdown_output += "\n"
+    return markdown_output
 
 
 # Function to get mitigations from the GPT response.
+@traced()
 def get_mitigations(api_key, model_name, prompt, language="en"):
-    client = OpenAI(api_key=api_key)
+    client = openai_client(api_key=api_key)
 
     # For reasoning models (o1, o3, o3-mini, o4-mini), use a structured system prompt
     if model_name in ["o1", "o3", "o3-mini", "o4-mini"]:
@@ -61,32 +276,27 @@ def get_mitigations(api_key, model_name, prompt, language="en"):
    - Consider the potential impact
    - Identify appropriate security controls and mitigations
    - Ensure mitigations are specific and actionable
-3. Format the output as a markdown table with columns for:
-   - Threat Type
-   - Scenario
-   - Suggested Mitigation(s)
+3. Format the output as JSON with a "Mitigations" entry per threat holding:
+   - Threat ID, Threat Type and Scenario from the threat list
+   - Controls, each with the mitigation, its control type and its implementation effort
 4. Ensure mitigations follow security best practices and industry standards"""
         )
     else:
-        system_prompt = "You are a helpful assistant that provides threat mitigation strategies in Markdown format."
+        system_prompt = MITIGATIONS_SYSTEM_PROMPT
 
     response = client.chat.completions.create(
         model = model_name,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ]
+        response_format={"type": "json_object"},
+        messages=stage_messages(system_prompt, prompt)
     )
 
-    # Access the content directly as the response will be in text format
-    mitigations = response.choices[0].message.content
-
-    return mitigations
+    return parse_mitigations(response.choices[0].message.content)
 
 
 # Function to get mitigations from the Azure OpenAI response.
+@traced()
 def get_mitigations_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, language="en"):
-    client = AzureOpenAI(
+    client = azure_openai_client(
         azure_endpoint = azure_api_endpoint,
         api_key = azure_api_key,
         api_version = azure_api_version,
@@ -94,45 +304,46 @@ def get_mitigations_azure(azure_api_endpoint, azure_api_key, azure_api_version,
 
     response = client.chat.completions.create(
         model = azure_deployment_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides threat mitigation strategies in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        response_format={"type": "json_object"},
+        messages=stage_messages(MITIGATIONS_SYSTEM_PROMPT, prompt)
     )
 
-    # Access the content directly as the response will be in text format
-    mitigations = response.choices[0].message.content
-
-    return mitigations
+    return parse_mitigations(response.choices[0].message.content)
 
 # Function to get mitigations from the Google model's response.
+@traced()
 def get_mitigations_google(google_api_key, google_model, prompt, language="en"):
-    client = google_genai.Client(api_key=google_api_key)
+    client = google_client(api_key=google_api_key)
+    google_types = google_genai_types()
     
     safety_settings = [
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_HARASSMENT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         )
     ]
     
-    system_instruction = "You are a helpful assistant that provides threat mitigation strategies in Markdown format."
+    system_instruction = (
+        "You are a helpful assistant that provides threat mitigation strategies in JSON format. "
+        "Only provide the mitigations in JSON format with no additional text. "
+        "Do not wrap the output in a code block."
+    )
+    system_instruction, prompt = stage_prompt(system_instruction, prompt)
     is_gemini_2_5 = "gemini-2.5" in google_model.lower()
     
     try:
-        from google.genai import types as google_types
         if is_gemini_2_5:
             config = google_types.GenerateContentConfig(
                 system_instruction=system_instruction,
@@ -159,38 +370,28 @@ def get_mitigations_google(google_api_key, google_model, prompt, language="en"):
                         thinking_content.append(str(part.thought))
         if thinking_content:
             joined_thinking = "\n\n".join(thinking_content)
-            st.session_state['last_thinking_content'] = joined_thinking
+            store_artefact('last_thinking_content', joined_thinking)
     except Exception as e:
         st.error(f"Error generating mitigations with Google AI: {str(e)}")
-        return f"""
-## Error Generating Mitigations
+        return {"Mitigations": []}
 
-**API Error:** {str(e)}
-
-Please try again or select a different model provider.
-"""
-    
-    mitigations = response.text
-    return mitigations
+    return parse_mitigations(response.text)
 
 # Function to get mitigations from the Mistral model's response.
+@traced()
 def get_mitigations_mistral(mistral_api_key, mistral_model, prompt, language="en"):
-    client = Mistral(api_key=mistral_api_key)
+    client = mistral_client(api_key=mistral_api_key)
 
     response = client.chat.complete(
         model = mistral_model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides threat mitigation strategies in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        response_format={"type": "json_object"},
+        messages=stage_messages(MITIGATIONS_SYSTEM_PROMPT, prompt)
     )
 
-    # Access the content directly as the response will be in text format
-    mitigations = response.choices[0].message.content
-
-    return mitigations
+    return parse_mitigations(response.choices[0].message.content)
 
 # Function to get mitigations from Ollama hosted LLM.
+@traced()
 def get_mitigations_ollama(ollama_endpoint, ollama_model, prompt, language="en"):
     """
     Get mitigations from Ollama hosted LLM.
@@ -201,7 +402,7 @@ def get_mitigations_ollama(ollama_endpoint, ollama_model, prompt, language="en")
         prompt (str): The prompt to send to the model
         
     Returns:
-        str: The generated mitigations in markdown format
+        dict: The mitigations, see parse_mitigations
         
     Raises:
         requests.exceptions.RequestException: If there's an error communicating with the Ollama endpoint
@@ -215,18 +416,10 @@ def get_mitigations_ollama(ollama_endpoint, ollama_model, prompt, language="en")
     data = {
         "model": ollama_model,
         "stream": False,
-        "messages": [
-            {
-                "role": "system", 
-                "content": """You are a cyber security expert with more than 20 years experience of implementing security controls for a wide range of applications. Your task is to analyze the provided application description and suggest appropriate security controls and mitigations.
-
-Please provide your response in markdown format with appropriate headings and bullet points."""
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
+        "format": "json",
+        "messages": stage_messages("""You are a cyber security expert with more than 20 years experience of implementing security controls for a wide range of applications. Your task is to analyze the provided application description and suggest appropriate security controls and mitigations.
+
+Please provide your response in the JSON format described in the prompt.""", prompt)
     }
 
     try:
@@ -236,8 +429,7 @@ Please provide your response in markdown format with appropriate headings and bu
         
         try:
             # Access the 'content' attribute of the 'message' dictionary
-            mitigations = outer_json["message"]["content"]
-            return mitigations
+            return parse_mitigations(outer_json["message"]["content"])
             
         except KeyError as e:
 
@@ -248,14 +440,17 @@ Please provide your response in markdown format with appropriate headings and bu
         raise
 
 # Function to get mitigations from the Anthropic model's response.
+@traced()
 def get_mitigations_anthropic(anthropic_api_key, anthropic_model, prompt, language="en"):
-    client = Anthropic(api_key=anthropic_api_key)
+    client = anthropic_client(api_key=anthropic_api_key)
     
     # Check if we're using extended thinking mode
     is_thinking_mode = "thinking" in anthropic_model.lower()
     
     # If using thinking mode, use the actual model name without the "thinking" suffix
     actual_model = "claude-3-7-sonnet-latest" if is_thinking_mode else anthropic_model
+
+    system_prompt, prompt = stage_prompt(MITIGATIONS_SYSTEM_PROMPT, prompt)
     
     try:
         # Configure the request based on whether thinking mode is enabled
@@ -267,9 +462,9 @@ def get_mitigations_anthropic(anthropic_api_key, anthropic_model, prompt, langua
                     "type": "enabled",
                     "budget_tokens": 16000
                 },
-                system="You are a helpful assistant that provides threat mitigation strategies in Markdown format.",
+                system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=600  # 10-minute timeout
             )
@@ -277,9 +472,9 @@ def get_mitigations_anthropic(anthropic_api_key, anthropic_model, prompt, langua
             response = client.messages.create(
                 model=actual_model,
                 max_tokens=4096,
-                system="You are a helpful assistant that provides threat mitigation strategies in Markdown format.",
+                system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=300  # 5-minute timeout
             )
@@ -292,66 +487,52 @@ def get_mitigations_anthropic(anthropic_api_key, anthropic_model, prompt, langua
             # Store thinking content in session state for debugging/transparency (optional)
             thinking_content = ''.join(block.thinking for block in response.content if block.type == "thinking")
             if thinking_content:
-                st.session_state['last_thinking_content'] = thinking_content
+                store_artefact('last_thinking_content', thinking_content)
         else:
             # Standard handling for regular responses
             mitigations = response.content[0].text
 
-        return mitigations
+        return parse_mitigations(mitigations)
     except Exception as e:
         # Handle timeout and other errors
         error_message = str(e)
         st.error(f"Error with Anthropic API: {error_message}")
-        
-        # Create a fallback response for timeout or other errors
-        fallback_mitigations = f"""
-## Error Generating Mitigations
-
-**API Error:** {error_message}
-
-### Suggestions:
-- For complex applications, try simplifying the input or breaking it into smaller components
-- If you're using extended thinking mode and encountering timeouts, try the standard model instead
-- Consider reducing the complexity of the application description
-"""
-        return fallback_mitigations
+        return {"Mitigations": []}
 
 # Function to get mitigations from LM Studio Server response.
+@traced()
 def get_mitigations_lm_studio(lm_studio_endpoint, model_name, prompt, language="en"):
-    client = OpenAI(
+    client = openai_client(
         base_url=f"{lm_studio_endpoint}/v1",
         api_key="not-needed"  # LM Studio Server doesn't require an API key
     )
 
     response = client.chat.completions.create(
         model=model_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides threat mitigation strategies in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": "mitigations_response", "schema": MITIGATIONS_SCHEMA},
+        },
+        messages=stage_messages(MITIGATIONS_SYSTEM_PROMPT, prompt)
     )
 
-    # Access the content directly as the response will be in text format
-    mitigations = response.choices[0].message.content
-
-    return mitigations
+    return parse_mitigations(response.choices[0].message.content)
 
 # Function to get mitigations from the Groq model's response.
+@traced()
 def get_mitigations_groq(groq_api_key, groq_model, prompt, language="en"):
-    client = Groq(api_key=groq_api_key)
+    client = groq_client(api_key=groq_api_key)
     response = client.chat.completions.create(
         model=groq_model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides threat mitigation strategies in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        response_format={"type": "json_object"},
+        messages=stage_messages(MITIGATIONS_SYSTEM_PROMPT, prompt)
     )
 
     # Process the response using our utility function
     reasoning, mitigations = process_groq_response(
         response.choices[0].message.content,
         groq_model,
-        expect_json=False
+        expect_json=True
     )
     
     # If we got reasoning, display it in an expander in the UI
@@ -359,9 +540,10 @@ def get_mitigations_groq(groq_api_key, groq_model, prompt, language="en"):
         with st.expander("View model's reasoning process", expanded=False):
             st.write(reasoning)
 
-    return mitigations
+    return parse_mitigations(mitigations)
 
 # Function to get mitigations from GLM response
+@traced()
 def get_mitigations_glm(glm_api_key, glm_model, prompt, language="en"):
     """
     Get mitigations from GLM (Zhipu AI) response.
@@ -372,9 +554,9 @@ def get_mitigations_glm(glm_api_key, glm_model, prompt, language="en"):
         prompt (str): The prompt to send to the model
 
     Returns:
-        str: Markdown formatted mitigations
+        dict: The mitigations, see parse_mitigations
     """
-    client = OpenAI(
+    client = openai_client(
     api_key= glm_api_key,
     base_url="https://open.bigmodel.cn/api/paas/v4/"
     )
@@ -382,21 +564,20 @@ def get_mitigations_glm(glm_api_key, glm_model, prompt, language="en"):
     try:
         response = client.chat.completions.create(
             model=glm_model,
-            messages=[
-                {"role": "system", "content": "You are a cybersecurity expert with extensive experience in threat modeling and mitigation strategies. Provide detailed, actionable security controls and mitigations."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages("You are a cybersecurity expert with extensive experience in threat modeling and mitigation strategies. Provide detailed, actionable security controls and mitigations in valid JSON format.", prompt),
             temperature=0.7,
-            max_tokens=4000
+            max_tokens=4000,
+            response_format={"type": "json_object"}
         )
 
-        return response.choices[0].message.content
+        return parse_mitigations(response.choices[0].message.content)
 
     except Exception as e:
         st.error(f"Error generating mitigations with GLM: {str(e)}")
-        return "Error generating mitigations. Please check your API key and try again."
+        return {"Mitigations": []}
 
 # Function to get mitigations from eCloud response
+@traced()
 def get_mitigations_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
     """
     Get mitigations from eCloud response.
@@ -407,7 +588,7 @@ def get_mitigations_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
         prompt (str): The prompt to send to the model
 
     Returns:
-        str: Markdown formatted mitigations
+        dict: The mitigations, see parse_mitigations
     """
     import requests
 
@@ -420,10 +601,7 @@ def get_mitigations_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
 
     data = {
         "model": ecloud_model,
-        "messages": [
-            {"role": "system", "content": "You are a cybersecurity expert with extensive experience in threat modeling and mitigation strategies. Provide detailed, actionable security controls and mitigations."},
-            {"role": "user", "content": prompt}
-        ],
+        "messages": stage_messages("You are a cybersecurity expert with extensive experience in threat modeling and mitigation strategies. Provide detailed, actionable security controls and mitigations in valid JSON format.", prompt),
         "temperature": 0.7,
         "max_tokens": 4000,
         "stream": False,
@@ -437,11 +615,11 @@ def get_mitigations_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
         response.raise_for_status()
 
         result = response.json()
-        return result['choices'][0]['message']['content']
+        return parse_mitigations(result['choices'][0]['message']['content'])
 
     except requests.exceptions.RequestException as e:
         st.error(f"Error generating mitigations with eCloud: {str(e)}")
-        return "Error generating mitigations. Please check your API key and try again."
+        return {"Mitigations": []}
     except Exception as e:
         st.error(f"Unexpected error with eCloud: {str(e)}")
-        return "Error generating mitigations. An unexpected error occurred."
\ No newline at end of file
+        return {"Mitigations": []}
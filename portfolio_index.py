@@ -0,0 +1,631 @@
+"""
+Cross-application risk portfolio index.
+
+Every run of the app or of batch_runner.py is isolated, so this module keeps a
+persistent local SQLite index of the threats, DREAD scores, mitigations and test
+cases they generate, tagged by application, commit and date. Questions about the
+whole portfolio are then answered from the index without calling a model:
+
+    python portfolio_index.py threats --category EoP --min-risk 7 --internet-facing
+    python portfolio_index.py trend --period month --category "Denial of Service"
+    python portfolio_index.py search "session fixation"
+    python portfolio_index.py import batch-output --commit 1a2b3c
+
+Generated text is indexed with SQLite FTS5 (trigram tokenizer, so English and
+Chinese both match on substrings). Runs are identified by a caller-chosen key; a
+stage recorded again for the same run replaces its earlier rows, and a new key
+starts a new run, which is what the trend view counts over time.
+
+Set PORTFOLIO_INDEX_PATH to move the index (default
+~/.local/share/stride-gpt/portfolio.db).
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+
+from dread_analytics import DREAD_FACTORS, resolve_weights, stride_category
+from threat_record import normalize_threat_model
+from utils import threat_id
+
+DEFAULT_INDEX_PATH = os.path.join(os.path.expanduser("~"), ".local", "share", "stride-gpt", "portfolio.db")
+
+# strftime formats for trend periods
+TREND_PERIODS = {"day": "%Y-%m-%d", "week": "%Y-W%W", "month": "%Y-%m", "quarter": None, "year": "%Y"}
+
+STAGES = ("threat_model", "dread", "mitigations", "test_cases")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_key TEXT UNIQUE NOT NULL,
+    application TEXT NOT NULL,
+    commit_sha TEXT,
+    created_at TEXT NOT NULL,
+    app_type TEXT,
+    authentication TEXT,
+    internet_facing INTEGER,
+    sensitive_data TEXT,
+    provider TEXT,
+    model TEXT,
+    language TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_application ON runs (application, created_at);
+CREATE INDEX IF NOT EXISTS runs_created_at ON runs (created_at);
+
+CREATE TABLE IF NOT EXISTS threats (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    threat_id TEXT,
+    threat_type TEXT,
+    category TEXT,
+    scenario TEXT,
+    scenario_key TEXT,
+    impact TEXT,
+    damage_potential REAL,
+    reproducibility REAL,
+    exploitability REAL,
+    affected_users REAL,
+    discoverability REAL,
+    risk REAL
+);
+CREATE INDEX IF NOT EXISTS threats_run ON threats (run_id, scenario_key);
+CREATE INDEX IF NOT EXISTS threats_run_threat_id ON threats (run_id, threat_id);
+CREATE INDEX IF NOT EXISTS threats_category_risk ON threats (category, risk);
+
+CREATE TABLE IF NOT EXISTS mitigations (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    threat_id TEXT,
+    threat_type TEXT,
+    category TEXT,
+    scenario TEXT,
+    mitigation TEXT,
+    control_type TEXT,
+    effort TEXT
+);
+CREATE INDEX IF NOT EXISTS mitigations_run ON mitigations (run_id, threat_id);
+
+CREATE TABLE IF NOT EXISTS test_cases (
+    id INTEGER PRIMARY KEY,
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    title TEXT,
+    body TEXT
+);
+CREATE INDEX IF NOT EXISTS test_cases_run ON test_cases (run_id);
+"""
+
+DREAD_COLUMNS = ["damage_potential", "reproducibility", "exploitability", "affected_users", "discoverability"]
+
+# Table and text columns indexed for full-text search, per kind
+SEARCH_SOURCES = {
+    "threat": ("threats", "coalesce(threat_type, '') || ' ' || coalesce(scenario, '') || ' ' || coalesce(impact, '')"),
+    "mitigation": ("mitigations", "coalesce(scenario, '') || ' ' || coalesce(mitigation, '')"),
+    "test_case": ("test_cases", "coalesce(title, '') || ' ' || coalesce(body, '')"),
+}
+
+
+def scenario_key(scenario):
+    """Normalise a scenario so a DREAD row finds the threat it scores."""
+    return " ".join(str(scenario).lower().split())[:200]
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return min(max(number, 0.0), 10.0) if number == number else None
+
+
+def parse_markdown_table(markdown):
+    """
+    Return the body rows of the Markdown tables in a text as lists of cell strings.
+    """
+    rows = []
+    for line in markdown.splitlines():
+        line = line.strip()
+        if not line.startswith("|"):
+            continue
+        # Split on pipes that are not escaped
+        cells = [cell.strip().replace("\\|", "|") for cell in re.split(r"(?<!\\)\|", line.strip("|"))]
+        if all(re.fullmatch(r":?-{2,}:?", cell) for cell in cells if cell) or any(cell.lower() in ("threat type", "威胁类型") for cell in cells[:1]):
+            continue
+        rows.append(cells)
+    return rows
+
+
+def parse_test_cases(markdown):
+    """
+    Split generated test cases into (title, Gherkin) pairs, one per fenced code
+    block, titled by the closest line above it. Text without code blocks is one
+    untitled test case.
+    """
+    cases, title, block = [], "", None
+    for line in markdown.splitlines():
+        if line.strip().startswith("```"):
+            if block is None:
+                block = []
+            else:
+                cases.append((title, "\n".join(block).strip()))
+                block, title = None, ""
+        elif block is not None:
+            block.append(line)
+        elif line.strip():
+            title = line.strip().lstrip("#").strip().strip("*").strip()
+    if block:
+        cases.append((title, "\n".join(block).strip()))
+    return cases or ([("", markdown.strip())] if markdown.strip() else [])
+
+
+class PortfolioIndex:
+    """SQLite index of generated threat modelling output across applications."""
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("PORTFOLIO_INDEX_PATH") or DEFAULT_INDEX_PATH
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA foreign_keys = ON")
+            if self.path != ":memory:":
+                self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.executescript(SCHEMA)
+            self.full_text = self._create_search_table()
+
+    def _create_search_table(self):
+        # FTS5 and its trigram tokenizer depend on how SQLite was built; without
+        # them search falls back to LIKE
+        for tokenizer in ("trigram", "unicode61"):
+            try:
+                self._connection.execute(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5("
+                    f"kind UNINDEXED, item_id UNINDEXED, run_id UNINDEXED, body, tokenize='{tokenizer}')"
+                )
+                return True
+            except sqlite3.OperationalError:
+                continue
+        return False
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _query(self, sql, parameters=()):
+        with self._lock:
+            return [dict(row) for row in self._connection.execute(sql, parameters)]
+
+    # ------------------ Recording ------------------ #
+
+    def start_run(self, run_key, application, commit=None, created_at=None, app_type=None, authentication=None,
+                  internet_facing=None, sensitive_data=None, provider=None, model=None, language=None):
+        """
+        Return the ID of the run with this key, creating it on first use.
+
+        Args:
+            run_key (str): Identifies the run, e.g. a digest of the application inputs
+            application (str): Application or service name
+            commit (str): Commit SHA the threat model describes, if any
+            created_at (str): ISO 8601 timestamp; defaults to now (UTC)
+            internet_facing (bool): Whether the application is internet-facing
+            authentication (list): Authentication methods
+
+        Returns:
+            int: The run ID
+        """
+        created_at = created_at or datetime.now(timezone.utc).isoformat(timespec="seconds")
+        if isinstance(authentication, (list, tuple)):
+            authentication = ", ".join(authentication)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO runs (run_key, application, commit_sha, created_at, app_type, authentication,"
+                " internet_facing, sensitive_data, provider, model, language) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_key, application, commit, created_at, app_type, authentication,
+                 None if internet_facing is None else int(bool(internet_facing)), sensitive_data, provider, model, language),
+            )
+            return self._connection.execute("SELECT id FROM runs WHERE run_key = ?", (run_key,)).fetchone()[0]
+
+    def _reindex(self, run_id, kind):
+        if not self.full_text:
+            return
+        table, body = SEARCH_SOURCES[kind]
+        self._connection.execute("DELETE FROM search WHERE run_id = ? AND kind = ?", (run_id, kind))
+        self._connection.execute(
+            f"INSERT INTO search (kind, item_id, run_id, body) SELECT ?, id, run_id, {body} FROM {table} WHERE run_id = ?",
+            (kind, run_id),
+        )
+
+    def record_threat_model(self, run_id, threat_model):
+        """Replace the threats of a run, keeping DREAD scores already recorded for them."""
+        with self._lock, self._connection:
+            scored = {
+                row["scenario_key"]: row
+                for row in self._connection.execute(
+                    f"SELECT scenario_key, {', '.join(DREAD_COLUMNS)}, risk FROM threats WHERE run_id = ? AND risk IS NOT NULL", (run_id,))
+            }
+            self._connection.execute("DELETE FROM threats WHERE run_id = ?", (run_id,))
+            rows = []
+            for threat in normalize_threat_model(threat_model):
+                key = scenario_key(threat.scenario)
+                previous = scored.pop(key, None)
+                rows.append((run_id, threat.id, threat.threat_type, stride_category(threat.threat_type), threat.scenario, key,
+                             threat.potential_impact,
+                             *((previous[column] for column in DREAD_COLUMNS) if previous else [None] * 5),
+                             previous["risk"] if previous else None))
+            self._connection.executemany(
+                f"INSERT INTO threats (run_id, threat_id, threat_type, category, scenario, scenario_key, impact, {', '.join(DREAD_COLUMNS)}, risk)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._reindex(run_id, "threat")
+
+    def record_dread(self, run_id, dread_assessment, weights="equal"):
+        """
+        Score the threats of a run. DREAD rows find their threat by its Threat ID,
+        or by scenario if they have none or it matches nothing (the model may
+        paraphrase scenarios). Rows that match no recorded threat are added as
+        threats of their own.
+        """
+        weights = resolve_weights(weights)
+        weights = weights / weights.sum()
+        with self._lock, self._connection:
+            for threat in (dread_assessment or {}).get("Risk Assessment", []):
+                if not isinstance(threat, dict):
+                    continue
+                factors = [_number(threat.get(factor)) for factor in DREAD_FACTORS]
+                risk = float(sum((factor or 0.0) * weight for factor, weight in zip(factors, weights)))
+                threat_type = threat.get("Threat Type", "Unknown")
+                scenario = threat.get("Scenario", "")
+                key = scenario_key(scenario)
+                assignments = f"UPDATE threats SET {', '.join(f'{column} = ?' for column in DREAD_COLUMNS)}, risk = ?"
+                updated = 0
+                if threat.get("Threat ID"):
+                    updated = self._connection.execute(
+                        f"{assignments} WHERE run_id = ? AND threat_id = ?",
+                        (*factors, risk, run_id, str(threat["Threat ID"]))).rowcount
+                if not updated:
+                    updated = self._connection.execute(
+                        f"{assignments} WHERE run_id = ? AND scenario_key = ?", (*factors, risk, run_id, key)).rowcount
+                if not updated:
+                    self._connection.execute(
+                        f"INSERT INTO threats (run_id, threat_id, threat_type, category, scenario, scenario_key, {', '.join(DREAD_COLUMNS)}, risk)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (run_id, threat_id(threat_type, scenario), threat_type, stride_category(threat_type), scenario, key, *factors, risk))
+            self._reindex(run_id, "threat")
+
+    def record_mitigations(self, run_id, mitigations):
+        """
+        Replace the mitigations of a run, given as the structured mitigations the
+        mitigations stage returns (one row per control) or, for older output, as a
+        Markdown table.
+        """
+        rows = []
+        if isinstance(mitigations, dict):
+            for entry in mitigations.get("Mitigations", []):
+                threat_type, scenario = entry.get("Threat Type"), entry.get("Scenario")
+                for control in entry.get("Controls") or []:
+                    rows.append((run_id, entry.get("Threat ID"), threat_type, stride_category(threat_type), scenario,
+                                 control.get("Mitigation"), control.get("Control Type"), control.get("Effort")))
+        else:
+            for cells in parse_markdown_table(mitigations or ""):
+                if len(cells) >= 3:
+                    rows.append((run_id, threat_id(cells[0], cells[1]), cells[0], stride_category(cells[0]), cells[1],
+                                 " | ".join(cells[2:]), None, None))
+            if not rows and (mitigations or "").strip():
+                rows.append((run_id, None, None, None, None, mitigations.strip(), None, None))
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM mitigations WHERE run_id = ?", (run_id,))
+            self._connection.executemany(
+                "INSERT INTO mitigations (run_id, threat_id, threat_type, category, scenario, mitigation, control_type, effort)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._reindex(run_id, "mitigation")
+
+    def record_test_cases(self, run_id, test_cases):
+        """Replace the test cases of a run, given as the Markdown the test cases stage returns."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM test_cases WHERE run_id = ?", (run_id,))
+            self._connection.executemany(
+                "INSERT INTO test_cases (run_id, title, body) VALUES (?, ?, ?)",
+                [(run_id, title, body) for title, body in parse_test_cases(test_cases or "")])
+            self._reindex(run_id, "test_case")
+
+    def record(self, run_id, stage, output):
+        """Record the output of a stage: one of STAGES."""
+        if stage == "threat_model":
+            self.record_threat_model(run_id, output)
+        elif stage == "dread":
+            self.record_dread(run_id, output)
+        elif stage == "mitigations":
+            self.record_mitigations(run_id, output)
+        elif stage == "test_cases":
+            self.record_test_cases(run_id, output)
+        else:
+            raise ValueError(f"Unknown stage '{stage}'")
+
+    # ------------------ Queries ------------------ #
+
+    @staticmethod
+    def _run_filters(application=None, internet_facing=None, since=None, until=None, latest_only=False):
+        clauses, parameters = [], []
+        if application:
+            clauses.append("runs.application = ?")
+            parameters.append(application)
+        if internet_facing is not None:
+            clauses.append("runs.internet_facing = ?")
+            parameters.append(int(bool(internet_facing)))
+        if since:
+            clauses.append("runs.created_at >= ?")
+            parameters.append(since)
+        if until:
+            clauses.append("runs.created_at < ?")
+            parameters.append(until)
+        if latest_only:
+            # The most recent run of every application
+            clauses.append("runs.id IN (SELECT id FROM runs AS latest WHERE latest.application = runs.application"
+                           " ORDER BY created_at DESC, id DESC LIMIT 1)")
+        return clauses, parameters
+
+    def threats(self, category=None, min_risk=None, application=None, internet_facing=None, since=None, until=None,
+                latest_only=True, limit=1000):
+        """
+        Find threats across applications, highest risk first.
+
+        Args:
+            category (str): STRIDE category, in any spelling stride_category knows
+            min_risk (float): Only threats scored above this risk
+            application (str): Only this application
+            internet_facing (bool): Only internet-facing (True) or internal (False) applications
+            since (str): Only runs created at or after this ISO date
+            until (str): Only runs created before this ISO date
+            latest_only (bool): Only the most recent run of every application
+            limit (int): Maximum number of threats
+
+        Returns:
+            list: Threat dicts with their run's application, commit and date
+        """
+        clauses, parameters = self._run_filters(application, internet_facing, since, until, latest_only)
+        if category:
+            clauses.append("threats.category = ?")
+            parameters.append(stride_category(category))
+        if min_risk is not None:
+            clauses.append("threats.risk > ?")
+            parameters.append(float(min_risk))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            "SELECT runs.application, runs.commit_sha, runs.created_at, runs.internet_facing, threats.threat_id, threats.threat_type,"
+            f" threats.category, threats.scenario, threats.impact, {', '.join('threats.' + column for column in DREAD_COLUMNS)},"
+            f" threats.risk FROM threats JOIN runs ON runs.id = threats.run_id {where}"
+            " ORDER BY threats.risk IS NULL, threats.risk DESC, runs.created_at DESC LIMIT ?",
+            (*parameters, int(limit)),
+        )
+
+    def trend(self, period="month", category=None, application=None, internet_facing=None, high_risk=7.0):
+        """
+        Threat counts and risk per period, from the runs created in each period.
+
+        Args:
+            period (str): One of TREND_PERIODS
+            category (str): Only this STRIDE category
+            application (str): Only this application
+            internet_facing (bool): Only internet-facing or internal applications
+            high_risk (float): Threats scored above this count as high risk
+
+        Returns:
+            list: Dicts with period, category, runs, threats, mean_risk, max_risk and high_risk
+        """
+        if period not in TREND_PERIODS:
+            raise ValueError(f"Unknown period '{period}'")
+        if period == "quarter":
+            bucket = "strftime('%Y', runs.created_at) || '-Q' || ((CAST(strftime('%m', runs.created_at) AS INTEGER) + 2) / 3)"
+        else:
+            bucket = f"strftime('{TREND_PERIODS[period]}', runs.created_at)"
+        clauses, parameters = self._run_filters(application, internet_facing)
+        if category:
+            clauses.append("threats.category = ?")
+            parameters.append(stride_category(category))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT {bucket} AS period, threats.category, COUNT(DISTINCT runs.id) AS runs, COUNT(*) AS threats,"
+            " ROUND(AVG(threats.risk), 2) AS mean_risk, MAX(threats.risk) AS max_risk,"
+            " SUM(threats.risk > ?) AS high_risk"
+            f" FROM threats JOIN runs ON runs.id = threats.run_id {where}"
+            " GROUP BY period, threats.category ORDER BY period, threats.category",
+            (float(high_risk), *parameters),
+        )
+
+    def search(self, text, kinds=None, application=None, latest_only=False, limit=50):
+        """
+        Full-text search over threats, mitigations and test cases.
+
+        Args:
+            text (str): Words or phrase to find
+            kinds (list): Any of "threat", "mitigation" and "test_case" (default: all)
+            application (str): Only this application
+            latest_only (bool): Only the most recent run of every application
+            limit (int): Maximum number of results
+
+        Returns:
+            list: Dicts with kind, application, commit_sha, created_at and body
+        """
+        kinds = list(kinds or SEARCH_SOURCES)
+        clauses, parameters = self._run_filters(application, latest_only=latest_only)
+        if self.full_text and len(text.strip()) >= 3:
+            clauses.append("search MATCH ?")
+            # Quote the text as one phrase so punctuation is not read as query syntax
+            parameters.append('"' + text.replace('"', '""') + '"')
+            order = "ORDER BY rank"
+        else:
+            clauses.append("search.body LIKE ?")
+            parameters.append(f"%{text}%")
+            order = "ORDER BY runs.created_at DESC"
+        clauses.append(f"search.kind IN ({', '.join('?' * len(kinds))})")
+        parameters.extend(kinds)
+        source = "search" if self.full_text else self._fallback_search_source()
+        return self._query(
+            f"SELECT search.kind, runs.application, runs.commit_sha, runs.created_at, search.body FROM {source}"
+            f" JOIN runs ON runs.id = search.run_id WHERE {' AND '.join(clauses)} {order} LIMIT ?",
+            (*parameters, int(limit)),
+        )
+
+    @staticmethod
+    def _fallback_search_source():
+        return "(" + " UNION ALL ".join(
+            f"SELECT '{kind}' AS kind, id AS item_id, run_id, {body} AS body FROM {table}"
+            for kind, (table, body) in SEARCH_SOURCES.items()
+        ) + ") AS search"
+
+    def applications(self):
+        """Every application with its number of runs and latest run date."""
+        return self._query(
+            "SELECT application, COUNT(*) AS runs, MAX(created_at) AS latest, MAX(internet_facing) AS internet_facing"
+            " FROM runs GROUP BY application ORDER BY application")
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return the process-wide PortfolioIndex shared by all sessions."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = PortfolioIndex()
+        return _default_index
+
+
+def import_batch_output(index, output_dir, commit=None, created_at=None, apps=None, provider=None, model=None, language=None):
+    """
+    Index the per-application directories written by batch_runner.py.
+
+    Args:
+        index (PortfolioIndex): The index
+        output_dir (str): batch_runner.py output directory
+        commit (str): Commit the applications were modelled at, if any
+        created_at (str): Run date; defaults to now
+        apps (dict): Directory name -> application details from apps.json; when
+            given, only these directories are indexed
+
+    Returns:
+        int: Number of applications indexed
+    """
+    created_at = created_at or datetime.now(timezone.utc).isoformat(timespec="seconds")
+    count = 0
+    for name in sorted(apps) if apps else sorted(os.listdir(output_dir)):
+        app_dir = os.path.join(output_dir, name)
+        if not os.path.isdir(app_dir):
+            continue
+        details = (apps or {}).get(name, {})
+        internet_facing = details.get("internet_facing")
+        run_id = index.start_run(
+            f"batch:{name}:{commit or ''}:{created_at}", details.get("name") or name, commit=commit, created_at=created_at,
+            app_type=details.get("app_type"), authentication=details.get("authentication"),
+            internet_facing=None if internet_facing is None else str(internet_facing).lower() in ("yes", "true", "1", "是"),
+            sensitive_data=details.get("sensitive_data"), provider=provider, model=model, language=language,
+        )
+        for stage, file_names in (("threat_model", ["threat_model.json"]), ("dread", ["dread.json"]),
+                                  ("mitigations", ["mitigations.json", "mitigations.md"]), ("test_cases", ["test_cases.md"])):
+            # Older batch runs only wrote the mitigations as Markdown
+            paths = [os.path.join(app_dir, file_name) for file_name in file_names if os.path.exists(os.path.join(app_dir, file_name))]
+            if not paths:
+                continue
+            path = paths[0]
+            with open(path, encoding="utf-8") as f:
+                content = f.read()
+            if path.endswith(".json"):
+                content = json.loads(content)
+                if stage == "threat_model":
+                    content = content.get("threat_model", [])
+            index.record(run_id, stage, content)
+        count += 1
+    return count
+
+
+def _print_rows(rows, columns):
+    if not rows:
+        print("No results")
+        return
+    widths = {column: min(60, max(len(column), *(len(str(row.get(column, ""))) for row in rows))) for column in columns}
+    print("  ".join(f"{column:<{widths[column]}}" for column in columns))
+    for row in rows:
+        values = ("" if row.get(column) is None else str(row.get(column)).replace("\n", " ") for column in columns)
+        print("  ".join(f"{value[:widths[column]]:<{widths[column]}}" for column, value in zip(columns, values)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query the portfolio index of generated threat models.")
+    parser.add_argument("--index", help="Index database (default: PORTFOLIO_INDEX_PATH or ~/.local/share/stride-gpt/portfolio.db)")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    threats = commands.add_parser("threats", help="Find threats across applications, highest risk first")
+    threats.add_argument("--category", help="STRIDE category, e.g. 'Elevation of Privilege' or EoP")
+    threats.add_argument("--min-risk", type=float, help="Only threats with a higher DREAD risk score")
+    threats.add_argument("--application")
+    threats.add_argument("--internet-facing", action="store_true", default=None, help="Only internet-facing applications")
+    threats.add_argument("--internal", dest="internet_facing", action="store_false", help="Only internal applications")
+    threats.add_argument("--since", help="Only runs from this ISO date on")
+    threats.add_argument("--all-runs", action="store_true", help="Include earlier runs, not only each application's latest")
+    threats.add_argument("--limit", type=int, default=100)
+
+    trend = commands.add_parser("trend", help="Threat counts and risk over time")
+    trend.add_argument("--period", choices=list(TREND_PERIODS), default="month")
+    trend.add_argument("--category")
+    trend.add_argument("--application")
+    trend.add_argument("--internet-facing", action="store_true", default=None)
+    trend.add_argument("--high-risk", type=float, default=7.0, help="Risk above which a threat counts as high risk")
+
+    search = commands.add_parser("search", help="Full-text search over threats, mitigations and test cases")
+    search.add_argument("text")
+    search.add_argument("--kind", action="append", choices=list(SEARCH_SOURCES))
+    search.add_argument("--application")
+    search.add_argument("--limit", type=int, default=20)
+
+    commands.add_parser("applications", help="List indexed applications")
+
+    batch = commands.add_parser("import", help="Index a batch_runner.py output directory")
+    batch.add_argument("output_dir")
+    batch.add_argument("--apps", help="The apps.json the batch ran on, for application details")
+    batch.add_argument("--commit")
+    batch.add_argument("--date", help="Run date (ISO 8601); default now")
+
+    args = parser.parse_args(argv)
+    index = PortfolioIndex(args.index)
+
+    if args.command == "import":
+        apps = None
+        if args.apps:
+            from batch_runner import app_directory_name
+            with open(args.apps, encoding="utf-8") as f:
+                apps = {app_directory_name(app, position): app for position, app in enumerate(json.load(f))}
+        count = import_batch_output(index, args.output_dir, commit=args.commit, created_at=args.date, apps=apps)
+        print(f"Indexed {count} applications from {args.output_dir} into {index.path}")
+        return 0
+
+    if args.command == "threats":
+        rows = index.threats(args.category, args.min_risk, args.application, args.internet_facing, args.since,
+                             latest_only=not args.all_runs, limit=args.limit)
+        columns = ["application", "created_at", "category", "risk", "scenario"]
+    elif args.command == "trend":
+        rows = index.trend(args.period, args.category, args.application, args.internet_facing, args.high_risk)
+        columns = ["period", "category", "runs", "threats", "mean_risk", "max_risk", "high_risk"]
+    elif args.command == "search":
+        rows = index.search(args.text, args.kind, args.application, limit=args.limit)
+        columns = ["kind", "application", "created_at", "body"]
+    else:
+        rows = index.applications()
+        columns = ["application", "runs", "latest", "internet_facing"]
+
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        _print_rows(rows, columns)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+import functools
+
+import requests
+
+from tracing import span
+from utils import extract_deepseek_reasoning, stage_prompt
+
+# Models that use the reasoning-model request format (max_completion_tokens)
+OPENAI_REASONING_MODELS = ["o1", "o3", "o3-mini", "o4-mini"]
+
+GLM_BASE_URL = "https://open.bigmodel.cn/api/paas/v4/"
+ECLOUD_CHAT_URL = "https://zhenze-huhehaote.cmecloud.cn/v1/chat/completions"
+
+DEFAULT_AZURE_API_VERSION = '2023-12-01-preview'
+
+
+def usage_attributes(usage):
+    """
+    Extract token counts from the usage information of any provider's response.
+
+    Returns:
+        dict: input_tokens, output_tokens and, where reported, cached_input_tokens and cache_hit
+    """
+    if usage is None:
+        return {}
+    get = usage.get if isinstance(usage, dict) else lambda key: getattr(usage, key, None)
+
+    input_tokens = get("prompt_tokens") or get("input_tokens") or get("prompt_token_count") or get("prompt_eval_count")
+    output_tokens = get("completion_tokens") or get("output_tokens") or get("candidates_token_count") or get("eval_count")
+
+    cached_tokens = get("cache_read_input_tokens") or get("cached_content_token_count")
+    details = get("prompt_tokens_details")
+    if not cached_tokens and details is not None:
+        cached_tokens = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", None)
+
+    attributes = {"input_tokens": input_tokens or 0, "output_tokens": output_tokens or 0}
+    if cached_tokens is not None:
+        attributes["cached_input_tokens"] = cached_tokens
+        attributes["cache_hit"] = cached_tokens > 0
+    return attributes
+
+
+def _trace_method(target, attribute, span_name, provider):
+    # Wrap an SDK method so every call records a span with latency and token usage
+    method = getattr(target, attribute)
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with span(span_name, provider=provider, model=kwargs.get("model")) as call_span:
+            response = method(*args, **kwargs)
+            usage = getattr(response, "usage", None) or getattr(response, "usage_metadata", None)
+            call_span.set(**usage_attributes(usage))
+            return response
+
+    setattr(target, attribute, wrapper)
+
+
+# Provider SDKs are imported on first use rather than at module load: a session only uses
+# one provider, and importing every SDK up front dominates the app's cold start time.
+
+def openai_client(**kwargs):
+    """Create an OpenAI client (also used for LM Studio and GLM, which are OpenAI compatible)."""
+    from openai import OpenAI
+    client = OpenAI(**kwargs)
+    provider = "openai-compatible" if kwargs.get("base_url") else "openai"
+    _trace_method(client.chat.completions, "create", "llm.chat.completions.create", provider)
+    return client
+
+
+def azure_openai_client(**kwargs):
+    """Create an Azure OpenAI client."""
+    from openai import AzureOpenAI
+    client = AzureOpenAI(**kwargs)
+    _trace_method(client.chat.completions, "create", "llm.chat.completions.create", "azure")
+    return client
+
+
+def anthropic_client(**kwargs):
+    """Create an Anthropic client."""
+    from anthropic import Anthropic
+    client = Anthropic(**kwargs)
+    _trace_method(client.messages, "create", "llm.messages.create", "anthropic")
+    return client
+
+
+def mistral_client(**kwargs):
+    """Create a Mistral client."""
+    from mistralai import Mistral
+    client = Mistral(**kwargs)
+    _trace_method(client.chat, "complete", "llm.chat.complete", "mistral")
+    return client
+
+
+def groq_client(**kwargs):
+    """Create a Groq client."""
+    from groq import Groq
+    client = Groq(**kwargs)
+    _trace_method(client.chat.completions, "create", "llm.chat.completions.create", "groq")
+    return client
+
+
+def google_client(**kwargs):
+    """Create a Google GenAI client."""
+    from google import genai as google_genai
+    client = google_genai.Client(**kwargs)
+    _trace_method(client.models, "generate_content", "llm.models.generate_content", "google")
+    return client
+
+
+def google_genai_types():
+    """Return the google.genai.types module."""
+    from google.genai import types as google_types
+    return google_types
+
+
+def anthropic_content(prompt, extra=""):
+    """
+    Build the content of an Anthropic user message for a prompt.
+
+    For a CacheablePrompt the shared prefix is sent as its own text block with a cache
+    breakpoint, so later requests that start with the same prefix (another stage on the
+    same application or threat list, see utils.stage_prompt) are served from
+    Anthropic's prompt cache.
+
+    Args:
+        prompt (str): The prompt, optionally a CacheablePrompt
+        extra (str): Text appended after the prompt
+
+    Returns:
+        str or list: The message content
+    """
+    prefix = getattr(prompt, "prefix", "")
+    if not prefix:
+        return prompt + extra
+    blocks = [{"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}}]
+    suffix = prompt.suffix + extra
+    if suffix.strip():
+        blocks.append({"type": "text", "text": suffix})
+    return blocks
+
+
+def _openai_compatible_completion(client, model_name, prompt, system_prompt, json_mode, max_tokens, reasoning=False, extra=None):
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": prompt})
+
+    kwargs = dict(extra or {})
+    if json_mode:
+        kwargs["response_format"] = {"type": "json_object"}
+    if max_tokens:
+        kwargs["max_completion_tokens" if reasoning else "max_tokens"] = max_tokens
+
+    response = client.chat.completions.create(model=model_name, messages=messages, **kwargs)
+    return response.choices[0].message.content
+
+
+def complete(model_provider, model_name, prompt, system_prompt="", credentials=None, json_mode=False, max_tokens=4000):
+    """
+    Send a single prompt to any supported model provider and return the text of the reply.
+
+    This is the provider-agnostic counterpart of the per-stage get_* functions, used by
+    features that need plain completions (component summaries, attack tree expansion, ...).
+
+    Args:
+        model_provider (str): Provider name as shown in the sidebar (e.g. "OpenAI API")
+        model_name (str): Model name, or the deployment name for Azure OpenAI Service
+        prompt (str): The user prompt
+        system_prompt (str): Optional system prompt
+        credentials (dict): Provider credentials; keys used are "api_key",
+            "azure_api_endpoint", "azure_api_version", "ollama_endpoint" and "lm_studio_endpoint"
+        json_mode (bool): Ask the provider for a JSON object response where supported
+        max_tokens (int): Maximum number of tokens to generate
+
+    Returns:
+        str: The text content of the model's response
+
+    Raises:
+        ValueError: If the model provider is not supported
+    """
+    credentials = credentials or {}
+    api_key = credentials.get("api_key", "")
+    system_prompt, prompt = stage_prompt(system_prompt, prompt)
+
+    if model_provider == "OpenAI API":
+        client = openai_client(api_key=api_key)
+        return _openai_compatible_completion(client, model_name, prompt, system_prompt, json_mode, max_tokens,
+                                             reasoning=model_name in OPENAI_REASONING_MODELS)
+
+    if model_provider == "Azure OpenAI Service":
+        client = azure_openai_client(
+            azure_endpoint=credentials.get("azure_api_endpoint", ""),
+            api_key=api_key,
+            api_version=credentials.get("azure_api_version", DEFAULT_AZURE_API_VERSION),
+        )
+        return _openai_compatible_completion(client, model_name, prompt, system_prompt, json_mode, max_tokens)
+
+    if model_provider == "LM Studio Server":
+        client = openai_client(
+            base_url=f"{credentials.get('lm_studio_endpoint', 'http://localhost:1234')}/v1",
+            api_key="not-needed"  # LM Studio Server doesn't require an API key
+        )
+        return _openai_compatible_completion(client, model_name, prompt, system_prompt, False, max_tokens)
+
+    if model_provider == "GLM API":
+        client = openai_client(api_key=api_key, base_url=GLM_BASE_URL)
+        return _openai_compatible_completion(client, model_name, prompt, system_prompt, json_mode, max_tokens)
+
+    if model_provider == "Groq API":
+        client = groq_client(api_key=api_key)
+        content = _openai_compatible_completion(client, model_name, prompt, system_prompt, json_mode, max_tokens)
+        # DeepSeek R1 wraps its reasoning in <think></think> tags
+        _, content = extract_deepseek_reasoning(content)
+        return content
+
+    if model_provider == "Mistral API":
+        client = mistral_client(api_key=api_key)
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        kwargs = {"response_format": {"type": "json_object"}} if json_mode else {}
+        response = client.chat.complete(model=model_name, messages=messages, **kwargs)
+        return response.choices[0].message.content
+
+    if model_provider == "Anthropic API":
+        client = anthropic_client(api_key=api_key)
+        # Thinking mode is selected through the model name; use the underlying model
+        actual_model = "claude-3-7-sonnet-latest" if "thinking" in model_name.lower() else model_name
+        kwargs = {"system": system_prompt} if system_prompt else {}
+        response = client.messages.create(
+            model=actual_model,
+            max_tokens=max_tokens or 4096,
+            messages=[{"role": "user", "content": anthropic_content(prompt)}],
+            timeout=300,  # 5-minute timeout
+            **kwargs
+        )
+        return ''.join(block.text for block in response.content if block.type == "text")
+
+    if model_provider == "Google AI API":
+        google_types = google_genai_types()
+        client = google_client(api_key=api_key)
+        config = google_types.GenerateContentConfig(
+            system_instruction=system_prompt or None,
+            response_mime_type='application/json' if json_mode else None,
+            max_output_tokens=max_tokens,
+        )
+        response = client.models.generate_content(model=model_name, contents=prompt, config=config)
+        return response.text
+
+    if model_provider == "Ollama":
+        endpoint = credentials.get("ollama_endpoint", "http://localhost:11434")
+        if not endpoint.endswith('/'):
+            endpoint = endpoint + '/'
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        data = {"model": model_name, "stream": False, "messages": messages}
+        if json_mode:
+            data["format"] = "json"
+        with span("llm.ollama.chat", provider="ollama", model=model_name) as call_span:
+            response = requests.post(endpoint + "api/chat", json=data, timeout=60)
+            response.raise_for_status()
+            result = response.json()
+            call_span.set(**usage_attributes(result))
+        return result["message"]["content"]
+
+    if model_provider == "eCloud":
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        data = {
+            "model": model_name,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "stream": False,
+            "chat_template_kwargs": {
+                "enable_thinking": False
+            }
+        }
+        headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        with span("llm.ecloud.chat", provider="ecloud", model=model_name) as call_span:
+            response = requests.post(ECLOUD_CHAT_URL, headers=headers, json=data, timeout=60)
+            response.raise_for_status()
+            result = response.json()
+            call_span.set(**usage_attributes(result.get('usage')))
+        return result['choices'][0]['message']['content']
+
+    raise ValueError(f"Unsupported model provider: {model_provider}")
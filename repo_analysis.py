@@ -0,0 +1,663 @@
+import os
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+from tracing import traced
+
+# File extensions considered when selecting repository files for analysis
+CODE_FILE_EXTENSIONS = ('.py', '.js', '.ts', '.html', '.css', '.java', '.go', '.rb', '.c', '.cpp', '.h', '.cs', '.php')
+
+# Infrastructure-as-code and container definitions are small but carry a lot of security signal
+IAC_FILE_EXTENSIONS = ('.tf', '.hcl', '.yaml', '.yml')
+IAC_FILE_NAMES = ('dockerfile', 'docker-compose.yml', 'docker-compose.yaml', 'containerfile')
+
+# Lines longer than this (minified code) are not scanned when summarizing a file
+MAX_SCANNED_LINE_LENGTH = 2000
+
+# Languages that usually hold the application logic
+PRIMARY_LANGUAGE_EXTENSIONS = ('.py', '.js', '.ts', '.java', '.go')
+
+# Path fragments and their weight in the security-relevance score.
+# Positive weights move a file towards the front of the analysis queue.
+PATH_SIGNALS = [
+    # Authentication, authorisation and session handling
+    (re.compile(r'auth|login|logout|session|oauth|openid|saml|sso|jwt|token|passw|permission|rbac|acl|polic|guard|middleware'), 5),
+    # Cryptography and secrets handling
+    (re.compile(r'crypt|cipher|secret|vault|kms|keystore|cert|tls|ssl|hash|signing|credential'), 5),
+    # Routes, handlers and other externally reachable entry points
+    (re.compile(r'route|router|controller|handler|views?\.|endpoint|urls\.py|api/|graphql|resolver|webhook|upload'), 4),
+    # Infrastructure as code, CI and deployment definitions
+    (re.compile(r'dockerfile|docker-compose|containerfile|\.tf$|\.hcl$|terraform|helm|k8s|kubernetes|manifests?/|\.github/workflows|deploy'), 4),
+    # Application entry points and configuration
+    (re.compile(r'(^|/)(main|app|server|index|wsgi|asgi|manage)\.(py|js|ts|go|java)$'), 3),
+    (re.compile(r'(^|/)(settings|config|configuration)\.|\.env\.example$|package\.json$'), 2),
+    # Data access layers are where injection flaws tend to live
+    (re.compile(r'(^|/)(db|database|models?|repository|dao|queries|sql)(/|\.)'), 2),
+]
+
+# Path fragments that indicate a file is unlikely to matter for the threat model
+PATH_PENALTIES = [
+    (re.compile(r'(^|/)(tests?|spec|specs|__tests__|fixtures?|mocks?|examples?|samples?|docs?|benchmarks?)(/|$)|(^|/)test_|_test\.|\.test\.|\.spec\.'), -4),
+    (re.compile(r'(^|/)(vendor|node_modules|third_party|dist|build|\.venv|venv)(/|$)|\.min\.(js|css)$'), -6),
+]
+
+# Patterns matched against already computed file summaries
+SUMMARY_SIGNALS = [
+    # Authentication and cryptography libraries
+    (re.compile(r'\b(jwt|jsonwebtoken|bcrypt|argon2|passlib|hashlib|hmac|cryptography|Crypto|nacl|oauthlib|authlib|passport|flask_login|django\.contrib\.auth|spring\.security|golang\.org/x/crypto|crypto/|ssl|secrets)\b'), 3),
+    # Route and request handler definitions
+    (re.compile(r'@(app|router|bp|blueprint|api)\.(route|get|post|put|patch|delete)|@(Get|Post|Put|Delete|Request)Mapping|\b(app|router)\.(get|post|put|patch|delete|use)\(|HandleFunc\(|APIRouter|Blueprint'), 3),
+    # Secrets and configuration read from the environment
+    (re.compile(r'os\.environ|getenv|process\.env|api_key|apikey|secret_key|password|private_key'), 2),
+    # Dangerous sinks: shell, dynamic evaluation and raw SQL
+    (re.compile(r'\bsubprocess\b|child_process|\beval\(|\bexec\(|Runtime\.getRuntime|\.execute\(|raw_sql|pickle|yaml\.load'), 2),
+]
+
+# Maximum bonus a file can receive from being imported by other files
+MAX_FAN_IN_BONUS = 5
+
+# Files summarised ahead, by path rank, and re-ranked with their summaries before use;
+# the window also stops once its summaries hold RERANK_BUDGET_FACTOR token budgets
+RERANK_WINDOW = 200
+RERANK_BUDGET_FACTOR = 2
+
+
+def _normalise_path(path):
+    return path.replace('\\', '/').lower()
+
+
+def is_candidate_file(path):
+    """
+    Check whether a repository file should be considered for analysis.
+
+    Args:
+        path (str): Repository-relative file path
+
+    Returns:
+        bool: True for source code, IaC and container definition files
+    """
+    lowered = _normalise_path(path)
+    basename = lowered.rsplit('/', 1)[-1]
+    if basename in IAC_FILE_NAMES or basename.startswith('dockerfile'):
+        return True
+    return lowered.endswith(CODE_FILE_EXTENSIONS) or lowered.endswith(IAC_FILE_EXTENSIONS)
+
+
+def score_path(path):
+    """
+    Score a file path by how likely it is to matter for a threat model.
+    Only the path is inspected, so this is free to compute before any content is fetched.
+
+    Args:
+        path (str): Repository-relative file path
+
+    Returns:
+        float: Security-relevance score, higher is more relevant
+    """
+    lowered = _normalise_path(path)
+
+    if lowered.endswith(PRIMARY_LANGUAGE_EXTENSIONS):
+        score = 1.0
+    elif lowered.endswith(CODE_FILE_EXTENSIONS):
+        score = 0.5
+    else:
+        score = 0.0
+
+    for pattern, weight in PATH_SIGNALS:
+        if pattern.search(lowered):
+            score += weight
+    for pattern, weight in PATH_PENALTIES:
+        if pattern.search(lowered):
+            score += weight
+
+    return score
+
+
+def score_summary(summary):
+    """
+    Score a file summary (as produced by summarize_file) by the security signals it contains.
+
+    Args:
+        summary (str): The file summary
+
+    Returns:
+        float: Security-relevance score contributed by the summary
+    """
+    score = 0.0
+    for pattern, weight in SUMMARY_SIGNALS:
+        if pattern.search(summary):
+            score += weight
+    return score
+
+
+def _module_keys(path):
+    """Return the names other files are likely to use when importing this path."""
+    normalised = path.replace('\\', '/')
+    stem = os.path.splitext(normalised)[0]
+    keys = {stem.rsplit('/', 1)[-1], stem.replace('/', '.')}
+    if stem.endswith('/__init__') or stem.endswith('/index'):
+        package = stem.rsplit('/', 1)[0]
+        keys.add(package.rsplit('/', 1)[-1])
+        keys.add(package.replace('/', '.'))
+    keys.discard('__init__')
+    keys.discard('index')
+    return {key.lower() for key in keys if key}
+
+
+_IMPORT_TARGET = re.compile(r'''(?:from\s+([\w./]+)\s+import|import\s+([\w.]+)|require\(\s*['"]([^'"]+)['"]|from\s+['"]([^'"]+)['"]|import\s+['"]([^'"]+)['"])''')
+
+
+def compute_fan_in(summaries):
+    """
+    Count how many other files import each file, using the import lines in the file summaries.
+
+    Args:
+        summaries (dict): Mapping of file path to summary text
+
+    Returns:
+        dict: Mapping of file path to the number of distinct files importing it
+    """
+    index = defaultdict(set)
+    for path in summaries:
+        for key in _module_keys(path):
+            index[key].add(path)
+
+    fan_in = defaultdict(set)
+    for importer, summary in summaries.items():
+        for match in _IMPORT_TARGET.finditer(summary):
+            target = next(group for group in match.groups() if group)
+            target = target.strip('./').replace('/', '.').lower()
+            candidates = index.get(target) or index.get(target.rsplit('.', 1)[-1], ())
+            for path in candidates:
+                if path != importer:
+                    fan_in[path].add(importer)
+
+    return {path: len(importers) for path, importers in fan_in.items()}
+
+
+def rank_files(files, summaries=None, key=None):
+    """
+    Order files by security relevance, most relevant first.
+
+    Files are scored from their path; when summaries are available for some of them,
+    the summary signals and the import-graph fan-in are added. Ties keep shallower
+    paths first, then the original order.
+
+    Args:
+        files (list): File paths, or objects from which key extracts the path
+        summaries (dict, optional): Mapping of file path to summary text
+        key (callable, optional): Function returning the path of a file object
+
+    Returns:
+        list: The files sorted by descending security relevance
+    """
+    get_path = key or (lambda item: item)
+    summaries = summaries or {}
+    fan_in = compute_fan_in(summaries) if summaries else {}
+
+    def sort_key(entry):
+        position, item = entry
+        path = get_path(item)
+        score = score_path(path)
+        summary = summaries.get(path)
+        if summary:
+            score += score_summary(summary)
+        score += min(fan_in.get(path, 0), MAX_FAN_IN_BONUS)
+        return (-score, path.count('/'), position)
+
+    return [item for _, item in sorted(enumerate(files), key=sort_key)]
+
+
+def iter_ranked_summaries(paths, fetch_summary, token_budget=None, count_tokens=None):
+    """
+    Yield file summaries in order of security relevance.
+
+    Summary signals and import fan-in are only known once files are fetched, so the
+    files are ranked by path, a window of the best ranked is summarised and re-ranked
+    with rank_files(summaries=...), and the remaining files follow in path order. The
+    window holds at most RERANK_WINDOW files and stops early once its summaries
+    reach RERANK_BUDGET_FACTOR times the token budget, so small budgets fetch little
+    more than they use.
+
+    Args:
+        paths (list): Candidate file paths
+        fetch_summary (callable): Function taking a path and returning its summary, or
+            None for files that cannot be read, which are skipped
+        token_budget (int, optional): Tokens the caller will spend on summaries
+        count_tokens (callable, optional): Token counter taking a string
+
+    Yields:
+        tuple: (path, summary)
+    """
+    count_tokens = count_tokens or estimate_tokens
+    paths = rank_files(paths)
+    window = {}
+    window_tokens = 0
+    position = 0
+    while position < len(paths) and len(window) < RERANK_WINDOW:
+        if token_budget is not None and window_tokens >= token_budget * RERANK_BUDGET_FACTOR:
+            break
+        path = paths[position]
+        position += 1
+        summary = fetch_summary(path)
+        if summary:
+            window[path] = summary
+            window_tokens += count_tokens(summary)
+
+    for path in rank_files(list(window), summaries=window):
+        yield path, window[path]
+    for path in paths[position:]:
+        summary = fetch_summary(path)
+        if summary:
+            yield path, summary
+
+
+@traced()
+def summarize_file(file_path, content):
+    """
+    Summarize a file's content by extracting key components.
+    Adapts the level of detail based on file size and importance.
+    
+    Args:
+        file_path: Path to the file
+        content: Content of the file
+        
+    Returns:
+        A string summary of the file
+    """
+    # Determine file type
+    file_ext = file_path.split('.')[-1].lower() if '.' in file_path else ''
+    
+    # Initialize summary
+    summary = f"File: {file_path}\n"
+    
+    # For very large files, be more selective
+    is_large_file = len(content) > 10000
+
+    # Minified bundles hold a whole program on a few very long lines, on which the
+    # extraction patterns below backtrack quadratically; leave such lines out
+    scan_content = content
+    if is_large_file:
+        scan_content = "\n".join(line for line in content.split("\n") if len(line) <= MAX_SCANNED_LINE_LENGTH)
+    
+    # Extract imports based on file type
+    imports = []
+    if file_ext in ['py']:
+        imports = re.findall(r'^import .*|^from .* import .*', scan_content, re.MULTILINE)
+    elif file_ext in ['js', 'ts']:
+        imports = re.findall(r'^import .*|^const .* = require\(.*\)|^import .* from .*', scan_content, re.MULTILINE)
+    elif file_ext in ['java']:
+        imports = re.findall(r'^import .*;', scan_content, re.MULTILINE)
+    elif file_ext in ['go']:
+        imports = re.findall(r'^import \(.*?\)|^import ".*"', scan_content, re.MULTILINE | re.DOTALL)
+    
+    # Extract functions based on file type
+    functions = []
+    if file_ext in ['py']:
+        functions = re.findall(r'def .*\(.*\):', scan_content, re.MULTILINE)
+    elif file_ext in ['js', 'ts']:
+        functions = re.findall(r'function .*\(.*\) {|const .* = \(.*\) =>|.*: function\(.*\)', scan_content, re.MULTILINE)
+    elif file_ext in ['java', 'c', 'cpp', 'cs']:
+        functions = re.findall(r'(public|private|protected|static|\s) +[\w\<\>\[\]]+\s+(\w+) *\([^\)]*\) *(\{?|[^;])', scan_content, re.MULTILINE)
+        functions = [' '.join(f).strip() for f in functions]
+    elif file_ext in ['go']:
+        functions = re.findall(r'func .*\(.*\).*{', scan_content, re.MULTILINE)
+    
+    # Extract classes based on file type
+    classes = []
+    if file_ext in ['py']:
+        classes = re.findall(r'class .*:', scan_content, re.MULTILINE)
+    elif file_ext in ['js', 'ts']:
+        classes = re.findall(r'class .* {', scan_content, re.MULTILINE)
+    elif file_ext in ['java', 'c', 'cpp', 'cs']:
+        classes = re.findall(r'(public|private|protected|static|\s) +(class|interface) +(\w+)', scan_content, re.MULTILINE)
+        classes = [' '.join(c).strip() for c in classes]
+    
+    # Add imports to summary (limit based on file size)
+    import_limit = 5 if not is_large_file else 3
+    if imports:
+        summary += "Imports:\n" + "\n".join(imports[:import_limit])
+        if len(imports) > import_limit:
+            summary += f"\n... ({len(imports) - import_limit} more imports)"
+        summary += "\n"
+    
+    # Add classes to summary (limit based on file size)
+    class_limit = 5 if not is_large_file else 3
+    if classes:
+        summary += "Classes:\n" + "\n".join(classes[:class_limit])
+        if len(classes) > class_limit:
+            summary += f"\n... ({len(classes) - class_limit} more classes)"
+        summary += "\n"
+    
+    # Add functions to summary (limit based on file size)
+    function_limit = 10 if not is_large_file else 5
+    if functions:
+        summary += "Functions:\n" + "\n".join(functions[:function_limit])
+        if len(functions) > function_limit:
+            summary += f"\n... ({len(functions) - function_limit} more functions)"
+        summary += "\n"
+    
+    # For configuration and IaC files (JSON, YAML, Terraform, Dockerfiles, etc.), try to extract key information
+    if file_ext in ['json', 'yaml', 'yml', 'toml', 'ini', 'tf', 'hcl'] or 'dockerfile' in file_path.lower():
+        # Just include a snippet of the beginning for config files
+        config_preview = content[:500] + ("..." if len(content) > 500 else "")
+        summary += "Configuration Content Preview:\n" + config_preview + "\n"
+    
+    # For README or documentation files, include a brief excerpt
+    if 'readme' in file_path.lower() or file_ext in ['md', 'rst', 'txt']:
+        doc_preview = content[:300] + ("..." if len(content) > 300 else "")
+        summary += "Content Preview:\n" + doc_preview + "\n"
+    
+    return summary
+
+
+@lru_cache(maxsize=8)
+def _get_encoding(model):
+    # tiktoken is slow to import and only needed once a repository is analysed
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+
+def estimate_tokens(text, model="gpt-4o"):
+    """
+    Estimate the number of tokens in a text string.
+    Uses tiktoken for OpenAI models, or falls back to a character-based approximation.
+    
+    Args:
+        text: The text to estimate tokens for
+        model: The model to use for estimation (default: gpt-4o)
+        
+    Returns:
+        Estimated token count
+    """
+    try:
+        # Try to use tiktoken for accurate estimation
+        enc = _get_encoding(model)
+        return len(enc.encode(text))
+    except (ImportError, KeyError, ValueError):
+        # Fall back to character-based approximation
+        # Different languages have different token densities
+        # English: ~4 chars per token, Chinese: ~1-2 chars per token
+        return len(text) // 4  # Conservative estimate for English text
+
+
+class DescriptionBuilder:
+    """
+    Incrementally assemble a repository system description.
+
+    Chunks are appended to per-section lists instead of being concatenated into one
+    string, and the token count is tracked as chunks are added, so the final size is
+    known without re-encoding the whole description. Sections keep the order in which
+    they were first used.
+    """
+
+    def __init__(self, model="gpt-4o", count_tokens=None):
+        """
+        Args:
+            model (str): Model used for token estimation
+            count_tokens (callable, optional): Custom token counter taking a string
+        """
+        self._count_tokens = count_tokens or (lambda text: estimate_tokens(text, model))
+        self._sections = {}
+        self.token_count = 0
+        self.char_count = 0
+
+    def _account(self, text, tokens=None):
+        self.token_count += self._count_tokens(text) if tokens is None else tokens
+        self.char_count += len(text)
+
+    def append(self, text, section=None, tokens=None):
+        """
+        Append a chunk of text to the description.
+
+        Args:
+            text (str): The text to append
+            section (str, optional): Section title, e.g. "PY Files". Chunks without a
+                section form the preamble.
+            tokens (int, optional): Token count of text if the caller already knows it
+
+        Returns:
+            int: The running token count of the description
+        """
+        chunks = self._sections.get(section)
+        if chunks is None:
+            chunks = self._sections[section] = []
+            if section is not None:
+                # Account for the section header and the blank line closing the section
+                header = f"{section}:\n"
+                chunks.append(header)
+                self._account(header + "\n")
+        chunks.append(text)
+        self._account(text, tokens)
+        return self.token_count
+
+    def iter_sections(self):
+        """
+        Yield the description one section at a time, e.g. to feed a sharding pipeline.
+
+        Yields:
+            str: The text of each section, in order
+        """
+        for section, chunks in self._sections.items():
+            text = "".join(chunks)
+            yield text + "\n" if section is not None else text
+
+    def build(self):
+        """
+        Returns:
+            str: The complete description
+        """
+        return "".join(self.iter_sections())
+
+
+# ------------------ Hierarchical summarization ------------------ #
+
+COMPONENT_SUMMARY_PROMPT = """Summarise the following repository component for a security architect who is building a threat model.
+In 3 to 5 sentences, describe the component's purpose, its entry points, the data it handles, the external systems it talks to and any security-relevant libraries or patterns. Do not speculate beyond the information given.
+
+{digest}"""
+
+# Digests of components keyed by the SHA of their subtree, shared across sessions
+_component_digest_cache = {}
+_COMPONENT_DIGEST_CACHE_SIZE = 1024
+
+
+def component_of(path, depth=2):
+    """
+    Return the component (directory prefix) a file belongs to.
+
+    Args:
+        path (str): Repository-relative file path
+        depth (int): Number of leading directories that make up a component
+
+    Returns:
+        str: The component path, or "." for files at the repository root
+    """
+    parts = path.split('/')[:-1]
+    return '/'.join(parts[:depth]) or '.'
+
+
+def group_by_component(paths, depth=2):
+    """
+    Group file paths by component.
+
+    Args:
+        paths (list): Repository-relative file paths
+        depth (int): Number of leading directories that make up a component
+
+    Returns:
+        dict: Mapping of component path to the list of its file paths
+    """
+    components = defaultdict(list)
+    for path in paths:
+        components[component_of(path, depth)].append(path)
+    return components
+
+
+def _summary_sections(summary):
+    """Split a summarize_file summary into its Imports/Classes/Functions sections."""
+    sections = defaultdict(list)
+    current = None
+    for line in summary.splitlines():
+        if line in ("Imports:", "Classes:", "Functions:"):
+            current = line[:-1]
+        elif line.startswith(("File: ", "Configuration Content Preview:", "Content Preview:")):
+            current = None
+        elif current and line and not line.startswith("... ("):
+            sections[current].append(line.strip())
+    return sections
+
+
+def _import_name(line):
+    match = _IMPORT_TARGET.search(line)
+    if not match:
+        return None
+    target = next(group for group in match.groups() if group)
+    return target.strip('./').split('.')[0].split('/')[0] or None
+
+
+def digest_component(component, paths, summaries, max_key_files=8, max_items=6):
+    """
+    Roll the file summaries of a component up into a compact digest.
+
+    Args:
+        component (str): Component path
+        paths (list): All candidate files in the component, most relevant first
+        summaries (dict): Mapping of file path to summary for the files that were fetched
+        max_key_files (int): Number of file paths to list
+        max_items (int): Number of imports, classes and functions to list
+
+    Returns:
+        str: The component digest
+    """
+    extensions = defaultdict(int)
+    for path in paths:
+        basename = path.rsplit('/', 1)[-1]
+        extensions[basename.rsplit('.', 1)[-1].lower() if '.' in basename else basename.lower()] += 1
+    languages = ', '.join(f"{ext} {count}" for ext, count in sorted(extensions.items(), key=lambda item: -item[1])[:5])
+
+    lines = [f"Component: {component}/ ({len(paths)} files: {languages})"]
+    lines.append("Key files: " + ', '.join(path.rsplit('/', 1)[-1] if component != '.' else path for path in paths[:max_key_files]))
+
+    imports = defaultdict(int)
+    classes = []
+    functions = []
+    for path in paths:
+        summary = summaries.get(path)
+        if not summary:
+            continue
+        sections = _summary_sections(summary)
+        for line in sections["Imports"]:
+            name = _import_name(line)
+            if name:
+                imports[name] += 1
+        classes.extend(sections["Classes"])
+        functions.extend(sections["Functions"])
+
+    if imports:
+        top_imports = sorted(imports.items(), key=lambda item: -item[1])[:max_items * 2]
+        lines.append("Common imports: " + ', '.join(name for name, _ in top_imports))
+    if classes:
+        lines.append("Classes: " + '; '.join(classes[:max_items]))
+    if functions:
+        lines.append("Functions: " + '; '.join(functions[:max_items]))
+
+    return '\n'.join(lines) + '\n'
+
+
+def _cache_digest(key, digest):
+    if len(_component_digest_cache) >= _COMPONENT_DIGEST_CACHE_SIZE:
+        # Drop the oldest entry; dicts keep insertion order
+        _component_digest_cache.pop(next(iter(_component_digest_cache)))
+    _component_digest_cache[key] = digest
+
+
+def build_hierarchical_overview(paths, fetch_summary, token_budget, count_tokens=None, depth=2,
+                                files_per_component=3, tree_shas=None, summarize=None, cache_namespace="",
+                                on_progress=None):
+    """
+    Build a compact architectural overview of a repository from per-component digests.
+
+    Instead of summarising files until the token budget runs out, files are grouped into
+    components (directory prefixes), the most security-relevant files of each component are
+    summarised, and the summaries are rolled up into one digest per component. Components
+    are visited in order of security relevance; those that no longer fit are listed by name.
+
+    Digests can optionally be rewritten by an LLM. LLM digests are cached by the SHA of the
+    component's subtree, so unchanged components are not summarised again.
+
+    Args:
+        paths (list): Candidate file paths
+        fetch_summary (callable): Function taking a path and returning its summary, or None
+        token_budget (int): Maximum number of tokens for the overview
+        count_tokens (callable, optional): Token counter taking a string
+        depth (int): Number of leading directories that make up a component
+        files_per_component (int): Number of files fetched and summarised per component
+        tree_shas (dict, optional): Mapping of directory path to git tree SHA
+        summarize (callable, optional): Function taking a prompt and returning an LLM summary
+        cache_namespace (str): Distinguishes cached LLM digests, e.g. by provider and model
+        on_progress (callable, optional): Called with (index, total, component)
+
+    Returns:
+        tuple: (overview text, number of files summarised)
+    """
+    count_tokens = count_tokens or estimate_tokens
+    tree_shas = tree_shas or {}
+
+    components = group_by_component(paths, depth)
+    ranked = {component: rank_files(files) for component, files in components.items()}
+    order = sorted(ranked, key=lambda component: (-score_path(ranked[component][0]) - min(len(ranked[component]), 1000) / 1000, component))
+
+    overview = DescriptionBuilder(count_tokens=count_tokens)
+    overview.append(f"Repository structure: {len(paths)} files in {len(order)} components.\n\n")
+    summarised_files = 0
+    skipped = []
+
+    for index, component in enumerate(order):
+        if on_progress:
+            on_progress(index, len(order), component)
+
+        files = ranked[component]
+        sha = tree_shas.get(component)
+        cache_key = (cache_namespace, component, sha) if summarize and sha else None
+        digest = _component_digest_cache.get(cache_key) if cache_key else None
+
+        if digest is None:
+            if overview.token_count >= token_budget:
+                skipped.append(component)
+                continue
+            summaries = {}
+            for path in files[:files_per_component]:
+                summary = fetch_summary(path)
+                if summary:
+                    summaries[path] = summary
+            summarised_files += len(summaries)
+            # The summaries add auth, route and fan-in signals to the path ranking
+            files = rank_files(files, summaries=summaries)
+            digest = digest_component(component, files, summaries)
+            if summarize:
+                header = digest.split('\n', 1)[0]
+                digest = f"{header}\n{summarize(COMPONENT_SUMMARY_PROMPT.format(digest=digest)).strip()}\n"
+                if cache_key:
+                    _cache_digest(cache_key, digest)
+
+        tokens = count_tokens(digest)
+        if overview.token_count + tokens > token_budget:
+            skipped.append(component)
+            continue
+        overview.append(digest + "\n", tokens=tokens)
+
+    if skipped:
+        remaining = token_budget - overview.token_count
+        listed = []
+        for component in skipped:
+            entry = f"{component}/ ({len(components[component])} files)"
+            remaining -= count_tokens(entry) + 1
+            if remaining < 0:
+                listed.append(f"... and {len(skipped) - len(listed)} more")
+                break
+            listed.append(entry)
+        overview.append("Other components (not summarised due to token limit): " + ', '.join(listed) + "\n")
+
+    return overview.build(), summarised_files
@@ -0,0 +1,248 @@
+"""
+Synthetic repository generator for ingestion benchmarks.
+
+Generates reproducible repositories of a given size and language mix, including the
+shapes that stress repository analysis: deep directory trees, very large source
+files, minified bundles, binary assets and files that are not analyzed at all. The
+same seed always produces the same repository.
+
+Usage:
+    python synthetic_repo.py fixtures/repo-10k.tar.gz --files 10000 --seed 1
+    python synthetic_repo.py fixtures/repo-100k --files 100000 --mix py=0.3,js=0.3,java=0.2,go=0.1,tf=0.1
+"""
+import argparse
+import gzip
+import io
+import os
+import random
+import sys
+import tarfile
+import time
+
+# Default share of generated source files per language
+DEFAULT_LANGUAGE_MIX = {"py": 0.3, "js": 0.2, "ts": 0.15, "java": 0.15, "go": 0.1, "tf": 0.05, "yaml": 0.05}
+
+# Share of files that are not source code (documentation, assets, lock files)
+DEFAULT_OTHER_SHARE = 0.15
+
+# Directory and file name parts; security-relevant names exercise the ranking
+DIRECTORY_NAMES = ["src", "app", "lib", "internal", "pkg", "services", "api", "handlers", "auth", "crypto",
+                   "models", "db", "utils", "config", "deploy", "web", "core", "common", "plugins", "jobs"]
+FILE_STEMS = ["main", "server", "routes", "views", "login", "session", "token", "user", "payment", "upload",
+              "models", "repository", "client", "helpers", "settings", "middleware", "webhook", "cache", "queue", "report"]
+OTHER_FILES = [("md", "docs"), ("txt", "notes"), ("png", "assets"), ("lock", "deps"), ("csv", "data")]
+
+
+def _identifier(rng):
+    return rng.choice(FILE_STEMS) + "_" + rng.choice(["handler", "service", "value", "item", "record", "request"]) + str(rng.randrange(1000))
+
+
+def _python_source(rng, functions):
+    lines = ["import os", "import json", "from typing import Any", ""]
+    for _ in range(max(1, functions // 8)):
+        lines += [f"class {_identifier(rng).title().replace('_', '')}:", "    pass", ""]
+    for _ in range(functions):
+        name = _identifier(rng)
+        lines += [f"def {name}(request, user=None):", f"    value = request.get('{name}')",
+                  "    if user is None:", "        raise PermissionError('login required')", "    return json.dumps(value)", ""]
+    return "\n".join(lines)
+
+
+def _javascript_source(rng, functions):
+    lines = ["import express from 'express';", "const jwt = require('jsonwebtoken');", ""]
+    for _ in range(functions):
+        name = _identifier(rng)
+        lines += [f"function {name}(req, res) {{", f"  const token = req.headers['{name}'];",
+                  "  if (!token) { return res.status(401).send('unauthorized'); }", "  return res.json(jwt.decode(token));", "}", ""]
+    return "\n".join(lines)
+
+
+def _java_source(rng, functions):
+    name = _identifier(rng).title().replace("_", "")
+    lines = ["import java.util.List;", "import javax.servlet.http.HttpServletRequest;", "", f"public class {name} {{"]
+    for _ in range(functions):
+        lines += [f"    public String {_identifier(rng)}(HttpServletRequest request) {{",
+                  "        return request.getParameter(\"id\");", "    }", ""]
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def _go_source(rng, functions):
+    lines = ["package main", "", 'import "net/http"', ""]
+    for _ in range(functions):
+        lines += [f"func {_identifier(rng)}(w http.ResponseWriter, r *http.Request) {{",
+                  "\tw.Write([]byte(r.URL.Query().Get(\"q\")))", "}", ""]
+    return "\n".join(lines)
+
+
+def _terraform_source(rng, functions):
+    blocks = []
+    for _ in range(functions):
+        blocks.append(f'resource "aws_s3_bucket" "{_identifier(rng)}" {{\n  bucket = "{_identifier(rng)}"\n  acl    = "private"\n}}\n')
+    return "\n".join(blocks)
+
+
+def _yaml_source(rng, functions):
+    lines = ["version: '3'", "services:"]
+    for _ in range(functions):
+        lines += [f"  {_identifier(rng)}:", "    image: nginx:latest", "    ports:", "      - \"8080:80\""]
+    return "\n".join(lines)
+
+
+GENERATORS = {
+    "py": _python_source,
+    "js": _javascript_source,
+    "ts": _javascript_source,
+    "java": _java_source,
+    "go": _go_source,
+    "tf": _terraform_source,
+    "yaml": _yaml_source,
+}
+
+
+def parse_mix(text):
+    """Parse a language mix such as "py=0.5,js=0.5" into a dict of normalised shares."""
+    mix = {}
+    for part in text.split(","):
+        language, _, share = part.partition("=")
+        if language.strip() not in GENERATORS:
+            raise ValueError(f"Unsupported language '{language}'; choose from {', '.join(sorted(GENERATORS))}")
+        mix[language.strip()] = float(share or 1)
+    total = sum(mix.values())
+    return {language: share / total for language, share in mix.items()}
+
+
+def _directory(rng, max_depth):
+    depth = rng.randint(1, max_depth)
+    return "/".join(rng.choice(DIRECTORY_NAMES) for _ in range(depth))
+
+
+def iter_repository(files=1000, language_mix=None, other_share=DEFAULT_OTHER_SHARE, max_depth=6, deep_paths=5,
+                    large_files=3, large_file_bytes=2_000_000, minified_files=3, seed=0):
+    """
+    Generate the files of a synthetic repository.
+
+    Args:
+        files (int): Total number of files
+        language_mix (dict): Share of source files per extension, see DEFAULT_LANGUAGE_MIX
+        other_share (float): Share of non-source files (docs, images, lock files)
+        max_depth (int): Maximum directory depth of ordinary files
+        deep_paths (int): Number of files placed 40+ directories deep
+        large_files (int): Number of source files of about large_file_bytes each
+        large_file_bytes (int): Size of each large file
+        minified_files (int): Number of single-line minified JavaScript bundles
+        seed (int): Random seed; the same arguments always produce the same repository
+
+    Yields:
+        tuple: (path, content bytes), starting with README.md
+    """
+    rng = random.Random(seed)
+    language_mix = language_mix or DEFAULT_LANGUAGE_MIX
+    languages, weights = zip(*language_mix.items())
+    seen = set()
+
+    def unique(path):
+        stem, dot, extension = path.rpartition(".")
+        candidate, counter = path, 1
+        while candidate in seen:
+            candidate = f"{stem}_{counter}{dot}{extension}" if dot else f"{path}_{counter}"
+            counter += 1
+        seen.add(candidate)
+        return candidate
+
+    yield unique("README.md"), f"# Synthetic repository {seed}\n\nGenerated with {files} files for ingestion benchmarks.\n".encode()
+    yield unique("Dockerfile"), b"FROM python:3.12-slim\nCOPY . /app\nRUN pip install -r /app/requirements.txt\nUSER 1000\n"
+    generated = 2
+
+    special = ["large"] * large_files + ["minified"] * minified_files + ["deep"] * deep_paths
+    for kind in special:
+        if generated >= files:
+            return
+        if kind == "large":
+            language = rng.choice(["py", "js", "java"])
+            content = GENERATORS[language](rng, max(1, large_file_bytes // 200))
+            yield unique(f"{_directory(rng, max_depth)}/generated_{rng.choice(FILE_STEMS)}.{language}"), content.encode()
+        elif kind == "minified":
+            functions = ";".join(f"function a{i}(b){{return b+{i}}}" for i in range(20000))
+            yield unique(f"web/static/js/bundle.{rng.randrange(16 ** 8):08x}.min.js"), functions.encode()
+        else:
+            path = "/".join(rng.choice(DIRECTORY_NAMES) for _ in range(40 + rng.randrange(20)))
+            yield unique(f"{path}/{rng.choice(FILE_STEMS)}.py"), _python_source(rng, 3).encode()
+        generated += 1
+
+    while generated < files:
+        if rng.random() < other_share:
+            extension, directory = rng.choice(OTHER_FILES)
+            path = unique(f"{directory}/{_directory(rng, 2)}/{rng.choice(FILE_STEMS)}.{extension}")
+            if extension == "png":
+                content = b"\x89PNG\r\n\x1a\n" + rng.randbytes(rng.randint(200, 4000))
+            else:
+                content = ("\n".join(_identifier(rng) for _ in range(rng.randint(5, 50))) + "\n").encode()
+        else:
+            language = rng.choices(languages, weights)[0]
+            path = unique(f"{_directory(rng, max_depth)}/{rng.choice(FILE_STEMS)}.{language}")
+            content = GENERATORS[language](rng, rng.randint(1, 30)).encode()
+        yield path, content
+        generated += 1
+
+
+def write_repository(output, **options):
+    """
+    Write a synthetic repository to a directory, or to a tarball if output ends in
+    .tar, .tar.gz or .tgz.
+
+    Returns:
+        tuple: (number of files, total bytes)
+    """
+    count = total = 0
+    if output.endswith((".tar", ".tar.gz", ".tgz")):
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        # Fixed timestamps keep the archive byte-identical across runs with the same seed
+        with open(output, "wb") as raw:
+            stream = raw if output.endswith(".tar") else gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+            with stream, tarfile.open(fileobj=stream, mode="w") as archive:
+                for path, content in iter_repository(**options):
+                    info = tarfile.TarInfo(path)
+                    info.size = len(content)
+                    info.mtime = 0
+                    archive.addfile(info, io.BytesIO(content))
+                    count += 1
+                    total += len(content)
+        return count, total
+
+    for path, content in iter_repository(**options):
+        full_path = os.path.join(output, *path.split("/"))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(content)
+        count += 1
+        total += len(content)
+    return count, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic repository for ingestion benchmarks.")
+    parser.add_argument("output", help="Output directory, or a .tar/.tar.gz/.tgz file")
+    parser.add_argument("--files", type=int, default=1000, help="Total number of files")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_LANGUAGE_MIX, help="Language mix, e.g. py=0.5,js=0.3,go=0.2")
+    parser.add_argument("--other-share", type=float, default=DEFAULT_OTHER_SHARE, help="Share of non-source files")
+    parser.add_argument("--max-depth", type=int, default=6, help="Maximum directory depth of ordinary files")
+    parser.add_argument("--deep-paths", type=int, default=5, help="Number of files 40+ directories deep")
+    parser.add_argument("--large-files", type=int, default=3, help="Number of very large source files")
+    parser.add_argument("--large-file-bytes", type=int, default=2_000_000, help="Approximate size of each large file")
+    parser.add_argument("--minified-files", type=int, default=3, help="Number of minified JavaScript bundles")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count, total = write_repository(
+        args.output, files=args.files, language_mix=args.mix, other_share=args.other_share,
+        max_depth=args.max_depth, deep_paths=args.deep_paths, large_files=args.large_files,
+        large_file_bytes=args.large_file_bytes, minified_files=args.minified_files, seed=args.seed,
+    )
+    print(f"Wrote {count} files ({total / 1e6:.1f} MB) to {args.output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,30 +1,31 @@
+import re
 import requests
-from anthropic import Anthropic
-from mistralai import Mistral
-from openai import OpenAI, AzureOpenAI
 import streamlit as st
 
-from google import genai as google_genai
-from groq import Groq
-from zhipuai import ZhipuAI
-from utils import process_groq_response, create_reasoning_system_prompt
+from utils import process_groq_response, create_reasoning_system_prompt, create_threats_context, CacheablePrompt, stage_prompt, stage_messages
+from providers import openai_client, azure_openai_client, anthropic_client, mistral_client, groq_client, google_client, google_genai_types, anthropic_content
+from artefacts import store_artefact
+from tracing import traced
 from i18n import get_prompt_language_suffix
 
 # Function to create a prompt to generate mitigating controls
+@traced()
 def create_test_cases_prompt(threats, language="en"):
     language_suffix = get_prompt_language_suffix(language)
 
-    if language == "zh":
-        prompt = f"""
-作为一名拥有超过20年STRIDE威胁建模方法经验的网络安全专家，您的任务是为威胁模型中识别的威胁提供Gherkin测试用例。您的响应必须根据威胁的详细信息进行调整。
+    # The threat list comes first so it forms a prefix shared with the mitigations and DREAD prompts
+    context = create_threats_context(threats, language)
 
-以下是识别出的威胁列表：
-{threats}
+    if language == "zh":
+        instructions = f"""
+作为一名拥有超过20年STRIDE威胁建模方法经验的网络安全专家，您的任务是为上面列出的威胁提供Gherkin测试用例。您的响应必须根据威胁的详细信息进行调整。
 
 在'Given'步骤中使用威胁描述，使测试用例特定于识别的威胁。
-将Gherkin语法放在三重反引号（```）内，以在Markdown中格式化测试用例。为每个测试用例添加标题。
+将Gherkin语法放在三重反引号（```）内，以在Markdown中格式化测试用例。为每个测试用例添加标题，标题以所测试威胁的ID开头。
 例如：
 
+    ### T-3f9a0c12：有效账户登录
+
     ```gherkin
     Given 一个拥有有效账户的用户
     When 用户登录
@@ -35,18 +36,17 @@ def create_test_cases_prompt(threats, language="en"):
 {language_suffix}
 """
     else:
-        prompt = f"""
+        instructions = f"""
 Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology.
-Your task is to provide Gherkin test cases for the threats identified in a threat model. It is very important that
+Your task is to provide Gherkin test cases for the threats listed above. It is very important that
 your responses are tailored to reflect the details of the threats.
 
-Below is the list of identified threats:
-{threats}
-
 Use the threat descriptions in the 'Given' steps so that the test cases are specific to the threats identified.
-Put the Gherkin syntax inside triple backticks (```) to format the test cases in Markdown. Add a title for each test case.
+Put the Gherkin syntax inside triple backticks (```) to format the test cases in Markdown. Add a title for each test case, starting with the ID of the threat it tests.
 For example:
 
+    ### T-3f9a0c12: Login with a valid account
+
     ```gherkin
     Given a user with a valid account
     When the user logs in
@@ -56,12 +56,47 @@ For example:
 YOUR RESPONSE (do not add introductory text, just provide the Gherkin test cases):
 {language_suffix}
 """
-    return prompt
+    return CacheablePrompt(context, instructions)
+
+
+# A test case title: a Markdown heading or bold line starting with a threat ID, such as
+# "### T-3f9a0c12: Login with a valid account". IDs mentioned in prose do not match
+TEST_CASE_TITLE_RE = re.compile(r"^\s*(?:#{1,6}\s+(?:\*\*|__)?|\*\*|__)\s*(T-[0-9a-f]{8})\b")
+
+
+def split_test_cases(test_cases, threat_ids):
+    """
+    Split test cases into the Markdown of every threat, so test cases can be reused
+    when the threat model changes. A test case belongs to the threat whose ID its
+    title (a heading or bold line) starts with; text up to the next such title stays
+    with it, including mentions of other threat IDs.
+
+    Args:
+        test_cases (str): Test cases in Markdown
+        threat_ids (list): IDs of the threats the test cases were requested for
+
+    Returns:
+        list: The Markdown of every threat in threat_ids, or None where no test case
+        names the threat
+    """
+    sections = {key: [] for key in threat_ids}
+    current, in_code = None, False
+    for line in (test_cases or "").splitlines():
+        if line.strip().startswith("```"):
+            in_code = not in_code
+        elif not in_code:
+            match = TEST_CASE_TITLE_RE.match(line)
+            if match and match.group(1) in sections:
+                current = match.group(1)
+        if current is not None:
+            sections[current].append(line)
+    return ["\n".join(sections[key]).strip() or None for key in threat_ids]
 
 
 # Function to get test cases from the GPT response.
+@traced()
 def get_test_cases(api_key, model_name, prompt, language="en"):
-    client = OpenAI(api_key=api_key)
+    client = openai_client(api_key=api_key)
 
     # For reasoning models (o1, o3, o3-mini, o4-mini), use a structured system prompt
     if model_name in ["o1", "o3", "o3-mini", "o4-mini"]:
@@ -89,10 +124,7 @@ def get_test_cases(api_key, model_name, prompt, language="en"):
         # Create completion with max_completion_tokens for reasoning models
         response = client.chat.completions.create(
             model = model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages(system_prompt, prompt),
             max_completion_tokens=4000
         )
     else:
@@ -100,10 +132,7 @@ def get_test_cases(api_key, model_name, prompt, language="en"):
         # Create completion with max_tokens for other models
         response = client.chat.completions.create(
             model = model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages(system_prompt, prompt),
             max_tokens=4000
         )
 
@@ -113,8 +142,9 @@ def get_test_cases(api_key, model_name, prompt, language="en"):
     return test_cases
 
 # Function to get mitigations from the Azure OpenAI response.
+@traced()
 def get_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt, language="en"):
-    client = AzureOpenAI(
+    client = azure_openai_client(
         azure_endpoint = azure_api_endpoint,
         api_key = azure_api_key,
         api_version = azure_api_version,
@@ -122,10 +152,7 @@ def get_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, a
 
     response = client.chat.completions.create(
         model = azure_deployment_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant that provides Gherkin test cases in Markdown format.", prompt)
     )
 
     # Access the content directly as the response will be in text format
@@ -134,33 +161,34 @@ def get_test_cases_azure(azure_api_endpoint, azure_api_key, azure_api_version, a
     return test_cases
 
 # Function to get test cases from the Google model's response.
+@traced()
 def get_test_cases_google(google_api_key, google_model, prompt, language="en"):
-    client = google_genai.Client(api_key=google_api_key)
+    client = google_client(api_key=google_api_key)
+    google_types = google_genai_types()
     
     safety_settings = [
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_HARASSMENT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         )
     ]
     
-    system_instruction = "You are a helpful assistant that provides Gherkin test cases in Markdown format."
+    system_instruction, prompt = stage_prompt("You are a helpful assistant that provides Gherkin test cases in Markdown format.", prompt)
     is_gemini_2_5 = "gemini-2.5" in google_model.lower()
     
     try:
-        from google.genai import types as google_types
         if is_gemini_2_5:
             config = google_types.GenerateContentConfig(
                 system_instruction=system_instruction,
@@ -187,7 +215,7 @@ def get_test_cases_google(google_api_key, google_model, prompt, language="en"):
                         thinking_content.append(str(part.thought))
         if thinking_content:
             joined_thinking = "\n\n".join(thinking_content)
-            st.session_state['last_thinking_content'] = joined_thinking
+            store_artefact('last_thinking_content', joined_thinking)
     except Exception as e:
         st.error(f"Error generating test cases with Google AI: {str(e)}")
         return f"""
@@ -202,15 +230,13 @@ Please try again or select a different model provider.
     return test_cases
 
 # Function to get test cases from the Mistral model's response.
+@traced()
 def get_test_cases_mistral(mistral_api_key, mistral_model, prompt, language="en"):
-    client = Mistral(api_key=mistral_api_key)
+    client = mistral_client(api_key=mistral_api_key)
 
     response = client.chat.complete(
         model = mistral_model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant that provides Gherkin test cases in Markdown format.", prompt)
     )
 
     # Access the content directly as the response will be in text format
@@ -219,6 +245,7 @@ def get_test_cases_mistral(mistral_api_key, mistral_model, prompt, language="en"
     return test_cases
 
 # Function to get test cases from Ollama hosted LLM.
+@traced()
 def get_test_cases_ollama(ollama_endpoint, ollama_model, prompt, language="en"):
     """
     Get test cases from Ollama hosted LLM.
@@ -243,23 +270,14 @@ def get_test_cases_ollama(ollama_endpoint, ollama_model, prompt, language="en"):
     data = {
         "model": ollama_model,
         "stream": False,
-        "messages": [
-            {
-                "role": "system", 
-                "content": """You are a cyber security expert with more than 20 years experience of security testing applications. Your task is to analyze the provided application description and suggest appropriate security test cases.
+        "messages": stage_messages("""You are a cyber security expert with more than 20 years experience of security testing applications. Your task is to analyze the provided application description and suggest appropriate security test cases.
 
 Please provide your response in markdown format with appropriate headings and bullet points. For each test case, include:
 - Test objective
 - Prerequisites
 - Test steps
 - Expected results
-- Pass/fail criteria"""
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ]
+- Pass/fail criteria""", prompt)
     }
 
     try:
@@ -281,14 +299,17 @@ Please provide your response in markdown format with appropriate headings and bu
         raise
 
 # Function to get test cases from the Anthropic model's response.
+@traced()
 def get_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt, language="en"):
-    client = Anthropic(api_key=anthropic_api_key)
+    client = anthropic_client(api_key=anthropic_api_key)
     
     # Check if we're using extended thinking mode
     is_thinking_mode = "thinking" in anthropic_model.lower()
     
     # If using thinking mode, use the actual model name without the "thinking" suffix
     actual_model = "claude-3-7-sonnet-latest" if is_thinking_mode else anthropic_model
+
+    system_prompt, prompt = stage_prompt("You are a helpful assistant that provides Gherkin test cases in Markdown format.", prompt)
     
     try:
         # Configure the request based on whether thinking mode is enabled
@@ -300,9 +321,9 @@ def get_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt, languag
                     "type": "enabled",
                     "budget_tokens": 16000
                 },
-                system="You are a helpful assistant that provides Gherkin test cases in Markdown format.",
+                system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=600  # 10-minute timeout
             )
@@ -310,9 +331,9 @@ def get_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt, languag
             response = client.messages.create(
                 model=actual_model,
                 max_tokens=4096,
-                system="You are a helpful assistant that provides Gherkin test cases in Markdown format.",
+                system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=300  # 5-minute timeout
             )
@@ -325,7 +346,7 @@ def get_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt, languag
             # Store thinking content in session state for debugging/transparency (optional)
             thinking_content = ''.join(block.thinking for block in response.content if block.type == "thinking")
             if thinking_content:
-                st.session_state['last_thinking_content'] = thinking_content
+                store_artefact('last_thinking_content', thinking_content)
         else:
             # Standard handling for regular responses
             test_cases = response.content[0].text
@@ -350,18 +371,16 @@ def get_test_cases_anthropic(anthropic_api_key, anthropic_model, prompt, languag
         return fallback_test_cases
 
 # Function to get test cases from LM Studio Server response.
+@traced()
 def get_test_cases_lm_studio(lm_studio_endpoint, model_name, prompt, language="en"):
-    client = OpenAI(
+    client = openai_client(
         base_url=f"{lm_studio_endpoint}/v1",
         api_key="not-needed"  # LM Studio Server doesn't require an API key
     )
 
     response = client.chat.completions.create(
         model=model_name,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant that provides Gherkin test cases in Markdown format.", prompt)
     )
 
     # Access the content directly as the response will be in text format
@@ -370,14 +389,12 @@ def get_test_cases_lm_studio(lm_studio_endpoint, model_name, prompt, language="e
     return test_cases
 
 # Function to get test cases from the Groq model's response.
+@traced()
 def get_test_cases_groq(groq_api_key, groq_model, prompt, language="en"):
-    client = Groq(api_key=groq_api_key)
+    client = groq_client(api_key=groq_api_key)
     response = client.chat.completions.create(
         model=groq_model,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant that provides Gherkin test cases in Markdown format."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant that provides Gherkin test cases in Markdown format.", prompt)
     )
 
     # Process the response using our utility function
@@ -395,6 +412,7 @@ def get_test_cases_groq(groq_api_key, groq_model, prompt, language="en"):
     return test_cases
 
 # Function to get test cases from GLM response
+@traced()
 def get_test_cases_glm(glm_api_key, glm_model, prompt, language="en"):
     """
     Get test cases from GLM (Zhipu AI) response.
@@ -407,7 +425,7 @@ def get_test_cases_glm(glm_api_key, glm_model, prompt, language="en"):
     Returns:
         str: Markdown formatted test cases
     """
-    client = OpenAI(
+    client = openai_client(
     api_key= glm_api_key,
     base_url="https://open.bigmodel.cn/api/paas/v4/"
     )
@@ -415,10 +433,7 @@ def get_test_cases_glm(glm_api_key, glm_model, prompt, language="en"):
     try:
         response = client.chat.completions.create(
             model=glm_model,
-            messages=[
-                {"role": "system", "content": "You are a cybersecurity expert with extensive experience in security testing and threat modeling. Generate detailed Gherkin test cases for security testing."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages("You are a cybersecurity expert with extensive experience in security testing and threat modeling. Generate detailed Gherkin test cases for security testing.", prompt),
             temperature=0.7,
             max_tokens=4000
         )
@@ -430,6 +445,7 @@ def get_test_cases_glm(glm_api_key, glm_model, prompt, language="en"):
         return "Error generating test cases. Please check your API key and try again."
 
 # Function to get test cases from eCloud response
+@traced()
 def get_test_cases_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
     """
     Get test cases from eCloud response.
@@ -453,10 +469,7 @@ def get_test_cases_ecloud(ecloud_api_key, ecloud_model, prompt, language="en"):
 
     data = {
         "model": ecloud_model,
-        "messages": [
-            {"role": "system", "content": "You are a cybersecurity expert with extensive experience in security testing and threat modeling. Generate detailed Gherkin test cases for security testing."},
-            {"role": "user", "content": prompt}
-        ],
+        "messages": stage_messages("You are a cybersecurity expert with extensive experience in security testing and threat modeling. Generate detailed Gherkin test cases for security testing.", prompt),
         "temperature": 0.7,
         "max_tokens": 4000,
         "stream": False,
@@ -1,34 +1,28 @@
 import json
 import requests
 import base64
-from anthropic import Anthropic
-from mistralai import Mistral, UserMessage
-from openai import OpenAI, AzureOpenAI
 import streamlit as st
 import re
 
-from google import genai as google_genai
-from groq import Groq
-from zhipuai import ZhipuAI
-from utils import process_groq_response, create_reasoning_system_prompt
+from utils import process_groq_response, create_reasoning_system_prompt, create_application_context, CacheablePrompt, stage_prompt, stage_messages
+from providers import complete, openai_client, azure_openai_client, anthropic_client, mistral_client, groq_client, google_client, google_genai_types, anthropic_content
+from artefacts import store_artefact
+from threat_record import ThreatRecord, normalize_threat_model
+from tracing import traced
 from i18n import get_prompt_language_suffix, get_text
 
 # Function to convert JSON to Markdown for display.
+@traced()
 def json_to_markdown(threat_model, improvement_suggestions, language="en"):
     markdown_output = "## Threat Model\n\n"
 
     # Start the markdown table with headers
-    markdown_output += "| Threat Type | Scenario | Potential Impact |\n"
-    markdown_output += "|-------------|----------|------------------|\n"
+    markdown_output += "| ID | Threat Type | Scenario | Potential Impact |\n"
+    markdown_output += "|----|-------------|----------|------------------|\n"
 
     # Fill the table rows with the threat model data
-    for threat in threat_model:
-        # Handle different field name variations that models might return
-        threat_type = threat.get('Threat Type') or threat.get('threat_type') or threat.get('threatType') or threat.get('type') or 'Unknown'
-        scenario = threat.get('Scenario') or threat.get('scenario') or threat.get('description') or 'Unknown scenario'
-        potential_impact = threat.get('Potential Impact') or threat.get('potential_impact') or threat.get('impact') or threat.get('effect') or 'Unknown impact'
-
-        markdown_output += f"| {threat_type} | {scenario} | {potential_impact} |\n"
+    for threat in normalize_threat_model(threat_model):
+        markdown_output += f"| {threat.id} | {threat.threat_type} | {threat.scenario} | {threat.potential_impact} |\n"
 
     markdown_output += "\n\n## " + get_text("improvement_suggestions", language) + "\n\n"
     for suggestion in improvement_suggestions:
@@ -37,12 +31,16 @@ def json_to_markdown(threat_model, improvement_suggestions, language="en"):
     return markdown_output
 
 # Function to create a prompt for generating a threat model
+@traced()
 def create_threat_model_prompt(app_type, authentication, internet_facing, sensitive_data, app_input, language="en"):
     language_suffix = get_prompt_language_suffix(language)
 
+    # The application details come first so they form a prefix shared with the attack tree prompt
+    context = create_application_context(app_type, authentication, internet_facing, sensitive_data, app_input, language)
+
     if language == "zh":
-        prompt = f"""
-作为一名拥有超过20年STRIDE威胁建模方法经验的网络安全专家，您的任务是为各种应用程序生成全面的威胁模型。请分析提供的代码摘要、README内容和应用程序描述，为该应用程序生成具体的威胁列表。
+        instructions = f"""
+作为一名拥有超过20年STRIDE威胁建模方法经验的网络安全专家，您的任务是为各种应用程序生成全面的威胁模型。请分析上面提供的代码摘要、README内容和应用程序描述，为该应用程序生成具体的威胁列表。
 
 请特别注意README内容，因为它通常提供有关项目目的、架构和潜在安全考虑的宝贵上下文。
 
@@ -60,13 +58,6 @@ def create_threat_model_prompt(app_type, authentication, internet_facing, sensit
 
 不要提供一般的安全建议 - 专注于什么额外信息有助于创建更好的威胁模型。
 
-应用程序类型：{app_type}
-身份验证方法：{authentication}
-面向互联网：{internet_facing}
-敏感数据：{sensitive_data}
-代码摘要、README内容和应用程序描述：
-{app_input}
-
 预期JSON响应格式示例：
 
     {{
@@ -92,8 +83,8 @@ def create_threat_model_prompt(app_type, authentication, internet_facing, sensit
 {language_suffix}
 """
     else:
-        prompt = f"""
-Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to analyze the provided code summary, README content, and application description to produce a list of specific threats for the application.
+        instructions = f"""
+Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology to produce comprehensive threat models for a wide range of applications. Your task is to analyze the code summary, README content, and application description provided above to produce a list of specific threats for the application.
 
 Pay special attention to the README content as it often provides valuable context about the project's purpose, architecture, and potential security considerations.
 
@@ -111,13 +102,6 @@ Under "improvement_suggestions", include an array of strings that suggest what a
 
 Do not provide general security recommendations - focus only on what additional information would help create a better threat model.
 
-APPLICATION TYPE: {app_type}
-AUTHENTICATION METHODS: {authentication}
-INTERNET FACING: {internet_facing}
-SENSITIVE DATA: {sensitive_data}
-CODE SUMMARY, README CONTENT, AND APPLICATION DESCRIPTION:
-{app_input}
-
 Example of expected JSON response format:
 
     {{
@@ -141,9 +125,215 @@ Example of expected JSON response format:
       ]
     }}
 {language_suffix}
+"""
+    return CacheablePrompt(context, instructions)
+
+# Function to create a prompt for updating an existing threat model from repository changes
+@traced()
+def create_incremental_threat_model_prompt(app_type, authentication, internet_facing, sensitive_data, previous_threat_model, change_summary, language="en"):
+    language_suffix = get_prompt_language_suffix(language)
+
+    # Number the existing threats so the model can refer to them in its response
+    existing_threats = json.dumps(
+        [
+            {
+                "index": index,
+                "Threat Type": threat.threat_type,
+                "Scenario": threat.scenario,
+                "Potential Impact": threat.potential_impact,
+            }
+            for index, threat in enumerate(normalize_threat_model(previous_threat_model), 1)
+        ],
+        ensure_ascii=False,
+        indent=2,
+    )
+
+    if language == "zh":
+        prompt = f"""
+作为一名拥有超过20年STRIDE威胁建模方法经验的网络安全专家。某个应用程序已经生成了威胁模型，此后该应用程序的代码发生了变化。您的任务是更新现有的威胁模型，仅反映这些变化。
+
+请审查下面的代码变更，并针对每项变更判断它是否：
+- 引入了新的威胁（添加该威胁），
+- 改变了现有威胁的场景或影响（修改该威胁，并通过其序号引用它），或
+- 消除了现有威胁的成立条件（撤销该威胁，并通过其序号引用它）。
+
+不受变更影响的威胁保持不变，不要在响应中重复它们。如果变更不影响威胁模型，请返回空列表。
+
+提供更新时，使用JSON格式的响应，键为"added"、"modified"、"retired"和"improvement_suggestions"：
+- "added"：对象数组，键为"Threat Type"、"Scenario"和"Potential Impact"。
+- "modified"：对象数组，键为"index"、"Threat Type"、"Scenario"和"Potential Impact"。
+- "retired"：不再适用的威胁的序号数组。
+- "improvement_suggestions"：字符串数组，建议提供哪些有关变更的额外信息可以使威胁模型更加准确。
+
+应用程序类型：{app_type}
+身份验证方法：{authentication}
+面向互联网：{internet_facing}
+敏感数据：{sensitive_data}
+
+现有威胁模型：
+{existing_threats}
+
+代码变更：
+{change_summary}
+
+预期JSON响应格式示例：
+
+    {{
+      "added": [
+        {{
+          "Threat Type": "篡改",
+          "Scenario": "示例场景",
+          "Potential Impact": "示例潜在影响"
+        }}
+      ],
+      "modified": [
+        {{
+          "index": 3,
+          "Threat Type": "欺骗",
+          "Scenario": "更新后的场景",
+          "Potential Impact": "更新后的潜在影响"
+        }}
+      ],
+      "retired": [5],
+      "improvement_suggestions": []
+    }}
+{language_suffix}
+"""
+    else:
+        prompt = f"""
+Act as a cyber security expert with more than 20 years experience of using the STRIDE threat modelling methodology. An existing threat model was produced for an application. The application's code has since changed. Your task is to update the existing threat model to reflect the changes only.
+
+Review the code changes below and decide, for each change, whether it:
+- introduces a new threat (add it),
+- changes the scenario or impact of an existing threat (modify it, referring to it by its index), or
+- removes the conditions for an existing threat (retire it, referring to it by its index).
+
+Leave threats that are not affected by the changes untouched and do not repeat them in your response. If the changes do not affect the threat model, return empty lists.
+
+When providing the update, use a JSON formatted response with the keys "added", "modified", "retired" and "improvement_suggestions":
+- "added": an array of objects with the keys "Threat Type", "Scenario" and "Potential Impact".
+- "modified": an array of objects with the keys "index", "Threat Type", "Scenario" and "Potential Impact".
+- "retired": an array of the indexes of threats that no longer apply.
+- "improvement_suggestions": an array of strings suggesting what additional information about the changes would make the threat model more accurate.
+
+APPLICATION TYPE: {app_type}
+AUTHENTICATION METHODS: {authentication}
+INTERNET FACING: {internet_facing}
+SENSITIVE DATA: {sensitive_data}
+
+EXISTING THREAT MODEL:
+{existing_threats}
+
+CODE CHANGES:
+{change_summary}
+
+Example of expected JSON response format:
+
+    {{
+      "added": [
+        {{
+          "Threat Type": "Tampering",
+          "Scenario": "Example Scenario",
+          "Potential Impact": "Example Potential Impact"
+        }}
+      ],
+      "modified": [
+        {{
+          "index": 3,
+          "Threat Type": "Spoofing",
+          "Scenario": "Updated Scenario",
+          "Potential Impact": "Updated Potential Impact"
+        }}
+      ],
+      "retired": [5],
+      "improvement_suggestions": []
+    }}
+{language_suffix}
 """
     return prompt
 
+def apply_threat_model_update(previous_threat_model, update):
+    """
+    Apply an incremental update produced from create_incremental_threat_model_prompt.
+
+    Args:
+        previous_threat_model (list): The existing list of threats
+        update (dict): The parsed model response with "added", "modified" and "retired" keys
+
+    Returns:
+        tuple: (updated threat model as canonical threat dicts, summary dict with the number of added, modified and retired threats)
+    """
+    def to_index(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+    retired = {to_index(index) for index in update.get("retired", [])}
+    modified = {}
+    for threat in update.get("modified", []):
+        if isinstance(threat, dict) and to_index(threat.get("index")) is not None:
+            modified[to_index(threat.get("index"))] = threat
+
+    threat_model = []
+    applied = {"added": 0, "modified": 0, "retired": 0}
+    for index, threat in enumerate(normalize_threat_model(previous_threat_model), 1):
+        if index in retired:
+            applied["retired"] += 1
+            continue
+        if index in modified:
+            # Fields the update leaves out keep their previous value; the ID follows the new type and scenario
+            threat = ThreatRecord.from_dict({
+                "Threat Type": modified[index].get("Threat Type") or threat.threat_type,
+                "Scenario": modified[index].get("Scenario") or threat.scenario,
+                "Potential Impact": modified[index].get("Potential Impact") or threat.potential_impact,
+            })
+            applied["modified"] += 1
+        threat_model.append(threat.to_dict())
+
+    for threat in update.get("added", []):
+        if isinstance(threat, dict):
+            threat_model.append(ThreatRecord.from_dict(threat).to_dict())
+            applied["added"] += 1
+
+    return threat_model, applied
+
+# Function to get an incremental threat model update from any supported model provider.
+@traced()
+def get_threat_model_update(model_provider, model_name, prompt, credentials=None):
+    """
+    Request an incremental threat model update and parse the JSON response.
+
+    Args:
+        model_provider (str): Provider name as shown in the sidebar
+        model_name (str): Model name, or the deployment name for Azure OpenAI Service
+        prompt (str): Prompt created with create_incremental_threat_model_prompt
+        credentials (dict): Provider credentials, see providers.complete
+
+    Returns:
+        dict: The update with "added", "modified", "retired" and "improvement_suggestions" keys
+    """
+    content = complete(
+        model_provider,
+        model_name,
+        prompt,
+        system_prompt="You are a helpful assistant designed to output JSON.",
+        credentials=credentials,
+        json_mode=True,
+    )
+
+    # Some models wrap the JSON in a markdown code block despite the instructions
+    content = re.sub(r'^```(?:json)?\s*|\s*```$', '', content.strip())
+    update = json.loads(content)
+
+    return {
+        "added": update.get("added", []),
+        "modified": update.get("modified", []),
+        "retired": update.get("retired", []),
+        "improvement_suggestions": update.get("improvement_suggestions", []),
+    }
+
+@traced()
 def create_image_analysis_prompt():
     prompt = """
     You are a Senior Solution Architect tasked with explaining the following architecture diagram to 
@@ -168,8 +358,9 @@ def create_image_analysis_prompt():
     return prompt
 
 # Function to get analyse uploaded architecture diagrams.
+@traced()
 def get_image_analysis(api_key, model_name, prompt, base64_image):
-    client = OpenAI(api_key=api_key)
+    client = openai_client(api_key=api_key)
 
     messages = [
         {
@@ -235,8 +426,9 @@ def get_image_analysis(api_key, model_name, prompt, base64_image):
             return None
 
 # Function to get image analysis using Azure OpenAI
+@traced()
 def get_image_analysis_azure(api_endpoint, api_key, api_version, deployment_name, prompt, base64_image):
-    client = AzureOpenAI(
+    client = azure_openai_client(
         azure_endpoint=api_endpoint,
         api_key=api_key,
         api_version=api_version,
@@ -264,9 +456,10 @@ def get_image_analysis_azure(api_endpoint, api_key, api_version, deployment_name
 
 
 # Function to get image analysis using Google Gemini models
+@traced()
 def get_image_analysis_google(api_key, model_name, prompt, base64_image):
-    client = google_genai.Client(api_key=api_key)
-    from google.genai import types as google_types
+    client = google_client(api_key=api_key)
+    google_types = google_genai_types()
 
     blob = google_types.Blob(data=base64.b64decode(base64_image), mime_type="image/jpeg")
     content = [
@@ -283,8 +476,9 @@ def get_image_analysis_google(api_key, model_name, prompt, base64_image):
 
 
 # Function to get image analysis using Anthropic Claude models
+@traced()
 def get_image_analysis_anthropic(api_key, model_name, prompt, base64_image, media_type="image/jpeg"):
-    client = Anthropic(api_key=api_key)
+    client = anthropic_client(api_key=api_key)
     response = client.messages.create(
         model=model_name,
         max_tokens=4000,
@@ -311,8 +505,9 @@ def get_image_analysis_anthropic(api_key, model_name, prompt, base64_image, medi
 
 
 # Function to get threat model from the GPT response.
+@traced()
 def get_threat_model(api_key, model_name, prompt):
-    client = OpenAI(api_key=api_key)
+    client = openai_client(api_key=api_key)
 
     # For reasoning models (o1, o3, o3-mini, o4-mini), use a structured system prompt
     if model_name in ["o1", "o3", "o3-mini", "o4-mini"]:
@@ -336,10 +531,7 @@ def get_threat_model(api_key, model_name, prompt):
         response = client.chat.completions.create(
             model=model_name,
             response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages(system_prompt, prompt),
             max_completion_tokens=4000
         )
     else:
@@ -348,10 +540,7 @@ def get_threat_model(api_key, model_name, prompt):
         response = client.chat.completions.create(
             model=model_name,
             response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages(system_prompt, prompt),
             max_tokens=4000
         )
 
@@ -362,8 +551,9 @@ def get_threat_model(api_key, model_name, prompt):
 
 
 # Function to get threat model from the Azure OpenAI response.
+@traced()
 def get_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version, azure_deployment_name, prompt):
-    client = AzureOpenAI(
+    client = azure_openai_client(
         azure_endpoint = azure_api_endpoint,
         api_key = azure_api_key,
         api_version = azure_api_version,
@@ -372,10 +562,7 @@ def get_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version,
     response = client.chat.completions.create(
         model = azure_deployment_name,
         response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant designed to output JSON.", prompt)
     )
 
     # Convert the JSON string in the 'content' field to a Python dictionary
@@ -385,27 +572,29 @@ def get_threat_model_azure(azure_api_endpoint, azure_api_key, azure_api_version,
 
 
 # Function to get threat model from the Google response.
+@traced()
 def get_threat_model_google(google_api_key, google_model, prompt):
     # Create a client with the Google API key
-    client = google_genai.Client(api_key=google_api_key)
+    client = google_client(api_key=google_api_key)
+    google_types = google_genai_types()
     
     # Set up safety settings to allow security content
     safety_settings = [
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_HATE_SPEECH,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_HARASSMENT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_HARASSMENT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         ),
-        google_genai.types.SafetySetting(
-            category=google_genai.types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
-            threshold=google_genai.types.HarmBlockThreshold.BLOCK_NONE
+        google_types.SafetySetting(
+            category=google_types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT,
+            threshold=google_types.HarmBlockThreshold.BLOCK_NONE
         )
     ]
     
@@ -413,7 +602,6 @@ def get_threat_model_google(google_api_key, google_model, prompt):
     is_gemini_2_5 = "gemini-2.5" in google_model.lower()
     
     try:
-        from google.genai import types as google_types
         if is_gemini_2_5:
             config = google_types.GenerateContentConfig(
                 response_mime_type='application/json',
@@ -443,7 +631,7 @@ def get_threat_model_google(google_api_key, google_model, prompt):
                         thinking_content.append(str(part.thought))
         if thinking_content:
             joined_thinking = "\n\n".join(thinking_content)
-            st.session_state['last_thinking_content'] = joined_thinking
+            store_artefact('last_thinking_content', joined_thinking)
         
     except Exception as e:
         st.error(f"Error generating content with Google AI: {str(e)}")
@@ -459,14 +647,15 @@ def get_threat_model_google(google_api_key, google_model, prompt):
     return response_content
 
 # Function to get threat model from the Mistral response.
+@traced()
 def get_threat_model_mistral(mistral_api_key, mistral_model, prompt):
-    client = Mistral(api_key=mistral_api_key)
+    client = mistral_client(api_key=mistral_api_key)
 
     response = client.chat.complete(
         model = mistral_model,
         response_format={"type": "json_object"},
         messages=[
-            UserMessage(content=prompt)
+            {"role": "user", "content": prompt}
         ]
     )
 
@@ -476,6 +665,7 @@ def get_threat_model_mistral(mistral_api_key, mistral_model, prompt):
     return response_content
 
 # Function to get threat model from Ollama hosted LLM.
+@traced()
 def get_threat_model_ollama(ollama_endpoint, ollama_model, prompt):
     """
     Get threat model from Ollama hosted LLM.
@@ -497,7 +687,7 @@ def get_threat_model_ollama(ollama_endpoint, ollama_model, prompt):
     
     url = ollama_endpoint + "api/generate"
 
-    system_prompt = "You are a helpful assistant designed to output JSON."
+    system_prompt, prompt = stage_prompt("You are a helpful assistant designed to output JSON.", prompt)
     full_prompt = f"{system_prompt}\n\n{prompt}"
 
     data = {
@@ -525,8 +715,9 @@ def get_threat_model_ollama(ollama_endpoint, ollama_model, prompt):
         raise
 
 # Function to get threat model from the Claude response.
+@traced()
 def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
-    client = Anthropic(api_key=anthropic_api_key)
+    client = anthropic_client(api_key=anthropic_api_key)
     
     # Check if we're using Claude 3.7
     is_claude_3_7 = "claude-3-7" in anthropic_model.lower()
@@ -541,7 +732,8 @@ def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
         # For Claude 3.7, use a more explicit prompt structure
         if is_claude_3_7:
             # Add explicit JSON formatting instructions to the prompt
-            json_prompt = prompt + "\n\nIMPORTANT: Your response MUST be a valid JSON object with the exact structure shown in the example above. Do not include any explanatory text, markdown formatting, or code blocks. Return only the raw JSON object."
+            system_prompt, prompt = stage_prompt("You are a JSON-generating assistant. You must ONLY output valid, parseable JSON with no additional text or formatting.", prompt)
+            json_prompt = anthropic_content(prompt, "\n\nIMPORTANT: Your response MUST be a valid JSON object with the exact structure shown in the example above. Do not include any explanatory text, markdown formatting, or code blocks. Return only the raw JSON object.")
             
             # Configure the request based on whether thinking mode is enabled
             if is_thinking_mode:
@@ -552,7 +744,7 @@ def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
                         "type": "enabled",
                         "budget_tokens": 16000
                     },
-                    system="You are a JSON-generating assistant. You must ONLY output valid, parseable JSON with no additional text or formatting.",
+                    system=system_prompt,
                     messages=[
                         {"role": "user", "content": json_prompt}
                     ],
@@ -562,7 +754,7 @@ def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
                 response = client.messages.create(
                     model=actual_model,
                     max_tokens=4096,
-                    system="You are a JSON-generating assistant. You must ONLY output valid, parseable JSON with no additional text or formatting.",
+                    system=system_prompt,
                     messages=[
                         {"role": "user", "content": json_prompt}
                     ],
@@ -570,12 +762,13 @@ def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
                 )
         else:
             # Standard handling for other Claude models
+            system_prompt, prompt = stage_prompt("You are a helpful assistant designed to output JSON. Your response must be a valid, parseable JSON object with no additional text, markdown formatting, or explanation. Do not include ```json code blocks or any other formatting - just return the raw JSON object.", prompt)
             response = client.messages.create(
                 model=actual_model,
                 max_tokens=4096,
-                system="You are a helpful assistant designed to output JSON. Your response must be a valid, parseable JSON object with no additional text, markdown formatting, or explanation. Do not include ```json code blocks or any other formatting - just return the raw JSON object.",
+                system=system_prompt,
                 messages=[
-                    {"role": "user", "content": prompt}
+                    {"role": "user", "content": anthropic_content(prompt)}
                 ],
                 timeout=300  # 5-minute timeout
             )
@@ -588,7 +781,7 @@ def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
             # Store thinking content in session state for debugging/transparency (optional)
             thinking_content = ''.join(block.thinking for block in response.content if block.type == "thinking")
             if thinking_content:
-                st.session_state['last_thinking_content'] = thinking_content
+                store_artefact('last_thinking_content', thinking_content)
         else:
             # Standard handling for regular responses
             full_content = ''.join(block.text for block in response.content)
@@ -645,8 +838,9 @@ def get_threat_model_anthropic(anthropic_api_key, anthropic_model, prompt):
         return fallback_response
 
 # Function to get threat model from LM Studio Server response.
+@traced()
 def get_threat_model_lm_studio(lm_studio_endpoint, model_name, prompt):
-    client = OpenAI(
+    client = openai_client(
         base_url=f"{lm_studio_endpoint}/v1",
         api_key="not-needed"  # LM Studio Server doesn't require an API key
     )
@@ -684,10 +878,7 @@ def get_threat_model_lm_studio(lm_studio_endpoint, model_name, prompt):
     response = client.chat.completions.create(
         model=model_name,
         response_format=threat_model_schema,
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ],
+        messages=stage_messages("You are a helpful assistant designed to output JSON.", prompt),
         max_tokens=4000,
     )
 
@@ -697,16 +888,14 @@ def get_threat_model_lm_studio(lm_studio_endpoint, model_name, prompt):
     return response_content
 
 # Function to get threat model from the Groq response.
+@traced()
 def get_threat_model_groq(groq_api_key, groq_model, prompt):
-    client = Groq(api_key=groq_api_key)
+    client = groq_client(api_key=groq_api_key)
 
     response = client.chat.completions.create(
         model=groq_model,
         response_format={"type": "json_object"},
-        messages=[
-            {"role": "system", "content": "You are a helpful assistant designed to output JSON."},
-            {"role": "user", "content": prompt}
-        ]
+        messages=stage_messages("You are a helpful assistant designed to output JSON.", prompt)
     )
 
     # Process the response using our utility function
@@ -724,6 +913,7 @@ def get_threat_model_groq(groq_api_key, groq_model, prompt):
     return response_content
 
 # Function to get threat model from GLM response.
+@traced()
 def get_threat_model_glm(glm_api_key, glm_model, prompt):
     """
     Get threat model from GLM (Zhipu AI) response.
@@ -736,7 +926,7 @@ def get_threat_model_glm(glm_api_key, glm_model, prompt):
     Returns:
         dict: The parsed JSON response from the model
     """
-    client = OpenAI(
+    client = openai_client(
     api_key= glm_api_key,
     base_url="https://open.bigmodel.cn/api/paas/v4/"
     )
@@ -745,10 +935,7 @@ def get_threat_model_glm(glm_api_key, glm_model, prompt):
     try:
         response = client.chat.completions.create(
             model=glm_model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant designed to output JSON. Your response must be a valid, parseable JSON object with no additional text, markdown formatting, or explanation."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=stage_messages("You are a helpful assistant designed to output JSON. Your response must be a valid, parseable JSON object with no additional text, markdown formatting, or explanation.", prompt),
             temperature=0.7,
             max_tokens=4000,
             response_format={"type": "json_object"}
@@ -802,6 +989,7 @@ def get_threat_model_glm(glm_api_key, glm_model, prompt):
         return fallback_response
 
 # Function to get image analysis using GLM models
+@traced()
 def get_image_analysis_glm(glm_api_key, glm_model, prompt, base64_image, media_type="image/jpeg"):
     """
     Get image analysis using GLM (Zhipu AI) models.
@@ -816,7 +1004,7 @@ def get_image_analysis_glm(glm_api_key, glm_model, prompt, base64_image, media_t
     Returns:
         dict: Response with the analysis content
     """
-    client = OpenAI(
+    client = openai_client(
     api_key= glm_api_key,
     base_url="https://open.bigmodel.cn/api/paas/v4/"
     )
@@ -857,6 +1045,7 @@ def get_image_analysis_glm(glm_api_key, glm_model, prompt, base64_image, media_t
         return None
 
 # Function to get threat model from eCloud response.
+@traced()
 def get_threat_model_ecloud(ecloud_api_key, ecloud_model, prompt):
     """
     Get threat model from eCloud response.
@@ -878,16 +1067,7 @@ def get_threat_model_ecloud(ecloud_api_key, ecloud_model, prompt):
 
     data = {
         "model": ecloud_model,
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a helpful assistant designed to output JSON. Your response must be a valid, parseable JSON object with no additional text, markdown formatting, or explanation."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
+        "messages": stage_messages("You are a helpful assistant designed to output JSON. Your response must be a valid, parseable JSON object with no additional text, markdown formatting, or explanation.", prompt),
         "chat_template_kwargs": {
             "enable_thinking": False
         },
@@ -0,0 +1,90 @@
+"""
+Normalised threat records.
+
+Providers return threats as dicts whose keys vary by model ("Threat Type",
+"threat_type", "threatType", "type", ...). normalize_threat_model() resolves those
+once, when a threat model is ingested, into ThreatRecord instances with a stable
+ID, and the renderers and downstream prompts work from the records. The threat
+model artefact stores the canonical dicts from ThreatRecord.to_dict(), which load
+back without probing.
+"""
+from dataclasses import dataclass
+
+from utils import threat_id
+
+# Alternative keys models use for every field, in order of preference
+THREAT_TYPE_KEYS = ("Threat Type", "threat_type", "threatType", "type")
+SCENARIO_KEYS = ("Scenario", "scenario", "description")
+IMPACT_KEYS = ("Potential Impact", "potential_impact", "impact", "effect")
+
+CANONICAL_KEYS = ("Threat ID", "Threat Type", "Scenario", "Potential Impact")
+
+
+def _first(threat, keys, default):
+    for key in keys:
+        value = threat.get(key)
+        if value:
+            return str(value)
+    return default
+
+
+@dataclass(frozen=True, slots=True)
+class ThreatRecord:
+    """
+    One threat of a threat model.
+
+    Attributes:
+        id (str): Stable ID derived from the threat type and scenario, see utils.threat_id
+        threat_type (str): STRIDE threat type as the model wrote it
+        scenario (str): Threat scenario
+        potential_impact (str): Potential impact
+    """
+
+    id: str
+    threat_type: str
+    scenario: str
+    potential_impact: str
+
+    @classmethod
+    def from_dict(cls, threat):
+        """
+        Create a record from a provider threat dict or a dict from to_dict().
+
+        The ID is always derived from the threat type and scenario; a stored
+        "Threat ID" is ignored, since an edited run file or a model echoing IDs
+        can carry one that no longer matches the scenario.
+        """
+        if all(key in threat for key in CANONICAL_KEYS):
+            threat_type, scenario = str(threat["Threat Type"]), str(threat["Scenario"])
+            return cls(threat_id(threat_type, scenario), threat_type, scenario, str(threat["Potential Impact"]))
+        threat_type = _first(threat, THREAT_TYPE_KEYS, "Unknown")
+        scenario = _first(threat, SCENARIO_KEYS, "Unknown scenario")
+        return cls(threat_id(threat_type, scenario), threat_type, scenario, _first(threat, IMPACT_KEYS, "Unknown impact"))
+
+    def to_dict(self):
+        """Return the canonical dict stored in artefacts and shown to models."""
+        return {
+            "Threat ID": self.id,
+            "Threat Type": self.threat_type,
+            "Scenario": self.scenario,
+            "Potential Impact": self.potential_impact,
+        }
+
+
+def normalize_threat_model(threat_model):
+    """
+    Normalise a threat model into records, skipping entries that are not threats.
+
+    Args:
+        threat_model (list): Provider threat dicts, canonical dicts or ThreatRecords
+
+    Returns:
+        list: ThreatRecord per threat, in order
+    """
+    records = []
+    for threat in threat_model or []:
+        if isinstance(threat, ThreatRecord):
+            records.append(threat)
+        elif isinstance(threat, dict):
+            records.append(ThreatRecord.from_dict(threat))
+    return records
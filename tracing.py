@@ -0,0 +1,221 @@
+"""
+Lightweight tracing for the analysis pipeline.
+
+Spans record wall time plus attributes such as provider, model, input and output
+tokens, retries and cache hits. Finished spans are kept in a bounded in-memory buffer
+that the sidebar performance panel reads, and can be exported as OpenTelemetry
+(OTLP/JSON) trace data for any OTLP-compatible backend.
+
+The buffer is shared by every session of the server process, so spans are tagged
+with the session that was active when they started (see set_session) and the panel
+only reads its own session's spans.
+"""
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+SERVICE_NAME = "stride-gpt"
+
+# Number of finished spans kept in memory
+MAX_SPANS = 2000
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_current_session = contextvars.ContextVar("current_session", default=None)
+_finished_spans = deque(maxlen=MAX_SPANS)
+_lock = threading.Lock()
+_listeners = []
+
+
+class Span:
+    """A timed operation. Use span() or @traced rather than creating spans directly."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "session", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.session = parent.session if parent else _current_session.get()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    @property
+    def duration_ms(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def set(self, **attributes):
+        """Set attributes on the span, ignoring None values."""
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def add(self, key, amount=1):
+        """Increment a numeric attribute, e.g. retries or tokens."""
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+
+class span:
+    """
+    Context manager that records a span as a child of the current span.
+
+    Example:
+        with span("threat_model.generate", provider=model_provider) as s:
+            ...
+            s.set(retries=retry_count)
+    """
+
+    def __init__(self, name, **attributes):
+        self._span = Span(name, _current_span.get(), attributes)
+        self._token = None
+
+    def __enter__(self):
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        self._span.end_ns = time.time_ns()
+        if exc is not None:
+            self._span.error = f"{exc_type.__name__}: {exc}"
+        _current_span.reset(self._token)
+        with _lock:
+            _finished_spans.append(self._span)
+            listeners = list(_listeners)
+        for listener in listeners:
+            listener(self._span)
+        return False
+
+
+def traced(name=None, **attributes):
+    """Decorator that records a span around every call of the decorated function."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def event(name, **attributes):
+    """Record an instantaneous span, e.g. a retry, as a child of the current span."""
+    with span(name, **attributes):
+        pass
+
+
+def current_span():
+    """Return the active span, or None outside of any span."""
+    return _current_span.get()
+
+
+def record(**attributes):
+    """Set attributes on the active span, if there is one."""
+    active = _current_span.get()
+    if active is not None:
+        active.set(**attributes)
+
+
+def add_listener(listener):
+    """Call listener(span) whenever a span finishes, e.g. to feed metrics."""
+    with _lock:
+        _listeners.append(listener)
+
+
+def set_session(session_id):
+    """Tag the spans started from now on in the current context with a session ID."""
+    _current_session.set(session_id)
+
+
+def get_session():
+    """Return the session ID set with set_session in the current context, or None."""
+    return _current_session.get()
+
+
+def get_spans(since_ns=0, session=None):
+    """
+    Return finished spans that started at or after since_ns, oldest first.
+
+    Args:
+        since_ns (int): Earliest start time, in nanoseconds since the epoch
+        session (str): Only return spans of this session; None returns all spans
+    """
+    with _lock:
+        return [
+            finished for finished in _finished_spans
+            if finished.start_ns >= since_ns and (session is None or finished.session == session)
+        ]
+
+
+def clear_spans():
+    with _lock:
+        _finished_spans.clear()
+
+
+def summarize_spans(spans):
+    """
+    Aggregate spans by name for display.
+
+    Returns:
+        list: One dict per span name with count, total and max duration, tokens,
+            retries and cache hits, sorted by total duration
+    """
+    summary = {}
+    for finished in spans:
+        row = summary.setdefault(finished.name, {
+            "name": finished.name, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+            "input_tokens": 0, "output_tokens": 0, "retries": 0, "cache_hits": 0, "errors": 0,
+        })
+        row["count"] += 1
+        row["total_ms"] += finished.duration_ms
+        row["max_ms"] = max(row["max_ms"], finished.duration_ms)
+        row["input_tokens"] += finished.attributes.get("input_tokens", 0)
+        row["output_tokens"] += finished.attributes.get("output_tokens", 0)
+        row["retries"] += finished.attributes.get("retries", 0)
+        row["cache_hits"] += 1 if finished.attributes.get("cache_hit") else 0
+        row["errors"] += 1 if finished.error else 0
+    return sorted(summary.values(), key=lambda row: row["total_ms"], reverse=True)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp_json(spans):
+    """
+    Convert spans to an OTLP/JSON ExportTraceServiceRequest, as accepted by an
+    OpenTelemetry collector on /v1/traces.
+    """
+    otlp_spans = []
+    for finished in spans:
+        otlp_span = {
+            "traceId": finished.trace_id,
+            "spanId": finished.span_id,
+            "name": finished.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(finished.start_ns),
+            "endTimeUnixNano": str(finished.end_ns or finished.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in finished.attributes.items()],
+            "status": {"code": 2, "message": finished.error} if finished.error else {"code": 1},
+        }
+        if finished.parent_id:
+            otlp_span["parentSpanId"] = finished.parent_id
+        otlp_spans.append(otlp_span)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": SERVICE_NAME}, "spans": otlp_spans}],
+        }]
+    }
@@ -1,5 +1,7 @@
 import re
 import json
+import bisect
+import hashlib
 
 def extract_deepseek_reasoning(response_text):
     """
@@ -27,6 +29,60 @@ def extract_deepseek_reasoning(response_text):
         # If no think tags found, return None for reasoning and the original text as final output
         return None, response_text
 
+# One token of Mermaid flowchart syntax. Every alternative stops at the end of the
+# line or at the first closing bracket, so a scan stays linear in the input size
+MERMAID_TOKEN_RE = re.compile(r"""
+      (?P<comment>^[ \t]*%%[^\n]*)
+    | (?P<string>"[^"\n]*"?)
+    | (?P<shape>\[\[[^\]\n]*\]\]|\[\([^\]\n]*?\)\]|\[[/\\][^\]\n]*?[/\\]\])
+    | (?P<label>\[[^\]\n]*\])
+    | (?P<edge_text>\|[^|\n]*\|)
+    | (?P<arrow>[-=.<>]{3,})
+    | (?P<newline>\n)
+    | (?P<other>[^"\[|\-=.<>\n]+|.)
+""", re.MULTILINE | re.VERBOSE)
+
+# Unquoted labels containing any of these characters are quoted
+LABEL_QUOTE_CHARACTERS = frozenset(' \t()[]{}<>;|"')
+
+# Control characters are dropped from labels
+LABEL_CONTROL_RE = re.compile(r"[\x00-\x08\x0b-\x1f\x7f]")
+
+
+def _find_fenced_graph(text):
+    """
+    Find the first ```mermaid code block holding a graph, or failing that the first
+    ``` code block holding one, without rescanning the text for every fence.
+
+    Returns:
+        str: The code block content from "graph" on, or None
+    """
+    fences = []
+    position = text.find("```")
+    while position != -1:
+        fences.append(position)
+        position = text.find("```", position + 1)
+
+    fallback = None
+    for fence in fences:
+        body = fence + 3
+        is_mermaid = text.startswith("mermaid", body)
+        if is_mermaid:
+            body += len("mermaid")
+        while body < len(text) and text[body].isspace():
+            body += 1
+        if not text.startswith("graph", body):
+            continue
+        closing = bisect.bisect_left(fences, body + len("graph"))
+        if closing == len(fences):
+            break
+        if is_mermaid:
+            return text[body:fences[closing]]
+        if fallback is None:
+            fallback = text[body:fences[closing]]
+    return fallback
+
+
 def extract_mermaid_code(text):
     """
     Extract the Mermaid diagram code from text that may contain additional content.
@@ -39,18 +95,10 @@ def extract_mermaid_code(text):
     Returns:
         str: The cleaned Mermaid code, or the original text if no code block is found
     """
-    # Try to find code block with explicit mermaid tag
-    mermaid_pattern = r'```mermaid\s*(graph[\s\S]*?)```'
-    match = re.search(mermaid_pattern, text, re.MULTILINE)
-    
-    if not match:
-        # Try to find any code block containing graph definition
-        code_pattern = r'```\s*(graph[\s\S]*?)```'
-        match = re.search(code_pattern, text, re.MULTILINE)
-    
-    if match:
+    code = _find_fenced_graph(text)
+    if code is not None:
         # Extract just the graph content
-        code = match.group(1).strip()
+        code = code.strip()
     else:
         # If no code block found but text contains graph definition, use as is
         code = text.strip()
@@ -68,70 +116,69 @@ def extract_mermaid_code(text):
     
     return code
 
+
+def _clean_label(label):
+    # Quote labels Mermaid would misread, or strip stray brackets from simple ones
+    if label.startswith(('"', "'")):
+        return f"[{label}]"
+    label = LABEL_CONTROL_RE.sub("", label).strip()
+    if any(character in LABEL_QUOTE_CHARACTERS for character in label):
+        return '["' + label.replace('"', "#quot;") + '"]'
+    return f"[{label.lstrip('[]{}()').rstrip('[]{}()')}]"
+
+
 def clean_mermaid_syntax(code):
     """
     Clean up common issues in Mermaid syntax.
 
+    Flowcharts are tokenized in a single scan that puts spaces around arrows, quotes
+    labels containing spaces, brackets or other special characters (escaping inner
+    quotes as #quot;), and drops control characters, blank lines and surrounding
+    whitespace. Quoted strings and %% comments are left alone.
+
     Args:
         code (str): The Mermaid code to clean
 
     Returns:
         str: The cleaned Mermaid code
     """
-    try:
-        # Only process if it's valid mermaid code
-        if not code.strip().startswith(('graph ', 'flowchart ', 'sequenceDiagram ')):
-            return code.strip()
-
-        # Fix only specific common issues, avoid aggressive regex
-
-        # Fix common arrow spacing issues (only if missing spaces)
-        code = re.sub(r'(\w+)-->(\w+)', r'\1 --> \2', code)
-        code = re.sub(r'(\w+)==>(\w+)', r'\1 ==> \2', code)
-
-        # Fix missing quotes for node labels with spaces (be more conservative)
-        def fix_space_labels(match):
-            full_match = match.group(0)
-            label = match.group(1)
-            if ' ' in label and not label.startswith('"') and not label.startswith("'"):
-                return f'["{label}"]'
-            return full_match
-
-        # Only apply to labels that actually contain spaces
-        code = re.sub(r'\[([^\]]*?\s[^\]]*?)\]', fix_space_labels, code)
-
-        # Fix parentheses in labels (be more specific)
-        def fix_parentheses_labels(match):
-            full_match = match.group(0)
-            label = match.group(1)
-            if ('(' in label or ')' in label) and not label.startswith('"') and not label.startswith("'"):
-                return f'["{label}"]'
-            return full_match
-
-        code = re.sub(r'\[([^\]]*?\([^)]*\)[^\]]*?)\]', fix_parentheses_labels, code)
-
-        # Clean up problematic characters only at the start/end of labels
-        def clean_label_content(match):
-            full_match = match.group(0)
-            label = match.group(1)
-            # Only clean if it's not already quoted
-            if not label.startswith('"') and not label.startswith("'"):
-                # Remove problematic characters from start/end only
-                label = label.strip()
-                label = label.lstrip('[]{}()').rstrip('[]{}()')
-                return f'[{label}]'
-            return full_match
-
-        code = re.sub(r'\[([^\]]+)\]', clean_label_content, code)
-
-        # Ensure proper line endings and remove empty lines
-        lines = [line.strip() for line in code.split('\n') if line.strip()]
-        code = '\n'.join(lines)
-
-        return code
-    except Exception as e:
-        # If cleaning fails, return the original code
-        return code.strip()
+    stripped = code.strip()
+    if stripped.startswith('sequenceDiagram '):
+        return '\n'.join(line.strip() for line in stripped.split('\n') if line.strip())
+    # Only process if it's a flowchart
+    if not stripped.startswith(('graph ', 'flowchart ')):
+        return stripped
+
+    lines, line = [], []
+    after_arrow = False
+    for token in MERMAID_TOKEN_RE.finditer(stripped):
+        kind, text = token.lastgroup, token.group()
+        if kind == 'newline':
+            cleaned = ''.join(line).strip()
+            if cleaned:
+                lines.append(cleaned)
+            line, after_arrow = [], False
+            continue
+        if kind == 'arrow' and ('-' in text or '=' in text) and (text.endswith('>') or not text.strip('-=.<')):
+            if line and not line[-1][-1:].isspace():
+                line.append(' ')
+            line.append(text)
+            after_arrow = True
+            continue
+        if after_arrow:
+            after_arrow = False
+            if kind == 'edge_text':
+                # Keep -->|text| together and space what follows it
+                line.append(text)
+                after_arrow = True
+                continue
+            if not text[:1].isspace():
+                line.append(' ')
+        line.append(_clean_label(text[1:-1]) if kind == 'label' else text)
+    cleaned = ''.join(line).strip()
+    if cleaned:
+        lines.append(cleaned)
+    return '\n'.join(lines)
 
 def process_groq_response(response_text, model_name, expect_json=True):
     """
@@ -170,6 +217,125 @@ def process_groq_response(response_text, model_name, expect_json=True):
     
     return reasoning, processed_output
 
+class CacheablePrompt(str):
+    """
+    A prompt made of a stable prefix followed by a variable suffix.
+
+    The prefix holds the large input several stages share (the application
+    description, or the threat table), so providers with prompt caching can reuse it
+    across requests. Provider caches match on everything sent before the end of the
+    prefix, system prompt included, so stages send SHARED_SYSTEM_PROMPT and put their
+    own system text in the suffix (see stage_prompt); the threat model and attack tree
+    stages then start byte-identically, as do the mitigations, DREAD and test case
+    stages. The prompt is still a plain string equal to prefix + suffix, so providers
+    without caching support use it unchanged.
+    """
+
+    def __new__(cls, prefix, suffix=""):
+        prompt = super().__new__(cls, prefix + suffix)
+        prompt.prefix = prefix
+        prompt.suffix = suffix
+        return prompt
+
+# System prompt sent with every CacheablePrompt, identical across stages so that it
+# does not break the shared cached prefix that follows it
+SHARED_SYSTEM_PROMPT = (
+    "You are a cyber security expert who supports threat modelling. The message starts with "
+    "the details of an application or its threats; follow the role and output format "
+    "instructions that come after them."
+)
+
+def stage_prompt(system_prompt, prompt):
+    """
+    Arrange a stage's system prompt and prompt for prefix caching.
+
+    For a CacheablePrompt, the stage's system prompt moves into the suffix after the
+    shared prefix and SHARED_SYSTEM_PROMPT is sent in its place. Other prompts are
+    returned unchanged.
+
+    Args:
+        system_prompt (str): The stage's system prompt
+        prompt (str): The prompt, optionally a CacheablePrompt
+
+    Returns:
+        tuple: (system prompt to send, prompt to send)
+    """
+    if not system_prompt or not isinstance(prompt, CacheablePrompt):
+        return system_prompt, prompt
+    return SHARED_SYSTEM_PROMPT, CacheablePrompt(prompt.prefix, f"\n{system_prompt}\n{prompt.suffix}")
+
+def stage_messages(system_prompt, prompt):
+    """Return the system and user chat messages of a stage, see stage_prompt."""
+    system_prompt, prompt = stage_prompt(system_prompt, prompt)
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": prompt},
+    ]
+
+def create_application_context(app_type, authentication, internet_facing, sensitive_data, app_input, language="en"):
+    """
+    Create the application details block shared by the threat model and attack tree
+    prompts. It is placed at the start of those prompts so it forms a cacheable prefix.
+
+    Args:
+        app_type (str): Application type
+        authentication (list): Authentication methods
+        internet_facing (str): Whether the application is internet facing
+        sensitive_data (str): Sensitivity of the data handled by the application
+        app_input (str): Code summary, README content and application description
+        language (str): Language code
+
+    Returns:
+        str: The application details block
+    """
+    if language == "zh":
+        return f"""
+应用程序类型：{app_type}
+身份验证方法：{authentication}
+面向互联网：{internet_facing}
+敏感数据：{sensitive_data}
+代码摘要、README内容和应用程序描述：
+{app_input}
+"""
+    return f"""
+APPLICATION TYPE: {app_type}
+AUTHENTICATION METHODS: {authentication}
+INTERNET FACING: {internet_facing}
+SENSITIVE DATA: {sensitive_data}
+CODE SUMMARY, README CONTENT, AND APPLICATION DESCRIPTION:
+{app_input}
+"""
+
+def create_threats_context(threats, language="en"):
+    """
+    Create the threat list block shared by the mitigations, DREAD and test case prompts.
+    It is placed at the start of those prompts so it forms a cacheable prefix.
+
+    Args:
+        threats (str): The threat table in Markdown
+        language (str): Language code
+
+    Returns:
+        str: The threat list block
+    """
+    if language == "zh":
+        return f"""
+以下是威胁模型中识别出的威胁列表：
+{threats}
+"""
+    return f"""
+Below is the list of threats identified in the threat model:
+{threats}
+"""
+
+def threat_id(threat_type, scenario):
+    """
+    Stable ID of a threat, derived from its type and scenario so that the same threat
+    gets the same ID in every run. Downstream stages refer to threats by this ID.
+    """
+    text = " ".join(str(threat_type).lower().split()) + "\n" + " ".join(str(scenario).lower().split())
+    return "T-" + hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+
 def create_reasoning_system_prompt(task_description, approach_description):
     """
     Creates a system prompt formatted for OpenAI's reasoning models (o1, o3, o3-mini, o4-mini).